@@ -1,42 +1,89 @@
-from main import rag_chatbot
+# Imported first: its import time is the start of the cold start measures
+from src.services.serving.startup import BackgroundLoader, record_startup_phase
+from main import load_index, rag_chatbot_stream
 import gradio as gr
-import time
+import os
 
-from src.ingestion.ingest_files import ingest_files_data_folder
-from src.services.models.embeddings import Embeddings
-from src.services.models.llm import LLM
-from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.observability.metrics_server import start_metrics_server
+from src.services.observability.telemetry import configure_logging
 
-# Initialize instances for the LLM, embeddings, and FAISS index
-llm = LLM()
-embeddings = Embeddings()
-index = FAISSIndex(embeddings=embeddings.get_embeddings)
+configure_logging()
+record_startup_phase("imports")
 
-# Load the FAISS index, ingest data if it doesn't exist
-try:
-    index.load_index()
-except FileNotFoundError:
-    ingest_files_data_folder(index)
-    index.save_index()
+
+def load_serving():
+    """
+    Loads what answering needs: the LLM client, the FAISS index and the retriever.
+
+    FAISS, OpenAI and the tokenizers are imported here, in the background loader, while the UI
+    is already served. Documents are never ingested by the app: without an index, the loader
+    reports it as missing until `python -m src.ingestion.ingest_files` was run and the app restarted.
+    Once loaded, the snapshots saved by later ingestions are swapped in without a restart, checked
+    for every INDEX_RELOAD_INTERVAL seconds (0 disables it). Indexes whose shards are served by shard
+    servers (SHARD_ADDRESSES) are not reloaded: the servers don't follow new snapshots.
+
+    Returns:
+        tuple: The LLM and the retriever.
+    """
+    from src.services.models.llm import LLM
+    from src.services.serving.hot_reload import HotReloadingIndex
+    from src.services.serving.retriever import BatchedRetriever
+
+    llm = LLM()
+    index = load_index(mmap=True)
+    reload_interval = float(os.getenv("INDEX_RELOAD_INTERVAL", 5))
+    if reload_interval > 0 and not os.getenv("SHARD_ADDRESSES"):
+        index = HotReloadingIndex(index, lambda: load_index(mmap=True), interval=reload_interval).start()
+    # Concurrent users' queries are embedded and searched in micro-batches
+    return llm, BatchedRetriever.from_env(index)
+
+
+def health():
+    """Readiness of the app, with the index snapshot served once loaded."""
+    health = serving.health()
+    if serving.ready and hasattr(serving.result[1].index, "health"):
+        health.update(serving.result[1].index.health())
+    return health
+
+
+serving = BackgroundLoader(load_serving, name="index").start()
+# Prometheus metrics on their own port (METRICS_PORT), with the readiness at /health
+start_metrics_server(health=health)
+# Number of chat requests served at once
+app_workers = int(os.getenv("APP_WORKERS", 16))
+# Seconds a question waits for the index still loading before being answered with a notice
+ready_timeout = float(os.getenv("APP_READY_TIMEOUT", 30))
 
 
 def chatbot_wrapper(input_text, history):
     """
     Wrapper function for the chatbot, handling Gradio integration.
 
+    The answer is streamed: Gradio updates the chat every time a new piece of it is generated.
+
     Args:
         input_text (str): User input text.
         history (list): Conversation history.
 
-    Returns:
+    Yields:
         tuple: Updated conversation history and a placeholder string.
     """
     if history is None:
         history = []
 
-    _, updated_history = rag_chatbot(llm, input_text, history[:-1], index) # Call the main chatbot function with previous history.
+    if not serving.wait(ready_timeout):
+        if serving.status == "loading":
+            notice = "The document index is still loading, please ask again in a moment."
+        else:
+            # The error details are in the server logs, not for the users
+            notice = "The document index is unavailable, please contact the administrator."
+        yield history + [{"role": "assistant", "content": notice}], ""
+        return
 
-    return updated_history, ""  # Return updated history and empty string.
+    # Call the main chatbot function with previous history.
+    llm, retriever = serving.result
+    for _, updated_history in rag_chatbot_stream(llm, input_text, history[:-1], retriever):
+        yield updated_history, ""  # Return updated history and empty string.
 
 
 def add_user_text(history, txt):
@@ -117,9 +164,14 @@ with gr.Blocks(css=custom_css) as demo:
 
     # Define the event chain: submit text -> add to history -> call chatbot_wrapper -> clear textbox
     txt_msg = txt.submit(add_user_text, [chatbot_ui, txt], [chatbot_ui, txt]).then(
-        chatbot_wrapper, [txt, chatbot_ui], [chatbot_ui, txt], queue=False
+        # Generator outputs are only streamed through the queue
+        chatbot_wrapper, [txt, chatbot_ui], [chatbot_ui, txt]
     ).then(lambda: gr.Textbox(interactive=True), None, [txt], queue=False)
 
 
-# Launch the Gradio interface
-demo.launch()
+# Launch the Gradio interface, with a pool of workers serving the chat requests concurrently
+demo.queue(default_concurrency_limit=app_workers)
+# The UI is served while the index loads
+demo.launch(prevent_thread_lock=True)
+record_startup_phase("ui")
+demo.block_thread()
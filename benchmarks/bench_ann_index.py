@@ -0,0 +1,94 @@
+"""Reports recall@k against the exact flat index, search latency and memory of each index type.
+
+Vectors are synthetic: unit vectors drawn around random cluster centres, which is closer to real
+embeddings than uniform noise. Queries are perturbed copies of stored vectors.
+
+Usage:
+    python -m benchmarks.bench_ann_index --vectors 100000 --dimension 768 --k 5
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from src.services.vectorial_db.index_factory import IndexConfig
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype("float32")
+    vectors = centres[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dimension)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def build(config: IndexConfig, vectors: np.ndarray) -> tuple[faiss.Index, float]:
+    index = config.build(vectors.shape[1])
+    start = time.perf_counter()
+    if config.needs_training:
+        sample = vectors[np.random.default_rng(1).permutation(len(vectors))[:config.min_training_points()]]
+        index.train(sample)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    return index, time.perf_counter() - start
+
+
+def measure(config: IndexConfig, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int,
+            built: dict) -> dict:
+    config = config.fitted(len(vectors)) if config.needs_training else config
+    # Configs differing only by their search parameters share the same built index
+    if config.factory_string() not in built:
+        built[config.factory_string()] = build(config, vectors)
+    index, build_seconds = built[config.factory_string()]
+    config.apply_search_params(index)
+
+    latencies = []
+    found = np.empty_like(truth)
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, I = index.search(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+        found[i] = I[0]
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+    return {
+        "index": config.factory_string(),
+        "nprobe": config.nprobe if config.is_ivf else None,
+        "ef_search": config.ef_search if config.index_type == "hnsw" else None,
+        f"recall@{k}": round(float(recall), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "build_seconds": round(build_seconds, 2),
+        "memory_mb": round(faiss.serialize_index(index).nbytes / 2 ** 20, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--nlist", type=int, default=1024)
+    parser.add_argument("--pq-m", type=int, default=64)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.vectors, args.dimension)
+    rng = np.random.default_rng(2)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype("float32")
+
+    flat = IndexConfig("flat").build(args.dimension)
+    flat.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    _, truth = flat.search(queries, args.k)
+
+    configs = [IndexConfig("flat")]
+    configs += [IndexConfig("ivf_flat", nlist=args.nlist, nprobe=nprobe) for nprobe in (1, 8, 32)]
+    configs += [IndexConfig("ivf_pq", nlist=args.nlist, nprobe=nprobe, pq_m=args.pq_m) for nprobe in (8, 32)]
+    configs += [IndexConfig("hnsw", ef_search=ef_search) for ef_search in (16, 64, 256)]
+    built = {}
+    results = [measure(config, vectors, queries, truth, args.k, built) for config in configs]
+    print(json.dumps({"vectors": args.vectors, "dimension": args.dimension, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
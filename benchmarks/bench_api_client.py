@@ -0,0 +1,120 @@
+"""Compares the resilient API client with the bare OpenAI SDK against a throttling stub server.
+
+Two scenarios run against `benchmarks.stub_server` on a local port:
+
+- quota: concurrent embeddings requests well above the stub's tokens-per-minute quota. The SDK
+  without retries surfaces the 429s as failures, the SDK with its default retries keeps hitting
+  the quota, and the resilient client paces itself with its token bucket and adaptive concurrency.
+- outage: every request fails with a 500. The SDK retries each one, the circuit breaker of the
+  resilient client fails fast once it opened.
+
+Usage:
+    python -m benchmarks.bench_api_client --requests 1000 --threads 32 --tokens-per-minute 1200000
+"""
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from openai import AzureOpenAI
+
+from benchmarks.corpus import synthetic_text
+from benchmarks.stub_server import StubServer
+from src.services.models.api_client import ResilientClient, get_http_client
+from src.services.models.batching import estimate_tokens
+
+
+def sdk_client(url: str, max_retries: int) -> AzureOpenAI:
+    return AzureOpenAI(azure_endpoint=url, azure_deployment="embeddings", api_version="2024-06-01", api_key="stub",
+                       http_client=get_http_client(), max_retries=max_retries)
+
+
+def run(server: StubServer, call, batches: list[list[str]], threads: int) -> dict:
+    """Sends the batches from `threads` threads, returns the outcome and latency figures."""
+    for key in server.requests:
+        server.requests[key] = 0
+    latencies = []
+    failures = {}
+
+    def send(batch):
+        start = time.perf_counter()
+        try:
+            call(batch)
+            latencies.append(time.perf_counter() - start)
+        except Exception as error:
+            failures[type(error).__name__] = failures.get(type(error).__name__, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(send, batches))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    result = {"succeeded": len(latencies), "failed": failures, "seconds": round(seconds, 2),
+              "requests_sent": server.requests["embeddings"], "throttled_by_server": server.requests["throttled"],
+              "server_errors": server.requests["errors"]}
+    if latencies:
+        result["p50_seconds"] = round(statistics.median(latencies), 3)
+        result["p99_seconds"] = round(latencies[int(0.99 * (len(latencies) - 1))], 3)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1000, help="Embeddings requests of the quota scenario.")
+    parser.add_argument("--batch", type=int, default=8, help="Texts per request.")
+    parser.add_argument("--words", type=int, default=60, help="Words per text.")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--tokens-per-minute", type=float, default=1_200_000, help="Quota of the stub server.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Latency of the stub embeddings requests.")
+    parser.add_argument("--outage-requests", type=int, default=40)
+    args = parser.parse_args()
+
+    server = StubServer(embeddings_latency=args.latency, dimension=256, tokens_per_minute=args.tokens_per_minute,
+                        latency_jitter=args.latency / 2).start()
+    texts = [synthetic_text(args.words, seed=i) for i in range(args.requests * args.batch)]
+    batches = [texts[i:i + args.batch] for i in range(0, len(texts), args.batch)]
+    stub_tokens = sum(len(text) // 4 for text in texts)
+    results = {"quota": {"requests": args.requests, "tokens": stub_tokens, "tokens_per_minute": args.tokens_per_minute,
+                         "minimum_seconds": round(max(0.0, stub_tokens - args.tokens_per_minute / 6)
+                                                  / (args.tokens_per_minute / 60), 2)}}
+
+    def with_sdk(max_retries):
+        client = sdk_client(server.url, max_retries)
+        return lambda batch: client.embeddings.create(input=batch, model="stub")
+
+    def with_resilient_client(**limits):
+        client = sdk_client(server.url, 0)
+        api = ResilientClient("bench_embeddings", max_concurrency=args.threads, **limits)
+
+        def call(batch):
+            # As `Embeddings.get_embeddings_batch` does
+            tokens = sum(estimate_tokens(text) for text in batch)
+            completion = api.call(client.embeddings.create, input=batch, model="stub", tokens=tokens)
+            api.record_usage(tokens, completion.usage.total_tokens)
+
+        return call
+
+    modes = {"sdk_no_retries": with_sdk(0), "sdk_retries": with_sdk(2),
+             "resilient_retries_only": with_resilient_client(),
+             "resilient": with_resilient_client(tokens_per_minute=args.tokens_per_minute)}
+    for mode, call in modes.items():
+        # Let the stub's quota refill between modes
+        time.sleep(10)
+        results["quota"][mode] = run(server, call, batches, args.threads)
+        print(json.dumps({"quota": mode, **results["quota"][mode]}))
+
+    server.error_rate = 1.0
+    outage = batches[:args.outage_requests]
+    results["outage"] = {"requests": len(outage)}
+    outage_modes = {"sdk_retries": with_sdk(2),
+                    "resilient": with_resilient_client(tokens_per_minute=args.tokens_per_minute)}
+    for mode, call in outage_modes.items():
+        results["outage"][mode] = run(server, call, outage, args.threads)
+        print(json.dumps({"outage": mode, **results["outage"][mode]}))
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
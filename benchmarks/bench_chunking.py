@@ -0,0 +1,103 @@
+"""Compares the chunking engine with llama-index's TokenTextSplitter, which it replaced.
+
+Every document is split by a new `TokenTextSplitter` (as `text_to_chunks` did), by a new engine
+(empty token count cache), by the shared engine (counts cached by the previous documents), and
+all documents at once with the batch mode. Chunks must be identical. Every document is also
+streamed in pages through `iter_chunks_from_pages`, with windows of 1, 2 and 16 chunks, whose
+chunks must be those of the engine on the whole text. Half of the synthetic documents have the
+irregular spacing of extracted text (double spaces, line breaks), which windows must restart on.
+
+Usage:
+    python -m benchmarks.bench_chunking --documents 20 --words 50000
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import numpy as np
+from llama_index.core.node_parser import TokenTextSplitter
+
+from benchmarks.corpus import synthetic_text
+from src.ingestion.chunking.chunk_engine import TokenChunkEngine
+from src.ingestion.chunking.token_chunking import TokenChunking, iter_chunks_from_pages
+from src.ingestion.loaders.loaderPDF import LoaderPDF
+
+
+def timed(function) -> tuple[float, object]:
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+
+def irregular_spacing(text: str, seed: int) -> str:
+    """Doubles some spaces of a text and replaces others with line breaks, as in text extracted from PDFs."""
+    words = text.split(" ")
+    separators = np.random.default_rng(seed).choice([" ", "  ", "\n", "   ", " \n "], len(words) - 1,
+                                                    p=[0.88, 0.06, 0.04, 0.01, 0.01])
+    return "".join(word + separator for word, separator in zip(words, separators)) + words[-1]
+
+
+def pages_of(text: str, page_chars: int = 3000) -> list[tuple[int, str]]:
+    return [(number + 1, text[start:start + page_chars]) for number, start in enumerate(range(0, len(text), page_chars))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=20, help="Number of synthetic documents.")
+    parser.add_argument("--words", type=int, default=50_000, help="Words per synthetic document.")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=100)
+    parser.add_argument("--data-folder", default="data", help="PDFs split in addition to the synthetic documents.")
+    args = parser.parse_args()
+
+    texts = [synthetic_text(args.words, seed=i) for i in range(args.documents)]
+    texts = [irregular_spacing(text, seed) if seed % 2 else text for seed, text in enumerate(texts)]
+    texts += [LoaderPDF(path).extract_text() for path in sorted(glob.glob(os.path.join(args.data_folder, "*.pdf")))]
+    megabytes = sum(len(text.encode("utf-8")) for text in texts) / 2 ** 20
+
+    def splitter():
+        return [TokenTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap).split_text(text)
+                for text in texts]
+
+    def new_engine():
+        return [TokenChunkEngine(args.chunk_size, args.chunk_overlap).split(text) for text in texts]
+
+    shared = TokenChunkEngine(args.chunk_size, args.chunk_overlap)
+
+    def shared_engine():
+        return [shared.split(text) for text in texts]
+
+    def batch():
+        return TokenChunkEngine(args.chunk_size, args.chunk_overlap).split_batch(texts)
+
+    # Load the tokenizer and compute the engine's token size bound before timing
+    TokenChunkEngine(args.chunk_size, args.chunk_overlap).split("warm up")
+    reference_seconds, reference = timed(splitter)
+    results = [{"mode": "token_text_splitter", "seconds": round(reference_seconds, 3),
+                "mb_per_second": round(megabytes / reference_seconds, 3), "speedup": 1.0, "identical": True}]
+    for mode, function in (("engine", new_engine), ("engine_shared", shared_engine), ("engine_batch", batch)):
+        seconds, chunks = timed(function)
+        results.append({"mode": mode, "seconds": round(seconds, 3), "mb_per_second": round(megabytes / seconds, 3),
+                        "speedup": round(reference_seconds / seconds, 1), "identical": chunks == reference})
+        print(json.dumps(results[-1]))
+
+    # Pages are joined with a space, as the streaming does
+    chunker = TokenChunking()
+    engine = TokenChunkEngine(chunker.DEFAULT_CHUNK_SIZE, chunker.DEFAULT_CHUNK_OVERLAP)
+    streamed_texts = [pages_of(text) for text in texts]
+    whole = [engine.split("".join(" " + page for _, page in pages)) for pages in streamed_texts]
+    for window in (1, 2, 16):
+        seconds, chunks = timed(lambda: [[chunk for chunk, _, _ in iter_chunks_from_pages(pages, window_chunks=window)]
+                                         for pages in streamed_texts])
+        results.append({"mode": f"streaming_window_{window}", "seconds": round(seconds, 3),
+                        "mb_per_second": round(megabytes / seconds, 3),
+                        "speedup": round(reference_seconds / seconds, 1), "identical": chunks == whole})
+        print(json.dumps(results[-1]))
+    print(json.dumps({"documents": len(texts), "megabytes": round(megabytes, 2),
+                      "chunks": sum(len(chunks) for chunks in reference), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
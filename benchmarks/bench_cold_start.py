@@ -0,0 +1,107 @@
+"""Measures the cold start of the chat app: time until the UI could serve, and until the index is ready.
+
+A synthetic index is saved once, then each startup mode runs in a fresh interpreter:
+
+- eager: everything is imported and the index loaded before serving, as app.py used to;
+- deferred: only the light modules are imported, the index is loaded by a `BackgroundLoader`
+  while serving, as app.py does now.
+
+Fake embeddings replace Azure OpenAI, and gradio is imported when installed, so the times include
+everything app.py does before `demo.launch` but the UI building itself.
+
+Usage:
+    python -m benchmarks.bench_cold_start --chunks 100000 --runs 3
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.corpus import synthetic_chunks
+from benchmarks.fakes import FakeEmbeddings
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+HEAVY_MODULES = ("gradio", "faiss", "numpy", "openai", "tiktoken", "llama_index", "PyPDF2", "docx")
+
+# Runs in a fresh interpreter: prints the startup times of a mode as JSON
+CHILD = r"""
+import importlib.util, json, sys, time
+start = time.perf_counter()
+mode, path, dimension = sys.argv[1], sys.argv[2], int(sys.argv[3])
+
+
+def load():
+    from benchmarks.fakes import FakeEmbeddings
+    from src.services.models.llm import LLM
+    from src.services.vectorial_db.faiss_index import FAISSIndex
+    embeddings = FakeEmbeddings(dimension)
+    index = FAISSIndex(dimension, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch)
+    index.load_index(path, mmap=True)
+    return index
+
+
+if importlib.util.find_spec("gradio") is not None:
+    import gradio
+if mode == "eager":
+    import main
+    import src.ingestion.ingest_files
+    load()
+    ui = index = time.perf_counter() - start
+else:
+    from src.services.serving.startup import BackgroundLoader
+    import main
+    loader = BackgroundLoader(load).start()
+    ui = time.perf_counter() - start
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    loader.wait()
+    index = time.perf_counter() - start
+print(json.dumps({"ui_ready_seconds": ui, "index_ready_seconds": index,
+                  "heavy_modules_at_ui": loaded if mode != "eager" else "all"}))
+"""
+
+
+def run_mode(mode: str, path: str, dimension: int) -> dict:
+    code = f"HEAVY_MODULES = {HEAVY_MODULES!r}\n" + CHILD
+    env = dict(os.environ, PYTHONPATH=os.getcwd(), LOG_LEVEL="WARNING")
+    output = subprocess.run([sys.executable, "-c", code, mode, path, str(dimension)],
+                            capture_output=True, text=True, check=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=100_000, help="Chunks of the synthetic index.")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--chunk-words", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=3, help="Startups per mode, the median is reported.")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, "faiss_index")
+        embeddings = FakeEmbeddings(args.dimension)
+        index = FAISSIndex(args.dimension, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch)
+        index.ingest_text(text_chunks=synthetic_chunks(args.chunks, args.chunk_words))
+        index.save_index(path)
+        del index
+
+        results = {"chunks": args.chunks, "dimension": args.dimension, "runs": args.runs}
+        for mode in ("eager", "deferred"):
+            runs = [run_mode(mode, path, args.dimension) for _ in range(args.runs)]
+            results[mode] = {key: round(statistics.median(run[key] for run in runs), 3)
+                             for key in ("ui_ready_seconds", "index_ready_seconds")}
+            results[mode]["heavy_modules_at_ui"] = runs[0]["heavy_modules_at_ui"]
+            print(json.dumps({mode: results[mode]}))
+        results["ui_speedup"] = round(results["eager"]["ui_ready_seconds"] / results["deferred"]["ui_ready_seconds"], 1)
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Measures what skipping duplicate chunks at ingestion saves, and what detecting them costs.
+
+A synthetic corpus mixes unique chunks, exact copies of some of them (with other case and
+whitespace, as boilerplate repeated across documents) and near copies (a few words changed). It
+is ingested without deduplication, with exact deduplication only and with near-duplicate
+detection too. For each mode, it reports the chunks stored, embeddings requests and tokens sent,
+index bytes (text and vectors), ingestion throughput, and how many distinct chunks the top-k
+results of queries about duplicated chunks hold (copies crowd out the other results).
+
+The embeddings are bags of words, so that copies get close vectors, as with a real model.
+
+Usage:
+    python -m benchmarks.bench_dedup --chunks 50000 --exact 0.2 --near 0.1
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from src.services.vectorial_db.dedup import ChunkDeduplicator, normalize_chunk
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+class BagOfWordsEmbeddings:
+    """Normalized sum of a random vector per word: texts sharing most of their words get close vectors."""
+    def __init__(self, dimension: int = 256, vocabulary: int = 5000):
+        self.dimension = dimension
+        self._words = np.random.default_rng(0).standard_normal((vocabulary, dimension)).astype("float32")
+
+    def _vector(self, text: str) -> np.ndarray:
+        vector = self._words[[int(word[1:]) for word in normalize_chunk(text).split()]].sum(axis=0)
+        return vector / np.linalg.norm(vector)
+
+    def get_embeddings(self, text: str) -> list[float]:
+        return self._vector(text).tolist()
+
+    def get_embeddings_batch(self, texts: list[str]) -> list[list[float]]:
+        return [self._vector(text).tolist() for text in texts]
+
+
+def corpus(chunks: int, words: int, exact: float, near: float, vocabulary: int) -> tuple[list[str], list[int]]:
+    """Returns the chunks, and the positions of the unique chunks that were copied."""
+    rng = np.random.default_rng(1)
+    unique = int(chunks * (1 - exact - near))
+    texts = [" ".join(f"w{word}" for word in row) for row in rng.integers(0, vocabulary, (unique, words))]
+    copied = rng.integers(0, unique, chunks - unique)
+    for number, source in enumerate(copied.tolist()):
+        if number < int(chunks * exact):
+            # Same text, other case and line breaks
+            texts.append(texts[source].upper().replace(" ", "\n", 3))
+        else:
+            changed = texts[source].split()
+            for position in rng.integers(0, words, 2):
+                changed[position] = f"w{rng.integers(0, vocabulary)}"
+            texts.append(" ".join(changed))
+    order = rng.permutation(len(texts))
+    return [texts[i] for i in order], sorted(set(copied.tolist()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--words", type=int, default=150, help="Words per chunk.")
+    parser.add_argument("--exact", type=float, default=0.2, help="Share of exact copies.")
+    parser.add_argument("--near", type=float, default=0.1, help="Share of near copies.")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Near-duplicate threshold.")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    texts, copied = corpus(args.chunks, args.words, args.exact, args.near, args.vocabulary)
+    rng = np.random.default_rng(2)
+    # Queries about copied chunks: a part of their text
+    queries = [" ".join(texts[i].split()[:args.words // 3]) for i in rng.choice(copied, args.queries)]
+    results = []
+    for mode, dedup in (("none", None), ("exact", ChunkDeduplicator(None)), ("near", ChunkDeduplicator(args.threshold))):
+        embeddings = BagOfWordsEmbeddings(args.dimension, args.vocabulary)
+        index = FAISSIndex(args.dimension, embeddings.get_embeddings, embeddings.get_embeddings_batch, dedup=dedup)
+        start = time.perf_counter()
+        index.add_chunks(texts)
+        seconds = time.perf_counter() - start
+        report = index.last_ingest_report
+        distinct = [len({normalize_chunk(chunk) for chunk in index.retrieve_chunks(query, args.k)}) for query in queries]
+        results.append({
+            "mode": mode,
+            "chunks_stored": len(index.chunks),
+            "requests": report.requests,
+            "tokens": report.tokens,
+            "index_mb": round((sum(len(index.chunks[i].encode("utf-8")) for i in index.chunks)
+                               + index.index.ntotal * args.dimension * 4) / 2 ** 20, 2),
+            "duplicates": report.duplicates,
+            "near_duplicates": report.near_duplicates,
+            "requests_saved": report.requests_saved,
+            "mb_saved": round(report.bytes_saved / 2 ** 20, 2),
+            "chunks_per_second": round(len(texts) / seconds, 1),
+            f"distinct_in_top{args.k}": round(float(np.mean(distinct)), 2),
+        })
+        print(json.dumps(results[-1]))
+    print(json.dumps({"chunks": args.chunks, "exact": args.exact, "near": args.near, "threshold": args.threshold,
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Compares filtered searches pushed down into FAISS with searching everything and filtering after.
+
+Synthetic vectors (see `bench_ann_index.synthetic_vectors`) are added document by document with
+their metadata, then every query is restricted to one document, to a few documents and to some
+pages of the documents. For each index type and filter, it reports the p50/p99 latency, the
+average number of results (out of k) and the recall@k against the exact nearest vectors among
+the matching chunks, of:
+
+- prefilter: `FAISSIndex.search_vectors(filter=...)`, the matching IDs are pushed down as a selector.
+- postfilter: the `--fetch` nearest vectors are searched, and those not matching are dropped.
+- postfilter_exhaustive: the number of vectors searched grows until k of them match.
+
+Usage:
+    python -m benchmarks.bench_filtered_search --vectors 200000 --documents 200 --dimension 768
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.bench_ann_index import synthetic_vectors
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.index_factory import IndexConfig
+from src.services.vectorial_db.metadata_store import IDFilter
+
+
+def no_embeddings(text: str):
+    raise RuntimeError("The benchmark searches vectors only")
+
+
+def build(config: IndexConfig, vectors: np.ndarray, documents: int, pages_per_document: int) -> FAISSIndex:
+    index = FAISSIndex(vectors.shape[1], no_embeddings, index_config=config)
+    for document, rows in enumerate(np.array_split(np.arange(len(vectors)), documents)):
+        pages = (np.arange(len(rows)) * pages_per_document // len(rows) + 1).repeat(2).reshape(-1, 2)
+        index.add_vectors(vectors[rows], [""] * len(rows), document=f"document_{document:04d}.pdf", pages=pages)
+    index.train()
+    return index
+
+
+def exact(vectors: np.ndarray, queries: np.ndarray, ids: np.ndarray, k: int) -> list[set]:
+    subset = faiss.IndexFlatL2(vectors.shape[1])
+    subset.add(vectors[ids])
+    _, I = subset.search(queries, k)
+    return [set(ids[row[row >= 0]].tolist()) for row in I]
+
+
+def measure(search, queries: np.ndarray, truth: list[set], k: int) -> dict:
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        _, I = search(query[None, :])
+        latencies.append(time.perf_counter() - start)
+        found.append([i for i in I[0].tolist() if i >= 0])
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "results": round(float(np.mean([len(ids) for ids in found])), 2),
+        f"recall@{k}": round(float(np.mean([len(set(ids) & expected) / k for ids, expected in zip(found, truth)])), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--documents", type=int, default=200)
+    parser.add_argument("--pages", type=int, default=50, help="Pages per document.")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fetch", type=int, default=100, help="Nearest vectors searched by the post-filtering.")
+    parser.add_argument("--nlist", type=int, default=1024)
+    args = parser.parse_args()
+
+    vectors = synthetic_vectors(args.vectors, args.dimension)
+    rng = np.random.default_rng(2)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype("float32")
+    filters = {
+        "one_document": {"file": "document_0007.pdf"},
+        "five_documents": {"file": [f"document_{document:04d}.pdf" for document in range(3, args.documents, args.documents // 5)]},
+        "pages_1_to_5": {"pages": [1, 5]},
+    }
+
+    results = []
+    for config in (IndexConfig("flat"), IndexConfig("ivf_flat", nlist=args.nlist, nprobe=32), IndexConfig("hnsw")):
+        index = build(config, vectors, args.documents, args.pages)
+        unfiltered = measure(lambda query: index.search_vectors(query, args.k), queries,
+                             exact(vectors, queries, np.arange(len(vectors)), args.k), args.k)
+        results.append({"index": config.index_type, "filter": None, "mode": "unfiltered", **unfiltered})
+        print(json.dumps(results[-1]))
+        for name, where in filters.items():
+            id_filter = IDFilter(index.metadata.select(where))
+            truth = exact(vectors, queries, id_filter.ids, args.k)
+            modes = {
+                "prefilter": lambda query: index.search_vectors(query, args.k, filter=where),
+                "postfilter": lambda query: id_filter.post_filter(index.index, query, args.k, max_fetch=args.fetch),
+                "postfilter_exhaustive": lambda query: id_filter.post_filter(index.index, query, args.k),
+            }
+            for mode, search in modes.items():
+                results.append({"index": config.index_type, "filter": name, "selectivity": round(len(id_filter) / len(vectors), 4),
+                                "mode": mode, **measure(search, queries, truth, args.k)})
+                print(json.dumps(results[-1]))
+    print(json.dumps({"vectors": args.vectors, "dimension": args.dimension, "documents": args.documents,
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Measures serving while new index snapshots are published, swapped in with and without leases.
+
+A writer replaces `--replace` chunks of the index and saves a new snapshot `--generations` times,
+while user threads retrieve chunks through a `BatchedRetriever`. The serving process picks up
+every snapshot:
+
+- in_place: the served `FAISSIndex` reloads the snapshot itself (`load_index`), so a query whose
+  search ran on the old snapshot may read its chunks from the new one, where some were removed;
+- hot_reload: a `HotReloadingIndex` loads the snapshot aside and swaps it in, queries lease an
+  index for their whole duration and finish on the snapshot they started on.
+
+For each mode, it reports the queries answered, errors, results missing chunks (torn reads), the
+p50/p99/max latency and the number of reloads, and the time a restart would spend loading the
+index, during which nothing is served.
+
+Usage:
+    python -m benchmarks.bench_hot_reload --chunks 50000 --generations 10 --users 8
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from benchmarks.corpus import synthetic_chunks
+from benchmarks.fakes import FakeEmbeddings
+from src.services.serving.hot_reload import HotReloadingIndex
+from src.services.serving.retriever import BatchedRetriever
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.snapshots import SnapshotStore
+
+
+def new_index(embeddings: FakeEmbeddings) -> FAISSIndex:
+    return FAISSIndex(embeddings.dimension, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch)
+
+
+def load(path: str, embeddings: FakeEmbeddings, mmap: bool = True) -> FAISSIndex:
+    index = new_index(embeddings)
+    index.load_index(path, mmap=mmap)
+    return index
+
+
+def write_snapshots(path: str, embeddings: FakeEmbeddings, generations: int, replace: int, pause: float):
+    index = load(path, embeddings, mmap=False)
+    for generation in range(1, generations + 1):
+        time.sleep(pause)
+        index.remove_ids(sorted(index.chunks)[:replace])
+        index.ingest_text(text_chunks=synthetic_chunks(replace, seed=generation))
+        index.save_index(path)
+
+
+def watch_in_place(index: FAISSIndex, path: str, interval: float, stop: threading.Event, reloads: list):
+    store = SnapshotStore(path)
+    while not stop.wait(interval):
+        name = store.current_name()
+        if name != index.snapshot:
+            index.load_index(path, mmap=True)
+            reloads.append(name)
+
+
+def run(mode: str, path: str, embeddings: FakeEmbeddings, args) -> dict:
+    stop = threading.Event()
+    reloads = []
+    if mode == "hot_reload":
+        served = HotReloadingIndex(load(path, embeddings), lambda: load(path, embeddings), path,
+                                   interval=args.interval).start()
+    else:
+        served = load(path, embeddings)
+        watcher = threading.Thread(target=watch_in_place, args=(served, path, args.interval, stop, reloads), daemon=True)
+        watcher.start()
+    retriever = BatchedRetriever(served)
+    latencies, short, errors = [], [0], [0]
+    lock = threading.Lock()
+
+    def user(number: int):
+        questions = synthetic_chunks(1000, words=12, seed=1000 + number)
+        position = 0
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                chunks = retriever.retrieve_chunks(questions[position % len(questions)], args.k)
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            finally:
+                position += 1
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                short[0] += len(chunks) < args.k
+
+    users = [threading.Thread(target=user, args=(number,), daemon=True) for number in range(args.users)]
+    for thread in users:
+        thread.start()
+    write_snapshots(path, embeddings, args.generations, args.replace, args.pause)
+    # Leaves the serving process the time to pick up the last snapshot
+    time.sleep(2 * args.interval + 0.5)
+    stop.set()
+    for thread in users:
+        thread.join()
+    retriever.close()
+    if mode == "hot_reload":
+        served.close()
+        reloads = [None] * served.reloads
+    milliseconds = np.array(latencies) * 1000
+    return {
+        "mode": mode,
+        "queries": len(latencies),
+        "errors": errors[0],
+        "missing_chunks": short[0],
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+        "max_ms": round(float(milliseconds.max()), 3),
+        "reloads": len(reloads),
+        "snapshots_on_disk": len(SnapshotStore(path).snapshots()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=50_000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--generations", type=int, default=10, help="Snapshots published while serving.")
+    parser.add_argument("--replace", type=int, default=2000, help="Chunks removed and added per snapshot.")
+    parser.add_argument("--pause", type=float, default=0.5, help="Seconds between two snapshots.")
+    parser.add_argument("--interval", type=float, default=0.1, help="Seconds between two checks for a new snapshot.")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(args.dimension)
+    base = new_index(embeddings)
+    base.ingest_text(text_chunks=synthetic_chunks(args.chunks))
+    folder = tempfile.mkdtemp()
+    try:
+        results = {"chunks": args.chunks, "dimension": args.dimension, "generations": args.generations,
+                   "users": args.users, "modes": []}
+        for mode in ("in_place", "hot_reload"):
+            path = os.path.join(folder, mode)
+            base.save_index(path)
+            results["modes"].append(run(mode, path, embeddings, args))
+            print(json.dumps(results["modes"][-1]))
+        start = time.perf_counter()
+        load(os.path.join(folder, "hot_reload"), embeddings)
+        results["restart_load_seconds"] = round(time.perf_counter() - start, 3)
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
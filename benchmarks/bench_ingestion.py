@@ -0,0 +1,46 @@
+"""Compares per-chunk and batched ingestion throughput of `FAISSIndex.add_chunks`.
+
+Usage:
+    python -m benchmarks.bench_ingestion --chunks 2000 --latency 0.05
+"""
+import argparse
+import json
+
+from benchmarks.fakes import FakeEmbeddings
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+def synthetic_chunks(count: int, words: int = 350) -> list[str]:
+    return [" ".join(f"word{(i * 31 + j) % 5000}" for j in range(words)) + f" chunk{i}" for i in range(count)]
+
+
+def run(chunks: list[str], dimension: int, latency: float, batched: bool, max_batch_items: int) -> dict:
+    embeddings = FakeEmbeddings(dimension=dimension, request_latency=latency)
+    index = FAISSIndex(
+        dimension=dimension,
+        embeddings=embeddings.get_embeddings,
+        batch_embeddings=embeddings.get_embeddings_batch if batched else None,
+        max_batch_items=max_batch_items,
+    )
+    index.add_chunks(chunks)
+    return {"mode": "batched" if batched else "per_chunk", **index.last_ingest_report.as_dict()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per embeddings request.")
+    parser.add_argument("--max-batch-items", type=int, default=256)
+    args = parser.parse_args()
+
+    chunks = synthetic_chunks(args.chunks)
+    results = [
+        run(chunks, args.dimension, args.latency, batched=False, max_batch_items=args.max_batch_items),
+        run(chunks, args.dimension, args.latency, batched=True, max_batch_items=args.max_batch_items),
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Compares the time to first visible token of blocking and streamed LLM responses.
+
+Runs `LLM` against the local stub server (see `benchmarks/stub_server.py`), which simulates the
+latency of the first token and of every following token.
+
+Usage:
+    python -m benchmarks.bench_llm_streaming --runs 5 --first-token-latency 0.3 --token-latency 0.02
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from benchmarks.stub_server import StubServer
+from src.services.models.llm import LLM
+
+
+def blocking(llm: LLM) -> dict:
+    start = time.perf_counter()
+    response = llm.get_response([], "Some context.", "What are the scopes of emissions?")
+    seconds = time.perf_counter() - start
+    # The user sees nothing until the whole response is back
+    return {"time_to_first_token": seconds, "seconds": seconds, "chars": len(response)}
+
+
+def streamed(llm: LLM) -> dict:
+    stats = {}
+    response = "".join(llm.stream_response([], "Some context.", "What are the scopes of emissions?", stats=stats))
+    return {**stats, "chars": len(response)}
+
+
+def summarize(runs: list[dict]) -> dict:
+    return {
+        "time_to_first_token_p50": round(statistics.median(run["time_to_first_token"] for run in runs), 4),
+        "seconds_p50": round(statistics.median(run["seconds"] for run in runs), 4),
+        "chars": runs[0]["chars"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--max-tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    server = StubServer(first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                        max_tokens=args.max_tokens).start()
+    os.environ.update({
+        "AZURE_LLM_ENDPOINT": server.url,
+        "AZURE_LLM_DEPLOYMENT_NAME": "stub",
+        "AZURE_LLM_API_KEY": "stub",
+        "AZURE_LLM_API_VERSION": "2024-06-01",
+        "AZURE_LLM_MODEL_NAME": "stub",
+    })
+    llm = LLM()
+    try:
+        results = {
+            "blocking": summarize([blocking(llm) for _ in range(args.runs)]),
+            "streamed": summarize([streamed(llm) for _ in range(args.runs)]),
+        }
+    finally:
+        server.shutdown()
+    results["time_to_first_token_speedup"] = round(
+        results["blocking"]["time_to_first_token_p50"] / results["streamed"]["time_to_first_token_p50"], 2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Measures the memory and throughput of the streaming CSV, HTML and DOCX loaders on large files.
+
+A file of each format is generated with about `--mb` megabytes of content (for DOCX, of its
+uncompressed document part), then read in a fresh process per format and mode:
+
+- stream: the loader's `iter_pages`, one page held at a time;
+- whole: the file read at once, as a loader without streaming would (the CSV rows formatted in a
+  single string, the HTML converted by `html2text.handle`, the DOCX opened with python-docx).
+
+For each, it reports the seconds, MB/s, pages and characters extracted, and the peak resident
+memory above the memory of the process before reading.
+
+Usage:
+    python -m benchmarks.bench_loaders --mb 2048 --formats csv html docx --modes stream whole
+"""
+import argparse
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+
+from benchmarks.corpus import VOCABULARY
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+WORD_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/document.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '</Types>'
+)
+RELATIONSHIPS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="word/document.xml"/></Relationships>'
+)
+
+
+def peak_rss_mb() -> float | None:
+    """Returns the peak resident set size of the current process in MiB, None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def sentences(seed: int = 0):
+    """Endless synthetic sentences, drawn in blocks to stay fast on multi-GB files."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(VOCABULARY)
+    while True:
+        for row in vocabulary[rng.integers(0, len(VOCABULARY), (1000, 14))]:
+            yield " ".join(row).capitalize() + "."
+
+
+def write_csv(path: str, size: int):
+    text = sentences(1)
+    with open(path, "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["Product ID", "Product Name", "Description", "Category", "Review Score", "Price ($)"])
+        row = 0
+        while file.tell() < size:
+            row += 1
+            name = " ".join(next(text).split()[:3]).title()
+            writer.writerow([row, name, next(text), VOCABULARY[row % len(VOCABULARY)], f"{3 + row % 20 / 10:.1f}",
+                             f"{row % 500 + 0.99:.2f}"])
+
+
+def write_html(path: str, size: int):
+    text = sentences(2)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("<html><head><title>Benchmark export</title></head><body>\n")
+        section = 0
+        while file.tell() < size:
+            section += 1
+            file.write(f"<section><h2>Section {section}</h2>")
+            file.write("".join(f"<p>{next(text)} <b>{next(text)}</b> {next(text)}</p>" for _ in range(4)))
+            file.write("<ul>" + "".join(f"<li>{next(text)}</li>" for _ in range(3)) + "</ul>")
+            file.write("<table><tr><th>Scope</th><th>Value</th></tr>"
+                       + "".join(f"<tr><td>{next(text)}</td><td>{section}</td></tr>" for _ in range(3))
+                       + "</table></section>\n")
+        file.write("</body></html>\n")
+
+
+def write_docx(path: str, size: int, paragraphs_per_page: int = 12):
+    """Writes a minimal DOCX whose document part is streamed, so files larger than memory can be built."""
+    text = sentences(3)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("[Content_Types].xml", CONTENT_TYPES)
+        archive.writestr("_rels/.rels", RELATIONSHIPS)
+        with archive.open("word/document.xml", "w", force_zip64=True) as part:
+            part.write(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><w:document xmlns:w="{WORD_NS}"><w:body>'
+                       .encode("utf-8"))
+            written, paragraph = 0, 0
+            while written < size:
+                paragraph += 1
+                page_break = "<w:lastRenderedPageBreak/>" if paragraph % paragraphs_per_page == 0 else ""
+                xml = (f"<w:p><w:r>{page_break}<w:t>{next(text)} {next(text)}</w:t></w:r>"
+                       f"<w:r><w:tab/><w:t xml:space=\"preserve\">{next(text)}</w:t></w:r></w:p>").encode("utf-8")
+                part.write(xml)
+                written += len(xml)
+            part.write(b"</w:body></w:document>")
+
+
+WRITERS = {"csv": write_csv, "html": write_html, "docx": write_docx}
+
+
+def read_whole(extension: str, path: str) -> tuple[int, int]:
+    """Reads a file at once, returns the number of pages (1) and characters extracted."""
+    if extension == "csv":
+        from src.ingestion.loaders.loaderCSV import LoaderCSV
+        loader = LoaderCSV(path)
+        with open(path, newline="", encoding="utf-8-sig") as file:
+            rows = list(csv.reader(file.read().splitlines()))
+        loader.columns = rows[0]
+        text = "\n".join(loader.format_row(row) for row in rows[1:])
+    elif extension == "html":
+        import html2text
+        converter = html2text.HTML2Text(bodywidth=0)
+        converter.ignore_images = True
+        with open(path, encoding="utf-8") as file:
+            text = converter.handle(file.read())
+    else:
+        from docx import Document
+        text = "\n".join(paragraph.text for paragraph in Document(path).paragraphs)
+    return 1, len(text)
+
+
+def read_stream(extension: str, path: str) -> tuple[int, int]:
+    from src.ingestion.loaders.loader import Loader
+    pages = chars = 0
+    for _, text in Loader(path, extension).iter_pages():
+        pages += 1
+        chars += len(text)
+    return pages, chars
+
+
+def measure(extension: str, mode: str, path: str) -> dict:
+    """Runs in the child process: reads the file and returns the figures of the run."""
+    # Modules both modes use are imported first, so the baseline includes them
+    import html2text  # noqa: F401
+    import docx  # noqa: F401
+    from src.ingestion.loaders.loader import Loader  # noqa: F401
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    pages, chars = (read_stream if mode == "stream" else read_whole)(extension, path)
+    seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    return {
+        "format": extension,
+        "mode": mode,
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(os.path.getsize(path) / 2 ** 20 / seconds, 2),
+        "pages": pages,
+        "chars": chars,
+        "peak_rss_above_baseline_mb": None if peak is None else round(peak - baseline, 1),
+    }
+
+
+def run_child(extension: str, mode: str, path: str) -> dict:
+    env = dict(os.environ, PYTHONPATH=os.getcwd(), LOG_LEVEL="WARNING")
+    result = subprocess.run([sys.executable, "-m", "benchmarks.bench_loaders", "--measure", extension, mode, path],
+                            capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        # e.g. killed when reading a whole file doesn't fit in memory
+        return {"format": extension, "mode": mode, "status": "failed", "returncode": result.returncode,
+                "error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else None}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=256, help="Megabytes of content per generated file.")
+    parser.add_argument("--formats", nargs="+", choices=list(WRITERS), default=list(WRITERS))
+    parser.add_argument("--modes", nargs="+", choices=["stream", "whole"], default=["stream", "whole"])
+    parser.add_argument("--folder", default=None, help="Folder of the generated files, a temporary one by default.")
+    parser.add_argument("--measure", nargs=3, metavar=("FORMAT", "MODE", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(*args.measure)))
+        return
+
+    with tempfile.TemporaryDirectory(dir=args.folder) as folder:
+        results = {"mb": args.mb, "runs": []}
+        for extension in args.formats:
+            path = os.path.join(folder, f"bench.{extension}")
+            start = time.perf_counter()
+            WRITERS[extension](path, args.mb * 2 ** 20)
+            print(json.dumps({"format": extension, "file_mb": round(os.path.getsize(path) / 2 ** 20, 1),
+                              "generate_seconds": round(time.perf_counter() - start, 1)}))
+            for mode in args.modes:
+                results["runs"].append(run_child(extension, mode, path))
+                print(json.dumps(results["runs"][-1]))
+            os.remove(path)
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
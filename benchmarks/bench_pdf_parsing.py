@@ -0,0 +1,63 @@
+"""Compares single-process and page-range parallel extraction of a large PDF.
+
+The PDFs of the data folder are replicated into a single document of the requested size.
+
+Usage:
+    python -m benchmarks.bench_pdf_parsing --pages 800 --workers 2 4 8
+"""
+import argparse
+import glob
+import json
+import os
+import tempfile
+import time
+
+import PyPDF2
+
+from src.ingestion.loaders.loaderPDF import LoaderPDF
+
+
+def build_large_pdf(pages: int, data_folder: str = "data") -> str:
+    """Writes a PDF of `pages` pages made of copies of the data folder PDFs, returns its path."""
+    sources = [PyPDF2.PdfReader(path) for path in sorted(glob.glob(os.path.join(data_folder, "*.pdf")))]
+    source_pages = [page for reader in sources for page in reader.pages]
+    writer = PyPDF2.PdfWriter()
+    for i in range(pages):
+        writer.add_page(source_pages[i % len(source_pages)])
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    with os.fdopen(fd, "wb") as file:
+        writer.write(file)
+    return path
+
+
+def run(path: str, workers: int, pages_per_range: int) -> tuple[dict, str]:
+    loader = LoaderPDF(path, workers=workers, pages_per_range=pages_per_range)
+    start = time.perf_counter()
+    text = loader.extract_text()
+    seconds = time.perf_counter() - start
+    return {"workers": workers, "seconds": round(seconds, 3)}, text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=800)
+    parser.add_argument("--workers", type=int, nargs="+", default=[2, 4, os.cpu_count() or 1])
+    parser.add_argument("--pages-per-range", type=int, default=16)
+    args = parser.parse_args()
+
+    path = build_large_pdf(args.pages)
+    try:
+        baseline, expected = run(path, 1, args.pages_per_range)
+        results = [baseline]
+        for workers in sorted(set(args.workers) - {1}):
+            result, text = run(path, workers, args.pages_per_range)
+            result["speedup"] = round(baseline["seconds"] / result["seconds"], 2)
+            result["identical_text"] = text == expected
+            results.append(result)
+        print(json.dumps({"pages": args.pages, "size_bytes": os.path.getsize(path), "results": results}, indent=2))
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
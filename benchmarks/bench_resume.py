@@ -0,0 +1,114 @@
+"""Measures what the ingestion journal costs, and what it saves when an ingestion is interrupted.
+
+A data folder of `--files` HTML documents is ingested with embeddings simulating the API
+latency:
+
+- no_journal / journal: a complete run without and with the journal, for its overhead (disk
+  writes and checkpoints) and its size on disk;
+- restart / resume: a run failing once `--fail-at` of the embeddings requests were served (an
+  API outage), followed by a second run, from scratch without the journal, resuming from it with
+  the journal. The work of the second run is what the interruption costs.
+
+Usage:
+    python -m benchmarks.bench_resume --files 200 --fail-at 0.7 --request-latency 0.05
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from benchmarks.corpus import synthetic_text
+from benchmarks.fakes import FakeEmbeddings
+from src.ingestion.ingest_files import ingest_files_data_folder
+from src.ingestion.journal import IngestionJournal
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+class OutageEmbeddings(FakeEmbeddings):
+    """Fails every request once `fail_after` requests were served."""
+    def __init__(self, dimension: int, request_latency: float, fail_after: int | None = None):
+        super().__init__(dimension, request_latency=request_latency)
+        self.fail_after = fail_after
+        self.chunks = 0
+
+    def get_embeddings_batch(self, texts: list[str]) -> list[list[float]]:
+        if self.fail_after is not None and self.requests >= self.fail_after:
+            raise ConnectionError("Embeddings API unavailable")
+        self.chunks += len(texts)
+        return super().get_embeddings_batch(texts)
+
+
+def write_folder(folder: str, files: int, words: int):
+    os.makedirs(folder)
+    for number in range(files):
+        with open(os.path.join(folder, f"document_{number:05d}.html"), "w", encoding="utf-8") as file:
+            file.write(f"<html><body><h1>Document {number}</h1><p>{synthetic_text(words, seed=number)}</p></body></html>")
+
+
+def ingest(data: str, embeddings: OutageEmbeddings, journal: IngestionJournal | None) -> tuple[float, bool]:
+    index = FAISSIndex(embeddings.dimension, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch)
+    start = time.perf_counter()
+    try:
+        ingest_files_data_folder(index, data, parse_workers=0, journal=journal)
+        failed = False
+    except ConnectionError:
+        failed = True
+    finally:
+        if journal is not None:
+            journal.close()
+    return time.perf_counter() - start, failed
+
+
+def folder_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(folder, name)) for folder, _, names in os.walk(path) for name in names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--words", type=int, default=3000, help="Words per document.")
+    parser.add_argument("--dimension", type=int, default=1536)
+    parser.add_argument("--request-latency", type=float, default=0.05, help="Seconds per embeddings request.")
+    parser.add_argument("--fail-at", type=float, default=0.7, help="Share of the requests served before the outage.")
+    parser.add_argument("--checkpoint-chunks", type=int, default=1000)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    try:
+        data = os.path.join(root, "data")
+        write_folder(data, args.files, args.words)
+        journal_path = os.path.join(root, "journal")
+        results = {"files": args.files, "runs": []}
+
+        def run(name: str, journal: bool, fail_after: int | None = None, keep: bool = False) -> dict:
+            if not keep:
+                shutil.rmtree(journal_path, ignore_errors=True)
+            embeddings = OutageEmbeddings(args.dimension, args.request_latency, fail_after)
+            seconds, failed = ingest(data, embeddings, IngestionJournal(
+                journal_path, checkpoint_chunks=args.checkpoint_chunks) if journal else None)
+            result = {"run": name, "seconds": round(seconds, 2), "failed": failed, "requests": embeddings.requests,
+                      "chunks_embedded": embeddings.chunks}
+            if journal:
+                result["journal_mb"] = round(folder_size(journal_path) / 2 ** 20, 1)
+            results["runs"].append(result)
+            print(json.dumps(result))
+            return result
+
+        # Warms up the tokenizer caches, so the first run measured isn't slower for it
+        ingest(data, OutageEmbeddings(args.dimension, 0.0), None)
+        complete = run("no_journal", journal=False)
+        run("journal", journal=True)
+        fail_after = int(complete["requests"] * args.fail_at)
+        run("restart: interrupted", journal=False, fail_after=fail_after)
+        run("restart: second run", journal=False)
+        run("resume: interrupted", journal=True, fail_after=fail_after)
+        run("resume: second run", journal=True, keep=True)
+        print(json.dumps(results, indent=2))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
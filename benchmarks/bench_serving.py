@@ -0,0 +1,117 @@
+"""Measures retrieval throughput as a function of the number of concurrent users.
+
+Every user thread sends distinct queries, either straight to `FAISSIndex.retrieve_chunks` (one
+embeddings request and one search per query) or through a `BatchedRetriever` (queries grouped in
+micro-batches). With `--ingest`, chunks are added to the index while the users search, to exercise
+the readers-writer lock.
+
+The simulated embeddings endpoint serves a limited number of concurrent requests, like a
+rate-limited deployment.
+
+Usage:
+    python -m benchmarks.bench_serving --chunks 20000 --concurrency 1 4 16 64 --latency 0.02
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.bench_ingestion import synthetic_chunks
+from benchmarks.fakes import FakeEmbeddings
+from src.services.serving.retriever import BatchedRetriever
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+def run(index: FAISSIndex, retrieve, concurrency: int, queries_per_user: int, embeddings: FakeEmbeddings) -> dict:
+    requests = embeddings.requests
+    latencies = []
+    lock = threading.Lock()
+
+    def user(worker: int):
+        for i in range(queries_per_user):
+            start = time.perf_counter()
+            chunks = retrieve(f"question {worker}-{i} about scope {i % 3} emissions", 5)
+            seconds = time.perf_counter() - start
+            assert len(chunks) == 5
+            with lock:
+                latencies.append(seconds)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(user, range(concurrency)))
+    seconds = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "queries_per_second": round(len(latencies) / seconds, 1),
+        "latency_p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "latency_p99_ms": round(latencies[int(0.99 * (len(latencies) - 1))] * 1000, 2),
+        "embeddings_requests": embeddings.requests - requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--queries-per-user", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated seconds per embeddings request.")
+    parser.add_argument("--item-latency", type=float, default=0.0005, help="Simulated seconds per embedded query.")
+    parser.add_argument("--max-concurrent-requests", type=int, default=8,
+                        help="Simulated limit of concurrent embeddings requests.")
+    parser.add_argument("--max-wait-ms", type=float, default=5)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--ingest", action="store_true", help="Add chunks to the index while searching.")
+    args = parser.parse_args()
+
+    embeddings = FakeEmbeddings(dimension=args.dimension, request_latency=args.latency, item_latency=args.item_latency,
+                                max_concurrent_requests=args.max_concurrent_requests)
+    index = FAISSIndex(dimension=args.dimension, embeddings=embeddings.get_embeddings,
+                       batch_embeddings=embeddings.get_embeddings_batch)
+    chunks = synthetic_chunks(args.chunks, 20)
+    index.add_vectors(np.array(FakeEmbeddings(dimension=args.dimension).get_embeddings_batch(chunks), dtype="float32"),
+                      chunks)
+
+    stop = threading.Event()
+    ingester = None
+    if args.ingest:
+        fast = FakeEmbeddings(dimension=args.dimension)
+
+        def ingest():
+            batch = 0
+            while not stop.is_set():
+                chunks = [f"ingested chunk {batch}-{i}" for i in range(64)]
+                index.add_vectors(np.array(fast.get_embeddings_batch(chunks), dtype="float32"), chunks)
+                batch += 1
+                time.sleep(0.01)
+        ingester = threading.Thread(target=ingest, daemon=True)
+        ingester.start()
+
+    retriever = BatchedRetriever(index, max_batch_size=args.max_batch_size, max_wait=args.max_wait_ms / 1000)
+    results = []
+    try:
+        for concurrency in args.concurrency:
+            direct = run(index, index.retrieve_chunks, concurrency, args.queries_per_user, embeddings)
+            batches = retriever.batcher.stats()
+            batched = run(index, retriever.retrieve_chunks, concurrency, args.queries_per_user, embeddings)
+            after = retriever.batcher.stats()
+            batched["average_batch_size"] = round((after["items"] - batches["items"])
+                                                  / max(1, after["batches"] - batches["batches"]), 2)
+            results.append({"direct": direct, "micro_batched": batched,
+                             "speedup": round(batched["queries_per_second"] / direct["queries_per_second"], 2)})
+    finally:
+        retriever.close()
+        stop.set()
+        if ingester:
+            ingester.join()
+    print(json.dumps({"chunks": args.chunks, "latency": args.latency, "ingesting": args.ingest,
+                      "final_chunks": len(index.chunks), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Compares the search latency and throughput of sharded indexes with a single flat index.
+
+The same synthetic vectors (see `bench_ann_index.synthetic_vectors`) are added to a `FAISSIndex`
+and to `ShardedFAISSIndex`es of every shard count, which must return exactly the same results:
+the benchmark fails otherwise. For each, it reports the p50/p99 latency of single queries and the
+queries per second of batches. With `--remote`, the sharded indexes are also saved and searched
+through one `shard_server` process per shard. Beforehand, it checks that documents added after the
+last ones were removed and the index reloaded get new IDs, under both partitionings.
+
+Sharding only pays off with free cores: every shard is searched in its own thread, so the speedup
+is bounded by the number of cores (reported as `cpus`).
+
+Usage:
+    python -m benchmarks.bench_sharding --vectors 200000 --dimension 768 --shards 1 2 4 8 --remote
+"""
+import argparse
+import json
+import os
+import secrets
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_ann_index import synthetic_vectors
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.sharded_index import ShardedFAISSIndex
+
+
+def no_embeddings(text: str):
+    raise RuntimeError("The benchmark searches vectors only")
+
+
+def fill(index: FAISSIndex, vectors: np.ndarray, documents: int = 100, first: int = 0) -> FAISSIndex:
+    chunks = [str(first + i) for i in range(len(vectors))]
+    for batch in np.array_split(np.arange(len(vectors)), documents):
+        index.add_vectors(vectors[batch], [chunks[i] for i in batch], document=f"document_{first + batch[0]}")
+    return index
+
+
+def check_delete_then_add(shards: int, partition: str, dimension: int = 16):
+    """Removes the last documents added, saves, reloads and adds new ones: the IDs removed are not given again."""
+    vectors = synthetic_vectors(600, dimension)
+    flat = FAISSIndex(dimension, no_embeddings)
+    sharded = ShardedFAISSIndex(dimension, no_embeddings, num_shards=shards, partition=partition)
+    path = os.path.join(tempfile.mkdtemp(), "faiss_index")
+    try:
+        for index in (flat, sharded):
+            fill(index, vectors[:400], documents=8)
+            for document in ("document_300", "document_350"):
+                index.remove_document(document, index.metadata.select({"file": document}))
+            index.save_index(path)
+            index.load_index(path)
+            fill(index, vectors[400:], documents=4, first=400)
+        if sharded.next_id != flat.next_id or sharded.next_id != 600:
+            raise AssertionError(f"The IDs of removed chunks were given again: next ID {sharded.next_id}, expected 600")
+        queries = vectors[::7]
+        if not np.array_equal(sharded.search_vectors(queries, 5)[1], flat.search_vectors(queries, 5)[1]):
+            raise AssertionError(f"{shards} shards do not return the results of the single index after a reload")
+    finally:
+        sharded.close()
+        shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def measure(index: FAISSIndex, queries: np.ndarray, k: int, batch: int) -> tuple[dict, np.ndarray]:
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search_vectors(query[None, :], k)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    found = np.vstack([index.search_vectors(queries[i:i + batch], k)[1] for i in range(0, len(queries), batch)])
+    seconds = time.perf_counter() - start
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "batch_qps": round(len(queries) / seconds, 1),
+    }, found
+
+
+def start_shard_servers(path: str, shards: int) -> tuple[list[subprocess.Popen], list[str]]:
+    # A random key per run, handed to the servers and to the `RemoteShard` clients of this process
+    os.environ.setdefault("SHARD_AUTHKEY", secrets.token_hex(32))
+    processes, addresses = [], []
+    for shard in range(shards):
+        process = subprocess.Popen([sys.executable, "-m", "src.services.vectorial_db.shard_server", path,
+                                    "--shard", str(shard), "--port", "0"], stdout=subprocess.PIPE, text=True,
+                                   env=os.environ.copy())
+        # "Serving shard 0 on 127.0.0.1:40123"
+        addresses.append(process.stdout.readline().split()[-1])
+        processes.append(process)
+    return processes, addresses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=200_000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=32, help="Queries per batch of the throughput figure.")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--partition", choices=("hash", "document"), default="hash")
+    parser.add_argument("--remote", action="store_true", help="Also search the shards through shard servers.")
+    args = parser.parse_args()
+
+    for shards in args.shards:
+        for partition in ("hash", "document"):
+            check_delete_then_add(shards, partition)
+    vectors = synthetic_vectors(args.vectors, args.dimension)
+    rng = np.random.default_rng(2)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype("float32")
+
+    flat = fill(FAISSIndex(args.dimension, no_embeddings), vectors)
+    baseline, truth = measure(flat, queries, args.k, args.batch)
+    results = [{"mode": "single", **baseline}]
+    print(json.dumps(results[-1]))
+    for shards in args.shards:
+        index = fill(ShardedFAISSIndex(args.dimension, no_embeddings, num_shards=shards, partition=args.partition),
+                     vectors)
+        modes = {"local": index}
+        if args.remote:
+            path = os.path.join(tempfile.mkdtemp(), "faiss_index")
+            index.save_index(path)
+            processes, addresses = start_shard_servers(path, shards)
+            remote = ShardedFAISSIndex(args.dimension, no_embeddings, shard_addresses=addresses)
+            remote.load_index(path)
+            modes["remote"] = remote
+        for mode, searched in modes.items():
+            figures, found = measure(searched, queries, args.k, args.batch)
+            if not np.array_equal(found, truth):
+                raise AssertionError(f"{shards} {mode} shards do not return the results of the single index")
+            results.append({"mode": mode, "shards": shards, **figures,
+                            "p50_speedup": round(baseline["p50_ms"] / figures["p50_ms"], 2),
+                            "qps_speedup": round(figures["batch_qps"] / baseline["batch_qps"], 2)})
+            print(json.dumps(results[-1]))
+            searched.close()
+        if args.remote:
+            for process in processes:
+                process.terminate()
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+    print(json.dumps({"vectors": args.vectors, "dimension": args.dimension, "partition": args.partition,
+                      "cpus": os.cpu_count(), "identical_results": True, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Reports memory per million chunks and recall of compact vector storage options.
+
+Every option is compared with the current setup, a full-precision flat index of full-dimension
+vectors: shortened embeddings (the `dimensions` parameter of text-embedding-3 models truncates and
+re-normalizes the vectors, which is simulated here), fp16/8-bit scalar quantization and product
+quantization, with and without an exact re-rank of the top candidates.
+
+Vectors are synthetic (see `bench_ann_index.synthetic_vectors`) unless real embeddings are given
+with `--vectors-file`, a .npy float32 matrix, e.g. exported from the embedding cache. Synthetic
+vectors spread their information evenly over all dimensions, unlike text-embedding-3 vectors which
+are trained to keep most of it in the first ones: their recall with shortened dimensions is much
+lower than what real embeddings get, measure it on real vectors.
+
+Usage:
+    python -m benchmarks.bench_vector_storage --vectors 20000 --dimensions 3072 1024 256 --rerank 100
+"""
+import argparse
+import json
+import time
+
+import faiss
+import numpy as np
+
+from benchmarks.bench_ann_index import synthetic_vectors
+from benchmarks.fakes import FakeEmbeddings
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.index_factory import IndexConfig
+
+
+def shorten(vectors: np.ndarray, dimension: int) -> np.ndarray:
+    """Keeps the first `dimension` dimensions and re-normalizes, like the embeddings API does."""
+    short = np.ascontiguousarray(vectors[:, :dimension])
+    return short / np.linalg.norm(short, axis=1, keepdims=True)
+
+
+def measure(config: IndexConfig, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    dimension = vectors.shape[1]
+    index = FAISSIndex(dimension, FakeEmbeddings(dimension).get_embeddings, index_config=config)
+    start = time.perf_counter()
+    index.add_vectors(vectors, [""] * len(vectors))
+    index.train()
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    _, found = index.search_vectors(queries, k)
+    search_seconds = time.perf_counter() - start
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+    per_million = 1_000_000 / len(vectors)
+    return {
+        "dimension": dimension,
+        "index": index.index_config.factory_string(),
+        "rerank": config.rerank,
+        f"recall@{k}": round(float(recall), 4),
+        "memory_mb_per_million": round(faiss.serialize_index(index.index).nbytes * per_million / 2 ** 20, 1),
+        # Full-precision vectors and their IDs, memory-mapped: disk and page cache, not process memory
+        "rerank_disk_mb_per_million": round((dimension * 4 + 8) * 1_000_000 / 2 ** 20, 1) if config.rerank else 0,
+        "query_ms": round(search_seconds / len(queries) * 1000, 3),
+        "build_seconds": round(build_seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vectors", type=int, default=20_000)
+    parser.add_argument("--vectors-file", help="A .npy float32 matrix of real embeddings to use instead.")
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[3072, 1024, 256])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--rerank", type=int, default=100)
+    parser.add_argument("--pq-dims-per-byte", type=int, default=16,
+                        help="Dimensions encoded per PQ byte: pq_m = dimension / this value.")
+    args = parser.parse_args()
+
+    if args.vectors_file:
+        vectors = np.load(args.vectors_file).astype("float32")
+    else:
+        vectors = synthetic_vectors(args.vectors, max(args.dimensions))
+    vectors = shorten(vectors, min(max(args.dimensions), vectors.shape[1]))
+    rng = np.random.default_rng(2)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)]
+    queries = queries + 0.1 * rng.standard_normal(queries.shape).astype("float32")
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    # Ground truth: the current full-precision flat index over full-dimension vectors
+    flat = IndexConfig("flat").build(vectors.shape[1])
+    flat.add_with_ids(vectors, np.arange(len(vectors), dtype="int64"))
+    _, truth = flat.search(queries, args.k)
+
+    results = []
+    for dimension in sorted(args.dimensions, reverse=True):
+        short_vectors = shorten(vectors, dimension)
+        short_queries = shorten(queries, dimension)
+        pq_m = max(1, dimension // args.pq_dims_per_byte)
+        configs = [
+            IndexConfig("flat"),
+            IndexConfig("sq_fp16"),
+            IndexConfig("sq8"),
+            IndexConfig("sq8", rerank=args.rerank),
+            IndexConfig("pq", pq_m=pq_m),
+            IndexConfig("pq", pq_m=pq_m, rerank=args.rerank),
+        ]
+        for config in configs:
+            results.append(measure(config, short_vectors, short_queries, truth, args.k))
+            print(json.dumps(results[-1]))
+    print(json.dumps({"vectors": len(vectors), "baseline": f"Flat, dimension {vectors.shape[1]}",
+                      "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
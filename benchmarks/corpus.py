@@ -0,0 +1,74 @@
+"""Deterministic synthetic corpora for the benchmarks: texts, chunks and documents of every format."""
+import csv
+import os
+
+import numpy as np
+
+from benchmarks.bench_pdf_parsing import build_large_pdf
+
+
+VOCABULARY = [
+    "emissions", "scope", "carbon", "inventory", "reporting", "company", "energy", "organizational",
+    "boundaries", "operational", "control", "equity", "share", "greenhouse", "gas", "protocol", "standard",
+    "direct", "indirect", "purchased", "electricity", "value", "chain", "reduction", "target", "baseline",
+    "year", "verification", "accounting", "principles", "relevance", "completeness", "consistency",
+    "transparency", "accuracy", "the", "of", "and", "to", "in", "a", "for", "is", "that", "by", "with",
+]
+
+
+def synthetic_words(count: int, seed: int = 0) -> list[str]:
+    rng = np.random.default_rng(seed)
+    return [VOCABULARY[i] for i in rng.integers(0, len(VOCABULARY), count)]
+
+
+def synthetic_text(words: int, seed: int = 0, sentence_words: int = 12) -> str:
+    """Returns a text of about `words` words, in sentences."""
+    tokens = synthetic_words(words, seed)
+    sentences = [" ".join(tokens[i:i + sentence_words]).capitalize() + "." for i in range(0, len(tokens), sentence_words)]
+    return " ".join(sentences)
+
+
+def synthetic_chunks(count: int, words: int = 100, seed: int = 0) -> list[str]:
+    """Returns `count` distinct chunks of `words` words each."""
+    rng = np.random.default_rng(seed)
+    vocabulary = np.array(VOCABULARY)
+    indexes = rng.integers(0, len(VOCABULARY), (count, words))
+    return [" ".join(vocabulary[row]) + f" ({i})" for i, row in enumerate(indexes)]
+
+
+def write_documents(folder: str, pages: int = 100, words_per_page: int = 400) -> dict[str, str]:
+    """Writes one document of each supported format, of about `pages` pages, in a folder.
+
+    Returns:
+        dict: The path of the document of each format, by extension.
+    """
+    from docx import Document
+
+    paths = {}
+    pdf = build_large_pdf(pages)
+    paths["pdf"] = os.path.join(folder, "corpus.pdf")
+    os.replace(pdf, paths["pdf"])
+
+    texts = [synthetic_text(words_per_page, seed=page) for page in range(pages)]
+    document = Document()
+    for page, text in enumerate(texts):
+        document.add_heading(f"Section {page + 1}", level=2)
+        document.add_paragraph(text)
+    paths["docx"] = os.path.join(folder, "corpus.docx")
+    document.save(paths["docx"])
+
+    paths["html"] = os.path.join(folder, "corpus.html")
+    with open(paths["html"], "w", encoding="utf-8") as file:
+        file.write("<html><head><title>Corpus</title></head><body>\n")
+        for page, text in enumerate(texts):
+            file.write(f"<section><h2>Section {page + 1}</h2><p>{text}</p></section>\n")
+        file.write("</body></html>\n")
+
+    paths["csv"] = os.path.join(folder, "corpus.csv")
+    with open(paths["csv"], "w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["id", "category", "description"])
+        for page, text in enumerate(texts):
+            for row, sentence in enumerate(text.split(". ")):
+                writer.writerow([f"{page}-{row}", VOCABULARY[(page + row) % len(VOCABULARY)], sentence])
+    return paths
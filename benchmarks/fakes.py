@@ -0,0 +1,116 @@
+import hashlib
+import threading
+import time
+from types import SimpleNamespace
+from typing import Iterator
+
+import numpy as np
+
+from src.services.models.api_client import ResilientClient
+from src.services.models.llm import LLM
+from src.services.models.prompt_builder import PromptBuilder
+
+
+class FakeEmbeddings:
+    """Deterministic local stand-in for `Embeddings`, used by the benchmarks.
+
+    Each text maps to a unit vector seeded by its SHA-256 hash, so repeated runs produce the
+    same index. A fixed latency per request and per item simulates the network round trip, and
+    an optional limit on concurrent requests simulates a rate-limited endpoint.
+
+    Attributes:
+        dimension (int): The dimension of the generated embeddings.
+        model (str): A model name, mirroring `Embeddings.model`.
+        requests (int): Number of requests served so far.
+    """
+    def __init__(self, dimension: int = 3072, request_latency: float = 0.0, item_latency: float = 0.0,
+                 max_concurrent_requests: int | None = None):
+        self.dimension = dimension
+        self.model = "fake-embeddings"
+        self.request_latency = request_latency
+        self.item_latency = item_latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(max_concurrent_requests) if max_concurrent_requests else None
+
+    def _vector(self, text: str) -> np.ndarray:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dimension).astype("float32")
+        return vector / np.linalg.norm(vector)
+
+    def _wait(self, items: int):
+        with self._lock:
+            self.requests += 1
+        delay = self.request_latency + self.item_latency * items
+        if not delay:
+            return
+        if self._slots is None:
+            time.sleep(delay)
+            return
+        with self._slots:
+            time.sleep(delay)
+
+    def get_embeddings(self, text: str) -> list[float]:
+        self._wait(1)
+        return self._vector(text).tolist()
+
+    def get_embeddings_batch(self, texts: list[str]) -> list[list[float]]:
+        self._wait(len(texts))
+        return [self._vector(text).tolist() for text in texts]
+
+
+class FakeChatClient:
+    """Deterministic local stand-in for the chat completions API of an `AzureOpenAI` client.
+
+    The answer to a conversation is a sequence of words seeded by the hash of its messages. Each
+    word is one token: the first one arrives after `first_token_latency`, the next ones every
+    `token_latency`, streamed or not.
+
+    Attributes:
+        chat: Mirrors `client.chat.completions.create`.
+        tokens (int): Number of tokens of every answer.
+        requests (int): Number of requests served so far.
+    """
+    WORDS = ("scope", "emissions", "inventory", "boundary", "report", "the", "of", "and", "company", "energy")
+
+    def __init__(self, first_token_latency: float = 0.0, token_latency: float = 0.0, tokens: int = 40):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.requests = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def _answer(self, messages: list[dict]) -> list[str]:
+        text = "\n".join(message["content"] for message in messages)
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        indexes = np.random.default_rng(seed).integers(0, len(self.WORDS), self.tokens)
+        return [self.WORDS[i] + " " for i in indexes]
+
+    def _stream(self, words: list[str]) -> Iterator[SimpleNamespace]:
+        for i, word in enumerate(words):
+            time.sleep(self.first_token_latency if i == 0 else self.token_latency)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=word))])
+
+    def create(self, messages: list[dict], stream: bool = False, **params):
+        with self._lock:
+            self.requests += 1
+        words = self._answer(messages)
+        if stream:
+            return self._stream(words)
+        time.sleep(self.first_token_latency + self.token_latency * max(0, len(words) - 1))
+        message = SimpleNamespace(content="".join(words))
+        prompt_tokens = sum(len(message["content"]) // 4 for message in messages)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(words),
+                                total_tokens=prompt_tokens + len(words))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+class FakeLLM(LLM):
+    """`LLM` talking to a `FakeChatClient`: prompts are built as usual, nothing leaves the machine."""
+    def __init__(self, client: FakeChatClient | None = None, model_name: str = "gpt-4o"):
+        self.client = client or FakeChatClient()
+        # No limits: the fake client neither throttles nor fails
+        self.api = ResilientClient("fake_chat")
+        self.model_name = model_name
+        self.prompt_builder = PromptBuilder(model_name)
@@ -0,0 +1,249 @@
+"""Local stand-in for the Azure OpenAI chat completions and embeddings endpoints.
+
+Answers `.../chat/completions` (blocking or streamed as server-sent events) and `.../embeddings`
+requests with deterministic content and configurable latencies, so the app and the benchmarks can
+run offline. Point the clients at it with, for instance:
+
+    AZURE_LLM_ENDPOINT=http://127.0.0.1:8900 AZURE_EMBEDDINGS_ENDPOINT=http://127.0.0.1:8900
+
+Like Azure, it can enforce a tokens-per-minute quota, answering 429 with Retry-After headers
+beyond it, and it can inject random throttling, server errors and latency jitter to test the
+clients' resilience.
+
+Usage:
+    python -m benchmarks.stub_server --port 8900 --first-token-latency 0.3 --token-latency 0.02
+    python -m benchmarks.stub_server --port 8900 --tokens-per-minute 600000 --error-rate 0.05
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.fakes import FakeEmbeddings
+
+
+ANSWER = ("According to the provided context, the GHG Protocol Corporate Standard classifies emissions into "
+          "three scopes: direct emissions from owned or controlled sources (scope 1), indirect emissions from "
+          "purchased energy (scope 2) and all other indirect emissions in the value chain (scope 3).")
+
+
+class StubServer(ThreadingHTTPServer):
+    """HTTP server answering like the Azure OpenAI API.
+
+    Attributes:
+        first_token_latency (float): Seconds before the first token of a completion.
+        token_latency (float): Seconds between two tokens of a completion.
+        embeddings_latency (float): Seconds per embeddings request.
+        max_tokens (int): Maximum number of tokens of a completion, capped by the request's max_tokens.
+        tokens_per_minute (float | None): Quota of request tokens (prompt and max_tokens), None for no quota.
+        throttle_rate (float): Fraction of the requests answered 429 whatever the quota.
+        error_rate (float): Fraction of the requests answered 500.
+        latency_jitter (float): Maximum random seconds added to the latency of each request.
+        retry_after (float): Seconds of the Retry-After header of the random 429s.
+        requests (dict): Number of requests received, by endpoint, and of throttled and failed ones.
+    """
+    daemon_threads = True
+    # Many clients connect at once, the default backlog of 5 makes them retry their connection
+    request_queue_size = 256
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, first_token_latency: float = 0.3,
+                 token_latency: float = 0.02, embeddings_latency: float = 0.05, max_tokens: int = 800,
+                 dimension: int = 3072, tokens_per_minute: float | None = None, throttle_rate: float = 0.0,
+                 error_rate: float = 0.0, latency_jitter: float = 0.0, retry_after: float = 1.0):
+        super().__init__((host, port), StubHandler)
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.embeddings_latency = embeddings_latency
+        self.max_tokens = max_tokens
+        self.fake_embeddings = FakeEmbeddings(dimension=dimension)
+        self.tokens_per_minute = tokens_per_minute
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.latency_jitter = latency_jitter
+        self.retry_after = retry_after
+        self.requests = {"chat": 0, "embeddings": 0, "throttled": 0, "errors": 0}
+        self._lock = threading.Lock()
+        # Quota left, refilled continuously up to 10 seconds of quota, the window Azure enforces quotas on
+        self._quota = (tokens_per_minute or 0.0) / 6
+        self._quota_updated = time.monotonic()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def take_quota(self, tokens: int) -> float | None:
+        """Counts a request against the quota, returns the seconds to wait if it exceeds it."""
+        if not self.tokens_per_minute:
+            return None
+        rate = self.tokens_per_minute / 60
+        with self._lock:
+            now = time.monotonic()
+            self._quota = min(self.tokens_per_minute / 6, self._quota + (now - self._quota_updated) * rate)
+            self._quota_updated = now
+            if tokens <= self._quota:
+                self._quota -= tokens
+                return None
+            return (tokens - self._quota) / rate
+
+    def start(self) -> "StubServer":
+        """Serves in a background thread, returns the server."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server: StubServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        path = self.path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            self.server.count("chat")
+            tokens = self._prompt_tokens(request) + min(self.server.max_tokens, request.get("max_tokens") or 0)
+            if self._rejected(tokens):
+                return
+            self._chat(request)
+        elif path.endswith("/embeddings"):
+            self.server.count("embeddings")
+            if self._rejected(sum(len(text) // 4 for text in self._inputs(request))):
+                return
+            self._embeddings(request)
+        else:
+            self._send_json({"error": {"message": f"Unknown path {path}"}}, status=404)
+
+    def _rejected(self, tokens: int) -> bool:
+        """Answers with an injected failure, or a 429 beyond the quota. Tells whether it did."""
+        server = self.server
+        if server.latency_jitter:
+            time.sleep(random.uniform(0, server.latency_jitter))
+        if random.random() < server.error_rate:
+            server.count("errors")
+            self._send_json({"error": {"code": "InternalServerError", "message": "Injected failure"}}, status=500)
+            return True
+        wait = server.retry_after if random.random() < server.throttle_rate else server.take_quota(tokens)
+        if wait is None:
+            return False
+        server.count("throttled")
+        body = json.dumps({"error": {"code": "429", "message": "Rate limit exceeded, retry later"}}).encode("utf-8")
+        self.send_response(429)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        # Azure sends both, the milliseconds one is the precise delay
+        self.send_header("Retry-After", str(math.ceil(wait)))
+        self.send_header("retry-after-ms", str(int(wait * 1000)))
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    @staticmethod
+    def _inputs(request: dict) -> list[str]:
+        texts = request.get("input")
+        return [texts] if isinstance(texts, str) else texts
+
+    @staticmethod
+    def _prompt_tokens(request: dict) -> int:
+        return sum(len(m.get("content", "")) // 4 for m in request.get("messages", []))
+
+    def _tokens(self, request: dict) -> list[str]:
+        words = ANSWER.split(" ")
+        tokens = [word if i == 0 else " " + word for i, word in enumerate(words)]
+        limit = min(self.server.max_tokens, request.get("max_tokens") or self.server.max_tokens)
+        return (tokens * (limit // len(tokens) + 1))[:limit]
+
+    def _chat(self, request: dict):
+        tokens = self._tokens(request)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        base = {"id": completion_id, "created": int(time.time()), "model": request.get("model") or "stub"}
+        usage = {"prompt_tokens": self._prompt_tokens(request), "completion_tokens": len(tokens)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        time.sleep(self.server.first_token_latency)
+        if not request.get("stream"):
+            time.sleep(self.server.token_latency * (len(tokens) - 1))
+            self._send_json({**base, "object": "chat.completion", "usage": usage, "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "".join(tokens)},
+            }]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+        def send(payload):
+            self.wfile.write(f"data: {payload}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(self.server.token_latency)
+            delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+            send(json.dumps({**base, "object": "chat.completion.chunk",
+                             "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}))
+        send(json.dumps({**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send(json.dumps({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage}))
+        send("[DONE]")
+
+    def _embeddings(self, request: dict):
+        texts = self._inputs(request)
+        time.sleep(self.server.embeddings_latency)
+        dimension = request.get("dimensions") or self.server.fake_embeddings.dimension
+        vectors = [self.server.fake_embeddings._vector(text)[:dimension].tolist() for text in texts]
+        self._send_json({
+            "object": "list",
+            "model": request.get("model") or "stub",
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i, vector in enumerate(vectors)],
+            "usage": {"prompt_tokens": sum(len(text) // 4 for text in texts),
+                      "total_tokens": sum(len(text) // 4 for text in texts)},
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--embeddings-latency", type=float, default=0.05)
+    parser.add_argument("--dimension", type=int, default=3072)
+    parser.add_argument("--tokens-per-minute", type=float, default=None, help="Quota beyond which requests get 429s.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of requests answered 429.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 500.")
+    parser.add_argument("--latency-jitter", type=float, default=0.0, help="Maximum random latency added, in seconds.")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After of the random 429s, in seconds.")
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, first_token_latency=args.first_token_latency,
+                        token_latency=args.token_latency, embeddings_latency=args.embeddings_latency,
+                        dimension=args.dimension, tokens_per_minute=args.tokens_per_minute,
+                        throttle_rate=args.throttle_rate, error_rate=args.error_rate,
+                        latency_jitter=args.latency_jitter, retry_after=args.retry_after)
+    print(f"Stub Azure OpenAI server listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""Offline benchmark suite of ingestion and retrieval, reported as JSON.
+
+Nothing leaves the machine: embeddings come from `FakeEmbeddings` and answers from a `FakeLLM`,
+both deterministic, and the corpora are synthetic (see `benchmarks.corpus`), so two runs of the
+same commit measure the same work. Scenarios:
+
+    loaders: extraction throughput of a generated document of every format, through `Loader`.
+    chunking: throughput of `text_to_chunks` and of the page-streaming `iter_chunks_from_pages`.
+    index: for every corpus size in `--scales`, `ingest_text` throughput, `save_index` time and
+        size, `load_index` time (with and without `mmap`), `retrieve_chunks` latency
+        percentiles and end-to-end `rag_chatbot` latency with a zero-latency LLM.
+
+Every scenario, and every scale of the index scenario, runs in its own process, so that its peak
+RSS (`peak_rss_mb`) is measured alone. The report also records the commit, Python, FAISS and
+machine it ran on; with `--baseline`, the relative change of every figure since an earlier report
+is printed.
+
+The default vector dimension (256) is smaller than text-embedding-3-large's (3072) so that the
+1M-chunk scale fits in memory on a laptop: use `--dimension 3072` to measure the real footprint.
+
+Usage:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --scenarios index --scales 10000 --baseline results.json
+"""
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import faiss
+import numpy as np
+
+from benchmarks.corpus import synthetic_chunks, synthetic_text, write_documents
+from benchmarks.fakes import FakeEmbeddings, FakeLLM
+from src.ingestion.chunking.token_chunking import iter_chunks_from_pages, text_to_chunks
+from src.ingestion.loaders.loader import Loader
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.index_factory import IndexConfig
+from src.services.vectorial_db.snapshots import SnapshotStore
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+SCENARIOS = ("loaders", "chunking", "index")
+
+
+def peak_rss_mb() -> float | None:
+    """Returns the peak resident set size of the current process in MiB, None where unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB on Linux
+    return round(peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10, 1)
+
+
+def latency_stats(seconds: list[float]) -> dict:
+    milliseconds = np.array(seconds) * 1000
+    return {
+        "count": len(seconds),
+        "mean_ms": round(float(milliseconds.mean()), 3),
+        "p50_ms": round(float(np.percentile(milliseconds, 50)), 3),
+        "p95_ms": round(float(np.percentile(milliseconds, 95)), 3),
+        "p99_ms": round(float(np.percentile(milliseconds, 99)), 3),
+    }
+
+
+def folder_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def bench_loaders(pages: int) -> dict:
+    """Measures the extraction throughput of a document of every format."""
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for extension, path in write_documents(folder, pages).items():
+            size = os.path.getsize(path)
+            try:
+                start = time.perf_counter()
+                text = Loader(path, extension).extract_text()
+                seconds = time.perf_counter() - start
+            except (ValueError, NotImplementedError) as e:
+                results[extension] = {"status": "unsupported", "error": str(e) or type(e).__name__}
+                continue
+            results[extension] = {
+                "status": "ok",
+                "pages": pages,
+                "bytes": size,
+                "chars": len(text),
+                "seconds": round(seconds, 4),
+                "mb_per_second": round(size / 2 ** 20 / seconds, 3),
+                "pages_per_second": round(pages / seconds, 2),
+            }
+    return results
+
+
+def bench_chunking(words: int, words_per_page: int = 400) -> dict:
+    """Measures the chunking throughput of a synthetic text, whole and page by page."""
+    text = synthetic_text(words)
+    size = len(text.encode("utf-8"))
+
+    start = time.perf_counter()
+    chunks = text_to_chunks(text)
+    seconds = time.perf_counter() - start
+    results = {"text_to_chunks": {"chunks": len(chunks), "seconds": round(seconds, 4),
+                                  "mb_per_second": round(size / 2 ** 20 / seconds, 3),
+                                  "chunks_per_second": round(len(chunks) / seconds, 2)}}
+
+    tokens = text.split(" ")
+    pages = [(page + 1, " ".join(tokens[i:i + words_per_page]))
+             for page, i in enumerate(range(0, len(tokens), words_per_page))]
+    start = time.perf_counter()
+    count = sum(1 for _ in iter_chunks_from_pages(pages))
+    seconds = time.perf_counter() - start
+    results["iter_chunks_from_pages"] = {"chunks": count, "seconds": round(seconds, 4),
+                                         "mb_per_second": round(size / 2 ** 20 / seconds, 3),
+                                         "chunks_per_second": round(count / seconds, 2)}
+    return {"bytes": size, **results}
+
+
+def bench_index(chunks: int, dimension: int, chunk_words: int, queries: int, index_type: str) -> dict:
+    """Measures ingestion, persistence and retrieval of an index of `chunks` synthetic chunks."""
+    from main import rag_chatbot
+
+    embeddings = FakeEmbeddings(dimension)
+
+    def new_index() -> FAISSIndex:
+        return FAISSIndex(dimension, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch,
+                          index_config=IndexConfig(index_type))
+
+    texts = synthetic_chunks(chunks, chunk_words)
+    index = new_index()
+    start = time.perf_counter()
+    index.ingest_text(text_chunks=texts)
+    index.train()
+    ingest_seconds = time.perf_counter() - start
+    del texts
+    results = {"chunks": chunks, "dimension": dimension, "index": index.index_config.factory_string(),
+               "ingest": {"seconds": round(ingest_seconds, 3),
+                          "chunks_per_second": round(chunks / ingest_seconds, 2)}}
+
+    folder = tempfile.mkdtemp()
+    try:
+        path = os.path.join(folder, "faiss_index")
+        start = time.perf_counter()
+        index.save_index(path)
+        results["save"] = {"seconds": round(time.perf_counter() - start, 3),
+                           "mb": round(folder_size(SnapshotStore(path).current()[1]) / 2 ** 20, 2)}
+        del index
+
+        for mode, mmap in (("load", False), ("load_mmap", True)):
+            index = new_index()
+            start = time.perf_counter()
+            index.load_index(path, mmap=mmap)
+            results[mode] = {"seconds": round(time.perf_counter() - start, 4)}
+
+        # Distinct queries, so that no cache of any kind serves them
+        questions = [synthetic_text(12, seed=chunks + i) for i in range(queries)]
+        index.retrieve_chunks(questions[0])
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            index.retrieve_chunks(question)
+            latencies.append(time.perf_counter() - start)
+        results["retrieve_chunks"] = latency_stats(latencies)
+
+        llm = FakeLLM()
+        latencies = []
+        for question in questions:
+            start = time.perf_counter()
+            rag_chatbot(llm, question, [], index)
+            latencies.append(time.perf_counter() - start)
+        results["rag_chatbot"] = latency_stats(latencies)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def _run_in_child(function, kwargs: dict, verbose: bool) -> dict:
+    with contextlib.ExitStack() as stack:
+        if not verbose:
+            # The index and the LLM print progress for every call
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        results = function(**kwargs)
+    results["peak_rss_mb"] = peak_rss_mb()
+    return results
+
+
+def run_isolated(function, verbose: bool = False, **kwargs) -> dict:
+    """Runs a scenario in a fresh process, so that its peak RSS is its own."""
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(_run_in_child, function, kwargs, verbose).result()
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "faiss": faiss.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    """Returns the numeric figures of a report by dotted path, e.g. `index.10000.save.seconds`."""
+    figures = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            figures.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            figures[path] = value
+    return figures
+
+
+def compare(baseline: dict, report: dict) -> list[dict]:
+    """Lists the relative change of every figure found in both reports."""
+    before = flatten(baseline["results"])
+    after = flatten(report["results"])
+    return [{"figure": path, "baseline": before[path], "current": after[path],
+             "change_percent": round((after[path] - before[path]) / before[path] * 100, 1)}
+            for path in after if path in before and before[path]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--scales", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="Numbers of chunks of the indexes of the index scenario.")
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--chunk-words", type=int, default=100, help="Words per synthetic chunk.")
+    parser.add_argument("--index-type", choices=IndexConfig.TYPES, default="flat")
+    parser.add_argument("--queries", type=int, default=200, help="Queries timed per scale.")
+    parser.add_argument("--loader-pages", type=int, default=50, help="Pages of the documents of the loaders scenario.")
+    parser.add_argument("--chunking-words", type=int, default=200_000, help="Words of the chunking scenario text.")
+    parser.add_argument("--output", help="JSON file the report is written to, printed otherwise.")
+    parser.add_argument("--baseline", help="An earlier report to compare with.")
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the benchmarked code.")
+    args = parser.parse_args()
+
+    report = {"environment": environment(), "parameters": vars(args), "results": {}}
+    results = report["results"]
+    if "loaders" in args.scenarios:
+        results["loaders"] = run_isolated(bench_loaders, args.verbose, pages=args.loader_pages)
+        print(json.dumps({"loaders": results["loaders"]}), flush=True)
+    if "chunking" in args.scenarios:
+        results["chunking"] = run_isolated(bench_chunking, args.verbose, words=args.chunking_words)
+        print(json.dumps({"chunking": results["chunking"]}), flush=True)
+    if "index" in args.scenarios:
+        results["index"] = {}
+        for scale in args.scales:
+            results["index"][str(scale)] = run_isolated(
+                bench_index, args.verbose, chunks=scale, dimension=args.dimension, chunk_words=args.chunk_words,
+                queries=args.queries, index_type=args.index_type)
+            print(json.dumps({"index": {str(scale): results["index"][str(scale)]}}), flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"Report written to {args.output}")
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            changes = compare(json.load(file), report)
+        for change in changes:
+            print(f"{change['figure']}: {change['baseline']} -> {change['current']} ({change['change_percent']:+}%)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,30 +1,92 @@
+from __future__ import annotations
+
 from dotenv import load_dotenv
 load_dotenv(override=True)
 
-import faiss
-from openai import AzureOpenAI
-from src.services.models.embeddings import Embeddings
-from src.services.vectorial_db.faiss_index import FAISSIndex
-from src.ingestion.ingest_files import ingest_files_data_folder
-from src.services.models.llm import LLM
+# FAISS, OpenAI and the tokenizers take most of the startup time: they are imported by the
+# functions that need them, so the app can serve its UI before they are loaded
+from src.services.observability.telemetry import configure_logging, span
+import logging
 import os
-from dotenv import load_dotenv
-import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from src.services.models.llm import LLM
+    from src.services.serving.retriever import BatchedRetriever
+    from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_NOT_FOUND = "Index not found. Ingest the documents first with: python -m src.ingestion.ingest_files"
+
 
-def rag_chatbot(llm: LLM, input_text: str, history: list, index: FAISSIndex):
+def load_index(path: str = "./faiss_index", mmap: bool = True) -> FAISSIndex:
     """
-    Retrieves relevant information from the FAISS index, generates a response using the LLM, and manages the conversation history.
+    Creates the embeddings client and loads the saved FAISS index to answer questions. Documents are never ingested here, a missing index raises FileNotFoundError.
+    Sharded indexes are loaded as such, their shards searched on the servers of SHARD_ADDRESSES when set.
+    """
+    from src.services.models.embeddings import Embeddings
+    from src.services.models.embedding_cache import CachedEmbeddings
+    from src.services.vectorial_db.faiss_index import FAISSIndex
+    from src.services.vectorial_db.query_cache import QueryCache
+    from src.services.vectorial_db.sharded_index import ShardedFAISSIndex, is_sharded
+
+    embeddings = CachedEmbeddings.from_embeddings(Embeddings())
+    options = dict(dimension=embeddings.dimension, embeddings=embeddings.get_embeddings,
+                   batch_embeddings=embeddings.get_embeddings_batch, query_cache=QueryCache())
+    # SHARD_ADDRESSES ("host:port,host:port,...") searches the shards on shard servers instead of locally
+    shard_addresses = [address for address in os.getenv("SHARD_ADDRESSES", "").split(",") if address]
+    if shard_addresses or is_sharded(path):
+        index = ShardedFAISSIndex(shard_addresses=shard_addresses or None, **options)
+    else:
+        index = FAISSIndex(**options)
+    try:
+        index.load_index(path, mmap=mmap)
+    except FileNotFoundError:
+        raise FileNotFoundError(INDEX_NOT_FOUND) from None
+    return index
+
+
+def retrieve_context(input_text: str, index: FAISSIndex | BatchedRetriever, filter: dict | None = None) -> list[str]:
+    """
+    Retrieves the chunks relevant to the user input from the FAISS index, most relevant first, among the chunks matching `filter` (e.g. `{"file": "ghg-protocol-revised-glossary.pdf"}`) if given.
+    The LLM prompt builder de-overlaps them and fits them into the context token budget.
     """
-    # 1. Retrieve context from FAISS Index
     try:
-        retrieved_chunks = index.retrieve_chunks(query=input_text, num_chunks=5)
-        context = "\n".join(retrieved_chunks)
+        with span("retrieve"):
+            return index.retrieve_chunks(query=input_text, num_chunks=5, filter=filter)
     except Exception as e:
-        context = ""
-        print(f"Error retrieving context from FAISS: {e}")
+        logger.error("Error retrieving context from FAISS: %s", e)
+        return []
+
 
-    # 2. Pass retrieve context to the LLM along with history
-    ai_response = llm.get_response(history, context, input_text)
+def error_message(error: Exception) -> str:
+    """
+    Answer shown in place of the LLM's when it could not answer. The errors are logged by the callers.
+    """
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after is not None:
+        seconds = max(1, round(retry_after))
+        return f"The assistant is temporarily unavailable, please try again in {seconds} second{'s' if seconds > 1 else ''}."
+    return "I'm sorry, I encountered an error generating a response."
+
+
+def rag_chatbot(llm: LLM, input_text: str, history: list, index: FAISSIndex, filter: dict | None = None):
+    """
+    Retrieves relevant information from the FAISS index, generates a response using the LLM, and manages the conversation history.
+    With a `filter`, answers only from the chunks matching it.
+    """
+    with span("chat_turn", level=logging.INFO):
+        # 1. Retrieve context from FAISS Index
+        context = retrieve_context(input_text, index, filter)
+
+        # 2. Pass retrieve context to the LLM along with history
+        try:
+            ai_response = llm.get_response(history, context, input_text)
+        except Exception as e:
+            logger.error("Error generating response: %s", e)
+            ai_response = error_message(e)
 
     # 3. Update conversation history
     history.append({"role": "user", "content": input_text})
@@ -33,21 +95,40 @@ def rag_chatbot(llm: LLM, input_text: str, history: list, index: FAISSIndex):
     return ai_response, history
 
 
+def rag_chatbot_stream(llm: LLM, input_text: str, history: list, index: FAISSIndex | BatchedRetriever,
+                       filter: dict | None = None):
+    """
+    Streaming variant of `rag_chatbot`: yields the partial response and the updated history every time the LLM generates a new piece of the answer.
+    """
+    with span("chat_turn", level=logging.INFO, stream=True):
+        context = retrieve_context(input_text, index, filter)
+
+        history.append({"role": "user", "content": input_text})
+        assistant_message = {"role": "assistant", "content": ""}
+        # The LLM must not see the current turn in the history, it gets it with the context
+        previous_turns = history[:-1]
+        history.append(assistant_message)
+        try:
+            for delta in llm.stream_response(previous_turns, context, input_text):
+                assistant_message["content"] += delta
+                yield assistant_message["content"], history
+        except Exception as e:
+            logger.error("Error generating response: %s", e)
+            # Keep what was already streamed
+            separator = "\n\n" if assistant_message["content"] else ""
+            assistant_message["content"] += separator + error_message(e)
+            yield assistant_message["content"], history
+
+
 def main():
     """
     Main function to run the chatbot.
     """
-    # Initialize embeddings and FAISS index
-    embeddings = Embeddings()
-    index = FAISSIndex(embeddings=embeddings.get_embeddings)
+    from src.services.models.llm import LLM
 
-    # Load or create FAISS index
-    try:
-        index.load_index()
-    except FileNotFoundError:
-        print("Index not found. Ingesting documents...")
-        ingest_files_data_folder(index)
-        index.save_index()
+    configure_logging()
+    # Initialize embeddings and load the FAISS index, ingestion is a separate step
+    index = load_index()
 
     # Initialize LLM and history
     llm = LLM()
@@ -65,35 +146,3 @@ def main():
 
 if __name__ == "__main__":
     main()
-
-
-
-def main():
-    """Main function to run the chatbot."""
-
-    embeddings = Embeddings()
-    
-    index = FAISSIndex(embeddings=embeddings.get_embeddings)
-
-    try:
-        index.load_index()
-    except FileNotFoundError:
-        print("Nao encontrei o ficheiro")
-        raise ValueError("Index not found. You must ingest documents first.")
-
-
-    llm = LLM()
-    history = []
-    print("\n# INTIALIZED CHATBOT #")
-
-    while True:
-        user_input = str(input("You:  "))
-        if user_input.lower() == "exit":
-            break
-        response, history = rag_chatbot(llm, user_input, history, index)
-        print("inside while true")
-        print("AI: ", response)
-
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
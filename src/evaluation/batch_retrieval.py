@@ -0,0 +1,111 @@
+"""Runs many questions through retrieval, e.g. for offline evaluation or bulk question answering.
+
+Questions are streamed from a JSONL file (one JSON object per line, or one JSON string), results are
+written as JSONL in the same order: each input object with a `results` list of
+`{"id", "score", "chunk"}` dicts, closest chunk first.
+
+Usage:
+    python -m src.evaluation.batch_retrieval questions.jsonl results.jsonl --num-chunks 5 --workers 4
+"""
+import argparse
+import json
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator
+
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+def read_questions(path: str, field: str = "question") -> Iterator[dict]:
+    """Streams the records of a JSONL file of questions, skipping blank lines.
+
+    Args:
+        path (str): The JSONL file.
+        field (str, optional): The key holding the question in each object. Defaults to "question".
+
+    Yields:
+        dict: The records, plain strings being turned into `{field: string}`.
+    """
+    with open(path, encoding="utf-8") as file:
+        for number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {field: record}
+            if not isinstance(record.get(field), str):
+                raise ValueError(f"Line {number} of {path} has no '{field}' string")
+            yield record
+
+
+def retrieve_records(index: FAISSIndex, records: Iterable[dict], field: str = "question", num_chunks: int = 5,
+                     batch_size: int = 256, workers: int = 4, filter: dict | None = None) -> Iterator[dict]:
+    """Retrieves the chunks of a stream of question records, in batches handled in parallel.
+
+    At most `2 * workers` batches are read ahead, so memory stays bounded whatever the number of
+    questions, and results are yielded in input order.
+
+    Args:
+        index (FAISSIndex): The index to search.
+        records (Iterable[dict]): The question records.
+        field (str, optional): The key holding the question in each record. Defaults to "question".
+        num_chunks (int, optional): The number of chunks per question. Defaults to 5.
+        batch_size (int, optional): Number of questions per `retrieve_chunks_batch` call. Defaults to 256.
+        workers (int, optional): Number of batches retrieved at once. Defaults to 4.
+        filter (dict, optional): Only retrieves the chunks matching this filter, see `ChunkMetadata.select`.
+
+    Yields:
+        dict: Each record with its `results`.
+    """
+    records = iter(records)
+    pending: deque[tuple[list[dict], Future]] = deque()
+    with ThreadPoolExecutor(workers) as pool:
+        while True:
+            while len(pending) < 2 * workers:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                queries = [record[field] for record in batch]
+                pending.append((batch, pool.submit(index.retrieve_chunks_batch, queries, num_chunks, filter)))
+            if not pending:
+                return
+            batch, future = pending.popleft()
+            for record, results in zip(batch, future.result()):
+                yield {**record, "results": results}
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv(override=True)
+
+    from src.services.models.embeddings import Embeddings
+    from src.services.models.embedding_cache import CachedEmbeddings
+
+    parser = argparse.ArgumentParser(description="Retrieves the chunks of a JSONL file of questions.")
+    parser.add_argument("questions", help="JSONL file of questions.")
+    parser.add_argument("output", help="JSONL file the results are written to.")
+    parser.add_argument("--field", default="question", help="Key holding the question in each JSON object.")
+    parser.add_argument("--num-chunks", type=int, default=5, help="Number of chunks retrieved per question.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Number of questions searched at once.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of batches retrieved in parallel.")
+    parser.add_argument("--index-path", default="./faiss_index", help="Folder of the FAISS index.")
+    parser.add_argument("--filter", type=json.loads, default=None,
+                        help='JSON filter of the chunks searched, e.g. \'{"file": "ghg-protocol-revised-glossary.pdf"}\'.')
+    args = parser.parse_args()
+
+    embeddings = CachedEmbeddings.from_embeddings(Embeddings())
+    index = FAISSIndex(dimension=embeddings.dimension, embeddings=embeddings.get_embeddings,
+                       batch_embeddings=embeddings.get_embeddings_batch)
+    index.load_index(args.index_path, mmap=True)
+
+    start = time.perf_counter()
+    count = 0
+    with open(args.output, "w", encoding="utf-8") as output:
+        for result in retrieve_records(index, read_questions(args.questions, args.field), args.field,
+                                       args.num_chunks, args.batch_size, args.workers, args.filter):
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            count += 1
+    seconds = time.perf_counter() - start
+    print(f"Retrieved chunks for {count} questions in {seconds:.2f}s ({count / seconds if seconds else 0:.1f} questions/s)")
@@ -0,0 +1,235 @@
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import accumulate
+
+import tiktoken
+
+from src.services.models.tokenizer import get_encoding
+
+
+# Tokenizer of llama-index's TokenTextSplitter, whose chunks this engine reproduces
+SPLITTER_MODEL = "gpt-3.5-turbo"
+# Entries of the shared cache of token counts, cleared when full
+MAX_CACHED_COUNTS = 2_000_000
+
+
+@lru_cache(maxsize=None)
+def max_token_bytes(encoding: tiktoken.Encoding) -> int:
+    """Returns the length in bytes of the longest token of an encoding (128 for cl100k_base)."""
+    longest = 0
+    for token in range(encoding.n_vocab):
+        try:
+            longest = max(longest, len(encoding.decode_single_token_bytes(token)))
+        except KeyError:
+            # Unassigned token IDs
+            continue
+    return longest
+
+
+class TokenChunkEngine:
+    """Splits texts into overlapping chunks of at most `chunk_size` tokens.
+
+    The chunks are exactly those of llama-index's `TokenTextSplitter` with the same settings: the
+    text is broken into splits (words with their leading separator, then lines, then characters
+    for splits longer than a chunk), and consecutive splits are merged into chunks, each chunk
+    starting with the last splits of the previous one, up to `chunk_overlap` tokens.
+
+    It gets there much faster. Each distinct split is tokenized once, and its token count cached
+    for all the documents that follow. Chunk boundaries are computed on the arrays of split
+    offsets and token counts, and chunks are sliced from the original text rather than joined
+    from their splits. A text is only tokenized as a whole when it is short enough to fit in a
+    single chunk, which is checked with a bound on its length.
+
+    Attributes:
+        chunk_size (int): Maximum number of tokens per chunk.
+        chunk_overlap (int): Maximum number of tokens shared by consecutive chunks.
+        encoding (tiktoken.Encoding): The tokenizer counting the tokens.
+        separators (tuple[str, ...]): Separators of the splits, tried in order before characters.
+
+    Methods:
+        split(text): Returns the chunks of a text.
+        split_spans(text): Returns the start and end offsets of the chunks of a text.
+        split_spans_with_starts(text, whole): Returns the offsets of the chunks and of their first split.
+        split_batch(texts): Returns the chunks of several texts, tokenizing their splits together.
+    """
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 100, model_name: str = SPLITTER_MODEL,
+                 separators: tuple[str, ...] = (" ", "\n")):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Got a larger chunk overlap ({chunk_overlap}) than chunk size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding = get_encoding(model_name)
+        self.separators = separators
+        # Texts longer than this can't fit in a chunk, whatever their tokens
+        self._max_fitting_chars = chunk_size * max_token_bytes(self.encoding)
+        self._counts: dict[str, int] = {}
+
+    def _count_tokens(self, texts: list[str]) -> dict[str, int]:
+        """Tokenizes the texts whose token count is not cached yet, in parallel.
+
+        Returns:
+            dict: Token counts holding those of `texts`. Another thread may replace the cache
+                when it is full, so the counts must be read from this dict.
+        """
+        counts = self._counts
+        missing = list({text for text in texts if text not in counts})
+        if not missing:
+            return counts
+        if len(counts) + len(missing) > MAX_CACHED_COUNTS:
+            counts = self._counts = {}
+        # Special tokens are encoded as such, like the splitter's tokenizer does
+        for text, tokens in zip(missing, self.encoding.encode_batch(missing, allowed_special="all")):
+            counts[text] = len(tokens)
+        return counts
+
+    def _fitting_count(self, text: str) -> int | None:
+        """Returns the number of tokens of a text if it fits in a chunk, None otherwise."""
+        if len(text) > self._max_fitting_chars:
+            return None
+        count = self._count_tokens([text])[text]
+        return count if count <= self.chunk_size else None
+
+    def _splits(self, text: str, start: int, end: int, out: list[tuple[int, int, int]]):
+        """Appends the (start, end, tokens) of the splits of text[start:end] to `out`."""
+        count = self._fitting_count(text[start:end])
+        if count is not None:
+            out.append((start, end, count))
+            return
+        self._split_parts(text, start, end, out)
+
+    def _split_parts(self, text: str, start: int, end: int, out: list[tuple[int, int, int]],
+                     continued: bool = False):
+        """Appends the splits of text[start:end], taken as longer than a chunk, to `out`.
+
+        A `continued` text is the end of a longer one, starting at one of its splits: a single
+        split, after its separator, is split the way the longer text was.
+        """
+        piece = text[start:end]
+        for separator in self.separators:
+            parts = piece.split(separator)
+            if len(parts) > 1 and (parts[0] or len(parts) > 2 or continued):
+                break
+        else:
+            counts = self._count_tokens(list(piece))
+            out.extend((i, i + 1, counts[char]) for i, char in zip(range(start, end), piece))
+            return
+        # Every split but the first one starts with the separator, an empty first split is dropped
+        splits = [separator + part for part in parts[1:]]
+        if parts[0]:
+            splits.insert(0, parts[0])
+        counts = self._count_tokens(splits)
+        split_counts = list(map(counts.__getitem__, splits))
+        offsets = list(accumulate(map(len, splits), initial=start))
+        if max(split_counts) <= self.chunk_size:
+            # Usual case, no split longer than a chunk
+            out.extend(zip(offsets[:-1], offsets[1:], split_counts))
+            return
+        for split_start, split_end, count in zip(offsets[:-1], offsets[1:], split_counts):
+            if count <= self.chunk_size:
+                out.append((split_start, split_end, count))
+            else:
+                self._splits(text, split_start, split_end, out)
+
+    def _merge(self, text: str, splits: list[tuple[int, int, int]]) -> list[tuple[int, int, int]]:
+        """Merges consecutive splits into chunks, returns the offsets of the stripped chunks and of their first split."""
+        chunks = []
+
+        def emit(first: int, last: int):
+            if last < first:
+                return
+            start, end = splits[first][0], splits[last][1]
+            chunk = text[start:end]
+            stripped = chunk.strip()
+            if stripped:
+                chunk_start = start + len(chunk) - len(chunk.lstrip())
+                chunks.append((chunk_start, chunk_start + len(stripped), start))
+
+        # Token count of the splits before each split: a chunk of the splits first..last has
+        # totals[last + 1] - totals[first] tokens. Every split has at least one token.
+        totals = list(accumulate((count for _, _, count in splits), initial=0))
+        first = 0
+        while True:
+            # Add splits until the next one would exceed the chunk size
+            end = bisect_right(totals, totals[first] + self.chunk_size) - 1
+            if end >= len(splits):
+                break
+            emit(first, end - 1)
+            # Drop splits from the start until the rest fits in the overlap, and leaves room for the next split
+            first = bisect_left(totals, max(totals[end] - self.chunk_overlap,
+                                            totals[end + 1] - self.chunk_size), first)
+        emit(first, len(splits) - 1)
+        return chunks
+
+    def split_spans(self, text: str) -> list[tuple[int, int]]:
+        """Returns the chunks of a text as (start, end) offsets: each chunk is text[start:end].
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            list[tuple[int, int]]: The offsets of the chunks, in text order.
+        """
+        return [(start, end) for start, end, _ in self.split_spans_with_starts(text)]
+
+    def split_spans_with_starts(self, text: str, whole: bool = True) -> list[tuple[int, int, int]]:
+        """Returns the chunks of a text as (start, end, split_start) offsets.
+
+        `split_start` is where the first split of the chunk starts, separators included: the text
+        from there splits into the same splits, and so the same chunks, as the full text does from
+        that chunk on. Texts streamed in windows are restarted there.
+
+        Args:
+            text (str): The text to split.
+            whole (bool, optional): False when `text` is the end of a longer text, which is then
+                never taken as a single split, even when it would fit in a chunk. Defaults to True.
+
+        Returns:
+            list[tuple[int, int, int]]: The offsets of the chunks and of their first split, in text order.
+        """
+        splits = []
+        if whole:
+            self._splits(text, 0, len(text), splits)
+        else:
+            self._split_parts(text, 0, len(text), splits, continued=True)
+        return self._merge(text, splits)
+
+    def split(self, text: str) -> list[str]:
+        """Returns the chunks of a text.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            list[str]: The chunks, stripped of surrounding whitespace. Like `TokenTextSplitter`,
+                an empty text gives a single empty chunk.
+        """
+        if text == "":
+            return [text]
+        return [text[start:end] for start, end in self.split_spans(text)]
+
+    def split_batch(self, texts: list[str]) -> list[list[str]]:
+        """Returns the chunks of several texts.
+
+        The words of all the texts are tokenized together, in parallel, before any is split.
+
+        Args:
+            texts (list[str]): The texts to split.
+
+        Returns:
+            list[list[str]]: The chunks of each text, in input order.
+        """
+        separator = self.separators[0]
+        splits = []
+        for text in texts:
+            if len(text) > self._max_fitting_chars:
+                parts = text.split(separator)
+                splits.append(parts[0])
+                splits.extend(separator + part for part in parts[1:])
+        self._count_tokens(splits)
+        return [self.split(text) for text in texts]
+
+
+@lru_cache(maxsize=None)
+def get_chunk_engine(chunk_size: int = 500, chunk_overlap: int = 100) -> TokenChunkEngine:
+    """Returns the shared engine of these settings, so its tokenizer and token counts are reused."""
+    return TokenChunkEngine(chunk_size, chunk_overlap)
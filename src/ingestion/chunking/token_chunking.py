@@ -1,10 +1,15 @@
-from llama_index.core.node_parser import TokenTextSplitter
-from llama_index.core import Document
 from src.ingestion.chunking.chunking_base import ChunkingBase
-from llama_index.core import SimpleDirectoryReader
+from src.ingestion.chunking.chunk_engine import get_chunk_engine
+from bisect import bisect_right
+import logging
+from typing import Iterable, Iterator
 
+from src.services.models.batching import estimate_tokens
+from src.services.observability.telemetry import span
 
 
+logger = logging.getLogger(__name__)
+
 
 class TokenChunking(ChunkingBase):
     def __init__(self):
@@ -12,12 +17,10 @@ class TokenChunking(ChunkingBase):
         self.DEFAULT_CHUNK_OVERLAP=100
     
     def _text_splitter(self):
-        print("Running token chunker...")        
-        splitter = TokenTextSplitter(
-            chunk_size=self.DEFAULT_CHUNK_SIZE,
-            chunk_overlap=self.DEFAULT_CHUNK_OVERLAP
-        )
-        chunks = splitter.split_text(self.text)
+        logger.debug("Running token chunker", extra={"chars": len(self.text)})
+        # Same chunks as llama-index's TokenTextSplitter, tokenizer and token counts are shared between calls
+        engine = get_chunk_engine(self.DEFAULT_CHUNK_SIZE, self.DEFAULT_CHUNK_OVERLAP)
+        chunks = engine.split(self.text)
         return chunks
     
     def get_chunks_lenght(self):
@@ -46,5 +49,81 @@ def text_to_chunks(text: str, chunk_size:int = 512) -> list[str]:
     """
     #TODO Find a better way to chunk
     chunker = TokenChunking()
-    chunks = chunker.get_chunks_from_text(text)
-    return chunks
\ No newline at end of file
+    with span("chunk", chars=len(text)):
+        chunks = chunker.get_chunks_from_text(text)
+    return chunks
+
+
+def texts_to_chunks(texts: list[str]) -> list[list[str]]:
+    """Splits several texts into chunks, the same as `text_to_chunks` on each of them.
+
+    The words of all the texts are tokenized together, which is faster than one text at a time.
+
+    Args:
+        texts (list[str]): The texts to split into chunks.
+
+    Returns:
+        list: The chunks of each text, in input order.
+    """
+    chunker = TokenChunking()
+    engine = get_chunk_engine(chunker.DEFAULT_CHUNK_SIZE, chunker.DEFAULT_CHUNK_OVERLAP)
+    with span("chunk", chars=sum(len(text) for text in texts), texts=len(texts)):
+        return engine.split_batch(texts)
+
+
+def iter_chunks_from_pages(pages: Iterable[tuple[int, str]], window_chunks: int = 16) -> Iterator[tuple[str, int, int]]:
+    """Splits streamed pages into chunks incrementally.
+
+    Pages are accumulated in a window of about `window_chunks` chunks. Once the window is full it is
+    split, every chunk but the last one is emitted, and the window restarts where the first split
+    of the last chunk starts, separators included, so chunk overlaps and token counts are
+    preserved across windows. Memory stays bounded by the window size whatever the document
+    length, and chunks are available before the whole document is parsed.
+    The chunks are the same as the ones of `text_to_chunks` on the whole text.
+
+    Args:
+        pages (Iterable[tuple[int, str]]): Page numbers and page texts, as yielded by `LoaderBase.iter_pages`.
+        window_chunks (int): Approximate number of chunks split at once (default is 16).
+
+    Yields:
+        tuple[str, int, int]: The chunk text with the first and last page it spans.
+    """
+    chunker = TokenChunking()
+    engine = get_chunk_engine(chunker.DEFAULT_CHUNK_SIZE, chunker.DEFAULT_CHUNK_OVERLAP)
+    window_tokens = window_chunks * chunker.DEFAULT_CHUNK_SIZE
+    buffer = ""
+    # Offset in the buffer where each page starts, with its page number
+    starts: list[int] = []
+    page_numbers: list[int] = []
+
+    def page_at(offset: int) -> int:
+        return page_numbers[max(0, bisect_right(starts, offset) - 1)]
+
+    restarted = False
+
+    def split(final: bool):
+        nonlocal buffer, starts, page_numbers, restarted
+        spans = engine.split_spans_with_starts(buffer, whole=not restarted)
+        if not final and len(spans) < 2:
+            return
+        emitted = len(spans) if final else len(spans) - 1
+        for start, end, _ in spans[:emitted]:
+            yield buffer[start:end], page_at(start), page_at(max(end - 1, start))
+        if not final:
+            # Restart where the first split of the last chunk starts, its separators included, so
+            # the splits from there on (and their token counts) are those of the whole text
+            keep = spans[-1][2]
+            buffer = buffer[keep:]
+            restarted = True
+            first = max(0, bisect_right(starts, keep) - 1)
+            starts = [0] + [start - keep for start in starts[first + 1:]]
+            page_numbers = page_numbers[first:]
+
+    for page_number, text in pages:
+        starts.append(len(buffer))
+        page_numbers.append(page_number)
+        buffer += " " + text
+        if estimate_tokens(buffer) >= window_tokens:
+            yield from split(final=False)
+    if buffer.strip():
+        yield from split(final=True)
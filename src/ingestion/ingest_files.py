@@ -1,28 +1,222 @@
+import argparse
+import hashlib
+import logging
 import os
+from src.services.vectorial_db.dedup import ChunkDeduplicator
 from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.ingestion.journal import IngestionJournal
 from src.ingestion.loaders.loader import Loader
+from src.ingestion.pipeline import IngestionPipeline
+from src.services.vectorial_db.index_factory import IndexConfig
+from src.services.vectorial_db.sharded_index import PARTITIONS, ShardedFAISSIndex, is_sharded
+from src.services.observability.telemetry import span
+
+
+logger = logging.getLogger(__name__)
 
 
 DATA_FOLDER = 'data'
+MANIFEST_VERSION = 1
+
+
+def file_sha256(filepath: str) -> str:
+    """Returns the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scan_data_folder(data_folder: str = DATA_FOLDER) -> dict:
+    """Lists the files of the data folder and its subfolders with their size and modification time.
+
+    Hidden files and folders, and files of formats no loader supports, are skipped.
+
+    Args:
+        data_folder (str, optional): The folder to scan. Defaults to 'data'.
+
+    Returns:
+        dict: File stats by path relative to the data folder, with '/' separators, in sorted order.
+    """
+    files = {}
+    for folder, folders, names in os.walk(data_folder):
+        # Sorted in place, so os.walk descends in order
+        folders[:] = sorted(name for name in folders if not name.startswith("."))
+        for name in sorted(names):
+            if name.startswith("."):
+                continue
+            filepath = os.path.join(folder, name)
+            file = os.path.relpath(filepath, data_folder).replace(os.sep, "/")
+            if os.path.splitext(name)[1][1:].lower() not in Loader.EXTENSIONS:
+                logger.debug("Skipping unsupported file %s", file)
+                continue
+            stat = os.stat(filepath)
+            files[file] = {"size": stat.st_size, "mtime": stat.st_mtime}
+    return dict(sorted(files.items()))
+
+
+def ingest_files_data_folder(index: FAISSIndex, data_folder: str = DATA_FOLDER, parse_workers: int | None = None,
+                             embed_concurrency: int = 4, pdf_workers: int = 1, journal: IngestionJournal | None = None):
+    """Ingests the files in the data folder and its subfolders into the FAISS index.
 
-def ingest_files_data_folder(index: FAISSIndex):
-    """Ingests all files in the data folder into the FAISS index."""
-    for file in os.listdir(DATA_FOLDER):
-        if os.path.isdir(os.path.join(DATA_FOLDER, file)):
-            # ignore directories
+    Only new or changed files are parsed and embedded. The manifest stored with the index records
+    the size, modification time, content hash and vector IDs of every ingested file: the vectors
+    of deleted or changed files are removed from the index, unless other files share them. With
+    the index's `dedup`, chunks duplicating stored ones are not embedded again. Changes are applied to the in-memory
+    index, they reach the disk atomically with the next `index.save_index()`.
+
+    Files go through an `IngestionPipeline`, which parses them in parallel while embedding others.
+    With a `journal`, the run is checkpointed as it goes: a run interrupted (crash, API outage,
+    Ctrl-C) resumes from the journal, without parsing or embedding again the files it finished.
+    The journal must be cleared once the index is saved.
+
+    Args:
+        index (FAISSIndex): The index to update, empty or loaded from disk.
+        data_folder (str, optional): The folder holding the documents. Defaults to 'data'.
+        parse_workers (int, optional): Number of parsing processes. Defaults to the number of CPUs.
+        embed_concurrency (int, optional): Maximum number of concurrent embeddings requests. Defaults to 4.
+        pdf_workers (int, optional): Number of processes splitting a single large PDF into page ranges. Defaults to 1.
+        journal (IngestionJournal, optional): Journal the run is recorded in, and resumed from. Defaults to None.
+
+    Returns:
+        ThroughputReport: Throughput figures of the embedded files.
+    """
+    manifest = index.manifest if index.manifest.get("version") == MANIFEST_VERSION else {}
+    known = manifest.get("files", {})
+    if not manifest and index.chunks:
+        # Index built without a manifest: its vectors cannot be traced back to files, rebuild it
+        logger.warning("Index has no manifest, rebuilding it from scratch")
+        if index.supports_removal:
+            index.remove_ids(list(index.chunks))
+        else:
+            index.reset()
+    current = scan_data_folder(data_folder)
+    files = {}
+    to_ingest = []
+    for file, stat in current.items():
+        entry = known.get(file)
+        if entry and entry["size"] == stat["size"] and entry["mtime"] == stat["mtime"]:
+            files[file] = entry
             continue
-        loader = Loader(extension=file.split(".")[-1], filepath=os.path.join(DATA_FOLDER, file))
-        text = loader.extract_text()
-        print(f"Ingesting {file}")
-        index.ingest_text(text=text)
+        sha256 = file_sha256(os.path.join(data_folder, file))
+        if entry and entry["sha256"] == sha256:
+            # Touched but identical content, keep its vectors
+            files[file] = {**entry, **stat}
+            continue
+        files[file] = {**stat, "sha256": sha256, "ids": []}
+        to_ingest.append(file)
+
+    stale = [file for file in known if file not in files or file in to_ingest]
+    if stale and not index.supports_removal:
+        logger.info("%s indexes don't support removing vectors, rebuilding the index", index.index_config.index_type)
+        index.reset()
+        files = {file: {**entry, "ids": []} for file, entry in files.items()}
+        to_ingest = list(files)
+        known = {}
+        stale = []
+    for file in stale:
+        # Chunks also found in other documents are kept for them
+        removed = index.remove_document(os.path.join(data_folder, file), known[file]["ids"])
+        logger.info("Removed chunks", extra={"file": file, "chunks": removed})
+
+    paths = {file: os.path.join(data_folder, file) for file in to_ingest}
+    resumed, done, skip = {}, set(), {}
+    if journal is not None:
+        resumed = journal.resume(index, [(paths[file], files[file]["sha256"]) for file in to_ingest])
+        done = {path for path, cursor in journal.files.items() if cursor["done"]}
+        skip = {path: cursor["chunks"] for path, cursor in journal.files.items() if not cursor["done"]}
+    pipeline = IngestionPipeline(index, parse_workers=parse_workers, embed_concurrency=embed_concurrency,
+                                 pdf_workers=pdf_workers, journal=journal)
+    try:
+        with span("ingest", level=logging.INFO, files=len(to_ingest) - len(done)):
+            ids = pipeline.run([paths[file] for file in to_ingest if paths[file] not in done], skip=skip)
+    finally:
+        if journal is not None:
+            # What was ingested before an error or an interruption is kept for the next run
+            journal.checkpoint()
+    for file in to_ingest:
+        files[file]["ids"] = resumed.get(paths[file], []) + ids.get(paths[file], [])
+    total = pipeline.report
+    logger.info("Ingestion finished: %s", pipeline.summary(),
+                extra={"ingested_files": len(to_ingest), "resumed_files": len(done), "removed_files": len(stale),
+                       "resumed_chunks": sum(len(chunk_ids) for chunk_ids in resumed.values()),
+                       "unchanged_files": len(files) - len(to_ingest), **total.as_dict()})
+
+    index.manifest = {"version": MANIFEST_VERSION, "files": files}
+    return total
+
 
 if __name__ == "__main__":
     from dotenv import load_dotenv
     load_dotenv(override=True)
-    
+
     from src.services.models.embeddings import Embeddings
-    
-    embeddings = Embeddings()
-    index = FAISSIndex(embeddings=embeddings.get_embeddings)    
-    ingest_files_data_folder(index)
-    index.save_index()
\ No newline at end of file
+    from src.services.models.embedding_cache import CachedEmbeddings
+    from src.services.observability.telemetry import configure_logging
+
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Ingests the data folder into the FAISS index.")
+    parser.add_argument("--full", action="store_true", help="Rebuild the index from scratch instead of updating it.")
+    parser.add_argument("--parse-workers", type=int, default=None, help="Number of parsing processes.")
+    parser.add_argument("--embed-concurrency", type=int, default=4, help="Maximum concurrent embeddings requests.")
+    parser.add_argument("--pdf-workers", type=int, default=1, help="Processes splitting a single large PDF into page ranges.")
+    parser.add_argument("--index-type", choices=IndexConfig.TYPES, default="flat",
+                        help="Type of FAISS index, used when the index is built from scratch.")
+    parser.add_argument("--nlist", type=int, default=1024, help="Number of inverted lists of the IVF indexes.")
+    parser.add_argument("--nprobe", type=int, default=16, help="Number of inverted lists scanned per query.")
+    parser.add_argument("--pq-m", type=int, default=64, help="Number of PQ sub-quantizers (bytes per vector) of pq and ivf_pq indexes.")
+    parser.add_argument("--hnsw-m", type=int, default=32, help="Number of neighbours per HNSW node.")
+    parser.add_argument("--ef-search", type=int, default=64, help="HNSW candidate list size while searching.")
+    parser.add_argument("--rerank", type=int, default=0,
+                        help="Candidates re-ranked exactly with the full-precision vectors (compressed index types).")
+    parser.add_argument("--compress-chunks", action="store_true", help="Save chunks in zlib-compressed blocks.")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="Number of shards the vectors are partitioned over, used when the index is built from scratch.")
+    parser.add_argument("--partition", choices=PARTITIONS, default="hash",
+                        help="Spread the vectors over the shards by hash of their ID, or keep each document on one shard.")
+    parser.add_argument("--no-dedup", action="store_true", help="Embed and store duplicate chunks too.")
+    parser.add_argument("--near-duplicate-threshold", type=float, default=0.9,
+                        help="Estimated word-shingle Jaccard similarity above which a chunk is a near duplicate, "
+                             "0 only skips exact duplicates.")
+    parser.add_argument("--keep-snapshots", type=int, default=2,
+                        help="Most recent index snapshots kept on disk, for the serving processes still using them.")
+    parser.add_argument("--journal", default="./ingestion_journal",
+                        help="Folder of the journal an interrupted ingestion resumes from.")
+    parser.add_argument("--checkpoint-chunks", type=int, default=10_000, help="Chunks ingested between two checkpoints.")
+    parser.add_argument("--checkpoint-seconds", type=float, default=60.0, help="Seconds between two checkpoints.")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore the journal of an interrupted ingestion.")
+    args = parser.parse_args()
+
+    index_config = IndexConfig(index_type=args.index_type, nlist=args.nlist, nprobe=args.nprobe, pq_m=args.pq_m,
+                               hnsw_m=args.hnsw_m, ef_search=args.ef_search, rerank=args.rerank)
+    embeddings = CachedEmbeddings.from_embeddings(Embeddings())
+    options = dict(dimension=embeddings.dimension, embeddings=embeddings.get_embeddings,
+                   batch_embeddings=embeddings.get_embeddings_batch,
+                   index_config=index_config, compress_chunks=args.compress_chunks,
+                   dedup=None if args.no_dedup else ChunkDeduplicator(args.near_duplicate_threshold or None))
+    if args.shards > 1 or (not args.full and is_sharded("./faiss_index")):
+        # A saved sharded index keeps its shards and partitioning
+        index = ShardedFAISSIndex(num_shards=args.shards, partition=args.partition, **options)
+    else:
+        index = FAISSIndex(**options)
+    if not args.full:
+        try:
+            index.load_index()
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            # The embeddings dimension changed, none of the stored vectors can be reused
+            logger.warning("%s, rebuilding it from scratch", e)
+    journal = IngestionJournal(args.journal, checkpoint_chunks=args.checkpoint_chunks,
+                               checkpoint_seconds=args.checkpoint_seconds)
+    if args.no_resume:
+        journal.clear()
+    try:
+        ingest_files_data_folder(index, parse_workers=args.parse_workers, embed_concurrency=args.embed_concurrency,
+                                 pdf_workers=args.pdf_workers, journal=journal)
+    finally:
+        journal.close()
+    # Compacts the journal into a snapshot of the index, it is no longer needed once published
+    index.save_index(keep_snapshots=args.keep_snapshots)
+    journal.clear()
@@ -0,0 +1,288 @@
+import json
+import logging
+import os
+import shutil
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.snapshots import fsync_dir
+
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 1
+HEADER_FILE = "journal.json"
+RECORDS_FILE = "records.bin"
+PROGRESS_FILE = "progress.json"
+# Before every record: CRC-32 of the record, then the lengths of its JSON and vectors parts
+RECORD_HEADER = struct.Struct("<IIQ")
+
+
+def write_json_atomic(path: str, data: dict):
+    """Writes a JSON file through a temporary file and a rename, so it is either the old or the new one after a crash."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    fsync_dir(os.path.dirname(path) or ".")
+
+
+def journal_header(index: FAISSIndex) -> dict:
+    """Returns what an ingestion run starts from: a journal only resumes a run started from the same state."""
+    return {
+        "version": JOURNAL_VERSION,
+        "base_snapshot": index.snapshot,
+        "next_id": index.next_id,
+        "dimension": index.dimension,
+        "index_type": index.index_config.index_type,
+        "dedup": None if index.dedup is None else {"threshold": index.dedup.threshold},
+    }
+
+
+class IngestionJournal:
+    """Append-only journal of an ingestion run, checkpointed so an interrupted run resumes where it stopped.
+
+    The ingestion pipeline records everything it applies to the index, in order: the chunks added
+    with their vectors, pages and IDs, the duplicates recorded as references, and the metadata of
+    every finished document. Records are appended to `records.bin`, each with a CRC-32.
+
+    Every `checkpoint_chunks` chunks or `checkpoint_seconds` seconds, the records are flushed to
+    disk and `progress.json` is replaced atomically. It holds the length of the durable part of
+    the journal and the cursor of every file: its content hash, the number of its chunks applied,
+    and whether it is done. Checkpoints are only taken between two segments of chunks, where the
+    chunks applied of a file are exactly its first ones, so a cursor is a single count.
+
+    A re-run from the same index (same snapshot and next ID, see `journal_header`) replays the
+    journal into the index, up to the last checkpoint and for the files unchanged since, in the
+    same order, so the chunks get the same IDs. Files done are neither parsed nor embedded again.
+    The file interrupted is parsed again, but only its chunks past the cursor are embedded. The
+    journal is deleted once the index, which holds everything it recorded, is saved: saving is
+    the compaction of the journal into the normal index format.
+
+        ingestion_journal/
+            journal.json        state of the index the run started from
+            records.bin         append-only records
+            progress.json       durable length of records.bin and cursor of every file
+
+    Attributes:
+        path (str): The journal folder.
+        checkpoint_chunks (int): Chunks applied between two checkpoints, at most.
+        checkpoint_seconds (float): Seconds between two checkpoints, at most.
+        header (dict): The state of the index the run started from.
+        files (dict): The cursor of every file of the journal as of the last segment finished, by path.
+        checkpoints (int): Number of checkpoints written.
+
+    Methods:
+        resume(index, plan): Replays the journal of an interrupted run into the index, or starts a new journal.
+        add(document, chunks, vectors, pages, ids): Records chunks added to the index.
+        references(document, ids, pages): Records duplicates found in a document.
+        end(document, metadata): Records the end of a document.
+        segment_done(): Marks that every chunk received so far was recorded, checkpoints when it's time.
+        checkpoint(): Makes the journal durable up to the last segment finished.
+        clear(): Deletes the journal.
+        close(): Closes the records file.
+    """
+    def __init__(self, path: str = r"./ingestion_journal", checkpoint_chunks: int = 10_000,
+                 checkpoint_seconds: float = 60.0):
+        """
+        Args:
+            path (str, optional): The journal folder. Defaults to r"./ingestion_journal".
+            checkpoint_chunks (int, optional): Chunks applied between two checkpoints, at most. Defaults to 10_000.
+            checkpoint_seconds (float, optional): Seconds between two checkpoints, at most. Defaults to 60.0.
+        """
+        self.path = path
+        self.checkpoint_chunks = checkpoint_chunks
+        self.checkpoint_seconds = checkpoint_seconds
+        self.header: dict = {}
+        self.files: dict[str, dict] = {}
+        self.checkpoints = 0
+        self._hashes: dict[str, str] = {}
+        self._records = None
+        self._offset = 0
+        # Chunks recorded per file, and documents ended, since the last segment finished
+        self._pending: dict[str, int] = {}
+        self._ended: list[str] = []
+        self._clean_offset = 0
+        self._durable_offset = 0
+        self._chunks_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _read_json(self, name: str) -> dict | None:
+        try:
+            with open(self._file(name), encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def resume(self, index: FAISSIndex, plan: list[tuple[str, str]]) -> dict[str, list[int]]:
+        """Replays the journal of an interrupted run into the index, or starts a new journal.
+
+        The journal is replayed when it was started from the state the index is in now, for the
+        files at the start of `plan` it recorded, with the same content. The rest of the journal
+        is dropped, and the whole of it when the index changed meanwhile.
+
+        Args:
+            index (FAISSIndex): The index about to be ingested into, stale files already removed.
+            plan (list[tuple[str, str]]): The path and SHA-256 of the files to ingest, in order.
+
+        Returns:
+            dict: The IDs of the chunks replayed for every file, by path. Their cursors are in
+                `files`: files done need no ingestion, the others must skip their first chunks.
+
+        Raises:
+            ValueError: If the durable part of the journal is corrupted.
+        """
+        self._hashes = dict(plan)
+        header = journal_header(index)
+        progress = self._read_json(PROGRESS_FILE)
+        if progress is None or self._read_json(HEADER_FILE) != header:
+            if os.path.isdir(self.path):
+                logger.info("Ingestion journal is from another state of the index, starting a new one",
+                            extra={"journal": self.path})
+            self._start(header)
+            return {}
+
+        # The files recorded, as long as they come in the order of the plan with the same content
+        kept, offset = {}, progress["offset"]
+        for position, (filepath, cursor) in enumerate(progress["files"].items()):
+            if position >= len(plan) or plan[position] != (filepath, cursor["sha256"]):
+                offset = cursor["offset"]
+                break
+            kept[filepath] = cursor
+        ids = self._replay(index, offset)
+        self.header = header
+        self.files = kept
+        self._open(offset)
+        write_json_atomic(self._file(PROGRESS_FILE), {"offset": offset, "files": self.files})
+        chunks = sum(len(file_ids) for file_ids in ids.values())
+        logger.info("Resumed ingestion from its journal",
+                    extra={"journal": self.path, "files_done": sum(cursor["done"] for cursor in kept.values()),
+                           "files_partial": sum(not cursor["done"] for cursor in kept.values()), "chunks": chunks})
+        return ids
+
+    def _start(self, header: dict):
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path)
+        self.header = header
+        self.files = {}
+        write_json_atomic(self._file(HEADER_FILE), header)
+        open(self._file(RECORDS_FILE), "wb").close()
+        write_json_atomic(self._file(PROGRESS_FILE), {"offset": 0, "files": {}})
+        self._open(0)
+
+    def _open(self, offset: int):
+        self._records = open(self._file(RECORDS_FILE), "r+b")
+        # Records past the last checkpoint may be incomplete, they are overwritten
+        self._records.truncate(offset)
+        self._records.seek(offset)
+        self._offset = self._clean_offset = self._durable_offset = offset
+        self._last_checkpoint = time.monotonic()
+
+    def _iter_records(self, offset: int):
+        with open(self._file(RECORDS_FILE), "rb") as file:
+            position = 0
+            while position < offset:
+                header = file.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    raise ValueError(f"Ingestion journal {self.path} is truncated, re-run without resuming")
+                crc, json_size, vectors_size = RECORD_HEADER.unpack(header)
+                payload = file.read(json_size + vectors_size)
+                if len(payload) < json_size + vectors_size or zlib.crc32(payload) != crc:
+                    raise ValueError(f"Ingestion journal {self.path} is corrupted, re-run without resuming")
+                position += RECORD_HEADER.size + len(payload)
+                yield json.loads(payload[:json_size]), payload[json_size:]
+
+    def _replay(self, index: FAISSIndex, offset: int) -> dict[str, list[int]]:
+        ids: dict[str, list[int]] = {}
+        for record, vectors in self._iter_records(offset):
+            document = record["document"]
+            pages = [tuple(page) for page in record["pages"]] if record.get("pages") is not None else None
+            if record["type"] == "add":
+                vectors = np.frombuffer(vectors, dtype="float32").reshape(len(record["ids"]), index.dimension)
+                added = index.add_vectors(vectors, record["chunks"], document=document, pages=pages)
+                if added != record["ids"]:
+                    raise ValueError(f"Ingestion journal {self.path} doesn't match the index, re-run without resuming")
+                if index.dedup is not None:
+                    index.dedup.add_existing(index.chunks, added)
+                ids.setdefault(document, []).extend(added)
+            elif record["type"] == "references":
+                index.add_references(record["ids"], document=document, pages=pages)
+                ids.setdefault(document, []).extend(record["ids"])
+            else:
+                index.set_document_metadata(document, record["metadata"])
+        return ids
+
+    def _append(self, record: dict, vectors: bytes = b""):
+        data = json.dumps(record).encode("utf-8")
+        payload = data + vectors
+        self._records.write(RECORD_HEADER.pack(zlib.crc32(payload), len(data), len(vectors)))
+        self._records.write(payload)
+        if record["document"] not in self.files:
+            self.files[record["document"]] = {"sha256": self._hashes.get(record["document"]), "chunks": 0,
+                                              "done": False, "offset": self._offset}
+        self._offset += RECORD_HEADER.size + len(payload)
+
+    def add(self, document: str, chunks: list[str], vectors: np.ndarray, pages: list[tuple[int, int]] | None,
+            ids: list[int]):
+        """Records chunks added to the index, with their vectors."""
+        self._append({"type": "add", "document": document, "chunks": chunks, "pages": pages, "ids": ids},
+                     np.ascontiguousarray(vectors, dtype="float32").tobytes())
+        self._pending[document] = self._pending.get(document, 0) + len(chunks)
+
+    def references(self, document: str, ids: list[int], pages: list[tuple[int, int]] | None):
+        """Records duplicates found in a document, as references to the chunks they duplicate."""
+        self._append({"type": "references", "document": document, "pages": pages, "ids": ids})
+        self._pending[document] = self._pending.get(document, 0) + len(ids)
+
+    def end(self, document: str, metadata: dict):
+        """Records the end of a document, with its metadata."""
+        self._append({"type": "end", "document": document, "metadata": metadata})
+        self._ended.append(document)
+
+    def segment_done(self):
+        """Marks that every chunk received so far was recorded, and checkpoints if it's time to."""
+        for document, chunks in self._pending.items():
+            self.files[document]["chunks"] += chunks
+            self._chunks_since_checkpoint += chunks
+        for document in self._ended:
+            self.files[document]["done"] = True
+        self._pending, self._ended = {}, []
+        self._clean_offset = self._offset
+        if self._chunks_since_checkpoint >= self.checkpoint_chunks or \
+                time.monotonic() - self._last_checkpoint >= self.checkpoint_seconds:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """Makes the journal durable up to the last segment finished, the records after it are dropped on resume."""
+        if self._records is None or self._clean_offset == self._durable_offset:
+            return
+        self._records.flush()
+        os.fsync(self._records.fileno())
+        # Cursors of files with a segment in progress are those as of its start
+        write_json_atomic(self._file(PROGRESS_FILE), {"offset": self._clean_offset, "files": {
+            document: {**cursor} for document, cursor in self.files.items() if cursor["offset"] < self._clean_offset
+        }})
+        self._durable_offset = self._clean_offset
+        self._chunks_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+        self.checkpoints += 1
+        logger.debug("Ingestion checkpoint", extra={"journal": self.path, "bytes": self._durable_offset})
+
+    def close(self):
+        if self._records is not None:
+            self._records.close()
+            self._records = None
+
+    def clear(self):
+        """Deletes the journal, once the index holding what it recorded was saved."""
+        self.close()
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -1,4 +1,5 @@
 from src.ingestion.loaders.loaderBase import LoaderBase
+from src.ingestion.loaders.loaderCSV import LoaderCSV
 from src.ingestion.loaders.loaderDOCX import LoaderDOCX
 from src.ingestion.loaders.loaderHTML import LoaderHTML
 from src.ingestion.loaders.loaderPDF import LoaderPDF
@@ -8,42 +9,52 @@ class Loader:
     Factory class for creating specific file loader objects based on file extension.
 
     Attributes:
+        EXTENSIONS (tuple[str, ...]): The supported file extensions, lowercase.
         extension (str): The file extension of the file to be loaded.
         filepath (str): The path to the file to be loaded.
+        workers (int): Number of processes used to parse a single large document.
         loader (LoaderBase): The specific loader object created based on the file extension.
 
     Methods:
         _get_specific_loader(): Returns a specific loader object based on the file extension.
         extract_metadata(): Extracts metadata from the file using the specific loader.
+        iter_pages(): Streams the text of the file page by page using the specific loader.
         extract_text(): Extracts text from the file using the specific loader.
     """
-    def __init__(self, filepath:str , extension:str) -> None:
+    EXTENSIONS = ("pdf", "html", "htm", "docx", "csv")
+
+    def __init__(self, filepath:str , extension:str, workers: int = 1) -> None:
         """Initializes the Loader class with file information and creates a specific loader object.
 
         Args:
             filepath (str): The path to the file to be loaded.
             extension (str): The file extension of the file to be loaded.
+            workers (int, optional): Number of processes used to parse a single large document,
+                for the formats that support it (PDF). Defaults to 1.
         """
-        self.extension=extension
+        self.extension=extension.lower()
         self.filepath=filepath
+        self.workers=workers
         self.loader=self._get_specific_loader()
 
     def _get_specific_loader(self) -> LoaderBase:
         """Returns a specific loader object based on the file extension.
 
         Returns:
-            LoaderBase: A specific loader object (e.g., LoaderPDF, LoaderDOCX) based on the file extension.
+            LoaderBase: A specific loader object (e.g., LoaderPDF, LoaderDOCX, LoaderCSV) based on the file extension.
 
         Raises:
             ValueError: If the file extension is not supported.
         """
         match self.extension:
             case "pdf":
-                return LoaderPDF(self.filepath)
-            case "html":
+                return LoaderPDF(self.filepath, workers=self.workers)
+            case "html" | "htm":
                 return LoaderHTML(self.filepath)
             case "docx":
                 return LoaderDOCX(self.filepath)
+            case "csv":
+                return LoaderCSV(self.filepath)
             case _:
                 raise ValueError(f"Not a supported extension: {self.extension}")
 
@@ -55,6 +66,14 @@ class Loader:
         """
         return self.loader.extract_metadata()
 
+    def iter_pages(self):
+        """Streams the text of the file using the specific loader.
+
+        Yields:
+            tuple[int, str]: The page (or section) number and its text.
+        """
+        return self.loader.iter_pages()
+
     def extract_text(self):
         """Extracts text from the file using the specific loader.
 
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Iterator
 
 class LoaderBase(ABC):
     """
@@ -8,11 +9,18 @@ class LoaderBase(ABC):
     Concrete loader classes (e.g., for PDF, DOCX) should inherit from this class 
     and implement the abstract methods.
 
+    Attributes:
+        SELF_CONTAINED_PAGES (bool): Whether every page is chunked on its own, e.g. the row groups
+            of a CSV file, rather than chunks running over page boundaries.
+
     Methods:
         __init__(filepath: str): Constructor for the LoaderBase class.
         extract_metadata(): Abstract method to extract metadata from a file.
-        extract_text(): Abstract method to extract text content from a file.
+        iter_pages(): Abstract method to stream the text content of a file, page by page.
+        extract_text(): Extracts the whole text content of a file.
     """
+    SELF_CONTAINED_PAGES = False
+
     @abstractmethod
     def __init__(self, filepath:str):
         """
@@ -34,11 +42,22 @@ class LoaderBase(ABC):
         pass
 
     @abstractmethod
+    def iter_pages(self) -> Iterator[tuple[int, str]]:
+        """
+        Abstract method to stream the text content of a file.
+
+        Only one page (or section, for formats without pages) is held in memory at a time.
+
+        Yields:
+            tuple[int, str]: The page number, starting at 1, and the text of the page.
+        """
+        pass
+
     def extract_text(self):
         """
-        Abstract method to extract text content from a file.
+        Extracts the whole text content of a file, each page prefixed with a space.
 
         Returns:
             str: The extracted text from the file.
         """
-        pass
+        return "".join(" " + text for _, text in self.iter_pages())
@@ -1,12 +1,89 @@
 from src.ingestion.loaders.loaderBase import LoaderBase
+from src.services.models.batching import estimate_tokens
+import csv
+
 
 class LoaderCSV(LoaderBase):
+    """
+    Streams CSV files in batches of rows.
+
+    Rows are read one at a time and every row is written as a line of `column: value` pairs, so
+    each row names the columns of its values. Consecutive rows are grouped into pages of at most
+    `page_tokens` estimated tokens, below the chunk size: pages are chunked on their own
+    (`SELF_CONTAINED_PAGES`), so every chunk holds whole rows. The memory used doesn't depend on
+    the file size.
+
+    The delimiter is sniffed from the start of the file (comma, semicolon, tab or pipe), the first
+    row holds the column names.
+
+    Attributes:
+        filepath (str): The path to the CSV file.
+        page_tokens (int): Maximum number of estimated tokens per page, a longer row is a page of its own.
+        encoding (str): The encoding of the file, a UTF-8 byte order mark is skipped.
+        metadata (dict): The columns and number of rows of the file, set by `extract_metadata`.
+    """
+    SELF_CONTAINED_PAGES = True
+    DELIMITERS = ",;\t|"
+    # Bytes read from the start of the file to sniff its delimiter
+    SNIFF_BYTES = 64 * 1024
+
+    def __init__(self, filepath: str, page_tokens: int = 400, encoding: str = "utf-8-sig"):
+        self.filepath = filepath
+        self.page_tokens = page_tokens
+        self.encoding = encoding
+        self.columns: list[str] | None = None
+        self.rows: int | None = None
+
+    def _open(self):
+        return open(self.filepath, newline="", encoding=self.encoding, errors="replace")
+
+    def _dialect(self, file) -> type[csv.Dialect] | str:
+        sample = file.read(self.SNIFF_BYTES)
+        file.seek(0)
+        try:
+            return csv.Sniffer().sniff(sample, delimiters=self.DELIMITERS)
+        except csv.Error:
+            # A single column, or too few rows to tell
+            return "excel"
+
+    def _header(self, row: list[str]) -> list[str]:
+        return [name.strip() or f"column {number + 1}" for number, name in enumerate(row)]
+
+    def format_row(self, row: list[str]) -> str:
+        """Writes a row as `column: value` pairs, skipping the empty values."""
+        columns = self.columns or []
+        return " | ".join(
+            f"{columns[number] if number < len(columns) else f'column {number + 1}'}: {value.strip()}"
+            for number, value in enumerate(row) if value.strip()
+        )
 
-    def __init__(self,filepath:str):
-        self.filepath=filepath
-    
     def extract_metadata(self):
-        raise NotImplementedError
-    
-    def extract_text(self):
-        raise NotImplementedError("Implement LoaderCSV.extract_text() to extract text from a CSV file.")            
\ No newline at end of file
+        if self.columns is None:
+            with self._open() as file:
+                self.columns = self._header(next(csv.reader(file, self._dialect(file)), []))
+        self.metadata = {"columns": ", ".join(self.columns)}
+        if self.rows is not None:
+            # Only known once the file was read
+            self.metadata["rows"] = self.rows
+        return self.metadata
+
+    def iter_pages(self):
+        with self._open() as file:
+            reader = csv.reader(file, self._dialect(file))
+            self.columns = self._header(next(reader, []))
+            rows, page, lines, tokens = 0, 1, [], 0
+            for row in reader:
+                rows += 1
+                line = self.format_row(row)
+                if not line:
+                    continue
+                line_tokens = estimate_tokens(line)
+                if lines and tokens + line_tokens > self.page_tokens:
+                    yield page, "\n".join(lines)
+                    page, lines, tokens = page + 1, [], 0
+                lines.append(line)
+                tokens += line_tokens
+            if lines:
+                yield page, "\n".join(lines)
+            self.rows = rows
+
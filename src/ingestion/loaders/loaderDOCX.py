@@ -1,13 +1,113 @@
 from src.ingestion.loaders.loaderBase import LoaderBase
-from docx import Document
+import zipfile
+import xml.etree.ElementTree as ET
+
+WORD_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+DOCUMENT_PART = "word/document.xml"
+CORE_PROPERTIES_PART = "docProps/core.xml"
+# Core properties kept as metadata, by element tag
+CORE_PROPERTIES = {
+    "{http://purl.org/dc/elements/1.1/}title": "title",
+    "{http://purl.org/dc/elements/1.1/}creator": "author",
+    "{http://purl.org/dc/elements/1.1/}subject": "subject",
+    "{http://schemas.openxmlformats.org/package/2006/metadata/core-properties}lastModifiedBy": "last_modified_by",
+}
+
+PARAGRAPH = f"{{{WORD_NS}}}p"
+TEXT = f"{{{WORD_NS}}}t"
+TAB = f"{{{WORD_NS}}}tab"
+BREAK = f"{{{WORD_NS}}}br"
+RENDERED_PAGE_BREAK = f"{{{WORD_NS}}}lastRenderedPageBreak"
+BODY = f"{{{WORD_NS}}}body"
+
 
 class LoaderDOCX(LoaderBase):
+    """
+    Streams DOCX files paragraph by paragraph.
+
+    The document part of the archive is parsed incrementally (`iterparse`) and every paragraph is
+    released once its text is read, so the document is never held whole in memory, unlike with
+    python-docx, which builds the tree of the whole document first. Paragraphs in tables are read
+    in document order too; headers, footers and notes, stored in other parts, are not.
 
-    def __init__(self, filepath:str):
-        self.filepath=filepath
+    Pages are those of the last rendering saved by Word (its rendered page breaks) and explicit
+    page breaks. A page longer than `section_chars` characters, e.g. in documents never rendered,
+    is yielded in several sections under the same page number.
+
+    Attributes:
+        filepath (str): The path to the DOCX file.
+        section_chars (int): Approximate maximum number of characters per section.
+        metadata (dict): The core properties of the document (title, author, ...), set by `extract_metadata`.
+    """
+    def __init__(self, filepath: str, section_chars: int = 16 * 1024):
+        self.filepath = filepath
+        self.section_chars = section_chars
 
     def extract_metadata(self):
-        raise NotImplementedError
-    
-    def extract_text(self):
-        raise NotImplementedError("Implement LoaderDOCX.extract_text() to extract text from a DOCX file.")
\ No newline at end of file
+        self.metadata = {}
+        with zipfile.ZipFile(self.filepath) as archive:
+            if CORE_PROPERTIES_PART not in archive.namelist():
+                return self.metadata
+            with archive.open(CORE_PROPERTIES_PART) as part:
+                for element in ET.parse(part).getroot():
+                    if element.tag in CORE_PROPERTIES and element.text:
+                        self.metadata[CORE_PROPERTIES[element.tag]] = element.text.strip()
+        return self.metadata
+
+    def iter_paragraphs(self):
+        """Streams the paragraphs of the document.
+
+        Yields:
+            tuple[int, str]: The page number, starting at 1, and the text of the paragraph.
+        """
+        page = 1
+        with zipfile.ZipFile(self.filepath) as archive, archive.open(DOCUMENT_PART) as part:
+            events = ET.iterparse(part, events=("start", "end"))
+            _, root = next(events)
+            depth = 0
+            parts: list[str] = []
+            for event, element in events:
+                if element.tag == PARAGRAPH:
+                    # Paragraphs can be nested, e.g. in text boxes
+                    depth += 1 if event == "start" else -1
+                    if event == "end" and depth == 0:
+                        yield page, "".join(parts)
+                        parts = []
+                        # The paragraph was read, release it and its predecessors
+                        element.clear()
+                        body = root.find(BODY)
+                        if body is not None:
+                            body.clear()
+                    continue
+                if event != "end":
+                    continue
+                if element.tag == TEXT:
+                    parts.append(element.text or "")
+                elif element.tag == TAB:
+                    parts.append("\t")
+                elif element.tag == BREAK:
+                    if element.get(f"{{{WORD_NS}}}type") == "page":
+                        if parts:
+                            yield page, "".join(parts)
+                            parts = []
+                        page += 1
+                    else:
+                        parts.append("\n")
+                elif element.tag == RENDERED_PAGE_BREAK:
+                    if parts:
+                        yield page, "".join(parts)
+                        parts = []
+                    page += 1
+
+    def iter_pages(self):
+        page, paragraphs, size = 1, [], 0
+        for paragraph_page, paragraph in self.iter_paragraphs():
+            if paragraphs and (paragraph_page != page or size >= self.section_chars):
+                yield page, "\n".join(paragraphs)
+                paragraphs, size = [], 0
+            page = paragraph_page
+            if paragraph.strip():
+                paragraphs.append(paragraph)
+                size += len(paragraph) + 1
+        if paragraphs:
+            yield page, "\n".join(paragraphs)
@@ -1,15 +1,87 @@
 from src.ingestion.loaders.loaderBase import LoaderBase
+import html
+import re
 import html2text
 
+# Placeholder html2text writes for non-breaking spaces, replaced when it finishes
+NBSP_PLACEHOLDER = "&nbsp_place_holder;"
+
+
 class LoaderHTML(LoaderBase):
+    """
+    Streams HTML files converted to Markdown-like text by html2text.
+
+    The file is fed to the converter in blocks of `block_chars` characters and the text it
+    outputs so far is collected after each block, so the file is never held whole in memory. The
+    text is yielded in sections of about `section_chars` characters, cut at a paragraph break
+    when there is one. Lines are not wrapped, the text is the same as converting the whole file.
+
+    Attributes:
+        filepath (str): The path to the HTML file.
+        section_chars (int): Approximate number of characters per section.
+        block_chars (int): Number of characters fed to the converter at once.
+        encoding (str): The encoding of the file.
+        metadata (dict): The title, author and description of the page, set by `extract_metadata`.
+    """
+    # Characters read from the start of the file to find the metadata of the page
+    HEAD_CHARS = 64 * 1024
 
-    def __init__(self,filepath:str):
-        self.filepath=filepath
-    
+    def __init__(self, filepath: str, section_chars: int = 16 * 1024, block_chars: int = 1024 * 1024,
+                 encoding: str = "utf-8"):
+        self.filepath = filepath
+        self.section_chars = section_chars
+        self.block_chars = block_chars
+        self.encoding = encoding
+
+    def _converter(self) -> html2text.HTML2Text:
+        converter = html2text.HTML2Text(bodywidth=0)
+        converter.ignore_images = True
+        # Only set by `handle`, which converts a whole document at once
+        converter.start = True
+        return converter
 
     def extract_metadata(self):
-        raise NotImplementedError
-    
-    def extract_text(self):
-        raise NotImplementedError("Implement LoaderHTML.extract_text() to extract text from a HTML file.")
-            
\ No newline at end of file
+        with open(self.filepath, encoding=self.encoding, errors="replace") as file:
+            head = file.read(self.HEAD_CHARS)
+        title = re.search(r"<title[^>]*>(.*?)</title>", head, re.IGNORECASE | re.DOTALL)
+        self.metadata = {"title": html.unescape(title.group(1)).strip() if title else None}
+        for name, key in (("author", "author"), ("description", "subject")):
+            meta = re.search(rf"<meta\s+name=[\"']{name}[\"']\s+content=[\"']([^\"']*)[\"']", head, re.IGNORECASE)
+            self.metadata[key] = html.unescape(meta.group(1)).strip() if meta else None
+        return self.metadata
+
+    def iter_pages(self):
+        converter = self._converter()
+        page, text, pending = 1, "", ""
+        with open(self.filepath, encoding=self.encoding, errors="replace") as file:
+            for block in iter(lambda: file.read(self.block_chars), ""):
+                # Fed up to the last tag: text split over two feeds would get a space inserted
+                pending += block
+                cut = pending.rfind("<")
+                if cut <= 0:
+                    if len(pending) < 2 * self.block_chars:
+                        continue
+                    # A text without any tag is fed whole past a bound, to keep memory bounded
+                    cut = len(pending)
+                converter.feed(pending[:cut])
+                pending = pending[cut:]
+                text += "".join(converter.outtextlist).replace(NBSP_PLACEHOLDER, " ")
+                converter.outtextlist = []
+                while len(text) >= self.section_chars:
+                    cut = self._cut(text)
+                    yield page, text[:cut]
+                    page, text = page + 1, text[cut:]
+        converter.feed(pending)
+        text += converter.finish().replace(NBSP_PLACEHOLDER, " ")
+        while text:
+            cut = self._cut(text) if len(text) > self.section_chars else len(text)
+            yield page, text[:cut]
+            page, text = page + 1, text[cut:]
+
+    def _cut(self, text: str) -> int:
+        """Returns where to end a section: after the last paragraph break, or line break, of its first `section_chars`."""
+        for separator in ("\n\n", "\n"):
+            position = text.rfind(separator, 0, self.section_chars)
+            if position > 0:
+                return position + len(separator)
+        return self.section_chars
@@ -4,15 +4,44 @@ import PyPDF2
 import io
 import os
 import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def extract_page_range(filepath: str, start: int, stop: int) -> list[str]:
+    """Extracts the text of the pages [start, stop) of a PDF, in a worker process."""
+    with open(filepath, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[page_num].extract_text() for page_num in range(start, stop)]
+
 
 class LoaderPDF(LoaderBase):
+    """
+    Loads PDF files with PyPDF2.
+
+    Large documents can be split into page ranges extracted in parallel by a process pool, the
+    pages are still yielded in order.
+
+    Attributes:
+        filepath (str): The path to the PDF file.
+        workers (int): Number of processes extracting page ranges, 1 extracts in this process.
+        pages_per_range (int): Number of pages extracted by a worker at once.
+    """
+    # Below this number of pages, starting worker processes costs more than it saves
+    PARALLEL_MIN_PAGES = 64
 
-    def __init__(self, filepath:str):
+    def __init__(self, filepath:str, workers: int = 1, pages_per_range: int = 16):
         self.filepath=filepath
+        self.workers=workers
+        self.pages_per_range=pages_per_range
 
     def extract_metadata(self):
         pdf_file_reader = PyPDF2.PdfReader(self.filepath)
         doc_info = pdf_file_reader.metadata
+        if doc_info is None:
+            # The PDF has no document information dictionary
+            self.metadata = {}
+            return False
         metadata = {  
             'author': doc_info.author,  
             'creator': doc_info.creator,  
@@ -26,14 +55,33 @@ class LoaderPDF(LoaderBase):
         
         return self.metadata if self.all_keys_have_values(metadata=self.metadata) else False
     
-    def extract_text(self):
+    def iter_pages(self):
         with open(self.filepath, 'rb') as file:
             reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page_num in range(len(reader.pages)):
-                text += " " + reader.pages[page_num].extract_text()
-        return text
-    
+            num_pages = len(reader.pages)
+            if self.workers > 1 and num_pages >= self.PARALLEL_MIN_PAGES:
+                yield from self._iter_pages_parallel(num_pages)
+                return
+            for page_num in range(num_pages):
+                yield page_num + 1, reader.pages[page_num].extract_text()
+
+    def _iter_pages_parallel(self, num_pages: int):
+        """Extracts page ranges in a process pool and yields the pages in order.
+
+        At most two ranges per worker are in flight, to keep memory bounded on very large documents.
+        """
+        ranges = deque((start, min(start + self.pages_per_range, num_pages))
+                       for start in range(0, num_pages, self.pages_per_range))
+        with ProcessPoolExecutor(self.workers) as pool:
+            pending = deque()
+            while ranges or pending:
+                while ranges and len(pending) < 2 * self.workers:
+                    start, stop = ranges.popleft()
+                    pending.append((start, pool.submit(extract_page_range, self.filepath, start, stop)))
+                start, future = pending.popleft()
+                for offset, text in enumerate(future.result()):
+                    yield start + offset + 1, text
+
     def extract_chunks(self):
         raise NotImplementedError
 
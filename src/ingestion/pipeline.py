@@ -0,0 +1,406 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from src.ingestion.chunking.token_chunking import iter_chunks_from_pages
+from src.ingestion.journal import IngestionJournal
+from src.ingestion.loaders.loader import Loader
+from src.services.models.batching import ThroughputReport, estimate_tokens, iter_batches
+from src.services.observability.telemetry import ERRORS, observe_stage
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+logger = logging.getLogger(__name__)
+
+
+_DONE = object()
+
+
+class _Failure:
+    """Carries an exception raised by an upstream stage down to the add stage."""
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def document_metadata(loader: Loader) -> dict:
+    """Returns the fields of the metadata extracted by a loader that have a value, empty if it extracts none."""
+    try:
+        loader.extract_metadata()
+    except NotImplementedError:
+        return {}
+    except Exception as e:
+        logger.warning("Could not extract the metadata of %s: %s", loader.filepath, e)
+        return {}
+    return {key: str(value) for key, value in (getattr(loader.loader, "metadata", None) or {}).items() if value}
+
+
+def parse_and_chunk(filepath: str, segments, segment_size: int, pdf_workers: int = 1,
+                    cancel=None) -> tuple[float, float]:
+    """Parses a file page by page and streams its chunks.
+
+    Runs in the worker processes of the pipeline, so it must stay a picklable top-level function.
+    Chunks are sent as soon as `segment_size` of them are ready, with the first and last page of
+    each, so the embedding of a large document starts before it is fully parsed. The pages of
+    loaders with `SELF_CONTAINED_PAGES` are chunked one by one. The segments are followed by a
+    `(filepath, None, metadata)` end marker carrying the metadata of the document. When the
+    `segments` queue is bounded, parsing waits while it is full, so it doesn't run ahead of the
+    embedding.
+
+    Args:
+        filepath (str): The path of the file.
+        segments: The queue receiving `(filepath, chunks, pages)` segments.
+        segment_size (int): Number of chunks per segment.
+        pdf_workers (int): Number of processes extracting the page ranges of a large PDF.
+        cancel (Event, optional): Stops the parsing once set, e.g. when the pipeline failed.
+
+    Returns:
+        tuple[float, float]: The seconds spent loading the pages of the file, and chunking them.
+    """
+    start = time.perf_counter()
+    load_seconds = 0.0
+    loader = Loader(extension=filepath.split(".")[-1], filepath=filepath, workers=pdf_workers)
+
+    def timed_pages():
+        # Pages are loaded while the chunker pulls them, time them apart
+        nonlocal load_seconds
+        pages = loader.iter_pages()
+        while True:
+            page_start = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                return
+            finally:
+                load_seconds += time.perf_counter() - page_start
+            yield page
+
+    if loader.loader.SELF_CONTAINED_PAGES:
+        chunks = (chunk for page in timed_pages() for chunk in iter_chunks_from_pages([page]))
+    else:
+        chunks = iter_chunks_from_pages(timed_pages())
+
+    def send(item) -> bool:
+        while True:
+            try:
+                segments.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                if cancel is not None and cancel.is_set():
+                    return False
+
+    segment, pages = [], []
+    for chunk, first_page, last_page in chunks:
+        segment.append(chunk)
+        pages.append((first_page, last_page))
+        if len(segment) >= segment_size:
+            if not send((filepath, segment, pages)):
+                return load_seconds, time.perf_counter() - start - load_seconds
+            segment, pages = [], []
+    if segment and not send((filepath, segment, pages)):
+        return load_seconds, time.perf_counter() - start - load_seconds
+    page_start = time.perf_counter()
+    metadata = document_metadata(loader)
+    load_seconds += time.perf_counter() - page_start
+    send((filepath, None, metadata))
+    return load_seconds, time.perf_counter() - start - load_seconds
+
+
+class StageStats:
+    """Counters of a pipeline stage.
+
+    Attributes:
+        name (str): The stage name.
+        items (int): Number of items processed (files for parsing, chunks otherwise).
+        seconds (float): Time spent working, summed over the stage workers.
+        max_queue_depth (int): Highest number of items waiting in the stage's output queue.
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.seconds = 0.0
+        self.max_queue_depth = 0
+
+    def as_dict(self) -> dict:
+        return {"items": self.items, "seconds": round(self.seconds, 4), "max_queue_depth": self.max_queue_depth}
+
+
+class IngestionPipeline:
+    """Staged ingestion engine: parse & chunk -> embed -> add.
+
+    Files are parsed and chunked page by page in a process pool, which streams their chunks in
+    segments. The chunks are embedded in batches by a thread pool with a bounded number of
+    in-flight requests, and the embeddings are added to the index by the calling thread. Bounded
+    queues between the stages keep memory in check, and let the parsing of the next files (or of
+    the end of a large file) overlap the embedding of the current chunks. Every file parsed streams
+    its segments through a queue of its own, bounded too: a parser waits once `max_queued_files`
+    of its segments are ready, so chunks are never held much ahead of the embedding, whatever the
+    size of the documents.
+
+    Batches are added in file order, then in chunk order, whatever the number of workers, so the
+    resulting index (vector IDs included) is deterministic.
+
+    When the index has a `dedup`, the chunks are checked for duplicates in file and chunk order
+    before being embedded: duplicates of stored chunks, or of chunks of the same run, are only
+    recorded as more sources of the chunk they duplicate, after it is added.
+
+    With a `journal`, everything applied to the index is also recorded in it, and checkpointed
+    between two segments, so an interrupted run can be resumed (see `IngestionJournal`).
+
+    Attributes:
+        index (FAISSIndex): The index the chunks are added to.
+        parse_workers (int): Number of parsing processes, 0 parses in a thread of this process.
+        pdf_workers (int): Number of processes splitting a single large PDF into page ranges.
+        embed_concurrency (int): Maximum number of concurrent embeddings requests.
+        max_queued_files (int): Maximum number of files parsed at once, of chunk segments of each waiting
+            to be forwarded, and of chunk segments waiting to be embedded.
+        max_queued_batches (int): Maximum number of embedded batches waiting to be added.
+        journal (IngestionJournal): Records what is applied to the index, none by default.
+        stats (dict): `StageStats` of the last run, by stage name.
+        report (ThroughputReport): Throughput figures of the last run.
+
+    Methods:
+        run(filepaths, skip): Ingests files and returns the IDs of their chunks.
+        queue_depths(): Returns the current depth of the queues between stages.
+    """
+    def __init__(self, index: FAISSIndex, parse_workers: int | None = None, embed_concurrency: int = 4,
+                 max_queued_files: int = 4, max_queued_batches: int = 16, pdf_workers: int = 1,
+                 journal: IngestionJournal | None = None):
+        self.index = index
+        self.parse_workers = (os.cpu_count() or 1) if parse_workers is None else parse_workers
+        self.pdf_workers = pdf_workers
+        self.embed_concurrency = embed_concurrency
+        self.max_queued_files = max_queued_files
+        self.max_queued_batches = max_queued_batches
+        self.journal = journal
+        self.stats: dict[str, StageStats] = {}
+        self.report: ThroughputReport | None = None
+        self._queues: dict[str, queue.Queue] = {}
+        self._stats_lock = threading.Lock()
+
+    def queue_depths(self) -> dict:
+        """Returns the number of items waiting between stages, e.g. to monitor a running pipeline."""
+        return {name: q.qsize() for name, q in self._queues.items()}
+
+    def run(self, filepaths: list[str], skip: dict[str, int] | None = None) -> dict[str, list[int]]:
+        """Ingests files into the index.
+
+        Args:
+            filepaths (list[str]): The files to ingest, their chunks get IDs in this order.
+            skip (dict[str, int], optional): Number of first chunks of files already ingested, e.g.
+                replayed from a journal, by file path. They are parsed but not embedded nor added.
+
+        Returns:
+            dict: The IDs of the chunks of each file ingested by this run, by file path.
+        """
+        self.stats = {name: StageStats(name) for name in ("parse", "embed", "add")}
+        self.report = ThroughputReport()
+        parsed = queue.Queue(maxsize=self.max_queued_files)
+        embedded = queue.Queue(maxsize=self.max_queued_batches)
+        self._queues = {"parsed": parsed, "embedded": embedded}
+        stop = threading.Event()
+
+        parse_pool = ProcessPoolExecutor(self.parse_workers) if self.parse_workers else ThreadPoolExecutor(1)
+        embed_pool = ThreadPoolExecutor(self.embed_concurrency)
+        threads = [
+            threading.Thread(target=self._parse_stage, args=(parse_pool, filepaths, parsed, stop), daemon=True),
+            threading.Thread(target=self._embed_stage, args=(embed_pool, parsed, embedded, stop, dict(skip or {})),
+                             daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            ids = self._add_stage(filepaths, embedded)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+            parse_pool.shutdown(cancel_futures=True)
+            embed_pool.shutdown(cancel_futures=True)
+            self._queues = {}
+        self.index.last_ingest_report = self.report.stop()
+        return ids
+
+    def _put(self, q: queue.Queue, item, stop: threading.Event, stage: StageStats) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            stage.max_queue_depth = max(stage.max_queue_depth, q.qsize())
+            return True
+        return False
+
+    def _parse_stage(self, pool: Executor, filepaths: list[str], parsed: queue.Queue, stop: threading.Event):
+        stage = self.stats["parse"]
+        manager = multiprocessing.Manager() if self.parse_workers else None
+        cancel = manager.Event() if manager else threading.Event()
+        # The segments of every file have a bounded queue of their own: the segments of the file
+        # being forwarded never wait behind those of the next files, whose parsers wait their turn
+        segments: dict[str, queue.Queue] = {}
+        futures: dict[str, Future] = {}
+        current = 0
+        try:
+            while current < len(filepaths) and not stop.is_set():
+                # Keep a bounded number of files in the pool
+                while len(futures) < len(filepaths) and len(futures) - current < self.max_queued_files:
+                    filepath = filepaths[len(futures)]
+                    segments[filepath] = manager.Queue(self.max_queued_files) if manager \
+                        else queue.Queue(self.max_queued_files)
+                    futures[filepath] = pool.submit(parse_and_chunk, filepath, segments[filepath],
+                                                    self.index.max_batch_items, self.pdf_workers, cancel)
+                filepath = filepaths[current]
+                try:
+                    _, chunks, pages = segments[filepath].get(timeout=0.1)
+                except queue.Empty:
+                    for future in futures.values():
+                        if future.done() and future.exception():
+                            ERRORS.inc(stage="load")
+                            raise future.exception()
+                    continue
+                if chunks is None:
+                    # Parsing runs in other processes: their timings are recorded here
+                    load_seconds, chunk_seconds = futures[filepath].result()
+                    observe_stage("load", load_seconds)
+                    observe_stage("chunk", chunk_seconds)
+                    logger.info("Parsed file", extra={"file": filepath, "load_seconds": round(load_seconds, 4),
+                                                      "chunk_seconds": round(chunk_seconds, 4)})
+                    stage.items += 1
+                    stage.seconds += load_seconds + chunk_seconds
+                    del segments[filepath]
+                    current += 1
+                # The end marker is forwarded too, with the document metadata in place of the pages
+                if not self._put(parsed, (filepath, chunks, pages), stop, stage):
+                    return
+            self._put(parsed, _DONE, stop, stage)
+        except BaseException as error:
+            self._put(parsed, _Failure(error), stop, stage)
+        finally:
+            # Parsers waiting for room in their queue give up
+            cancel.set()
+            if manager:
+                manager.shutdown()
+
+    def _embed_stage(self, pool: Executor, parsed: queue.Queue, embedded: queue.Queue, stop: threading.Event,
+                     skip: dict[str, int]):
+        stage = self.stats["embed"]
+        in_flight = threading.Semaphore(self.embed_concurrency)
+        try:
+            while not stop.is_set():
+                try:
+                    item = parsed.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE or isinstance(item, _Failure):
+                    self._put(embedded, item, stop, stage)
+                    return
+                filepath, chunks, pages = item
+                if chunks is None:
+                    if not self._put(embedded, (filepath, None, pages, None, None, True), stop, stage):
+                        return
+                    continue
+                if skip.get(filepath):
+                    skipped = min(skip[filepath], len(chunks))
+                    skip[filepath] -= skipped
+                    chunks, pages = chunks[skipped:], pages[skipped:]
+                    if not chunks:
+                        continue
+                slots = None
+                if self.index.dedup is not None:
+                    # Duplicates are not embedded, they are recorded as sources of the chunk they duplicate
+                    slots, positions = self.index.deduplicate(chunks, self.report)
+                    new = set(positions)
+                    duplicates = [position for position in range(len(chunks)) if position not in new]
+                    references = (filepath, [chunks[position] for position in duplicates],
+                                  [pages[position] for position in duplicates], None,
+                                  [slots[position] for position in duplicates], True)
+                    chunks = [chunks[position] for position in positions]
+                    pages = [pages[position] for position in positions]
+                    slots = [slots[position] for position in positions]
+                # Each batch is sent once the next one is submitted: the last item of the segment is flagged
+                start, previous = 0, None
+                for batch in iter_batches(chunks, self.index.max_batch_items, self.index.max_batch_tokens):
+                    while not in_flight.acquire(timeout=0.1):
+                        if stop.is_set():
+                            return
+                    future = pool.submit(self._embed, batch, in_flight, stage)
+                    batch_slots = None if slots is None else slots[start:start + len(batch)]
+                    if previous is not None and not self._put(embedded, previous, stop, stage):
+                        return
+                    previous = (filepath, batch, pages[start:start + len(batch)], future, batch_slots, False)
+                    start += len(batch)
+                has_references = slots is not None and references[1]
+                if previous is not None and not self._put(embedded, (*previous[:-1], not has_references), stop, stage):
+                    return
+                # After the batches of the segment: the chunks duplicated are added by then
+                if has_references and not self._put(embedded, references, stop, stage):
+                    return
+        except BaseException as error:
+            self._put(embedded, _Failure(error), stop, stage)
+
+    def _embed(self, batch: list[str], in_flight: threading.Semaphore, stage: StageStats):
+        start = time.perf_counter()
+        try:
+            return self.index._embed_batch(batch)
+        finally:
+            in_flight.release()
+            seconds = time.perf_counter() - start
+            with self._stats_lock:
+                stage.seconds += seconds
+                stage.items += len(batch)
+                self.report.embed_seconds += seconds
+
+    def _add_stage(self, filepaths: list[str], embedded: queue.Queue) -> dict[str, list[int]]:
+        stage = self.stats["add"]
+        ids = {filepath: [] for filepath in filepaths}
+        while True:
+            item = embedded.get()
+            if item is _DONE:
+                return ids
+            if isinstance(item, _Failure):
+                raise item.error
+            filepath, batch, pages, future, slots, segment_end = item
+            if batch is None:
+                # End of the file, `pages` holds the metadata of the document
+                self.index.set_document_metadata(filepath, pages)
+                if self.journal is not None:
+                    self.journal.end(filepath, pages)
+            elif future is None:
+                # Duplicates of added chunks, `slots` are those of the chunks duplicated
+                referenced = [self.index.dedup.id_of(slot) for slot in slots]
+                self.index.add_references(referenced, document=filepath, pages=pages)
+                if self.journal is not None:
+                    self.journal.references(filepath, referenced, pages)
+                ids[filepath].extend(referenced)
+            else:
+                self._add(filepath, batch, pages, future, slots, ids, stage)
+            if self.journal is not None and segment_end:
+                self.journal.segment_done()
+
+    def _add(self, filepath: str, batch: list[str], pages: list[tuple[int, int]], future: Future,
+             slots: list[int] | None, ids: dict[str, list[int]], stage: StageStats):
+        """Adds an embedded batch to the index, once its embeddings are ready."""
+        vectors = future.result()
+        start = time.perf_counter()
+        added = self.index.add_vectors(vectors, batch, document=filepath, pages=pages)
+        if slots is not None:
+            self.index.dedup.bind(slots, added)
+        if self.journal is not None:
+            self.journal.add(filepath, batch, vectors, pages, added)
+        ids[filepath].extend(added)
+        seconds = time.perf_counter() - start
+        stage.items += len(batch)
+        stage.seconds += seconds
+        self.report.add_seconds += seconds
+        self.report.chunks += len(batch)
+        self.report.requests += 1 if self.index.batch_embeddings else len(batch)
+        self.report.tokens += sum(estimate_tokens(chunk) for chunk in batch)
+
+    def summary(self) -> str:
+        """Returns a one-line summary of the last run."""
+        stages = ", ".join(f"{name} {stats.seconds:.2f}s (max queue {stats.max_queue_depth})"
+                           for name, stats in self.stats.items())
+        return f"{self.report} | {stages}"
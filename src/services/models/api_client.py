@@ -0,0 +1,413 @@
+"""Resilient access to the Azure OpenAI APIs, shared by the embeddings and LLM clients.
+
+Every request goes through the `ResilientClient` of its API, which, in order:
+
+1. fails fast while the API's circuit breaker is open (after consecutive server errors);
+2. waits for the token bucket of the API's tokens-per-minute quota (estimated tokens) and the one
+   of its requests-per-minute quota, so bursts are smoothed before Azure rejects them;
+3. waits for a slot of the adaptive concurrency limit, which is halved on 429s and grows back by
+   one request per round of successes;
+4. retries throttled (429), server (5xx), timeout and connection errors with jittered exponential
+   backoff, or after the delay of the Retry-After header, which every thread of the API honors.
+
+Token estimates are upper bounds (`batching.estimate_tokens`): when a response reports the tokens it
+used, `record_usage` gives the difference back to the token bucket.
+
+All the clients share a pooled HTTP connection (`get_http_client`), and the OpenAI SDK's own
+retries are disabled. Limits are read from the environment: AZURE_EMBEDDINGS_TPM/RPM/MAX_CONCURRENCY
+and AZURE_LLM_TPM/RPM/MAX_CONCURRENCY, API_MAX_RETRIES, API_BACKOFF_BASE, API_BACKOFF_MAX,
+API_CIRCUIT_FAILURES and API_CIRCUIT_RESET.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from typing import Callable, TypeVar
+
+import httpx
+import openai
+
+from src.services.observability.telemetry import (
+    API_RETRIES,
+    API_THROTTLED,
+    CIRCUIT_REJECTIONS,
+    CIRCUIT_STATE,
+    CONCURRENCY_LIMIT,
+    RATE_LIMIT_WAIT,
+)
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """Returns the HTTP client shared by all the Azure OpenAI clients of the process.
+
+    Connections are kept alive and reused across requests and threads, up to HTTP_MAX_CONNECTIONS
+    (64) connections. Requests time out after HTTP_TIMEOUT seconds (60), connections after 5.
+    """
+    max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", 64))
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections,
+                            keepalive_expiry=60.0),
+        timeout=httpx.Timeout(float(os.getenv("HTTP_TIMEOUT", 60)), connect=5.0),
+    )
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the API while its circuit breaker is open.
+
+    Attributes:
+        retry_after (float): Seconds until the breaker lets a trial request through.
+    """
+    def __init__(self, api: str, retry_after: float):
+        super().__init__(f"The {api} API is unavailable, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Rate limit of a per-minute quota, e.g. tokens or requests per minute.
+
+    The bucket holds up to 10 seconds of quota, the window over which Azure enforces the per-minute
+    quotas, and refills continuously. A request takes its amount
+    right away, possibly leaving the bucket in debt, and sleeps until the debt is paid back: requests
+    are served in arrival order and a large one does not starve behind small ones.
+
+    Attributes:
+        per_minute (float): The quota.
+        capacity (float): Maximum amount available at once.
+
+    Methods:
+        acquire(amount): Takes `amount` from the bucket, waiting for it if needed. Returns the seconds waited.
+        refund(amount): Gives `amount` back to the bucket, or takes it if negative, without waiting.
+    """
+    def __init__(self, per_minute: float, capacity: float | None = None):
+        if per_minute <= 0:
+            raise ValueError(f"Got a non-positive quota ({per_minute})")
+        self.per_minute = per_minute
+        self.capacity = capacity or per_minute / 6
+        self._rate = per_minute / 60
+        self._available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self._available = min(self.capacity, self._available + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def acquire(self, amount: float) -> float:
+        # A request above the capacity waits for a full bucket rather than forever
+        amount = min(amount, self.capacity)
+        with self._lock:
+            self._refill(time.monotonic())
+            self._available -= amount
+            wait = -self._available / self._rate if self._available < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def refund(self, amount: float):
+        with self._lock:
+            self._refill(time.monotonic())
+            self._available = min(self.capacity, self._available + amount)
+
+
+class AdaptiveConcurrencyLimiter:
+    """Limits the number of concurrent requests, adapting the limit to throttling (AIMD).
+
+    The limit is halved when a request is throttled, at most once per `backoff_interval` seconds
+    since a burst of 429s is a single signal, and grows by one after `limit` successes.
+
+    Attributes:
+        api (str): The API name, the label of `rag_api_concurrency_limit`.
+        limit (float): The current limit.
+        min_limit (int): The lowest limit.
+        max_limit (int): The highest limit, and the initial one.
+        in_flight (int): Number of requests being sent.
+
+    Methods:
+        acquire(): Waits for a free slot.
+        release(throttled): Frees a slot, tells whether its request was throttled.
+    """
+    def __init__(self, api: str, max_limit: int = 16, min_limit: int = 1, backoff_interval: float = 1.0):
+        self.api = api
+        self.limit = float(max_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_interval = backoff_interval
+        self.in_flight = 0
+        self._last_backoff = 0.0
+        self._condition = threading.Condition()
+        CONCURRENCY_LIMIT.set(self.limit, api=api)
+
+    def acquire(self):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, throttled: bool = False):
+        with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                if now - self._last_backoff >= self.backoff_interval:
+                    self.limit = max(float(self.min_limit), self.limit / 2)
+                    self._last_backoff = now
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            CONCURRENCY_LIMIT.set(int(self.limit), api=self.api)
+            self._condition.notify_all()
+
+
+class CircuitBreaker:
+    """Stops calling an API that keeps failing, and probes it again after a while.
+
+    After `failure_threshold` consecutive failures the breaker opens: calls fail fast with
+    `CircuitOpenError` for `reset_timeout` seconds. Then it is half-open: a single trial call goes
+    through, its success closes the breaker and its failure opens it again.
+
+    Attributes:
+        api (str): The API name, the label of `rag_circuit_state`.
+        failure_threshold (int): Consecutive failures opening the breaker.
+        reset_timeout (float): Seconds the breaker stays open.
+        state (str): "closed", "open" or "half_open".
+
+    Methods:
+        before_call(): Raises CircuitOpenError if the call must not be made, returns whether it is the trial call.
+        record_success(): Records a successful call.
+        record_failure(): Records a failed call.
+        release_trial(): Lets another trial call through, when the trial ended without an outcome.
+    """
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, api: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.api = api
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.set(0, api=api)
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning("Circuit breaker %s", state, extra={"api": self.api, "failures": self._failures})
+        self.state = state
+        CIRCUIT_STATE.set(self.STATES[state], api=self.api)
+
+    def before_call(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return False
+            remaining = self._opened + self.reset_timeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self._set_state("half_open")
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+        CIRCUIT_REJECTIONS.inc(api=self.api)
+        # While a trial is in flight, its failure would open the breaker for reset_timeout again
+        raise CircuitOpenError(self.api, remaining if remaining > 0 else self.reset_timeout)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self._set_state("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self._opened = time.monotonic()
+                self._set_state("open")
+
+    def release_trial(self):
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def retry_after(error: Exception) -> float | None:
+    """Returns the delay asked by the Retry-After headers of a failed response, in seconds."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def failure_reason(error: Exception) -> str | None:
+    """Returns why a request failed if retrying it may succeed ("throttled", "server", "timeout",
+    "connection"), None if it must not be retried (e.g. a bad request or an authentication error)."""
+    if isinstance(error, openai.RateLimitError):
+        return "throttled"
+    if isinstance(error, openai.APITimeoutError):
+        return "timeout"
+    if isinstance(error, openai.APIConnectionError):
+        return "connection"
+    if isinstance(error, openai.APIStatusError) and (error.status_code >= 500 or error.status_code == 408):
+        return "server"
+    return None
+
+
+class ResilientClient:
+    """Calls an Azure OpenAI API within its rate limits, with retries and a circuit breaker.
+
+    Attributes:
+        api (str): The API name, the label of the metrics ("embeddings" or "chat").
+        tokens (TokenBucket | None): The tokens-per-minute limit, None for no limit.
+        requests (TokenBucket | None): The requests-per-minute limit, None for no limit.
+        limiter (AdaptiveConcurrencyLimiter): The concurrency limit.
+        breaker (CircuitBreaker): The circuit breaker.
+        max_retries (int): Maximum number of retries of a request.
+        backoff_base (float): Seconds of the first backoff, doubled on each retry.
+        backoff_max (float): Maximum seconds of a backoff.
+
+    Methods:
+        call(function, *args, tokens, **kwargs): Calls `function` (an SDK method) with resilience.
+        record_usage(estimated, used): Corrects the token bucket with the tokens a request actually used.
+        from_env(api, prefix): Creates a client configured by environment variables.
+    """
+    def __init__(self, api: str, tokens_per_minute: float | None = None, requests_per_minute: float | None = None,
+                 max_concurrency: int = 16, max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 20.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.api = api
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.limiter = AdaptiveConcurrencyLimiter(api, max_concurrency)
+        self.breaker = CircuitBreaker(api, failure_threshold, reset_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # Requests wait until then after a 429, whichever thread got it
+        self._resume_at = 0.0
+
+    @classmethod
+    def from_env(cls, api: str, prefix: str) -> "ResilientClient":
+        """Reads `<prefix>_TPM`, `<prefix>_RPM` and `<prefix>_MAX_CONCURRENCY`, and the shared retry
+        and circuit breaker settings, from the environment."""
+        def number(name: str) -> float | None:
+            value = os.getenv(name)
+            return float(value) if value else None
+
+        return cls(api, tokens_per_minute=number(f"{prefix}_TPM"), requests_per_minute=number(f"{prefix}_RPM"),
+                   max_concurrency=int(os.getenv(f"{prefix}_MAX_CONCURRENCY", 16)),
+                   max_retries=int(os.getenv("API_MAX_RETRIES", 5)),
+                   backoff_base=float(os.getenv("API_BACKOFF_BASE", 0.5)),
+                   backoff_max=float(os.getenv("API_BACKOFF_MAX", 20)),
+                   failure_threshold=int(os.getenv("API_CIRCUIT_FAILURES", 5)),
+                   reset_timeout=float(os.getenv("API_CIRCUIT_RESET", 30)))
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        delay = retry_after(error)
+        if delay is not None:
+            # A little jitter, so the threads told to wait the same time don't retry at once
+            return min(delay, self.backoff_max * 3) + random.uniform(0, self.backoff_base / 2)
+        # Full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def record_usage(self, estimated: int, used: int):
+        if self.tokens is not None:
+            self.tokens.refund(estimated - used)
+
+    def call(self, function: Callable[..., T], *args, tokens: int = 1, **kwargs) -> T:
+        """Calls an API method, waiting for the rate limits and retrying transient failures.
+
+        Args:
+            function (Callable): The SDK method, e.g. `client.embeddings.create`.
+            *args: Positional arguments of `function`.
+            tokens (int, optional): Estimated tokens of the request, counted against the
+                tokens-per-minute limit. Defaults to 1.
+            **kwargs: Keyword arguments of `function`.
+
+        Returns:
+            The return value of `function`. For streamed responses, the stream once its headers
+            were received: failures while reading it are not retried.
+
+        Raises:
+            CircuitOpenError: The circuit breaker is open.
+            openai.APIError: The request failed and can't be retried, or failed `max_retries` times.
+        """
+        attempt = 0
+        while True:
+            trial = self.breaker.before_call()
+            recorded = False
+            try:
+                waited = max(0.0, self._resume_at - time.monotonic())
+                if waited:
+                    time.sleep(waited)
+                if self.requests is not None:
+                    waited += self.requests.acquire(1)
+                if self.tokens is not None:
+                    waited += self.tokens.acquire(tokens)
+                self.limiter.acquire()
+                reason = None
+                try:
+                    result = function(*args, **kwargs)
+                except Exception as error:
+                    reason = failure_reason(error)
+                    if reason is None or reason == "throttled":
+                        # The API answered: client errors and throttling tell nothing bad about its health
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.record_failure()
+                    recorded = True
+                    if reason is None:
+                        raise
+                    if reason == "throttled":
+                        API_THROTTLED.inc(api=self.api)
+                    if attempt >= self.max_retries:
+                        logger.error("Request failed after %d retries: %s", attempt, error,
+                                     extra={"api": self.api, "reason": reason})
+                        raise
+                    delay = self._backoff(attempt, error)
+                    if reason == "throttled":
+                        self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                    API_RETRIES.inc(api=self.api, reason=reason)
+                    logger.warning("Retrying request", extra={"api": self.api, "reason": reason,
+                                                              "attempt": attempt + 1, "delay": round(delay, 3)})
+                else:
+                    self.breaker.record_success()
+                    recorded = True
+                    return result
+                finally:
+                    self.limiter.release(throttled=reason == "throttled")
+                    RATE_LIMIT_WAIT.observe(waited, api=self.api)
+            finally:
+                # Interrupted (e.g. KeyboardInterrupt) before the trial had an outcome: let another one through
+                if trial and not recorded:
+                    self.breaker.release_trial()
+            time.sleep(delay)
+            attempt += 1
+
+
+@lru_cache(maxsize=None)
+def get_api_client(api: str, prefix: str) -> ResilientClient:
+    """Returns the resilient client of an API, shared by the process so its limits are global.
+
+    Args:
+        api (str): The API name, "embeddings" or "chat".
+        prefix (str): The prefix of its environment variables, e.g. "AZURE_EMBEDDINGS".
+    """
+    return ResilientClient.from_env(api, prefix)
@@ -0,0 +1,134 @@
+import math
+import time
+from typing import Iterable, Iterator
+
+
+# Azure OpenAI embeddings accept up to 2048 inputs per request and reject
+# requests above roughly 300k tokens, keep comfortably below both.
+DEFAULT_MAX_BATCH_ITEMS = 256
+DEFAULT_MAX_BATCH_TOKENS = 100_000
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap upper-bound estimate of the number of tokens in a text.
+
+    English text averages ~4 characters per token, 3 is used to stay on the safe side
+    of the request limits without having to run the tokenizer.
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated number of tokens.
+    """
+    return max(1, math.ceil(len(text) / 3))
+
+
+def iter_batches(texts: Iterable[str], max_items: int = DEFAULT_MAX_BATCH_ITEMS,
+                 max_tokens: int = DEFAULT_MAX_BATCH_TOKENS) -> Iterator[list[str]]:
+    """Groups texts into batches that respect an item and a token budget.
+
+    A single text above the token budget is sent alone in its own batch.
+
+    Args:
+        texts (Iterable[str]): The texts to group, consumed lazily.
+        max_items (int): Maximum number of texts per batch.
+        max_tokens (int): Maximum number of estimated tokens per batch.
+
+    Yields:
+        list[str]: The batches, in input order.
+    """
+    if max_items < 1 or max_tokens < 1:
+        raise ValueError("max_items and max_tokens must be positive")
+    batch: list[str] = []
+    batch_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+class ThroughputReport:
+    """Accumulates throughput figures of an embedding ingestion run.
+
+    Attributes:
+        chunks (int): Number of chunks embedded and added to the index.
+        requests (int): Number of embeddings requests issued.
+        tokens (int): Estimated number of tokens sent.
+        duplicates (int): Number of chunks found to duplicate a stored chunk, neither embedded nor stored.
+        near_duplicates (int): Number of those duplicates that were near, not exact, duplicates.
+        requests_saved (int): Number of embeddings requests the duplicates would have cost.
+        tokens_saved (int): Estimated number of tokens of the duplicates.
+        bytes_saved (int): Bytes of text and vectors the duplicates would have taken in the index.
+        embed_seconds (float): Time spent waiting on embeddings.
+        add_seconds (float): Time spent adding vectors to the index.
+        seconds (float): Wall-clock time of the run.
+    """
+    def __init__(self):
+        self.chunks = 0
+        self.requests = 0
+        self.tokens = 0
+        self.duplicates = 0
+        self.near_duplicates = 0
+        self.requests_saved = 0
+        self.tokens_saved = 0
+        self.bytes_saved = 0
+        self.embed_seconds = 0.0
+        self.add_seconds = 0.0
+        self.seconds = 0.0
+        self._start = time.perf_counter()
+
+    def stop(self) -> "ThroughputReport":
+        """Freezes the wall-clock time of the run."""
+        self.seconds = time.perf_counter() - self._start
+        return self
+
+    def merge(self, other: "ThroughputReport") -> "ThroughputReport":
+        """Adds the figures of another report to this one."""
+        self.chunks += other.chunks
+        self.requests += other.requests
+        self.tokens += other.tokens
+        self.duplicates += other.duplicates
+        self.near_duplicates += other.near_duplicates
+        self.requests_saved += other.requests_saved
+        self.tokens_saved += other.tokens_saved
+        self.bytes_saved += other.bytes_saved
+        self.embed_seconds += other.embed_seconds
+        self.add_seconds += other.add_seconds
+        self.seconds += other.seconds
+        return self
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "chunks": self.chunks,
+            "requests": self.requests,
+            "tokens": self.tokens,
+            "duplicates": self.duplicates,
+            "near_duplicates": self.near_duplicates,
+            "requests_saved": self.requests_saved,
+            "tokens_saved": self.tokens_saved,
+            "bytes_saved": self.bytes_saved,
+            "seconds": round(self.seconds, 4),
+            "embed_seconds": round(self.embed_seconds, 4),
+            "add_seconds": round(self.add_seconds, 4),
+            "chunks_per_second": round(self.chunks_per_second, 2),
+        }
+
+    def __str__(self) -> str:
+        summary = (f"{self.chunks} chunks in {self.seconds:.2f}s "
+                   f"({self.chunks_per_second:.1f} chunks/s, {self.requests} requests, "
+                   f"~{self.tokens} tokens, embed {self.embed_seconds:.2f}s, add {self.add_seconds:.2f}s)")
+        if self.duplicates:
+            summary += (f", {self.duplicates} duplicates skipped ({self.near_duplicates} near, "
+                        f"{self.requests_saved} requests, ~{self.tokens_saved} tokens and {self.bytes_saved} bytes saved)")
+        return summary
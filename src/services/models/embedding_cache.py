@@ -0,0 +1,297 @@
+import hashlib
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: cross-process locking is not available, in-process locking still applies
+    fcntl = None
+
+
+DEFAULT_CACHE_PATH = "./embedding_cache"
+DEFAULT_MAX_ENTRIES = 100_000
+KEY_BYTES = 16
+
+
+class EmbeddingCache:
+    """Persistent, content-addressed cache of embeddings.
+
+    Entries are keyed by a hash of (model name, dimension, text). Vectors live in a fixed-capacity,
+    memory-mapped float32 matrix where each slot is addressed by its row offset. A parallel
+    memory-mapped array holds the key of each slot and another one its last-use stamp, which is
+    used for least-recently-used eviction once every slot is taken.
+
+    Several processes can read the cache while one of them writes: writers hold an exclusive file
+    lock, clear the slot key before overwriting a vector and publish the new key last, and readers
+    only accept a vector whose slot key matches before and after the copy. Readers don't take the
+    file lock to update last-use stamps, so processes may overwrite each other's stamps: eviction
+    is least-recently-used within a process, and only approximately so across processes.
+
+    Attributes:
+        path (str): The folder holding the cache files of this model and dimension.
+        model (str): The embeddings model name.
+        dimension (int): The dimension of the embeddings.
+        max_entries (int): Maximum number of cached embeddings.
+        hits (int): Number of lookups answered from the cache.
+        misses (int): Number of lookups not found in the cache.
+        evictions (int): Number of entries evicted to make room for new ones.
+
+    Methods:
+        get(text): Returns the cached embedding of a text, or None.
+        get_many(texts): Returns the cached embeddings of several texts, None for the misses.
+        put_many(texts, vectors): Stores the embeddings of several texts.
+        stats(): Returns the hit/miss counters.
+    """
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, model: str | None = None, dimension: int = 3072,
+                 max_entries: int = DEFAULT_MAX_ENTRIES):
+        """Opens the cache, creating its files if they don't exist.
+
+        Args:
+            path (str, optional): The root folder of the cache. Defaults to "./embedding_cache".
+            model (str, optional): The embeddings model name, part of every key.
+            dimension (int, optional): The dimension of the embeddings. Defaults to 3072.
+            max_entries (int, optional): Maximum number of cached embeddings. Defaults to 100 000.
+        """
+        self.model = model or ""
+        self.dimension = dimension
+        self.max_entries = max_entries
+        safe_model = re.sub(r"[^A-Za-z0-9_.-]", "_", self.model) or "default"
+        self.path = os.path.join(path, f"{safe_model}-{dimension}")
+        os.makedirs(self.path, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.RLock()
+        self._lock_path = os.path.join(self.path, "lock")
+        open(self._lock_path, "a").close()
+
+        with self._file_lock(exclusive=True):
+            self._keys = self._open_memmap("keys.bin", np.uint8, (max_entries, KEY_BYTES))
+            self._vectors = self._open_memmap("vectors.f32", np.float32, (max_entries, dimension))
+            self._stamps = self._open_memmap("stamps.i64", np.int64, (max_entries,))
+            # meta[0]: generation bumped on every write, meta[1]: logical clock used for stamps
+            self._meta = self._open_memmap("meta.i64", np.int64, (2,))
+        self._generation = -1
+        self._slots: dict[bytes, int] = {}
+        self._refresh()
+
+    def _open_memmap(self, name: str, dtype, shape: tuple) -> np.memmap:
+        filepath = os.path.join(self.path, name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        if not os.path.exists(filepath) or os.path.getsize(filepath) != size:
+            # A resized cache starts empty: slots of a different capacity cannot be reused
+            with open(filepath, "wb") as file:
+                file.truncate(size)
+        return np.memmap(filepath, dtype=dtype, mode="r+", shape=shape)
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool):
+        if fcntl is None:
+            yield
+            return
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _key(self, text: str) -> bytes:
+        digest = hashlib.sha256(f"{self.model}\x00{self.dimension}\x00{text}".encode("utf-8")).digest()
+        # An all-zero key marks an empty slot
+        return digest[:KEY_BYTES] if any(digest[:KEY_BYTES]) else b"\x01" + digest[1:KEY_BYTES]
+
+    def _refresh(self):
+        """Rebuilds the key -> slot map when another writer changed the cache."""
+        generation = int(self._meta[0])
+        if generation == self._generation:
+            return
+        occupied = np.flatnonzero(self._keys.any(axis=1))
+        keys = self._keys[occupied].tobytes()
+        self._slots = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: int(slot) for i, slot in enumerate(occupied)}
+        self._generation = generation
+
+    def _tick(self) -> int:
+        self._meta[1] += 1
+        return int(self._meta[1])
+
+    def _read(self, key: bytes) -> np.ndarray | None:
+        slot = self._slots.get(key)
+        if slot is None:
+            return None
+        if self._keys[slot].tobytes() != key:
+            # The slot was evicted by another process since the map was built
+            del self._slots[key]
+            return None
+        vector = np.array(self._vectors[slot])
+        if self._keys[slot].tobytes() != key:
+            # Evicted during the copy
+            del self._slots[key]
+            return None
+        # Unlocked read-modify-write of the shared clock: LRU order is approximate across processes
+        self._stamps[slot] = self._tick()
+        return vector
+
+    def get(self, text: str) -> np.ndarray | None:
+        """Returns the cached embedding of a text.
+
+        Args:
+            text (str): The embedded text.
+
+        Returns:
+            np.ndarray | None: The embedding, or None when it is not cached.
+        """
+        return self.get_many([text])[0]
+
+    def get_many(self, texts: list[str]) -> list[np.ndarray | None]:
+        """Returns the cached embeddings of several texts.
+
+        Args:
+            texts (list[str]): The embedded texts.
+
+        Returns:
+            list: One embedding per text, None for the texts that are not cached.
+        """
+        with self._lock:
+            self._refresh()
+            vectors = [self._read(self._key(text)) for text in texts]
+            found = sum(vector is not None for vector in vectors)
+            self.hits += found
+            self.misses += len(texts) - found
+        return vectors
+
+    def put_many(self, texts: list[str], vectors) -> None:
+        """Stores the embeddings of several texts, evicting the least recently used entries if needed.
+
+        Args:
+            texts (list[str]): The embedded texts.
+            vectors: The embeddings, one row per text.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.shape != (len(texts), self.dimension):
+            raise ValueError(f"Expected embeddings of shape {(len(texts), self.dimension)}, got {vectors.shape}")
+        with self._lock, self._file_lock(exclusive=True):
+            self._refresh()
+            pending = {}
+            for text, vector in zip(texts, vectors):
+                key = self._key(text)
+                if key not in self._slots:
+                    pending[key] = vector
+            if not pending:
+                return
+            pending = list(pending.items())[-self.max_entries:]
+            free = np.argpartition(self._stamps, len(pending) - 1)[:len(pending)] \
+                if len(pending) < self.max_entries else np.arange(self.max_entries)
+            for slot, (key, vector) in zip(free.tolist(), pending):
+                old_key = self._keys[slot].tobytes()
+                if any(old_key):
+                    self._slots.pop(old_key, None)
+                    self.evictions += 1
+                self._keys[slot] = 0
+                self._vectors[slot] = vector
+                self._keys[slot] = np.frombuffer(key, dtype=np.uint8)
+                self._stamps[slot] = self._tick()
+                self._slots[key] = slot
+            self._meta[0] += 1
+            self._generation = int(self._meta[0])
+            self._flush()
+
+    def _flush(self):
+        for array in (self._vectors, self._keys, self._stamps, self._meta):
+            array.flush()
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return len(self._slots)
+
+    def stats(self) -> dict:
+        """Returns the cache counters.
+
+        Returns:
+            dict: Entries, hits, misses, hit ratio and evictions.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+class CachedEmbeddings:
+    """Wraps embeddings callables with an `EmbeddingCache`.
+
+    Exposes the same `get_embeddings`/`get_embeddings_batch` methods as `Embeddings`, so it can be
+    handed to `FAISSIndex` in its place: only texts missing from the cache reach the API.
+
+    Attributes:
+        cache (EmbeddingCache): The cache in front of the embeddings API.
+        embeddings (function): The function that returns the embeddings of a text.
+        batch_embeddings (function): Optional function that returns the embeddings of a list of texts.
+    """
+    def __init__(self, cache: EmbeddingCache, embeddings, batch_embeddings=None):
+        self.cache = cache
+        self.embeddings = embeddings
+        self.batch_embeddings = batch_embeddings
+
+    @classmethod
+    def from_embeddings(cls, embeddings, path: str | None = None, max_entries: int | None = None) -> "CachedEmbeddings":
+        """Builds a cached wrapper around an `Embeddings` instance.
+
+        The cache location and size default to the `EMBEDDINGS_CACHE_PATH` and
+        `EMBEDDINGS_CACHE_MAX_ENTRIES` environment variables.
+
+        Args:
+            embeddings (Embeddings): The embeddings service to wrap.
+            path (str, optional): The root folder of the cache.
+            max_entries (int, optional): Maximum number of cached embeddings.
+
+        Returns:
+            CachedEmbeddings: The wrapper.
+        """
+        cache = EmbeddingCache(
+            path=path or os.getenv("EMBEDDINGS_CACHE_PATH", DEFAULT_CACHE_PATH),
+            model=embeddings.model,
+            dimension=getattr(embeddings, "dimension", 3072),
+            max_entries=max_entries or int(os.getenv("EMBEDDINGS_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        )
+        return cls(cache, embeddings.get_embeddings, embeddings.get_embeddings_batch)
+
+    @property
+    def model(self) -> str:
+        return self.cache.model
+
+    @property
+    def dimension(self) -> int:
+        return self.cache.dimension
+
+    def get_embeddings(self, text: str) -> list[float]:
+        """Returns the embedding of a text, calling the API only on a cache miss."""
+        vector = self.cache.get(text)
+        if vector is None:
+            vector = np.asarray(self.embeddings(text), dtype=np.float32)
+            self.cache.put_many([text], vector[None, :])
+        return vector.tolist()
+
+    def get_embeddings_batch(self, texts: list[str]) -> list[list[float]]:
+        """Returns the embeddings of several texts, sending only the cache misses to the API."""
+        vectors = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, vectors) if vector is None))
+        if missing:
+            if self.batch_embeddings:
+                computed = self.batch_embeddings(missing)
+            else:
+                computed = [self.embeddings(text) for text in missing]
+            computed = np.asarray(computed, dtype=np.float32)
+            self.cache.put_many(missing, computed)
+            by_text = dict(zip(missing, computed))
+            vectors = [vector if vector is not None else by_text[text] for text, vector in zip(texts, vectors)]
+        return [vector.tolist() for vector in vectors]
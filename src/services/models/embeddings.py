@@ -1,33 +1,57 @@
-from openai import AzureOpenAI
+from openai import AzureOpenAI, NOT_GIVEN
 import os
 
+from src.services.models.api_client import get_api_client, get_http_client
+from src.services.models.batching import estimate_tokens
+from src.services.observability.telemetry import API_CALLS, TOKENS
+
+
+# Dimension of the embeddings of text-embedding-3-large when they are not shortened
+DEFAULT_DIMENSION = 3072
+
 class Embeddings:
     """Handles interactions with the Azure OpenAI Embeddings API.
 
     Attributes:
         client (AzureOpenAI): The Azure OpenAI client instance.
+        api (ResilientClient): Rate limits, retries and circuit breaker of the embeddings requests, shared by the process.
         model (str): The name of the Azure OpenAI embedding model to use.
+        dimensions (int | None): The number of dimensions requested, None for the model's full size.
+        dimension (int): The dimension of the returned embeddings.
 
     Methods:
         get_embeddings(text): Generates embeddings for the given text using the Azure OpenAI Embeddings API.
+        get_embeddings_batch(texts): Generates embeddings for several texts in a single API request.
     """
-    def __init__(self):
-        """Initializes the Embeddings class with Azure OpenAI client and model information."""
+    def __init__(self, dimensions: int | None = None):
+        """Initializes the Embeddings class with Azure OpenAI client and model information.
+
+        Args:
+            dimensions (int, optional): Number of dimensions of the embeddings, to request shortened
+                embeddings (text-embedding-3 models). Defaults to the AZURE_EMBEDDINGS_DIMENSIONS
+                environment variable, or the model's full size.
+        """
         azure_endpoint = os.getenv("AZURE_EMBEDDINGS_ENDPOINT")
         azure_deployment = os.getenv("AZURE_EMBEDDINGS_DEPLOYMENT_NAME")
         api_key = os.getenv("AZURE_EMBEDDINGS_API_KEY")
         api_version = os.getenv("AZURE_LLM_API_VERSION")
 
         self.model = os.getenv("AZURE_EMBEDDINGS_MODEL_NAME")
+        if dimensions is None and os.getenv("AZURE_EMBEDDINGS_DIMENSIONS"):
+            dimensions = int(os.getenv("AZURE_EMBEDDINGS_DIMENSIONS"))
+        self.dimensions = dimensions
+        self.dimension = dimensions or DEFAULT_DIMENSION
 
         self.client = AzureOpenAI(
             azure_endpoint=azure_endpoint,
             azure_deployment=azure_deployment,
             api_version=api_version,
-            api_key=api_key
+            api_key=api_key,
+            http_client=get_http_client(),
+            # Retried by `api`, which knows about the rate limits
+            max_retries=0,
         )
-
-
+        self.api = get_api_client("embeddings", "AZURE_EMBEDDINGS")
 
     def get_embeddings(self, text: str) -> list[float]:
         """Generates embeddings for the given text.
@@ -38,9 +62,42 @@ class Embeddings:
         Returns:
             list: A list of floats representing the text embedding.
         """
-        completion = self.client.embeddings.create(
+        API_CALLS.inc(api="embeddings")
+        tokens = estimate_tokens(text)
+        completion = self.api.call(
+            self.client.embeddings.create,
             input=text,
-            model=self.model
+            model=self.model,
+            dimensions=self.dimensions or NOT_GIVEN,
+            tokens=tokens,
         )
+        if completion.usage:
+            TOKENS.inc(completion.usage.total_tokens, api="embeddings", kind="prompt")
+            self.api.record_usage(tokens, completion.usage.total_tokens)
         
         return completion.data[0].embedding
+
+    def get_embeddings_batch(self, texts: list[str]) -> list[list[float]]:
+        """Generates embeddings for several texts with a single request.
+
+        Args:
+            texts (list[str]): The texts to generate embeddings for.
+
+        Returns:
+            list: One embedding per text, in the same order as `texts`.
+        """
+        API_CALLS.inc(api="embeddings")
+        tokens = sum(estimate_tokens(text) for text in texts)
+        completion = self.api.call(
+            self.client.embeddings.create,
+            input=texts,
+            model=self.model,
+            dimensions=self.dimensions or NOT_GIVEN,
+            tokens=tokens,
+        )
+        if completion.usage:
+            TOKENS.inc(completion.usage.total_tokens, api="embeddings", kind="prompt")
+            # The estimate is an upper bound, give the difference back to the rate limit
+            self.api.record_usage(tokens, completion.usage.total_tokens)
+
+        return [item.embedding for item in sorted(completion.data, key=lambda item: item.index)]
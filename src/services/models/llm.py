@@ -1,5 +1,15 @@
 from openai import AzureOpenAI
+import logging
 import os
+import time
+from typing import Iterator
+
+from src.services.models.api_client import get_api_client, get_http_client
+from src.services.models.prompt_builder import PromptBuilder
+from src.services.observability.telemetry import API_CALLS, TOKENS, span
+
+
+logger = logging.getLogger(__name__)
 
 
 class LLM:
@@ -7,10 +17,13 @@ class LLM:
 
     Attributes:
         client (AzureOpenAI): The Azure OpenAI client instance.
+        api (ResilientClient): Rate limits, retries and circuit breaker of the chat requests, shared by the process.
         model_name (str): The name of the Azure OpenAI LLM model to use.
+        prompt_builder (PromptBuilder): Fits the history and context of each request into a token budget.
 
     Methods:
         get_response(history, context, user_input): Generates a response from the LLM based on the conversation history, context, and user input.
+        stream_response(history, context, user_input, stats): Same as get_response, yielding the response as it is generated.
     """
     def __init__(self):
         """Initializes the LLM class with Azure OpenAI client and model information."""
@@ -24,45 +37,118 @@ class LLM:
             azure_endpoint=azure_endpoint,
             azure_deployment=azure_deployment,
             api_version=api_version,
-            api_key=api_key
+            api_key=api_key,
+            http_client=get_http_client(),
+            # Retried by `api`, which knows about the rate limits
+            max_retries=0,
         )
+        self.api = get_api_client("chat", "AZURE_LLM")
         self.model_name = os.getenv("AZURE_LLM_MODEL_NAME")
+        self.prompt_builder = PromptBuilder.from_env(self.model_name)
+
+    def _build_messages(self, history, context, user_input) -> tuple[list[dict], dict]:
+        """Prepares the messages for the chat/completions endpoint within the prompt token budget, with their stats."""
+        with span("prompt_build"):
+            return self.prompt_builder.build(history, context, user_input)
+
+    def _request_tokens(self, prompt_stats: dict) -> int:
+        """Tokens counted against the tokens-per-minute quota: Azure counts the prompt and max_tokens."""
+        return prompt_stats.get("prompt_tokens", 0) + self._completion_params()["max_tokens"]
+
+    def _completion_params(self) -> dict:
+        return dict(
+            model=self.model_name,  # Use 'engine' instead of 'model' for Azure OpenAI
+            temperature=0.7,
+            max_tokens=800,
+            top_p=1.0,
+            frequency_penalty=0.0,
+            presence_penalty=0.6,
+        )
 
     def get_response(self, history, context, user_input):
         """Generates a response from the LLM.
 
         Args:
             history (list): A list of previous messages in the conversation history.
-            context (str): Relevant information from the knowledge base to provide context to the LLM.
+            context (str | list[str]): Relevant information from the knowledge base to provide context to the LLM,
+                as retrieved chunks (most relevant first) or a single string.
             user_input (str): The user's current input.
 
         Returns:
             str: The LLM's generated response.
-        """
-        # Prepare the messages for the chat/completions endpoint
-        messages = [{"role": "system", "content": "You are a helpful assistant."}]
-        if history:
-            messages.extend(history)  # Add previous messages
-        messages.append({"role": "user", "content": f"Context:\n{context}\n\n{user_input}"})
 
-        #print("context:", context)
-        print("user_input:", user_input)
+        Raises:
+            CircuitOpenError: The chat API failed repeatedly and is not called for a while.
+            openai.APIError: The request failed, after retries for transient failures.
+        """
+        messages, prompt_stats = self._build_messages(history, context, user_input)
+        logger.debug("Generating a response", extra={"user_input": user_input})
 
-        try:
+        with span("llm_call", stream=False):
+            API_CALLS.inc(api="chat")
             # Call Azure OpenAI API to generate a response
-            response = self.client.chat.completions.create(
-                model=self.model_name,  # Use 'engine' instead of 'model' for Azure OpenAI
-                messages=messages,
-                temperature=0.7,
-                max_tokens=800,
-                top_p=1.0,
-                frequency_penalty=0.0,
-                presence_penalty=0.6,
-            )
-            # Extract the response content
-            print(response.choices[0].message.content)
-            return response.choices[0].message.content
-
-        except Exception as e:
-            print(f"Error generating response: {e}")
-            return "I'm sorry, I encountered an error generating a response."
+            response = self.api.call(self.client.chat.completions.create, messages=messages,
+                                     tokens=self._request_tokens(prompt_stats), **self._completion_params())
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            TOKENS.inc(usage.prompt_tokens, api="chat", kind="prompt")
+            TOKENS.inc(usage.completion_tokens, api="chat", kind="completion")
+        # Extract the response content
+        return response.choices[0].message.content
+
+    def stream_response(self, history, context, user_input, stats: dict | None = None) -> Iterator[str]:
+        """Generates a response from the LLM, yielding it piece by piece as it is generated.
+
+        Args:
+            history (list): A list of previous messages in the conversation history.
+            context (str | list[str]): Relevant information from the knowledge base to provide context to the LLM,
+                as retrieved chunks (most relevant first) or a single string.
+            user_input (str): The user's current input.
+            stats (dict, optional): Filled with the time to first token, the tokens and the generation
+                speed of this response once the stream ends. It belongs to the caller: the LLM is shared
+                by concurrent requests, so it keeps no per-request state.
+
+        Yields:
+            str: The successive pieces (deltas) of the LLM's response.
+
+        Raises:
+            CircuitOpenError: The chat API failed repeatedly and is not called for a while.
+            openai.APIError: The request failed, after retries for transient failures, or the
+                stream broke while being read.
+        """
+        messages, prompt_stats = self._build_messages(history, context, user_input)
+        logger.debug("Streaming a response", extra={"user_input": user_input})
+
+        start = time.perf_counter()
+        first_token = None
+        deltas = 0
+        # Times the whole generation, including the pauses of the consumer between pieces
+        with span("llm_call", stream=True):
+            try:
+                API_CALLS.inc(api="chat")
+                # Retried until the response starts, a stream broken midway is not
+                stream = self.api.call(self.client.chat.completions.create, messages=messages, stream=True,
+                                       tokens=self._request_tokens(prompt_stats), **self._completion_params())
+                for chunk in stream:
+                    # Azure sends chunks without choices, e.g. for content filtering results
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    if first_token is None:
+                        first_token = time.perf_counter() - start
+                    deltas += 1
+                    yield chunk.choices[0].delta.content
+            finally:
+                seconds = time.perf_counter() - start
+                generation = seconds - (first_token or 0.0)
+                # Each streamed delta carries one token
+                stream_stats = {
+                    "time_to_first_token": round(first_token, 4) if first_token is not None else None,
+                    "tokens": deltas,
+                    "tokens_per_second": round(deltas / generation, 2) if deltas and generation > 0 else 0.0,
+                    "seconds": round(seconds, 4),
+                }
+                if stats is not None:
+                    stats.update(stream_stats)
+                TOKENS.inc(prompt_stats.get("prompt_tokens", 0), api="chat", kind="prompt")
+                TOKENS.inc(deltas, api="chat", kind="completion")
+                logger.info("Streamed response", extra=stream_stats)
@@ -0,0 +1,214 @@
+import logging
+import os
+
+from src.services.models.tokenizer import get_encoding
+from src.services.observability.telemetry import PROMPT_TOKENS_SAVED
+
+
+logger = logging.getLogger(__name__)
+
+# Tokens added by the chat format around every message, and to prime the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+SYSTEM_PROMPT = "You are a helpful assistant."
+
+
+def overlap_length(first: str, second: str, min_overlap: int = 32) -> int:
+    """Returns the length of the longest suffix of `first` that is a prefix of `second`, 0 below `min_overlap`."""
+    if min(len(first), len(second)) < min_overlap:
+        return 0
+    probe = second[:min_overlap]
+    position = first.find(probe, max(0, len(first) - len(second)))
+    while position >= 0:
+        if second.startswith(first[position:]):
+            return len(first) - position
+        position = first.find(probe, position + 1)
+    return 0
+
+
+def merge_overlapping_chunks(chunks: list[str], min_overlap: int = 32) -> list[str]:
+    """Merges retrieved chunks whose texts overlap, and drops duplicated ones.
+
+    Consecutive chunks of a document share their boundary text (the chunker overlap): when the end
+    of a chunk is the start of another, both are merged into a single span so the shared text is
+    sent once. Chunks contained in another are dropped. Spans keep the rank of their best chunk.
+
+    Args:
+        chunks (list[str]): The chunks, most relevant first.
+        min_overlap (int, optional): Minimum number of shared characters to merge two chunks. Defaults to 32.
+
+    Returns:
+        list[str]: The merged spans, most relevant first.
+    """
+    spans = []
+    for chunk in (chunk.strip() for chunk in chunks):
+        if not chunk or any(chunk in span for span in spans):
+            continue
+        contained = [i for i, span in enumerate(spans) if span in chunk]
+        if contained:
+            # The chunk replaces the chunks it contains, at the rank of the best one
+            spans[contained[0]] = chunk
+            spans = [span for i, span in enumerate(spans) if i not in contained[1:]]
+        else:
+            spans.append(chunk)
+    merged = True
+    while merged:
+        merged = False
+        for i, first in enumerate(spans):
+            for j, second in enumerate(spans):
+                if i == j:
+                    continue
+                overlap = overlap_length(first, second, min_overlap)
+                if overlap:
+                    spans[min(i, j)] = first + second[overlap:]
+                    del spans[max(i, j)]
+                    merged = True
+                    break
+            if merged:
+                break
+    return spans
+
+
+class PromptBuilder:
+    """Assembles the chat messages sent to the LLM within a token budget.
+
+    The prompt is made of the system prompt, a summary of the older turns of the conversation, a
+    sliding window of the most recent turns, and the user input with its retrieved context:
+        - retrieved chunks are de-overlapped, then added by relevance until the context budget is
+          used, the last one being truncated if needed;
+        - the last `max_history_messages` messages are kept verbatim within the history budget;
+        - older messages are compacted into a short extractive summary (the start of each message),
+          keeping the most recent ones within the summary budget.
+    Tokens are counted with the model's tokenizer.
+
+    Attributes:
+        encoding (tiktoken.Encoding): The tokenizer of the model.
+        max_context_tokens (int): Token budget of the retrieved context.
+        max_history_tokens (int): Token budget of the verbatim history window.
+        max_history_messages (int): Maximum number of messages in the history window.
+        max_summary_tokens (int): Token budget of the summary of older messages.
+        summary_tokens_per_message (int): Tokens kept from each summarized message.
+
+    Methods:
+        build(history, context, user_input): Returns the messages of a chat/completions request and their token counts.
+        count_tokens(text) / count_message_tokens(messages): Count tokens.
+        from_env(model_name): Creates a builder configured by environment variables.
+    """
+    def __init__(self, model_name: str | None = None, max_context_tokens: int = 3000, max_history_tokens: int = 2000,
+                 max_history_messages: int = 6, max_summary_tokens: int = 300, summary_tokens_per_message: int = 40):
+        self.encoding = get_encoding(model_name)
+        self.max_context_tokens = max_context_tokens
+        self.max_history_tokens = max_history_tokens
+        self.max_history_messages = max_history_messages
+        self.max_summary_tokens = max_summary_tokens
+        self.summary_tokens_per_message = summary_tokens_per_message
+
+    @classmethod
+    def from_env(cls, model_name: str | None = None) -> "PromptBuilder":
+        """Reads the PROMPT_MAX_CONTEXT_TOKENS, PROMPT_MAX_HISTORY_TOKENS, PROMPT_MAX_HISTORY_MESSAGES
+        and PROMPT_MAX_SUMMARY_TOKENS environment variables."""
+        return cls(model_name,
+                   max_context_tokens=int(os.getenv("PROMPT_MAX_CONTEXT_TOKENS", 3000)),
+                   max_history_tokens=int(os.getenv("PROMPT_MAX_HISTORY_TOKENS", 2000)),
+                   max_history_messages=int(os.getenv("PROMPT_MAX_HISTORY_MESSAGES", 6)),
+                   max_summary_tokens=int(os.getenv("PROMPT_MAX_SUMMARY_TOKENS", 300)))
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message_tokens(self, messages: list[dict]) -> int:
+        """Counts the tokens of chat messages, chat format overhead included."""
+        return TOKENS_PER_REPLY + sum(TOKENS_PER_MESSAGE + self.count_tokens(message.get("content") or "")
+                                      for message in messages)
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        tokens = self.encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens]).rstrip() + "…"
+
+    def _fit_context(self, chunks: list[str]) -> str:
+        spans = []
+        budget = self.max_context_tokens
+        for span in merge_overlapping_chunks(chunks):
+            tokens = self.count_tokens(span)
+            if tokens > budget:
+                # Not worth sending a few words cut from a chunk
+                if budget >= 50:
+                    spans.append(self._truncate(span, budget))
+                break
+            spans.append(span)
+            budget -= tokens + 1
+        return "\n".join(spans)
+
+    def _split_history(self, history: list[dict]) -> tuple[list[dict], list[dict]]:
+        """Splits the history into the older messages to summarize and the recent window kept verbatim."""
+        window = []
+        budget = self.max_history_tokens
+        for message in reversed(history[-self.max_history_messages:] if self.max_history_messages else []):
+            tokens = TOKENS_PER_MESSAGE + self.count_tokens(message.get("content") or "")
+            if tokens > budget:
+                break
+            window.insert(0, message)
+            budget -= tokens
+        # Don't start the window with an answer whose question was left out
+        while window and window[0].get("role") == "assistant":
+            window.pop(0)
+        return history[:len(history) - len(window)], window
+
+    def _summarize(self, messages: list[dict]) -> str:
+        lines = []
+        budget = self.max_summary_tokens
+        # The most recent of the older messages are the most useful, keep them first
+        for message in reversed(messages):
+            content = " ".join((message.get("content") or "").split())
+            if not content:
+                continue
+            line = f"{message.get('role', 'user')}: {self._truncate(content, self.summary_tokens_per_message)}"
+            tokens = self.count_tokens(line) + 1
+            if tokens > budget:
+                break
+            lines.insert(0, line)
+            budget -= tokens
+        return "\n".join(lines)
+
+    def build(self, history: list[dict] | None, context: str | list[str], user_input: str) -> tuple[list[dict], dict]:
+        """Returns the messages of the chat/completions request and their token counts.
+
+        The builder keeps no state between calls, so one builder can serve concurrent requests.
+
+        Args:
+            history (list): The previous messages of the conversation, oldest first.
+            context (str | list[str]): The retrieved chunks, most relevant first, or an already joined context.
+            user_input (str): The user's current input.
+
+        Returns:
+            tuple[list[dict], dict]: The messages, within the token budgets, and their statistics: the
+                prompt tokens, against those of the unbudgeted prompt, and the messages kept and summarized.
+        """
+        history = history or []
+        chunks = [context] if isinstance(context, str) else list(context)
+        older, window = self._split_history(history)
+
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        summary = self._summarize(older) if older else ""
+        if summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"})
+        messages.extend(window)
+        messages.append({"role": "user", "content": f"Context:\n{self._fit_context(chunks)}\n\n{user_input}"})
+
+        unbudgeted = [{"role": "system", "content": SYSTEM_PROMPT}, *history,
+                      {"role": "user", "content": f"Context:\n{chr(10).join(chunks)}\n\n{user_input}"}]
+        tokens = self.count_message_tokens(messages)
+        unbudgeted_tokens = self.count_message_tokens(unbudgeted)
+        stats = {
+            "prompt_tokens": tokens,
+            "unbudgeted_prompt_tokens": unbudgeted_tokens,
+            "saved_tokens": unbudgeted_tokens - tokens,
+            "history_messages": len(window),
+            "summarized_messages": len(older),
+        }
+        # Per request, so the savings of the budgets show at the default level
+        logger.info("Prompt built", extra=stats)
+        PROMPT_TOKENS_SAVED.inc(stats["saved_tokens"])
+        return messages, stats
@@ -0,0 +1,67 @@
+"""Tokenizers of the OpenAI models, shared by the chunking engine and the prompt builder."""
+import base64
+import hashlib
+import logging
+import os
+from functools import lru_cache
+
+import tiktoken
+
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_ENCODING = "cl100k_base"
+# The copy of cl100k_base bundled with llama-index sits in a tiktoken cache, named by the SHA-1 of its URL
+FALLBACK_URL = "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken"
+FALLBACK_SHA256 = "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7"
+FALLBACK_PATTERN = r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+"""
+FALLBACK_SPECIAL_TOKENS = {
+    "<|endoftext|>": 100257,
+    "<|fim_prefix|>": 100258,
+    "<|fim_middle|>": 100259,
+    "<|fim_suffix|>": 100260,
+    "<|endofprompt|>": 100276,
+}
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str | None = None) -> tiktoken.Encoding:
+    """Returns the tokenizer of a model.
+
+    Unknown models get the `cl100k_base` encoding. When the encoding files can't be downloaded, the
+    copy of `cl100k_base` bundled with llama-index is used, so counts stay close for newer models.
+
+    Args:
+        model_name (str, optional): The model name, e.g. "gpt-4o".
+
+    Returns:
+        tiktoken.Encoding: The tokenizer.
+    """
+    try:
+        encoding_name = tiktoken.encoding_name_for_model(model_name) if model_name else FALLBACK_ENCODING
+    except KeyError:
+        encoding_name = FALLBACK_ENCODING
+    try:
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning("Could not load the %s tokenizer (%s), counting tokens with the copy of %s bundled "
+                       "with llama-index", encoding_name, e, FALLBACK_ENCODING)
+    return bundled_encoding()
+
+
+def bundled_encoding() -> tiktoken.Encoding:
+    """Builds the `cl100k_base` tokenizer from the copy bundled with llama-index.
+
+    The file is read from its path rather than by pointing TIKTOKEN_CACHE_DIR at llama-index's
+    cache, since the environment is shared by every thread of the process.
+    """
+    import llama_index.core
+    path = os.path.join(os.path.dirname(llama_index.core.__file__), "_static", "tiktoken_cache",
+                        hashlib.sha1(FALLBACK_URL.encode("utf-8")).hexdigest())
+    with open(path, "rb") as file:
+        contents = file.read()
+    if hashlib.sha256(contents).hexdigest() != FALLBACK_SHA256:
+        raise ValueError(f"The bundled {FALLBACK_ENCODING} tokenizer {path} is corrupted")
+    ranks = {base64.b64decode(token): int(rank) for token, rank in (line.split() for line in contents.splitlines() if line)}
+    return tiktoken.Encoding(FALLBACK_ENCODING, pat_str=FALLBACK_PATTERN, mergeable_ranks=ranks,
+                             special_tokens=FALLBACK_SPECIAL_TOKENS)
@@ -0,0 +1,69 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import logging
+import os
+import threading
+from typing import Callable
+
+from src.services.observability.telemetry import render_prometheus
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_METRICS_PORT = 9464
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    # Returns the readiness of the application, set on the server class by `start_metrics_server`
+    health: Callable[[], dict] | None = None
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/metrics":
+            self._send(200, render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/health" and self.health is not None:
+            health = self.health()
+            # Load balancers only route to ready instances, the body tells why one is not
+            status = 200 if health.get("ready") else 503
+            self._send(status, json.dumps(health), "application/json")
+        else:
+            self.send_error(404)
+
+    def _send(self, status: int, text: str, content_type: str):
+        body = text.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would drown the application logs
+        pass
+
+
+def start_metrics_server(port: int | None = None, host: str | None = None,
+                         health: Callable[[], dict] | None = None) -> ThreadingHTTPServer:
+    """Serves the metrics in the Prometheus text format at `/metrics`, from a daemon thread.
+
+    With `health`, its result is also served as JSON at `/health`, with status 200 when its
+    "ready" field is true and 503 otherwise.
+
+    Args:
+        port (int, optional): The port to listen on, 0 for any free port. Defaults to the
+            METRICS_PORT environment variable, or 9464.
+        host (str, optional): The address to listen on. Defaults to the METRICS_HOST environment
+            variable, or 0.0.0.0.
+        health (Callable[[], dict], optional): Returns the readiness of the application.
+
+    Returns:
+        ThreadingHTTPServer: The running server, `shutdown()` stops it.
+    """
+    port = int(os.getenv("METRICS_PORT", DEFAULT_METRICS_PORT)) if port is None else port
+    host = host or os.getenv("METRICS_HOST", "0.0.0.0")
+    handler = type("_Handler", (_MetricsHandler,), {"health": staticmethod(health) if health else None})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics", extra={"url": f"http://{host}:{server.server_address[1]}/metrics"})
+    return server
@@ -0,0 +1,345 @@
+"""Lightweight instrumentation: timed spans, counters and latency histograms, and structured logs.
+
+Every stage of the RAG pipeline (load, chunk, embed, index add, search, prompt build, LLM call) is
+timed with `span`, which records its duration in the `rag_stage_seconds` histogram. Spans opened
+while another one is open in the same thread (e.g. the search of a chat turn) also add their
+duration to the stage breakdown of the outermost span, which is logged when it ends: one log line
+tells where a chat turn spent its time.
+
+Metrics are rendered in the Prometheus text format by `render_prometheus` (served by
+`metrics_server.start_metrics_server`). Setting the TELEMETRY_ENABLED environment variable to 0
+turns spans and metrics into no-ops that cost a flag check.
+
+Logs are written with the standard `logging` module, as one JSON object per line once
+`configure_logging` was called (LOG_LEVEL and LOG_FORMAT environment variables).
+"""
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a cached search to a long LLM answer
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = os.getenv("TELEMETRY_ENABLED", "1").lower() not in ("0", "false", "no")
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def set_enabled(enabled: bool):
+    """Turns spans and metrics on or off, e.g. to measure their overhead."""
+    global _enabled
+    _enabled = enabled
+
+
+class _Metric:
+    """Base of the metrics: a named family of values, one per combination of label values."""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if len(labels) != len(self.labels):
+            raise ValueError(f"{self.name} has labels {self.labels}, got {tuple(labels)}")
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _label_string(self, key: tuple, extra: str = "") -> str:
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> list[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """A monotonically increasing count, e.g. of API calls or tokens."""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{self._label_string(key)} {_number(value)}" for key, value in values)
+        return lines
+
+
+class Gauge(_Metric):
+    """A value that is set rather than accumulated, e.g. a startup duration."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{self._label_string(key)} {_number(value)}" for key, value in values)
+        return lines
+
+
+class Histogram(_Metric):
+    """A distribution of observed values in cumulative buckets, e.g. of stage latencies."""
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: the count of each bucket (the last one is +Inf), the sum
+        self._values: dict[tuple, tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        if not _enabled:
+            return
+        key = self._key(labels)
+        bucket = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[bucket] += 1
+            total[0] += value
+
+    def count(self, **labels) -> int:
+        counts, _ = self._values.get(self._key(labels), ([0], [0.0]))
+        return sum(counts)
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        with self._lock:
+            values = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bound_label = f'le="{le}"'
+                lines.append(f"{self.name}_bucket{self._label_string(key, bound_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_string(key)} {_number(total)}")
+            lines.append(f"{self.name}_count{self._label_string(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics of the process, rendered together."""
+    def __init__(self):
+        self.metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"A metric named {metric.name} already exists")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render()) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram("rag_stage_seconds", "Duration of the RAG pipeline stages.", ("stage",))
+API_CALLS = Counter("rag_api_calls_total", "Requests to the Azure OpenAI APIs.", ("api",))
+TOKENS = Counter("rag_tokens_total", "Tokens sent to and generated by the Azure OpenAI APIs.", ("api", "kind"))
+PROMPT_TOKENS_SAVED = Counter("rag_prompt_tokens_saved_total",
+                              "Prompt tokens left out by the prompt token budgets, against the unbudgeted prompts.")
+ERRORS = Counter("rag_errors_total", "Errors, by pipeline stage.", ("stage",))
+API_RETRIES = Counter("rag_api_retries_total", "Retried Azure OpenAI requests, by reason.", ("api", "reason"))
+API_THROTTLED = Counter("rag_api_throttled_total", "Azure OpenAI requests rejected with 429.", ("api",))
+RATE_LIMIT_WAIT = Histogram("rag_rate_limit_wait_seconds", "Time requests waited for the client-side rate limits.",
+                            ("api",))
+CONCURRENCY_LIMIT = Gauge("rag_api_concurrency_limit", "Adaptive limit of concurrent Azure OpenAI requests.", ("api",))
+CIRCUIT_STATE = Gauge("rag_circuit_state", "Circuit breaker state: 0 closed, 1 half-open, 2 open.", ("api",))
+CIRCUIT_REJECTIONS = Counter("rag_circuit_rejections_total", "Requests failed fast by an open circuit breaker.",
+                             ("api",))
+STARTUP_SECONDS = Gauge("rag_startup_seconds", "Seconds from process start to each startup phase.", ("phase",))
+INDEX_RELOADS = Counter("rag_index_reloads_total", "Index snapshots loaded by the serving process, by status.",
+                        ("status",))
+
+
+def render_prometheus() -> str:
+    """Returns all metrics in the Prometheus text exposition format."""
+    return REGISTRY.render()
+
+
+_current_span: contextvars.ContextVar["Span | None"] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed stage, used as a context manager.
+
+    Its duration is recorded in `rag_stage_seconds` and, unless it is the outermost span of its
+    thread, added to the `stages` of the outermost one (its trace). An exception leaving the span
+    increments `rag_errors_total`.
+
+    Attributes:
+        name (str): The stage name.
+        attributes (dict): Extra fields of the span log line.
+        level (int): The logging level of the span log line.
+        trace_id (str): Shared by the spans of the same trace.
+        stages (dict): Seconds spent in each nested stage, for outermost spans.
+        seconds (float): The duration, once the span ended.
+    """
+    def __init__(self, name: str, level: int = logging.DEBUG, **attributes):
+        self.name = name
+        self.level = level
+        self.attributes = attributes
+        self.stages: dict[str, float] = {}
+        self.seconds = 0.0
+        self._root: Span | None = None
+        self._previous: Span | None = None
+
+    def __enter__(self) -> "Span":
+        self._previous = _current_span.get()
+        if self._previous is None:
+            self.trace_id = os.urandom(8).hex()
+        else:
+            self._root = self._previous._root or self._previous
+            self.trace_id = self._root.trace_id
+        _current_span.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.seconds = time.perf_counter() - self._start
+        # Set rather than reset: a span around a generator may end in another context than it started
+        _current_span.set(self._previous)
+        STAGE_SECONDS.observe(self.seconds, stage=self.name)
+        if exc_type is not None and not issubclass(exc_type, GeneratorExit):
+            ERRORS.inc(stage=self.name)
+        if self._root is not None:
+            self._root.stages[self.name] = self._root.stages.get(self.name, 0.0) + self.seconds
+        if logger.isEnabledFor(self.level):
+            fields = {"span": self.name, "trace_id": self.trace_id, "seconds": round(self.seconds, 6),
+                      **self.attributes}
+            if self.stages:
+                fields["stages"] = {name: round(seconds, 6) for name, seconds in self.stages.items()}
+            if exc_type is not None:
+                fields["error"] = exc_type.__name__
+            logger.log(self.level, "span %s", self.name, extra=fields)
+        return False
+
+
+class _NoopSpan:
+    attributes: dict = {}
+    stages: dict = {}
+    seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(name: str, level: int = logging.DEBUG, **attributes) -> Span:
+    """Times a pipeline stage: `with span("search", queries=8): ...`.
+
+    Args:
+        name (str): The stage name, the `stage` label of `rag_stage_seconds`.
+        level (int, optional): The logging level of the span log line. Defaults to DEBUG.
+        **attributes: Extra fields of the span log line.
+
+    Returns:
+        Span: The span, or a shared no-op when telemetry is disabled.
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return Span(name, level, **attributes)
+
+
+def observe_stage(name: str, seconds: float):
+    """Records the duration of a stage timed elsewhere, e.g. in a worker process."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+
+
+# Attributes of every LogRecord, the others come from `extra`
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line, with the fields given in `extra`."""
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        fields.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            fields["exception"] = self.formatException(record.exc_info)
+        return json.dumps(fields, default=str, ensure_ascii=False)
+
+
+def configure_logging(level: str | None = None, log_format: str | None = None):
+    """Sends the logs of the application to stderr.
+
+    Args:
+        level (str, optional): The minimum level logged. Defaults to the LOG_LEVEL environment
+            variable, or INFO.
+        log_format (str, optional): "json" for one JSON object per line, "text" for plain lines.
+            Defaults to the LOG_FORMAT environment variable, or json.
+    """
+    level = (level or os.getenv("LOG_LEVEL", "INFO")).upper()
+    log_format = (log_format or os.getenv("LOG_FORMAT", "json")).lower()
+    handler = logging.StreamHandler(sys.stderr)
+    if log_format == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers = [handler]
+    root.setLevel(level)
+    # Keep the HTTP clients' request logs out of the application logs
+    for name in ("httpx", "httpcore", "openai"):
+        logging.getLogger(name).setLevel(max(logging.WARNING, root.level))
@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from src.services.observability.telemetry import INDEX_RELOADS
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.snapshots import SnapshotStore
+
+
+logger = logging.getLogger(__name__)
+
+
+class IndexHandle:
+    """A loaded index and the number of queries using it.
+
+    Once retired (a newer snapshot replaced it), the index is closed as soon as its last query
+    releases it, and `on_closed` is called.
+
+    Attributes:
+        index (FAISSIndex): The index.
+        refs (int): Number of queries holding the handle.
+        retired (bool): Whether the handle was replaced, no new query acquires it.
+    """
+    def __init__(self, index: FAISSIndex, on_closed: Callable[["IndexHandle"], None] | None = None):
+        self.index = index
+        self.refs = 0
+        self.retired = False
+        self.on_closed = on_closed
+        self._lock = threading.Lock()
+
+    def acquire(self) -> FAISSIndex:
+        with self._lock:
+            self.refs += 1
+        return self.index
+
+    def release(self):
+        with self._lock:
+            self.refs -= 1
+            last = self.retired and self.refs == 0
+        if last:
+            self._close()
+
+    def retire(self):
+        with self._lock:
+            self.retired = True
+            last = self.refs == 0
+        if last:
+            self._close()
+
+    def _close(self):
+        self.index.close()
+        if self.on_closed is not None:
+            self.on_closed(self)
+
+
+class HotReloadingIndex:
+    """Serves a saved index and swaps in the snapshots published while it is served.
+
+    A background thread polls the `CURRENT` pointer of the index folder (see `SnapshotStore`).
+    When it names a new snapshot, the snapshot is loaded in that thread, while queries go on with
+    the previous one, then swapped in. Every query leases the index for its whole duration, from
+    the search to reading the chunks, so it never mixes two versions: queries in flight during a
+    swap finish on the old index, which is closed when the last of them releases it. The snapshots
+    no longer served are then garbage-collected.
+
+    It has the same `retrieve_chunks` and `retrieve_chunks_batch` methods as `FAISSIndex`, so it
+    can be used in its place, e.g. by a `BatchedRetriever`.
+
+    Attributes:
+        load (Callable[[], FAISSIndex]): Loads the current snapshot of the index folder.
+        store (SnapshotStore): The snapshots of the index folder.
+        interval (float): Seconds between two checks for a new snapshot.
+        reloads (int): Number of snapshots swapped in.
+        last_error (str | None): Why the last snapshot failed to load, None once one loaded.
+
+    Methods:
+        lease(): Context manager holding the current index for a query.
+        retrieve_chunks(query, num_chunks, filter): Retrieves relevant chunks for a query.
+        retrieve_chunks_batch(queries, num_chunks, filter): Retrieves relevant chunks for many queries.
+        check(): Swaps in the current snapshot if it is a new one.
+        start(): Starts watching for new snapshots, returns the index.
+        close(): Stops watching.
+        health(): Returns the snapshot served, for the health endpoint.
+    """
+    def __init__(self, index: FAISSIndex, load: Callable[[], FAISSIndex], path: str = r"./faiss_index",
+                 interval: float = 5.0, keep_snapshots: int = 2):
+        """
+        Args:
+            index (FAISSIndex): The index loaded at startup.
+            load (Callable[[], FAISSIndex]): Loads the current snapshot of `path`.
+            path (str, optional): The index folder. Defaults to r"./faiss_index".
+            interval (float, optional): Seconds between two checks for a new snapshot. Defaults to 5.0.
+            keep_snapshots (int, optional): Number of most recent snapshots kept on disk. Defaults to 2.
+        """
+        self.load = load
+        self.store = SnapshotStore(path, keep=keep_snapshots)
+        self.interval = interval
+        self.reloads = 0
+        self.last_error: str | None = None
+        self._failed: str | None = None
+        self._handle = IndexHandle(index, self._collect)
+        # Handles replaced but still used by queries in flight
+        self._retired: set[IndexHandle] = set()
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._watch, name="index-reloader", daemon=True)
+
+    @property
+    def index(self) -> FAISSIndex:
+        """The index currently served."""
+        return self._handle.index
+
+    @contextmanager
+    def lease(self) -> Iterator[FAISSIndex]:
+        """Holds the current index for the duration of a query, a reload doesn't close it meanwhile."""
+        with self._lock:
+            # Under the lock swapping the handles: a retired handle is never acquired again
+            handle = self._handle
+            index = handle.acquire()
+        try:
+            yield index
+        finally:
+            handle.release()
+
+    def retrieve_chunks(self, query: str, num_chunks: int = 5, filter: dict | None = None) -> list:
+        """Retrieves relevant chunks from the current index, see `FAISSIndex.retrieve_chunks`."""
+        with self.lease() as index:
+            return index.retrieve_chunks(query, num_chunks, filter=filter)
+
+    def retrieve_chunks_batch(self, queries: list[str], num_chunks: int = 5,
+                              filter: dict | None = None) -> list[list[dict]]:
+        """Retrieves relevant chunks from the current index, see `FAISSIndex.retrieve_chunks_batch`."""
+        with self.lease() as index:
+            return index.retrieve_chunks_batch(queries, num_chunks, filter=filter)
+
+    def check(self) -> bool:
+        """Loads and swaps in the current snapshot if it isn't the one served, tells whether it did."""
+        with self._reload_lock:
+            name = self.store.current_name()
+            if name is None or name in (self.index.snapshot, self._failed):
+                return False
+            start = time.perf_counter()
+            try:
+                index = self.load()
+            except Exception as error:
+                # Not retried: a snapshot collected meanwhile was replaced by a newer one, which is loaded next
+                self.last_error = str(error)
+                self._failed = name
+                INDEX_RELOADS.inc(status="failed")
+                logger.exception("Failed to load the index snapshot", extra={"snapshot": name})
+                return False
+            with self._lock:
+                old, self._handle = self._handle, IndexHandle(index, self._collect)
+                self._retired.add(old)
+            self.reloads += 1
+            self.last_error = None
+            INDEX_RELOADS.inc(status="ok")
+            logger.info("Index snapshot swapped in", extra={"snapshot": index.snapshot, "previous": old.index.snapshot,
+                                                            "seconds": round(time.perf_counter() - start, 3)})
+            old.retire()
+            return True
+
+    def _collect(self, handle: IndexHandle):
+        with self._lock:
+            self._retired.discard(handle)
+            in_use = {retired.index.snapshot for retired in self._retired} | {self._handle.index.snapshot}
+        self.store.gc(in_use={name for name in in_use if name is not None})
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.check()
+            except Exception:
+                logger.exception("Failed to check for a new index snapshot")
+
+    def start(self) -> "HotReloadingIndex":
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def health(self) -> dict:
+        health = {"snapshot": self.index.snapshot, "reloads": self.reloads}
+        if self.last_error is not None:
+            health["reload_error"] = self.last_error
+        return health
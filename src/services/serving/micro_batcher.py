@@ -0,0 +1,115 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+
+class MicroBatcher:
+    """Groups the items submitted by concurrent callers into batches handled in a single call.
+
+    A background thread waits for a first item, then keeps collecting items for at most
+    `max_wait` seconds or until `max_batch_size` items are queued, and hands the whole batch to
+    `handler`. Up to `max_in_flight` batches are handled at once, so a slow batch (e.g. waiting on
+    an embeddings request) doesn't hold up the next ones. Each caller gets its own result back
+    through a future.
+
+    Attributes:
+        handler (Callable[[list], list]): Handles a batch of items, returns one result per item.
+        max_batch_size (int): Maximum number of items per batch.
+        max_wait (float): Maximum seconds the first item of a batch waits for more items.
+        max_in_flight (int): Maximum number of batches handled at once.
+        batches (int): Number of batches handled so far.
+        items (int): Number of items handled so far.
+
+    Methods:
+        submit(item): Queues an item, returns the future of its result.
+        __call__(item): Queues an item and waits for its result.
+        close(): Handles the queued items and stops the background threads.
+        stats(): Returns the number of batches and the average batch size.
+    """
+    def __init__(self, handler: Callable[[list], list], max_batch_size: int = 32, max_wait: float = 0.005,
+                 max_in_flight: int = 4, name: str = "micro-batcher"):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_in_flight = max_in_flight
+        self.batches = 0
+        self.items = 0
+        self._queue: queue.Queue[tuple[Any, Future] | None] = queue.Queue()
+        self._closed = False
+        self._in_flight = threading.Semaphore(max_in_flight)
+        self._stats_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_in_flight, thread_name_prefix=name)
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> Future:
+        if self._closed:
+            raise RuntimeError("The micro-batcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        return self.submit(item).result()
+
+    def close(self):
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        self._pool.shutdown()
+
+    def _collect(self) -> tuple[list, bool]:
+        """Waits for a batch of items, tells whether the batcher was closed meanwhile."""
+        # Items keep piling up in the queue while all the handlers are busy
+        self._in_flight.acquire()
+        first = self._queue.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if item is None:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        closed = False
+        while not closed:
+            batch, closed = self._collect()
+            if batch:
+                self._pool.submit(self._handle, batch)
+            else:
+                self._in_flight.release()
+
+    def _handle(self, batch: list[tuple[Any, Future]]):
+        try:
+            items = [item for item, _ in batch]
+            try:
+                results = self.handler(items)
+                if len(results) != len(items):
+                    raise ValueError(f"The handler returned {len(results)} results for {len(items)} items")
+            except BaseException as error:
+                for _, future in batch:
+                    future.set_exception(error)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            with self._stats_lock:
+                self.batches += 1
+                self.items += len(batch)
+        finally:
+            self._in_flight.release()
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "average_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
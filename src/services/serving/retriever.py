@@ -0,0 +1,68 @@
+import os
+from contextlib import nullcontext
+
+from src.services.serving.hot_reload import HotReloadingIndex
+from src.services.serving.micro_batcher import MicroBatcher
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.metadata_store import filter_key
+
+
+class BatchedRetriever:
+    """Retrieves chunks for concurrent users in micro-batches.
+
+    The queries submitted by concurrent threads within a few milliseconds are embedded in a single
+    batched embeddings request and searched with a single `index.search` over their query matrix.
+    It has the same `retrieve_chunks` method as `FAISSIndex`, so it can be used in its place.
+    With a `HotReloadingIndex`, each batch is searched and its chunks read on the same snapshot.
+
+    Attributes:
+        index (FAISSIndex | HotReloadingIndex): The index searched.
+        batcher (MicroBatcher): The micro-batcher grouping the queries.
+
+    Methods:
+        retrieve_chunks(query, num_chunks, filter): Retrieves relevant chunks for a query.
+        from_env(index): Creates a retriever configured by environment variables.
+        close(): Stops the micro-batcher.
+    """
+    def __init__(self, index: FAISSIndex | HotReloadingIndex, max_batch_size: int = 32, max_wait: float = 0.005, max_in_flight: int = 4):
+        """
+        Args:
+            index (FAISSIndex | HotReloadingIndex): The index to search.
+            max_batch_size (int, optional): Maximum number of queries per batch. Defaults to 32.
+            max_wait (float, optional): Maximum seconds a query waits for others. Defaults to 0.005.
+            max_in_flight (int, optional): Maximum number of batches retrieved at once. Defaults to 4.
+        """
+        self.index = index
+        self.batcher = MicroBatcher(self._retrieve_batch, max_batch_size, max_wait, max_in_flight,
+                                    name="retrieval-batcher")
+
+    @classmethod
+    def from_env(cls, index: FAISSIndex | HotReloadingIndex) -> "BatchedRetriever":
+        """Reads RETRIEVAL_MAX_BATCH_SIZE, RETRIEVAL_MAX_WAIT_MS and RETRIEVAL_MAX_IN_FLIGHT from the environment."""
+        return cls(index, max_batch_size=int(os.getenv("RETRIEVAL_MAX_BATCH_SIZE", 32)),
+                   max_wait=float(os.getenv("RETRIEVAL_MAX_WAIT_MS", 5)) / 1000,
+                   max_in_flight=int(os.getenv("RETRIEVAL_MAX_IN_FLIGHT", 4)))
+
+    def retrieve_chunks(self, query: str, num_chunks: int = 5, filter: dict | None = None) -> list:
+        """Retrieves chunks from the FAISS index based on a query, batched with concurrent queries."""
+        return self.batcher((query, num_chunks, filter))
+
+    def _retrieve_batch(self, items: list[tuple[str, int, dict | None]]) -> list[list[str]]:
+        # Queries with the same filter are searched together
+        groups: dict[str | None, list[int]] = {}
+        for position, (_, _, where) in enumerate(items):
+            groups.setdefault(filter_key(where), []).append(position)
+        chunks = [None] * len(items)
+        lease = self.index.lease() if isinstance(self.index, HotReloadingIndex) else nullcontext(self.index)
+        with lease as index:
+            for positions in groups.values():
+                # Search once for the largest number of chunks asked, and truncate the other results
+                num_chunks = max(items[position][1] for position in positions)
+                results = index.search_queries([items[position][0] for position in positions], num_chunks,
+                                               filter=items[positions[0]][2])
+                for position, (ids, _) in zip(positions, results):
+                    chunks[position] = index.get_chunks(ids[:items[position][1]])
+        return chunks
+
+    def close(self):
+        self.batcher.close()
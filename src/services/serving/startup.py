@@ -0,0 +1,92 @@
+import logging
+import threading
+import time
+from typing import Any, Callable
+
+from src.services.observability.telemetry import STARTUP_SECONDS
+
+
+logger = logging.getLogger(__name__)
+
+# Process start, as early as the first import of this module: app.py imports it first
+PROCESS_START = time.perf_counter()
+
+
+def record_startup_phase(phase: str) -> float:
+    """Records the seconds from process start to a startup phase (e.g. "ui", "index") and logs them."""
+    seconds = time.perf_counter() - PROCESS_START
+    STARTUP_SECONDS.set(seconds, phase=phase)
+    logger.info("Startup phase reached", extra={"phase": phase, "seconds": round(seconds, 3)})
+    return seconds
+
+
+class BackgroundLoader:
+    """Runs a slow initialization (imports, index loading) in a background thread.
+
+    The application starts serving right away and asks the loader whether the result is ready,
+    rather than waiting for it at import time.
+
+    Attributes:
+        load (Callable[[], Any]): The initialization, its return value is the loader's result.
+        name (str): The startup phase, and the name of the thread.
+        status (str): "loading", "ready", "missing" (the initialization raised FileNotFoundError,
+            e.g. no index was ingested yet) or "failed".
+        result (Any): The return value of `load`, once ready.
+        error (BaseException | None): The exception raised by `load`, if any.
+        seconds (float): Duration of `load`, once finished.
+
+    Methods:
+        start(): Starts the initialization, returns the loader.
+        wait(timeout): Waits for the initialization to finish, tells whether it is ready.
+        health(): Returns the readiness of the loader, as served by the health endpoint, without error details.
+    """
+    def __init__(self, load: Callable[[], Any], name: str = "index"):
+        self.load = load
+        self.name = name
+        self.status = "loading"
+        self.result = None
+        self.error: BaseException | None = None
+        self.seconds = 0.0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"{name}-loader", daemon=True)
+
+    def start(self) -> "BackgroundLoader":
+        self._thread.start()
+        return self
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self.result = self.load()
+            self.status = "ready"
+        except FileNotFoundError as error:
+            self.error = error
+            self.status = "missing"
+            logger.error("Startup phase failed: %s", error, extra={"phase": self.name})
+        except Exception as error:
+            self.error = error
+            self.status = "failed"
+            logger.exception("Startup phase failed", extra={"phase": self.name})
+        finally:
+            self.seconds = time.perf_counter() - start
+            if self.ready:
+                record_startup_phase(self.name)
+            self._done.set()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        self._done.wait(timeout)
+        return self.ready
+
+    def health(self) -> dict:
+        health = {"ready": self.ready, "status": self.status,
+                  "uptime_seconds": round(time.perf_counter() - PROCESS_START, 3)}
+        if self._done.is_set():
+            health[f"{self.name}_seconds"] = round(self.seconds, 3)
+        if self.error is not None:
+            # The exception itself is only logged: the health endpoint is served on every interface
+            health["failed_phase"] = self.name
+        return health
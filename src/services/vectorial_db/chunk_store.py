@@ -0,0 +1,224 @@
+import json
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping, MutableMapping
+from typing import Iterable, Iterator
+
+import numpy as np
+
+
+STORE_VERSION = 1
+META_FILE = "chunk_store.json"
+IDS_FILE = "chunk_ids.npy"
+OFFSETS_FILE = "chunk_offsets.npy"
+BLOCKS_FILE = "chunk_blocks.npy"
+BLOB_FILE = "chunks.bin"
+
+
+class ChunkStore(Mapping):
+    """Read-only, memory-mapped store of text chunks by ID.
+
+    On disk, chunks are concatenated as UTF-8 in a single blob, with a sorted array of chunk IDs and
+    an array of byte offsets. When compression is enabled, chunks are grouped in blocks of
+    `block_size` chunks compressed with zlib; offsets are then relative to the decompressed block
+    and a second offsets array locates the blocks in the blob.
+
+    All arrays and the blob are memory-mapped, so opening the store costs the same whatever its
+    size, chunks are decoded only when they are looked up, and several processes serving the same
+    store share its pages through the OS page cache. No pickle is involved.
+
+    Methods:
+        write(path, items, compress, block_size): Writes a store.
+        exists(path): Tells whether a store was written in a folder.
+    """
+    def __init__(self, path: str, cached_blocks: int = 64):
+        """Opens the store saved in a folder.
+
+        Args:
+            path (str): The folder holding the store files.
+            cached_blocks (int, optional): Number of decompressed blocks kept in memory. Defaults to 64.
+        """
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as file:
+            meta = json.load(file)
+        if meta.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported chunk store version: {meta.get('version')}")
+        self.compression = meta.get("compression")
+        self.block_size = meta.get("block_size", 0)
+        self._ids = np.load(os.path.join(path, IDS_FILE), mmap_mode="r")
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self._blocks = np.load(os.path.join(path, BLOCKS_FILE), mmap_mode="r") if self.compression else None
+        blob_path = os.path.join(path, BLOB_FILE)
+        self._blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.empty(0, np.uint8)
+        self._cached_blocks = cached_blocks
+        self._block_cache: OrderedDict[int, bytes] = OrderedDict()
+        # Concurrent searches look chunks up together, the LRU order changes on every lookup
+        self._cache_lock = threading.Lock()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, META_FILE))
+
+    @staticmethod
+    def write(path: str, items: Iterable[tuple[int, str]], compress: bool = False, block_size: int = 64):
+        """Writes a store in a folder.
+
+        Args:
+            path (str): The folder to write the store files to.
+            items (Iterable[tuple[int, str]]): The chunk IDs and texts, sorted by ID.
+            compress (bool, optional): Whether to compress chunks in zlib blocks. Defaults to False.
+            block_size (int, optional): Number of chunks per compressed block. Defaults to 64.
+        """
+        ids = []
+        offsets = [0]
+        blocks = [0]
+        block = bytearray()
+        with open(os.path.join(path, BLOB_FILE), "wb") as blob:
+            for chunk_id, text in items:
+                if ids and chunk_id <= ids[-1]:
+                    raise ValueError("Chunks must be written sorted by ID")
+                data = text.encode("utf-8")
+                ids.append(chunk_id)
+                if not compress:
+                    blob.write(data)
+                    offsets.append(offsets[-1] + len(data))
+                    continue
+                if len(ids) > 1 and (len(ids) - 1) % block_size == 0:
+                    blocks.append(blocks[-1] + blob.write(zlib.compress(bytes(block))))
+                    block = bytearray()
+                # Offsets restart at 0 at every block, the first offset of a block is always 0
+                offsets.append(len(block) + len(data))
+                block += data
+            if compress and block:
+                blocks.append(blocks[-1] + blob.write(zlib.compress(bytes(block))))
+        np.save(os.path.join(path, IDS_FILE), np.array(ids, dtype=np.int64))
+        np.save(os.path.join(path, OFFSETS_FILE), np.array(offsets, dtype=np.int64))
+        if compress:
+            np.save(os.path.join(path, BLOCKS_FILE), np.array(blocks, dtype=np.int64))
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as file:
+            json.dump({"version": STORE_VERSION, "compression": "zlib" if compress else None,
+                       "block_size": block_size if compress else 0, "count": len(ids)}, file)
+
+    def _position(self, chunk_id: int) -> int:
+        position = int(np.searchsorted(self._ids, chunk_id))
+        if position >= len(self._ids) or self._ids[position] != chunk_id:
+            return -1
+        return position
+
+    def _block(self, block: int) -> bytes:
+        with self._cache_lock:
+            data = self._block_cache.get(block)
+            if data is not None:
+                self._block_cache.move_to_end(block)
+                return data
+        # Decompressed outside of the lock, other lookups go on meanwhile
+        data = zlib.decompress(self._blob[self._blocks[block]:self._blocks[block + 1]].tobytes())
+        with self._cache_lock:
+            self._block_cache[block] = data
+            self._block_cache.move_to_end(block)
+            if len(self._block_cache) > self._cached_blocks:
+                self._block_cache.popitem(last=False)
+        return data
+
+    def __getitem__(self, chunk_id: int) -> str:
+        position = self._position(chunk_id)
+        if position < 0:
+            raise KeyError(chunk_id)
+        if not self.compression:
+            return self._blob[self._offsets[position]:self._offsets[position + 1]].tobytes().decode("utf-8")
+        block, first = divmod(position, self.block_size)
+        # The offsets array holds one start offset per block (0) followed by the end offset of each chunk
+        start = 0 if first == 0 else int(self._offsets[position])
+        end = int(self._offsets[position + 1])
+        return self._block(block)[start:end].decode("utf-8")
+
+    def __contains__(self, chunk_id) -> bool:
+        return self._position(chunk_id) >= 0
+
+    @property
+    def max_id(self) -> int:
+        """Returns the highest chunk ID, -1 for an empty store."""
+        return int(self._ids[-1]) if len(self._ids) else -1
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class ChunkMap(MutableMapping):
+    """Chunks by ID: a read-only `ChunkStore` with the in-memory changes made since it was loaded.
+
+    Attributes:
+        base (ChunkStore | None): The store loaded from disk, if any.
+
+    Methods:
+        take(ids): Returns the values of several IDs.
+    """
+    def __init__(self, base: ChunkStore | None = None, chunks: dict[int, str] | None = None):
+        self.base = base
+        self._added: dict[int, str] = dict(chunks or {})
+        # IDs of the base store that were removed or overwritten
+        self._hidden: set[int] = set()
+
+    def _in_base(self, chunk_id: int) -> bool:
+        return self.base is not None and chunk_id not in self._hidden and chunk_id in self.base
+
+    def __getitem__(self, chunk_id: int) -> str:
+        if chunk_id in self._added:
+            return self._added[chunk_id]
+        if self._in_base(chunk_id):
+            return self.base[chunk_id]
+        raise KeyError(chunk_id)
+
+    def take(self, ids: list[int]) -> list | np.ndarray:
+        """Returns the values of several IDs, read from the base store in one call when it has a `take` method.
+
+        Raises:
+            KeyError: One of the IDs is not in the map.
+        """
+        values = [None] * len(ids)
+        rows = []
+        for row, chunk_id in enumerate(ids):
+            if chunk_id in self._added:
+                values[row] = self._added[chunk_id]
+            elif self.base is None or chunk_id in self._hidden:
+                raise KeyError(chunk_id)
+            else:
+                rows.append(row)
+        if rows:
+            base_ids = [ids[row] for row in rows]
+            taken = self.base.take(base_ids) if hasattr(self.base, "take") else [self.base[i] for i in base_ids]
+            if len(rows) == len(ids):
+                return taken
+            for row, value in zip(rows, taken):
+                values[row] = value
+        return values
+
+    def __setitem__(self, chunk_id: int, text: str):
+        if self._in_base(chunk_id):
+            self._hidden.add(chunk_id)
+        self._added[chunk_id] = text
+
+    def __delitem__(self, chunk_id: int):
+        if chunk_id in self._added:
+            del self._added[chunk_id]
+        elif self._in_base(chunk_id):
+            self._hidden.add(chunk_id)
+        else:
+            raise KeyError(chunk_id)
+
+    def __contains__(self, chunk_id) -> bool:
+        return chunk_id in self._added or self._in_base(chunk_id)
+
+    def __iter__(self) -> Iterator[int]:
+        if self.base is not None:
+            for chunk_id in self.base:
+                if chunk_id not in self._hidden:
+                    yield chunk_id
+        yield from self._added
+
+    def __len__(self) -> int:
+        return (len(self.base) - len(self._hidden) if self.base is not None else 0) + len(self._added)
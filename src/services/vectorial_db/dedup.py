@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import threading
+import zlib
+from typing import Iterable
+
+import numpy as np
+
+
+IDS_FILE = "dedup_ids.npy"
+HASHES_FILE = "dedup_hashes.npy"
+SIGNATURES_FILE = "dedup_signatures.npy"
+CONFIG_FILE = "dedup.json"
+# Probability that a pair of chunks exactly at the threshold shares an LSH bucket
+LSH_RECALL = 0.95
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize_chunk(text: str) -> str:
+    """Normalizes a chunk for duplicate detection: case-folded, with whitespace collapsed."""
+    return " ".join(text.casefold().split())
+
+
+def exact_hash(normalized: str) -> int:
+    """Returns the 64-bit hash of a normalized chunk."""
+    return int.from_bytes(hashlib.blake2b(normalized.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def lsh_parameters(num_perm: int, threshold: float) -> tuple[int, int]:
+    """Returns the number of bands and of rows per band splitting MinHash signatures for a similarity threshold.
+
+    The bands are as selective as possible while a pair of chunks of similarity `threshold` still
+    shares at least one bucket with probability `LSH_RECALL`. The candidates are then checked
+    against the threshold with their full signatures.
+    """
+    for rows in range(num_perm, 0, -1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands >= LSH_RECALL:
+            return bands, rows
+    return num_perm, 1
+
+
+class MinHasher:
+    """MinHash signatures of the word shingles of a text, whose agreement estimates the Jaccard similarity of two texts.
+
+    Attributes:
+        num_perm (int): Number of hash functions, the length of the signatures.
+        shingle_size (int): Number of consecutive words per shingle.
+    """
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        # Below 2**32, so that a * hash + b can't overflow 64 bits
+        self._a = rng.integers(1, 1 << 32, num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, 1 << 32, num_perm, dtype=np.uint64)[:, None]
+
+    def signature(self, normalized: str) -> np.ndarray:
+        words = normalized.split()
+        size = self.shingle_size
+        shingles = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles), dtype=np.uint64,
+                             count=len(shingles))
+        return (((self._a * hashes + self._b) % _MERSENNE_PRIME) & _MAX_HASH).min(axis=1).astype(np.uint32)
+
+
+class ChunkDeduplicator:
+    """Detects the chunks that are exact or near duplicates of chunks already in the index.
+
+    Every chunk is fingerprinted before it is embedded: a 64-bit hash of its normalized text finds
+    exact duplicates, and a MinHash signature of its word shingles, bucketed by LSH bands, finds
+    chunks whose estimated Jaccard similarity is at least `threshold`. A duplicate isn't embedded
+    nor stored: it is recorded as one more source of the chunk it duplicates.
+
+    Fingerprints live in slots, numbered in the order chunks were fingerprinted, each bound to the
+    vector ID of its chunk once added (-1 until then, so chunks of the same ingestion run can
+    already be matched). Fingerprints saved with the index are kept as columns, searched through
+    sorted copies of their keys, and those added since in dictionaries. Fingerprints of chunks
+    removed from the index are ignored, and dropped when saved.
+
+    Attributes:
+        threshold (float | None): Minimum estimated Jaccard similarity of near duplicates, None only detects exact ones.
+        minhash (MinHasher): The MinHash functions.
+        bands (int): Number of LSH bands of the signatures.
+        rows (int): Number of signature values per LSH band.
+
+    Methods:
+        assign(chunk, chunks): Fingerprints a chunk, returns its slot and whether it is a duplicate.
+        bind(slots, ids): Binds the slots of new chunks to their vector IDs.
+        id_of(slot): Returns the vector ID of a slot.
+        add_existing(chunks): Fingerprints the chunks of an index built without deduplication.
+        clear(): Forgets every fingerprint.
+        write(path, chunks) / load(path): Saves and loads the fingerprints of the chunks still in the index.
+    """
+    def __init__(self, threshold: float | None = 0.9, num_perm: int = 64, shingle_size: int = 5,
+                 ids: np.ndarray | None = None, hashes: np.ndarray | None = None,
+                 signatures: np.ndarray | None = None):
+        if threshold is not None and not 0 < threshold <= 1:
+            raise ValueError("The near-duplicate threshold must be in (0, 1]")
+        self.threshold = threshold
+        self.minhash = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = lsh_parameters(num_perm, threshold) if threshold else (0, 0)
+        self._band_mix = np.random.default_rng(2).integers(1, 1 << 63, max(self.rows, 1), dtype=np.uint64) | np.uint64(1)
+        self._base_ids = np.empty(0, dtype=np.int64) if ids is None else ids
+        self._base_hashes = np.empty(0, dtype=np.uint64) if hashes is None else hashes
+        self._base_signatures = np.empty((0, num_perm), dtype=np.uint32) if signatures is None else signatures
+        # Sorted keys of the saved fingerprints and their slots, built on first use
+        self._base_index = None
+        self._ids: list[int] = []
+        self._signatures: list[np.ndarray] = []
+        self._new_hashes: list[int] = []
+        self._exact: dict[int, int] = {}
+        self._buckets: dict[tuple[int, int], int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._base_ids) + len(self._ids)
+
+    def _band_keys(self, signatures: np.ndarray) -> np.ndarray:
+        """Returns the (n, bands) keys of the LSH bands of (n, num_perm) signatures."""
+        bands = signatures[:, :self.bands * self.rows].reshape(len(signatures), self.bands, self.rows)
+        # Wraps around 64 bits, which is as good a hash
+        return (bands.astype(np.uint64) * self._band_mix).sum(axis=2, dtype=np.uint64)
+
+    def _build_base_index(self):
+        hash_order = np.argsort(self._base_hashes, kind="stable")
+        bands = []
+        if self.bands:
+            keys = self._band_keys(np.asarray(self._base_signatures))
+            for band in range(self.bands):
+                order = np.argsort(keys[:, band], kind="stable")
+                bands.append((keys[order, band], order))
+        self._base_index = (np.asarray(self._base_hashes)[hash_order], hash_order, bands)
+
+    def id_of(self, slot: int) -> int:
+        base = len(self._base_ids)
+        return int(self._base_ids[slot]) if slot < base else self._ids[slot - base]
+
+    def _signature(self, slot: int) -> np.ndarray:
+        base = len(self._base_ids)
+        return self._base_signatures[slot] if slot < base else self._signatures[slot - base]
+
+    def _alive(self, slot: int, chunks) -> bool:
+        chunk_id = self.id_of(slot)
+        # Unbound slots are chunks of the current run, not added yet
+        return chunk_id < 0 or chunk_id in chunks
+
+    def _exact_candidates(self, key: int) -> Iterable[int]:
+        slot = self._exact.get(key)
+        if slot is not None:
+            yield slot
+        sorted_hashes, order, _ = self._base_index
+        key = np.uint64(key)
+        start = int(np.searchsorted(sorted_hashes, key, side="left"))
+        end = int(np.searchsorted(sorted_hashes, key, side="right"))
+        yield from order[start:end].tolist()
+
+    def _near_candidates(self, keys: np.ndarray) -> Iterable[int]:
+        _, _, bands = self._base_index
+        for band, key in enumerate(keys.tolist()):
+            slot = self._buckets.get((band, key))
+            if slot is not None:
+                yield slot
+            sorted_keys, order = bands[band]
+            key = np.uint64(key)
+            start = int(np.searchsorted(sorted_keys, key, side="left"))
+            end = int(np.searchsorted(sorted_keys, key, side="right"))
+            yield from order[start:end].tolist()
+
+    def assign(self, chunk: str, chunks) -> tuple[int, str | None]:
+        """Fingerprints a chunk and looks for a chunk it duplicates.
+
+        Args:
+            chunk (str): The chunk text.
+            chunks: The chunks of the index by vector ID (e.g. `FAISSIndex.chunks`), duplicates of
+                chunks no longer in it don't count.
+
+        Returns:
+            tuple[int, str | None]: The slot of the chunk duplicated and "exact" or "near", or the
+                new slot of the chunk and None when it isn't a duplicate.
+        """
+        normalized = normalize_chunk(chunk)
+        key = exact_hash(normalized)
+        signature = self.minhash.signature(normalized)
+        with self._lock:
+            if self._base_index is None:
+                self._build_base_index()
+            for slot in self._exact_candidates(key):
+                if self._alive(slot, chunks):
+                    return slot, "exact"
+            band_keys = self._band_keys(signature[None, :])[0] if self.bands else None
+            if self.bands:
+                for slot in self._near_candidates(band_keys):
+                    if (np.count_nonzero(self._signature(slot) == signature) >= self.threshold * self.minhash.num_perm
+                            and self._alive(slot, chunks)):
+                        return slot, "near"
+            return self._add(key, signature, band_keys, -1, chunks), None
+
+    def _add(self, key: int, signature: np.ndarray, band_keys: np.ndarray | None, chunk_id: int, chunks) -> int:
+        slot = len(self)
+        self._ids.append(chunk_id)
+        self._new_hashes.append(key)
+        self._signatures.append(signature)
+        self._exact[key] = slot
+        if band_keys is not None:
+            for band, band_key in enumerate(band_keys.tolist()):
+                current = self._buckets.get((band, band_key))
+                if current is None or not self._alive(current, chunks):
+                    self._buckets[(band, band_key)] = slot
+        return slot
+
+    def bind(self, slots: list[int], ids: list[int]):
+        """Binds the slots of new chunks to the vector IDs they were added under."""
+        base = len(self._base_ids)
+        with self._lock:
+            for slot, chunk_id in zip(slots, ids):
+                self._ids[slot - base] = chunk_id
+
+    def add_existing(self, chunks, ids: Iterable[int] | None = None):
+        """Fingerprints chunks of an index (`FAISSIndex.chunks`): all of them for an index built without
+        deduplication, or those of `ids`, e.g. replayed from an ingestion journal."""
+        with self._lock:
+            if self._base_index is None:
+                self._build_base_index()
+            for chunk_id in chunks if ids is None else ids:
+                normalized = normalize_chunk(chunks[chunk_id])
+                signature = self.minhash.signature(normalized)
+                band_keys = self._band_keys(signature[None, :])[0] if self.bands else None
+                self._add(exact_hash(normalized), signature, band_keys, chunk_id, chunks)
+
+    def clear(self):
+        """Forgets every fingerprint, e.g. when the index is emptied."""
+        with self._lock:
+            self._base_ids = np.empty(0, dtype=np.int64)
+            self._base_hashes = np.empty(0, dtype=np.uint64)
+            self._base_signatures = np.empty((0, self.minhash.num_perm), dtype=np.uint32)
+            self._base_index = None
+            self._ids, self._signatures, self._new_hashes = [], [], []
+            self._exact, self._buckets = {}, {}
+
+    def _columns(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Returns the IDs, hashes and signatures of every slot."""
+        with self._lock:
+            return (np.concatenate([self._base_ids, np.asarray(self._ids, dtype=np.int64)]),
+                    np.concatenate([self._base_hashes, np.asarray(self._new_hashes, dtype=np.uint64)]),
+                    np.concatenate([self._base_signatures, np.asarray(self._signatures, dtype=np.uint32)
+                                    .reshape(-1, self.minhash.num_perm)]))
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, IDS_FILE))
+
+    def write(self, path: str, chunks):
+        """Saves the fingerprints of the chunks still in the index (`FAISSIndex.chunks`) in a folder."""
+        ids, hashes, signatures = self._columns()
+        keep = np.fromiter((chunk_id >= 0 and chunk_id in chunks for chunk_id in ids.tolist()), dtype=bool, count=len(ids))
+        np.save(os.path.join(path, IDS_FILE), ids[keep])
+        np.save(os.path.join(path, HASHES_FILE), hashes[keep])
+        np.save(os.path.join(path, SIGNATURES_FILE), signatures[keep])
+        with open(os.path.join(path, CONFIG_FILE), "w", encoding="utf-8") as file:
+            json.dump({"threshold": self.threshold, "num_perm": self.minhash.num_perm,
+                       "shingle_size": self.minhash.shingle_size}, file)
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkDeduplicator | None":
+        """Loads the fingerprints saved in a folder, memory-mapped; None if there are none."""
+        if not cls.exists(path):
+            return None
+        with open(os.path.join(path, CONFIG_FILE), encoding="utf-8") as file:
+            config = json.load(file)
+        return cls(config["threshold"], config["num_perm"], config["shingle_size"],
+                   np.load(os.path.join(path, IDS_FILE), mmap_mode="r"),
+                   np.load(os.path.join(path, HASHES_FILE), mmap_mode="r"),
+                   np.load(os.path.join(path, SIGNATURES_FILE), mmap_mode="r"))
+
+    def configured(self, threshold: float | None) -> "ChunkDeduplicator":
+        """Returns the deduplicator with another near-duplicate threshold, keeping the fingerprints."""
+        if threshold == self.threshold:
+            return self
+        ids, hashes, signatures = self._columns()
+        return ChunkDeduplicator(threshold, self.minhash.num_perm, self.minhash.shingle_size, ids, hashes, signatures)
@@ -1,88 +1,703 @@
-from faiss import IndexFlatL2, write_index, read_index
+from faiss import IndexFlatL2, IndexIDMap2, IO_FLAG_MMAP, write_index, read_index
 import numpy as np
+import json
+import logging
 import os
+import shutil
+import time
+from typing import Iterable
 
-from src.ingestion.chunking.token_chunking import text_to_chunks
+from src.services.vectorial_db.chunk_store import ChunkMap, ChunkStore
+from src.services.vectorial_db.dedup import ChunkDeduplicator
+from src.services.vectorial_db.index_factory import IndexConfig, empty_results
+from src.services.vectorial_db.metadata_store import ChunkMetadata, IDFilter, filter_key
+from src.services.vectorial_db.query_cache import QueryCache
+from src.services.vectorial_db.rw_lock import RWLock
+from src.services.vectorial_db.snapshots import SnapshotStore
+from src.services.vectorial_db.vector_store import VectorStore
+from src.services.models.batching import (
+    DEFAULT_MAX_BATCH_ITEMS,
+    DEFAULT_MAX_BATCH_TOKENS,
+    ThroughputReport,
+    estimate_tokens,
+    iter_batches,
+)
+from src.services.observability.telemetry import span
+
+
+logger = logging.getLogger(__name__)
+
+# With deduplication, chunks are checked this many batches at a time, so the chunks left fill full batches
+DEDUP_WINDOW_BATCHES = 8
 
 
 class FAISSIndex():
     """
     Manages a FAISS index for storing and retrieving text chunks based on their embeddings.
 
+    Every vector is stored under a stable integer ID (the index is wrapped in an `IndexIDMap2`),
+    so the chunks of a document can be removed without rebuilding the index. The type of index
+    (exact or approximate) is chosen with an `IndexConfig`; index types that need training keep
+    the first vectors aside until there are enough of them to train on. Compressed index types
+    (`sq_fp16`, `sq8`, `pq`, `ivf_pq`) can re-rank their candidates exactly: the full-precision
+    vectors are then kept in a memory-mapped `VectorStore` saved next to the index.
+
+    The index is safe to share between threads: searches run concurrently under the read side of
+    `lock`, while additions, removals and reloads take its write side. Embeddings requests are
+    always made without holding the lock.
+
     Attributes:
         dimension (int): The dimension of the embeddings.
         embeddings (function): The function used to generate embeddings for text.
-        index (faiss.IndexFlatL2): The FAISS index object.
-        chunks_list (list): A list of text chunks stored in the index.
+        batch_embeddings (function): Optional function that embeds a list of texts in one request.
+        max_batch_items (int): Maximum number of chunks sent per embeddings request.
+        max_batch_tokens (int): Maximum number of estimated tokens sent per embeddings request.
+        index_config (IndexConfig): The type and parameters of the FAISS index.
+        index (faiss.IndexIDMap2): The FAISS index object.
+        chunks (ChunkMap): The text chunks stored in the index, by vector ID.
+        metadata (ChunkMetadata): The document and pages of the chunks, which searches can be filtered by.
+        dedup (ChunkDeduplicator | None): Detects the chunks duplicating stored ones before they are
+            embedded, they are then recorded as more sources of the stored chunk. None stores every chunk.
+        full_vectors (ChunkMap | None): The full-precision vectors by ID, kept when the index config re-ranks.
+        compress_chunks (bool): Whether chunks are saved in compressed blocks.
+        read_only (bool): Whether the index can't be modified, its inverted lists being memory-mapped from disk.
+        query_cache (QueryCache): Optional cache of query embeddings and search results.
+        version (int): Incremented whenever the index content changes, invalidates cached results.
+        next_id (int): The ID given to the next added chunk.
+        manifest (dict): Ingestion bookkeeping saved and loaded together with the index.
+        snapshot (str | None): Name of the snapshot last saved or loaded, see `SnapshotStore`.
+        last_ingest_report (ThroughputReport): Throughput figures of the last ingestion.
+        lock (RWLock): Readers-writer lock guarding the index and chunks.
 
     Methods:
         _create_faiss_index(): Initializes a new FAISS index.
         ingest_text(): Adds text chunks to the index.
+        add_chunks(): Embeds chunks in batches and adds them to the index.
+        add_vectors(): Adds already embedded chunks to the index.
+        deduplicate(): Finds the chunks duplicating stored chunks, before embedding them.
+        add_references(): Records more sources of stored chunks.
+        remove_document(): Removes the sources of chunks in a document, and the chunks left without any.
+        set_document_metadata(): Sets the loader metadata of a document.
+        train(): Trains the index on the vectors kept aside so far.
+        remove_ids(): Removes chunks from the index.
+        reset(): Empties the index.
         retrieve_chunks(): Retrieves relevant chunks for a given query.
-        save_index(): Saves the index and chunk list to disk.
-        load_index(): Loads the index and chunk list from disk.
+        retrieve_chunks_batch(): Retrieves relevant chunks, with their IDs and scores, for many queries.
+        embed_queries(): Embeds several queries in batched requests.
+        search_queries(): Searches the IDs and distances of the nearest chunks of several queries at once.
+        search_vectors(): Searches the IDs and distances of the nearest chunks of query vectors.
+        get_chunks(): Returns the chunks of search results.
+        save_index(): Saves the index, chunks and manifest to disk as a new snapshot.
+        load_index(): Loads the index, chunks and manifest of the current snapshot from disk.
+        close(): Releases the resources of the index.
     """
-    def __init__(self, dimension: int = 3072, embeddings = None):
+    def __init__(self, dimension: int = 3072, embeddings = None, batch_embeddings = None,
+                 max_batch_items: int = DEFAULT_MAX_BATCH_ITEMS,
+                 max_batch_tokens: int = DEFAULT_MAX_BATCH_TOKENS, index_config: IndexConfig | None = None,
+                 compress_chunks: bool = False, query_cache: QueryCache | None = None,
+                 dedup: ChunkDeduplicator | None = None):
         """dimension(int): the dimension of the embeddings.
-        embeddings(function): the function that returns the embeddings."""
+        embeddings(function): the function that returns the embeddings.
+        batch_embeddings(function): the function that returns the embeddings of a list of texts.
+            When not provided, ingestion falls back to one `embeddings` call per chunk.
+        max_batch_items(int): maximum number of chunks per embeddings request.
+        max_batch_tokens(int): maximum number of estimated tokens per embeddings request.
+        index_config(IndexConfig): the type and parameters of the FAISS index, exact flat index by default.
+        compress_chunks(bool): whether to save chunks in zlib-compressed blocks.
+        query_cache(QueryCache): cache of query embeddings and search results, none by default.
+        dedup(ChunkDeduplicator): detects duplicate chunks before they are embedded, none by default."""
         if not embeddings:
             raise ValueError("No embeddings provided.")
         self.embeddings = embeddings
+        self.batch_embeddings = batch_embeddings
+        self.max_batch_items = max_batch_items
+        self.max_batch_tokens = max_batch_tokens
         self.dimension = dimension
-        self.index: IndexFlatL2 | None= None
+        self.index_config = index_config or IndexConfig()
+        self.index: IndexIDMap2 | None= None
+        self.compress_chunks = compress_chunks
+        self.query_cache = query_cache
+        self.lock = RWLock()
+        self.version = 0
         self._create_faiss_index()
-        self.chunks_list: list = []
-    
+        self.chunks = ChunkMap()
+        self.metadata = ChunkMetadata()
+        self.dedup = dedup
+        # The overlay works the same for vectors as for chunks: a base store on disk, plus the changes
+        self.full_vectors = ChunkMap() if self.index_config.rerank else None
+        self.next_id = 0
+        self.read_only = False
+        self.manifest: dict = {}
+        self.snapshot: str | None = None
+        self.last_ingest_report: ThroughputReport | None = None
+
     def _create_faiss_index(self):
-        self.index = IndexFlatL2(self.dimension)
-    
+        self.index = self._build_index(self.index_config)
+        self.version += 1
+        # Vectors waiting for the index to be trained
+        self._pending_vectors: list[np.ndarray] = []
+        self._pending_ids: list[np.ndarray] = []
+
+    def _build_index(self, config: IndexConfig):
+        """Creates an empty FAISS index of a config."""
+        return config.build(self.dimension)
+
+    def _assign(self, ids: np.ndarray, document: str | None):
+        """Called with the IDs of every added batch and their document, before they are added.
+
+        A no-op hook here: ShardedFAISSIndex overrides it to assign the IDs to their shards.
+        """
+
+    @property
+    def supports_removal(self) -> bool:
+        return self.index_config.supports_removal
+
+    def reset(self):
+        """Empties the index, keeping its configuration."""
+        with self.lock.write():
+            self._create_faiss_index()
+            self.chunks = ChunkMap()
+            self.metadata = ChunkMetadata()
+            if self.dedup is not None:
+                # IDs are given again from 0, fingerprints bound to the old ones would match new chunks
+                self.dedup.clear()
+            self.full_vectors = ChunkMap() if self.index_config.rerank else None
+            self.next_id = 0
+            self.read_only = False
+
     def ingest_text(self, text: str | None = None, text_chunks: list | None = None) -> bool:
         """Ingests text to the faiss index."""
         if not (text_chunks or text):
             raise ValueError("Either text or text_chunks must be provided")
         if not text_chunks:
+            # Imported here: serving an index never chunks, and the tokenizer is slow to load
+            from src.ingestion.chunking.token_chunking import text_to_chunks
             #TODO: Improve chunking
             text_chunks = text_to_chunks(text)
-        for chunk in text_chunks:
-            embedding = self.embeddings(chunk)
-            self.index.add(np.array([embedding]).astype('float32'))
-            self.chunks_list += [chunk]
+        self.add_chunks(text_chunks)
         return True
-    
-    def retrieve_chunks(self, query: str, num_chunks: int = 5) -> list:
-        """Retrieves chunks from the FAISS index based on a query."""
-        query_embedding = self.embeddings(query)
-        query_vector = np.array([query_embedding]).astype('float32')
-        _, I = self.index.search(query_vector, num_chunks)
-        return [self.chunks_list[i] for i in I[0]]
-    
-    def save_index(self, path=r"./faiss_index"):
-        """Saves the index and chunk list to disk.
+
+    def add_chunks(self, chunks: Iterable[str]) -> list[int]:
+        """Embeds chunks in batches and adds each batch to the index in a single call.
+
+        With `dedup`, the chunks duplicating a stored chunk are neither embedded nor stored, they
+        get the ID of the chunk they duplicate. Throughput figures of the ingestion are kept in
+        `last_ingest_report`.
+
+        Args:
+            chunks (Iterable[str]): The chunks to add, consumed lazily.
+
+        Returns:
+            list[int]: The IDs given to the chunks, in input order.
+        """
+        report = ThroughputReport()
+        ids = []
+        window = 1 if self.dedup is None else DEDUP_WINDOW_BATCHES
+        for chunks_window in iter_batches(chunks, self.max_batch_items * window, self.max_batch_tokens * window):
+            slots, positions = self.deduplicate(chunks_window, report) if self.dedup is not None else (None, None)
+            new = chunks_window if positions is None else [chunks_window[position] for position in positions]
+            new_ids = []
+            for batch in iter_batches(new, self.max_batch_items, self.max_batch_tokens):
+                start = time.perf_counter()
+                vectors = self._embed_batch(batch)
+                report.embed_seconds += time.perf_counter() - start
+                report.requests += 1 if self.batch_embeddings else len(batch)
+                report.tokens += sum(estimate_tokens(chunk) for chunk in batch)
+
+                start = time.perf_counter()
+                new_ids.extend(self.add_vectors(vectors, batch))
+                report.add_seconds += time.perf_counter() - start
+                report.chunks += len(batch)
+            if slots is None:
+                ids.extend(new_ids)
+            else:
+                self.dedup.bind([slots[position] for position in positions], new_ids)
+                ids.extend(self.dedup.id_of(slot) for slot in slots)
+        self.last_ingest_report = report.stop()
+        return ids
+
+    def add_vectors(self, vectors: np.ndarray, chunks: list[str], document: str | None = None,
+                    pages: list[tuple[int, int]] | None = None) -> list[int]:
+        """Adds already embedded chunks to the index.
+
+        Args:
+            vectors (np.ndarray): The embeddings, a float32 matrix with one row per chunk.
+            chunks (list[str]): The chunks the embeddings were computed from.
+            document (str, optional): The path of the document of the chunks, recorded in their metadata.
+                Sharded indexes can partition by it.
+            pages (list[tuple[int, int]], optional): The first and last page of every chunk.
+
+        Returns:
+            list[int]: The IDs given to the chunks, in input order.
+        """
+        with span("index_add", items=len(chunks)), self.lock.write():
+            self._check_writable()
+            ids = np.arange(self.next_id, self.next_id + len(chunks), dtype='int64')
+            self._assign(ids, document)
+            if self.index.is_trained:
+                self.index.add_with_ids(vectors, ids)
+            else:
+                self._pending_vectors.append(vectors)
+                self._pending_ids.append(ids)
+                if sum(len(pending) for pending in self._pending_ids) >= self.index_config.min_training_points():
+                    self._train()
+            self.chunks.update(zip(ids.tolist(), chunks))
+            if document is not None or pages is not None:
+                self.metadata.add(ids, document, pages)
+            if self.full_vectors is not None:
+                self.full_vectors.update(zip(ids.tolist(), vectors))
+            self.next_id += len(chunks)
+            self.version += 1
+        return ids.tolist()
+
+    def deduplicate(self, chunks: list[str], report: ThroughputReport | None = None) -> tuple[list[int], list[int]]:
+        """Finds the chunks duplicating a stored chunk, or an earlier chunk of the list, before they are embedded.
+
+        Args:
+            chunks (list[str]): The chunks about to be embedded.
+            report (ThroughputReport, optional): Counts the duplicates and what skipping them saves.
+
+        Returns:
+            tuple[list[int], list[int]]: The `dedup` slot of every chunk, and the positions of the
+                chunks that aren't duplicates, to embed and add. Once added, their slots must be bound
+                to their IDs with `dedup.bind`.
+        """
+        slots, positions, near = [], [], 0
+        for position, chunk in enumerate(chunks):
+            slot, duplicate = self.dedup.assign(chunk, self.chunks)
+            slots.append(slot)
+            if duplicate is None:
+                positions.append(position)
+            near += duplicate == "near"
+        if report is not None and len(positions) < len(chunks):
+            new = set(positions)
+            duplicates = [chunk for position, chunk in enumerate(chunks) if position not in new]
+            report.duplicates += len(duplicates)
+            report.near_duplicates += near
+            report.tokens_saved += sum(estimate_tokens(chunk) for chunk in duplicates)
+            report.bytes_saved += sum(len(chunk.encode("utf-8")) for chunk in duplicates) + \
+                len(duplicates) * self.dimension * np.dtype('float32').itemsize
+            if self.batch_embeddings:
+                report.requests_saved += \
+                    sum(1 for _ in iter_batches(chunks, self.max_batch_items, self.max_batch_tokens)) - \
+                    sum(1 for _ in iter_batches([chunks[position] for position in positions], self.max_batch_items,
+                                                self.max_batch_tokens))
+            else:
+                report.requests_saved += len(duplicates)
+        return slots, positions
+
+    def add_references(self, ids: list[int], document: str | None = None,
+                       pages: list[tuple[int, int]] | None = None):
+        """Records more sources of stored chunks: duplicates found in a document, see `deduplicate`.
+
+        Args:
+            ids (list[int]): The IDs of the stored chunks.
+            document (str, optional): The path of the document the duplicates were found in.
+            pages (list[tuple[int, int]], optional): The first and last page of every duplicate.
+        """
+        if document is None and pages is None:
+            return
+        with self.lock.write():
+            self._check_writable()
+            self.metadata.add(np.asarray(ids, dtype='int64'), document, pages)
+            self.version += 1
+
+    def remove_document(self, document: str, ids: Iterable[int]) -> int:
+        """Removes the sources of chunks in a document, and the chunks no other document shares.
+
+        Args:
+            document (str): The path of the document.
+            ids (Iterable[int]): The IDs of the chunks found in the document.
+
+        Returns:
+            int: The number of removed vectors.
+        """
+        ids = np.unique(np.fromiter(ids, dtype='int64'))
+        with self.lock.write():
+            self._check_writable()
+            orphans = self.metadata.remove_references(ids, document)
+            self.version += 1
+        return self.remove_ids(orphans)
+
+    def set_document_metadata(self, document: str, metadata: dict):
+        """Sets the metadata extracted from a document by its loader (title, author, ...), which searches can be filtered by."""
+        with self.lock.write():
+            self._check_writable()
+            self.metadata.update_document(document, metadata)
+            self.version += 1
+
+    def _check_writable(self):
+        if self.read_only:
+            raise RuntimeError("The index is read-only: its inverted lists are memory-mapped (load it with mmap=False "
+                               "to modify it), or its shards are served by shard servers")
+
+    def train(self):
+        """Trains the index on the vectors kept aside so far, then adds them.
+
+        Called automatically once enough vectors were added, and before searching or saving. When
+        there are fewer vectors than the configured training size, the number of inverted lists is
+        reduced to what they can train.
+        """
+        if self.index.is_trained or not self._pending_ids:
+            return
+        with self.lock.write():
+            self._train()
+
+    def _train(self):
+        if self.index.is_trained or not self._pending_ids:
+            return
+        vectors = np.concatenate(self._pending_vectors)
+        ids = np.concatenate(self._pending_ids)
+        config = self.index_config.fitted(len(vectors))
+        if config.nlist != self.index_config.nlist:
+            logger.info("Training %s index on %d vectors with %d lists instead of %d", config.index_type,
+                        len(vectors), config.nlist, self.index_config.nlist)
+            self.index_config = config
+            self.index = self._build_index(config)
+        with span("train", level=logging.INFO, index_type=config.index_type, vectors=len(vectors)):
+            self.index.train(vectors)
+            self.index.add_with_ids(vectors, ids)
+        self._pending_vectors = []
+        self._pending_ids = []
+
+    def _embed_batch(self, batch: list[str]) -> np.ndarray:
+        """Embeds a batch of chunks into a contiguous float32 matrix of shape (len(batch), dimension)."""
+        with span("embed", items=len(batch)):
+            if self.batch_embeddings:
+                embeddings = self.batch_embeddings(batch)
+            else:
+                embeddings = [self.embeddings(chunk) for chunk in batch]
+        vectors = np.ascontiguousarray(embeddings, dtype='float32')
+        if vectors.shape != (len(batch), self.dimension):
+            raise ValueError(f"Expected embeddings of shape {(len(batch), self.dimension)}, got {vectors.shape}")
+        return vectors
+
+    def remove_ids(self, ids: Iterable[int]) -> int:
+        """Removes chunks from the index.
+
+        Args:
+            ids (Iterable[int]): The IDs of the chunks to remove.
+
+        Returns:
+            int: The number of removed vectors.
+
+        Raises:
+            ValueError: If the index type doesn't support removing vectors (see `supports_removal`).
+        """
+        ids = np.fromiter(ids, dtype='int64')
+        if not len(ids):
+            return 0
+        if not self.supports_removal:
+            raise ValueError(f"{self.index_config.index_type} indexes don't support removing vectors")
+        with self.lock.write():
+            self._check_writable()
+            self._train()
+            removed = self.index.remove_ids(ids)
+            self.metadata.remove(ids)
+            self.version += 1
+            for i in ids.tolist():
+                self.chunks.pop(i, None)
+                if self.full_vectors is not None:
+                    self.full_vectors.pop(i, None)
+        return removed
+
+    def retrieve_chunks(self, query: str, num_chunks: int = 5, filter: dict | None = None) -> list:
+        """Retrieves chunks from the FAISS index based on a query, among the chunks matching `filter` if given.
+
+        See `ChunkMetadata.select` for the filters, e.g. `{"file": "glossary.pdf"}`.
+        """
+        ids, _ = self.search_queries([query], num_chunks, filter=filter)[0]
+        return self.get_chunks(ids)
+
+    def retrieve_chunks_batch(self, queries: list[str], num_chunks: int = 5,
+                              filter: dict | None = None) -> list[list[dict]]:
+        """Retrieves chunks from the FAISS index for many queries at once.
+
+        The queries are embedded in batched requests (see `max_batch_items`) and searched with a
+        single `index.search` over the whole query matrix.
+
+        Args:
+            queries (list[str]): The queries.
+            num_chunks (int, optional): The number of chunks per query. Defaults to 5.
+            filter (dict, optional): Only searches the chunks matching this filter, see `ChunkMetadata.select`.
+
+        Returns:
+            list[list[dict]]: For each query, its nearest chunks as `{"id", "score", "chunk", "metadata"}`
+                dicts, closest first. The score is the squared L2 distance to the query, lower is closer.
+        """
+        results = self.search_queries(queries, num_chunks, filter=filter)
+        with self.lock.read():
+            return [
+                [{"id": int(i), "score": float(d), "chunk": self.chunks[i], "metadata": self.metadata.get(i)}
+                 for i, d in zip(ids.tolist(), distances.tolist()) if i >= 0 and i in self.chunks]
+                for ids, distances in results
+            ]
+
+    def embed_queries(self, queries: list[str]) -> np.ndarray:
+        """Embeds queries into a (len(queries), dimension) float32 matrix.
+
+        Queries found in the query cache are not embedded again, the others are embedded in
+        batched requests when `batch_embeddings` is available.
+        """
+        vectors = [self.query_cache.get_vector(query) if self.query_cache else None for query in queries]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        start = 0
+        for batch in iter_batches((queries[i] for i in missing), self.max_batch_items, self.max_batch_tokens):
+            for i, vector in zip(missing[start:start + len(batch)], self._embed_batch(batch)):
+                vectors[i] = vector.reshape(1, -1)
+                if self.query_cache:
+                    self.query_cache.put_vector(queries[i], vectors[i])
+            start += len(batch)
+        if not vectors:
+            return np.empty((0, self.dimension), dtype='float32')
+        return np.ascontiguousarray(np.concatenate(vectors), dtype='float32')
+
+    def search_queries(self, queries: list[str], num_chunks: int = 5,
+                       filter: dict | None = None) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Searches the nearest chunks of several queries at once.
+
+        Results are taken from the query cache when possible; the other queries are embedded
+        together and searched with a single `index.search` over their query matrix. With a filter,
+        the IDs of the matching chunks are pushed down into the search, which only computes the
+        distances to their vectors.
+
+        Args:
+            queries (list[str]): The queries.
+            num_chunks (int, optional): The number of chunks per query. Defaults to 5.
+            filter (dict, optional): Only searches the chunks matching this filter, see `ChunkMetadata.select`.
+
+        Returns:
+            list[tuple[np.ndarray, np.ndarray]]: The IDs and distances of the nearest chunks of each
+                query, IDs are -1 when the index holds fewer than num_chunks vectors.
+        """
+        self.train()
+        results = [None] * len(queries)
+        if self.query_cache:
+            with self.lock.read():
+                version = self.version
+            results = [self.query_cache.get_results(query, num_chunks, version, filter_key(filter))
+                       for query in queries]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            return results
+        # Embed outside of the lock, writers are not held up by the embeddings requests
+        vectors = self.embed_queries([queries[i] for i in missing])
+        with span("search", queries=len(missing), filtered=filter is not None), self.lock.read():
+            D, I = self._search_vectors(vectors, num_chunks, self._id_filter(filter))
+            version = self.version
+        for row, i in enumerate(missing):
+            results[i] = (I[row], D[row])
+            if self.query_cache:
+                self.query_cache.put_results(queries[i], num_chunks, version, I[row], D[row], filter_key(filter))
+        return results
+
+    def search_vectors(self, vectors: np.ndarray, num_chunks: int = 5,
+                       filter: dict | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Searches the nearest chunks of query vectors.
+
+        Args:
+            vectors (np.ndarray): The query embeddings, a float32 matrix with one row per query.
+            num_chunks (int, optional): The number of chunks per query. Defaults to 5.
+            filter (dict, optional): Only searches the chunks matching this filter, see `ChunkMetadata.select`.
+
+        Returns:
+            tuple[np.ndarray, np.ndarray]: The distances and IDs matrices, as returned by `index.search`.
+        """
+        self.train()
+        with span("search", queries=len(vectors), filtered=filter is not None), self.lock.read():
+            return self._search_vectors(np.ascontiguousarray(vectors, dtype='float32'), num_chunks,
+                                        self._id_filter(filter))
+
+    def _id_filter(self, filter: dict | None) -> IDFilter | None:
+        return None if filter is None else IDFilter(self.metadata.select(filter))
+
+    def _search_index(self, vectors: np.ndarray, k: int, id_filter: IDFilter | None) -> tuple[np.ndarray, np.ndarray]:
+        if self.index.ntotal == 0:
+            # E.g. every document was removed by a re-ingestion
+            return empty_results(len(vectors), k)
+        if id_filter is None:
+            return self.index.search(vectors, k)
+        return id_filter.search(self.index, vectors, k, self.index_config)
+
+    def _search_vectors(self, vectors: np.ndarray, num_chunks: int,
+                        id_filter: IDFilter | None = None) -> tuple[np.ndarray, np.ndarray]:
+        if self.full_vectors is None:
+            return self._search_index(vectors, num_chunks, id_filter)
+        # Re-rank the candidates of the compressed index with their exact distances
+        _, candidates = self._search_index(vectors, max(num_chunks, self.index_config.rerank), id_filter)
+        D = np.full((len(vectors), num_chunks), np.inf, dtype='float32')
+        I = np.full((len(vectors), num_chunks), -1, dtype='int64')
+        for row, (query, ids) in enumerate(zip(vectors, candidates)):
+            # The full vectors are added and removed with those of the index, under the same lock
+            ids = [i for i in ids.tolist() if i >= 0]
+            if not ids:
+                continue
+            distances = ((np.stack(self.full_vectors.take(ids)) - query) ** 2).sum(axis=1)
+            order = np.argsort(distances, kind='stable')[:num_chunks]
+            D[row, :len(order)] = distances[order]
+            I[row, :len(order)] = np.asarray(ids)[order]
+        return D, I
+
+    def get_chunks(self, ids: Iterable[int]) -> list[str]:
+        """Returns the chunks of search results, skipping the -1 padding and chunks removed since."""
+        with self.lock.read():
+            # FAISS pads the results with -1 when the index holds fewer than num_chunks vectors
+            return [self.chunks[i] for i in ids if i >= 0 and i in self.chunks]
+
+    def save_index(self, path=r"./faiss_index", keep_snapshots: int = 2) -> str:
+        """Saves the index, its configuration, chunks, chunk metadata and manifest as a new snapshot.
+
+        Everything is written to a temporary folder and flushed to disk, then published atomically
+        as the current snapshot of `path` (see `SnapshotStore`): a crash never leaves an index that
+        doesn't match its chunks or manifest, and processes serving the index can load the new
+        snapshot while it is in use, without ever reading a half-written one.
 
         Args:
             path (str, optional): The directory to save the index to. Defaults to r"./faiss_index".
+            keep_snapshots (int, optional): Number of most recent snapshots kept on disk. Defaults to 2.
+
+        Returns:
+            str: The name of the published snapshot.
         """
-        print(f"Saving index to '{path}' folder...")
+        with span("save_index", level=logging.INFO, path=path):
+            store = SnapshotStore(path, keep=keep_snapshots)
+            os.makedirs(store.path, exist_ok=True)
+            tmp_path = store.create()
+
+            try:
+                self.train()
+                # Searches go on while saving, modifications wait for a consistent snapshot to be written
+                with self.lock.read():
+                    with open(os.path.join(tmp_path, "index_config.json"), "w", encoding="utf-8") as file:
+                        json.dump(self.index_config.as_dict(), file)
+                    self._write_index(tmp_path)
+                    ChunkStore.write(tmp_path, ((i, self.chunks[i]) for i in sorted(self.chunks)),
+                                     compress=self.compress_chunks)
+                    self.metadata.write(tmp_path)
+                    if self.full_vectors is not None:
+                        VectorStore.write(tmp_path, ((i, self.full_vectors[i]) for i in sorted(self.full_vectors)),
+                                          len(self.full_vectors), self.dimension)
+                    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as file:
+                        # The IDs of removed chunks are never given again: document shards are routed by ID ranges
+                        json.dump({**self.manifest, "next_id": self.next_id}, file)
+                    if self.dedup is not None:
+                        self.dedup.write(tmp_path, self.chunks)
+            except BaseException:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+            self.snapshot = store.publish(tmp_path)
+            return self.snapshot
+
+    def _write_index(self, path: str):
+        write_index(self.index, os.path.join(path, "index.faiss"))
+
+    def _read_index(self, path: str, mmap: bool):
         index_path = os.path.join(path, "index.faiss")
-        chunks_path = os.path.join(path, "chunks.npy")
-        if not os.path.exists(path):
-            os.makedirs(path)
-        write_index(self.index, index_path)
-        np.save(chunks_path, self.chunks_list)
-    
-    def load_index(self, path: str = r"./faiss_index"):
-        """Loads the index and chunk list from disk.
+        if not os.path.exists(index_path) and os.path.exists(os.path.join(path, "shards.json")):
+            raise ValueError(f"{path} holds a sharded index, load it with ShardedFAISSIndex")
+        return read_index(index_path, IO_FLAG_MMAP) if mmap else read_index(index_path)
+
+    def load_index(self, path: str = r"./faiss_index", mmap: bool = False):
+        """Loads the index, its configuration, chunks, chunk metadata and manifest from disk.
+
+        The current snapshot of `path` is loaded, or the files at its root for an index saved before
+        snapshots existed. Chunks and their metadata are memory-mapped and decoded lazily. With `mmap`, the
+        inverted lists of IVF indexes are memory-mapped as well, so several serving processes share their
+        pages; the index is then read-only. FAISS reads the other index types (flat, HNSW, scalar and
+        product quantized) in memory whatever `mmap`, they stay writable. An index created with `dedup`
+        loads the duplicate fingerprints saved with the index, or fingerprints its chunks.
 
         Args:
             path (str, optional): The directory to load the index from. Defaults to r"./faiss_index".
+            mmap (bool, optional): Whether to memory-map the inverted lists of an IVF index. Defaults to False.
 
         Raises:
             FileNotFoundError: If the index is not found at the specified path.
+            ValueError: If the index dimension is not the dimension of the embeddings.
+        """
+        with span("load_index", level=logging.INFO, path=path, mmap=mmap):
+            path = os.path.normpath(path)
+            if not os.path.exists(path) and os.path.exists(path + ".old"):
+                # A save made before snapshots existed was interrupted between swapping the folders,
+                # the previous index is intact
+                os.rename(path + ".old", path)
+            if not os.path.exists(path):
+                raise FileNotFoundError("Index not found.")
+            snapshot, path = SnapshotStore(path).current()
+            legacy_chunks_path = os.path.join(path, "chunks.npy")
+            manifest_path = os.path.join(path, "manifest.json")
+            config_path = os.path.join(path, "index_config.json")
+            index_config = IndexConfig()
+            if os.path.exists(config_path):
+                with open(config_path, encoding="utf-8") as file:
+                    index_config = IndexConfig.from_dict(json.load(file))
+            mmap = mmap and index_config.supports_mmap
+            index = self._read_index(path, mmap)
+            if index.d != self.dimension:
+                raise ValueError(f"The index holds vectors of dimension {index.d}, the embeddings have dimension "
+                                 f"{self.dimension}: rebuild the index")
+            if ChunkStore.exists(path):
+                store = ChunkStore(path)
+                chunks = ChunkMap(store)
+                next_id = store.max_id + 1
+            else:
+                # Index saved before the chunk store existed: chunks are a numpy array of strings,
+                # vector IDs are in chunk_ids.npy or, for the oldest indexes, the insertion positions
+                texts = np.load(legacy_chunks_path, allow_pickle=False).tolist()
+                ids_path = os.path.join(path, "chunk_ids.npy")
+                ids = np.load(ids_path).tolist() if os.path.exists(ids_path) else list(range(len(texts)))
+                chunks = ChunkMap(chunks=dict(zip(ids, texts)))
+                next_id = max(ids, default=-1) + 1
+                if not isinstance(index, IndexIDMap2):
+                    id_index = IndexIDMap2(IndexFlatL2(index.d))
+                    if index.ntotal:
+                        id_index.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype='int64'))
+                    index = id_index
+            index_config.apply_search_params(index)
+            full_vectors = None
+            if index_config.rerank:
+                if VectorStore.exists(path):
+                    full_vectors = ChunkMap(VectorStore(path))
+                else:
+                    logger.warning("The full-precision vectors were not saved with the index, re-ranking is disabled")
+                    index_config.rerank = 0
+            metadata = ChunkMetadata.load(path)
+            dedup = None
+            if self.dedup is not None:
+                # Deduplicating: with the fingerprints saved with the index, or those of its chunks
+                dedup = ChunkDeduplicator.load(path)
+                if dedup is not None:
+                    dedup = dedup.configured(self.dedup.threshold)
+                else:
+                    dedup = ChunkDeduplicator(self.dedup.threshold, self.dedup.minhash.num_perm,
+                                              self.dedup.minhash.shingle_size)
+                    dedup.add_existing(chunks)
+            manifest = {}
+            if os.path.exists(manifest_path):
+                with open(manifest_path, encoding="utf-8") as file:
+                    manifest = json.load(file)
+                # Older snapshots didn't save it, the IDs of chunks removed last are then given again
+                next_id = max(next_id, manifest.pop("next_id", 0))
+            # Everything is read before swapping, searches are only held up by the swap itself
+            with self.lock.write():
+                self.index_config = index_config
+                self.index = index
+                self._pending_vectors = []
+                self._pending_ids = []
+                self.chunks = chunks
+                self.metadata = metadata
+                self.dedup = dedup
+                self.full_vectors = full_vectors
+                self.next_id = next_id
+                self.read_only = mmap
+                self.manifest = manifest
+                self.snapshot = snapshot
+                self.version += 1
+                if self.query_cache:
+                    self.query_cache.invalidate(vectors=True)
+
+    def close(self):
+        """Releases the resources of the index, once it is no longer searched.
+
+        A no-op hook here: ShardedFAISSIndex overrides it to stop its search threads and close its remote shards.
         """
-        print(f"Loading index from '{path}' folder...")
-        index_path = os.path.join(path, "index.faiss")
-        chunks_path = os.path.join(path, "chunks.npy")
-        if not os.path.exists(path):
-            raise FileNotFoundError("Index not found.")
-        self.index = read_index(index_path)
-        self.chunks_list = np.load(chunks_path, allow_pickle=True).tolist()
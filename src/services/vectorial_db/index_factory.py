@@ -0,0 +1,187 @@
+import faiss
+import numpy as np
+
+
+# FAISS needs about 39 training points per centroid to train k-means without warnings
+POINTS_PER_CENTROID = 39
+# Vectors sampled to learn the value range of each dimension of an 8-bit scalar quantizer
+SQ_TRAINING_POINTS = 10_000
+
+
+def empty_results(queries: int, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the results of a search that found nothing: inf distances and -1 IDs, like FAISS pads them.
+
+    Searches of an index holding no vectors return these instead of calling FAISS, which crashes
+    when it searches an emptied flat index with 20 queries or more.
+    """
+    return np.full((queries, k), np.inf, dtype="float32"), np.full((queries, k), -1, dtype="int64")
+
+
+class IndexConfig:
+    """Type and parameters of the FAISS index behind a `FAISSIndex`.
+
+    Supported types:
+        flat: exact brute-force search (`IndexFlatL2`).
+        ivf_flat: inverted file with `nlist` lists, full vectors, `nprobe` lists scanned per query.
+        ivf_pq: inverted file with vectors compressed by product quantization in `pq_m` sub-vectors
+            of `pq_nbits` bits.
+        hnsw: HNSW graph with `hnsw_m` neighbours per node, `ef_search` candidates explored per query.
+        sq_fp16: exact brute-force search over vectors stored as 16-bit floats (half the memory of flat).
+        sq8: brute-force search over vectors scalar-quantized to 8 bits per dimension (a quarter).
+        pq: brute-force search over vectors compressed by product quantization in `pq_m` bytes.
+
+    IVF, sq8 and pq types need a training step on a sample of the vectors before anything can be
+    added; HNSW does not support removing vectors. With `rerank`, the index returns `rerank`
+    candidates per query, which are re-ranked exactly with the full-precision vectors, kept on disk
+    next to the index.
+
+    Attributes:
+        index_type (str): One of `IndexConfig.TYPES`.
+        nlist (int): Number of inverted lists of the IVF types.
+        nprobe (int): Number of inverted lists scanned per query.
+        pq_m (int): Number of PQ sub-quantizers, must divide the dimension.
+        pq_nbits (int): Bits per PQ sub-quantizer code.
+        hnsw_m (int): Number of neighbours per HNSW node.
+        ef_construction (int): HNSW candidate list size while building.
+        ef_search (int): HNSW candidate list size while searching.
+        training_size (int | None): Number of vectors to train on, defaults to what the type needs.
+        rerank (int): Number of candidates re-ranked exactly per query, 0 disables re-ranking.
+    """
+    TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq_fp16", "sq8", "pq")
+
+    def __init__(self, index_type: str = "flat", nlist: int = 1024, nprobe: int = 16, pq_m: int = 64,
+                 pq_nbits: int = 8, hnsw_m: int = 32, ef_construction: int = 200, ef_search: int = 64,
+                 training_size: int | None = None, rerank: int = 0):
+        if index_type not in self.TYPES:
+            raise ValueError(f"Not a supported index type: {index_type}. Choose one of {self.TYPES}")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.pq_m = pq_m
+        self.pq_nbits = pq_nbits
+        self.hnsw_m = hnsw_m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.training_size = training_size
+        self.rerank = rerank
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, values: dict) -> "IndexConfig":
+        return cls(**values)
+
+    def __repr__(self) -> str:
+        return f"IndexConfig({', '.join(f'{key}={value!r}' for key, value in self.as_dict().items())})"
+
+    @property
+    def needs_training(self) -> bool:
+        return self.index_type in ("ivf_flat", "ivf_pq", "sq8", "pq")
+
+    @property
+    def is_ivf(self) -> bool:
+        return self.index_type in ("ivf_flat", "ivf_pq")
+
+    @property
+    def supports_removal(self) -> bool:
+        return self.index_type != "hnsw"
+
+    @property
+    def supports_mmap(self) -> bool:
+        """Whether saved indexes of this type can be memory-mapped: FAISS only maps the inverted lists of IVF indexes."""
+        return self.is_ivf
+
+    @property
+    def supports_selectors(self) -> bool:
+        """Whether searches can be restricted to a set of IDs (`IndexPQ` ignores search parameters)."""
+        return self.index_type != "pq"
+
+    def min_training_points(self) -> int:
+        """Returns the number of vectors needed before the index can be trained."""
+        if not self.needs_training:
+            return 0
+        if self.training_size:
+            return self.training_size
+        if self.index_type == "sq8":
+            # Only the range of each dimension is learnt
+            return SQ_TRAINING_POINTS
+        points = POINTS_PER_CENTROID * self.nlist if self.is_ivf else 0
+        if self.index_type in ("ivf_pq", "pq"):
+            points = max(points, POINTS_PER_CENTROID * 2 ** self.pq_nbits)
+        return points
+
+    def fitted(self, num_vectors: int) -> "IndexConfig":
+        """Returns a copy of the config whose number of lists can be trained on `num_vectors` vectors.
+
+        Raises:
+            ValueError: If there are too few vectors to train the PQ codebooks.
+        """
+        config = IndexConfig.from_dict(self.as_dict())
+        if self.is_ivf:
+            config.nlist = max(1, min(self.nlist, num_vectors // POINTS_PER_CENTROID))
+            config.nprobe = min(self.nprobe, config.nlist)
+        if self.index_type in ("ivf_pq", "pq") and num_vectors < 2 ** self.pq_nbits:
+            raise ValueError(f"{self.index_type} needs at least {2 ** self.pq_nbits} vectors to train, got {num_vectors}")
+        return config
+
+    def factory_string(self) -> str:
+        """Returns the `faiss.index_factory` description of the index."""
+        match self.index_type:
+            case "flat":
+                return "Flat"
+            case "ivf_flat":
+                return f"IVF{self.nlist},Flat"
+            case "ivf_pq":
+                return f"IVF{self.nlist},PQ{self.pq_m}x{self.pq_nbits}"
+            case "hnsw":
+                return f"HNSW{self.hnsw_m},Flat"
+            case "sq_fp16":
+                return "SQfp16"
+            case "sq8":
+                return "SQ8"
+            case "pq":
+                return f"PQ{self.pq_m}x{self.pq_nbits}"
+
+    def build(self, dimension: int) -> faiss.IndexIDMap2:
+        """Creates an empty index of this type, wrapped to store vectors under custom IDs.
+
+        Args:
+            dimension (int): The dimension of the vectors.
+
+        Returns:
+            faiss.IndexIDMap2: The new index, untrained for the IVF types.
+        """
+        index = faiss.index_factory(dimension, self.factory_string(), faiss.METRIC_L2)
+        if self.index_type == "hnsw":
+            index.hnsw.efConstruction = self.ef_construction
+        index = faiss.IndexIDMap2(index)
+        self.apply_search_params(index)
+        return index
+
+    def search_parameters(self, selector: faiss.IDSelector) -> faiss.SearchParameters:
+        """Returns the search parameters restricting a search to the IDs of a selector.
+
+        IVF and HNSW indexes only accept parameters of their own type, which also carry `nprobe`
+        and `efSearch`: they replace the values set on the index.
+        """
+        if self.is_ivf:
+            return faiss.SearchParametersIVF(sel=selector, nprobe=self.nprobe)
+        if self.index_type == "hnsw":
+            return faiss.SearchParametersHNSW(sel=selector, efSearch=self.ef_search)
+        return faiss.SearchParameters(sel=selector)
+
+    def apply_search_params(self, index: faiss.Index):
+        """Sets the query-time parameters (`nprobe`, `efSearch`) on an index built from this config."""
+        shards = getattr(index, "shards", None)
+        if shards is not None:
+            # Sharded vectors: every shard is an index of this config
+            for shard in shards:
+                if isinstance(shard, faiss.Index):
+                    self.apply_search_params(shard)
+            return
+        inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+        if isinstance(inner, faiss.IndexIVF):
+            inner.nprobe = self.nprobe
+        elif isinstance(inner, faiss.IndexHNSW):
+            inner.hnsw.efSearch = self.ef_search
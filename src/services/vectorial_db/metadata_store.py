@@ -0,0 +1,291 @@
+import json
+import os
+import threading
+
+import faiss
+import numpy as np
+
+from src.services.vectorial_db.index_factory import IndexConfig
+
+
+IDS_FILE = "metadata_ids.npy"
+DOCUMENTS_FILE = "metadata_documents.npy"
+PAGES_FILE = "metadata_pages.npy"
+DOCUMENT_TABLE_FILE = "documents.json"
+# Field of the filters selecting chunks by the pages they span, the other fields select documents
+PAGES_FIELD = "pages"
+# Up to this number of IDs, HNSW searches compare the queries with every allowed vector instead
+EXACT_SEARCH_MAX_IDS = 4096
+
+
+def filter_key(where: dict | None) -> str | None:
+    """Returns a canonical string of a filter, to group or cache searches by filter."""
+    return None if where is None else json.dumps(where, sort_keys=True, default=str)
+
+
+def _matches(value, wanted) -> bool:
+    if isinstance(wanted, (list, tuple, set)):
+        return value in wanted
+    return value == wanted
+
+
+class ChunkMetadata:
+    """Columnar store of the metadata of every chunk.
+
+    Each source of a chunk has a row of three fixed-width columns: the chunk ID, the code of its
+    document and the first and last page it spans (-1 when unknown). A chunk has one source, or
+    several when the same text was found in several places and stored once (see
+    `ChunkDeduplicator`). The fields of the documents themselves (`source` path, `file` name and
+    what their loader extracted, e.g. a PDF's title or author) are kept once per document in a
+    table indexed by the codes. A source costs 20 bytes whatever the size of its metadata, and
+    filters are evaluated as vectorized comparisons over the columns.
+
+    The rows are kept sorted by chunk ID, the sources of a chunk in the order they were added. On
+    disk, the columns are `.npy` arrays, memory-mapped when loaded, and the document table is a
+    JSON file.
+
+    Attributes:
+        documents (list[dict]): The fields of every document, by document code.
+
+    Methods:
+        add(ids, document, pages): Records a source of chunks.
+        update_document(document, fields): Sets the fields of a document.
+        remove(ids): Drops the metadata of removed chunks.
+        remove_references(ids, document): Drops the sources of chunks in a document.
+        get(chunk_id): Returns the metadata of a chunk.
+        select(where): Returns the IDs of the chunks matching a filter.
+        write(path) / load(path): Saves and loads the store.
+    """
+    def __init__(self, ids: np.ndarray | None = None, documents: np.ndarray | None = None,
+                 pages: np.ndarray | None = None, document_table: list[dict] | None = None):
+        self._ids = np.empty(0, dtype=np.int64) if ids is None else ids
+        self._documents = np.empty(0, dtype=np.int32) if documents is None else documents
+        self._pages = np.empty((0, 2), dtype=np.int32) if pages is None else pages
+        self.documents: list[dict] = list(document_table or [])
+        self._codes = {document["source"]: code for code, document in enumerate(self.documents)}
+        # Rows added since the columns were last concatenated, by the first reader to come
+        self._pending: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._flush_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids) + sum(len(ids) for ids, _, _ in self._pending)
+
+    def _code(self, document: str) -> int:
+        code = self._codes.get(document)
+        if code is None:
+            code = self._codes[document] = len(self.documents)
+            self.documents.append({"source": document, "file": os.path.basename(document)})
+        return code
+
+    def _flush(self):
+        if not self._pending:
+            return
+        # Concurrent searches can get here together
+        with self._flush_lock:
+            if not self._pending:
+                return
+            ids = np.concatenate([self._ids] + [ids for ids, _, _ in self._pending])
+            documents = np.concatenate([self._documents] + [documents for _, documents, _ in self._pending])
+            pages = np.concatenate([self._pages] + [pages for _, _, pages in self._pending])
+            if len(ids) > 1 and (ids[1:] < ids[:-1]).any():
+                # Sources added to chunks already recorded
+                order = np.argsort(ids, kind="stable")
+                ids, documents, pages = ids[order], documents[order], pages[order]
+            self._ids, self._documents, self._pages = ids, documents, pages
+            self._pending = []
+
+    def add(self, ids: np.ndarray, document: str | None = None, pages: list[tuple[int, int]] | None = None):
+        """Records a source of chunks: new chunks, or chunks found again in another place.
+
+        Args:
+            ids (np.ndarray): The IDs of the chunks.
+            document (str, optional): The path of their document.
+            pages (list[tuple[int, int]], optional): The first and last page of every chunk.
+        """
+        code = -1 if document is None else self._code(document)
+        self._pending.append((
+            np.asarray(ids, dtype=np.int64),
+            np.full(len(ids), code, dtype=np.int32),
+            np.full((len(ids), 2), -1, dtype=np.int32) if pages is None else np.asarray(pages, dtype=np.int32).reshape(-1, 2),
+        ))
+
+    def update_document(self, document: str, fields: dict):
+        """Sets fields of a document, e.g. the metadata extracted by its loader."""
+        self.documents[self._code(document)].update(fields)
+
+    def remove(self, ids: np.ndarray):
+        self._flush()
+        keep = ~np.isin(self._ids, ids)
+        if not keep.all():
+            self._ids, self._documents, self._pages = self._ids[keep], self._documents[keep], self._pages[keep]
+
+    def remove_references(self, ids: np.ndarray, document: str) -> np.ndarray:
+        """Drops the sources of chunks in a document, e.g. when the document is removed.
+
+        Args:
+            ids (np.ndarray): The IDs of the chunks found in the document.
+            document (str): The path of the document.
+
+        Returns:
+            np.ndarray: The IDs among `ids` left without any source, whose vectors can be removed.
+        """
+        self._flush()
+        ids = np.asarray(ids, dtype=np.int64)
+        code = self._codes.get(document)
+        if code is not None:
+            keep = ~(np.isin(self._ids, ids) & (self._documents == code))
+            if not keep.all():
+                self._ids, self._documents, self._pages = self._ids[keep], self._documents[keep], self._pages[keep]
+        return ids[~np.isin(ids, self._ids)]
+
+    def _source(self, position: int) -> dict:
+        code = int(self._documents[position])
+        metadata = dict(self.documents[code]) if code >= 0 else {}
+        first, last = self._pages[position].tolist()
+        if first >= 0:
+            metadata["page_start"], metadata["page_end"] = first, last
+        return metadata
+
+    def get(self, chunk_id: int) -> dict:
+        """Returns the document fields and pages of a chunk, an empty dict when it has no metadata.
+
+        Those of its first source, with every source under "sources" when the chunk has several.
+        """
+        self._flush()
+        start, end = np.searchsorted(self._ids, [chunk_id, chunk_id + 1]).tolist()
+        if start == end:
+            return {}
+        metadata = self._source(start)
+        if end - start > 1:
+            metadata["sources"] = [self._source(position) for position in range(start, end)]
+        return metadata
+
+    def select(self, where: dict) -> np.ndarray:
+        """Returns the sorted IDs of the chunks matching a filter.
+
+        Args:
+            where (dict): Document fields and their wanted value, or list of accepted values, e.g.
+                `{"file": "glossary.pdf"}`. `"pages": [first, last]` keeps the chunks overlapping
+                those pages. All the conditions must hold for one of the sources of a chunk.
+
+        Returns:
+            np.ndarray: The matching chunk IDs.
+        """
+        self._flush()
+        mask = np.ones(len(self._ids), dtype=bool)
+        fields = {field: wanted for field, wanted in where.items() if field != PAGES_FIELD}
+        if fields:
+            codes = [code for code, document in enumerate(self.documents)
+                     if all(_matches(document.get(field), wanted) for field, wanted in fields.items())]
+            mask &= np.isin(self._documents, codes)
+        if PAGES_FIELD in where:
+            first, last = where[PAGES_FIELD]
+            mask &= (self._pages[:, 1] >= first) & (self._pages[:, 0] <= last) & (self._pages[:, 0] >= 0)
+        return np.unique(self._ids[mask])
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, IDS_FILE))
+
+    def write(self, path: str):
+        """Saves the store in a folder, dropping the documents that no longer have chunks."""
+        self._flush()
+        used = np.unique(self._documents[self._documents >= 0])
+        remap = np.full(len(self.documents) + 1, -1, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        # Rows without a document keep -1, the last entry of the remapping
+        np.save(os.path.join(path, IDS_FILE), self._ids)
+        np.save(os.path.join(path, DOCUMENTS_FILE), remap[self._documents])
+        np.save(os.path.join(path, PAGES_FILE), self._pages)
+        with open(os.path.join(path, DOCUMENT_TABLE_FILE), "w", encoding="utf-8") as file:
+            json.dump([self.documents[code] for code in used.tolist()], file)
+
+    @classmethod
+    def load(cls, path: str) -> "ChunkMetadata":
+        """Loads the store saved in a folder, memory-mapping its columns; an empty store if there is none."""
+        if not cls.exists(path):
+            return cls()
+        with open(os.path.join(path, DOCUMENT_TABLE_FILE), encoding="utf-8") as file:
+            document_table = json.load(file)
+        return cls(np.load(os.path.join(path, IDS_FILE), mmap_mode="r"),
+                   np.load(os.path.join(path, DOCUMENTS_FILE), mmap_mode="r"),
+                   np.load(os.path.join(path, PAGES_FILE), mmap_mode="r"), document_table)
+
+
+class IDFilter:
+    """The vector IDs a search is restricted to, pushed down into the FAISS search.
+
+    The IDs become a FAISS `IDSelector`, checked before any distance is computed: a single run of
+    consecutive IDs (the chunks of one document) is a range check, a dense set a bitmap lookup and
+    a sparse one a hash set lookup. Index types that don't support selectors (`pq`) fall back to
+    searching more and more neighbours until enough of them match. An HNSW graph search only
+    reaches a few of the allowed vectors when they are rare, so up to `EXACT_SEARCH_MAX_IDS` IDs
+    their vectors are compared with the queries one by one instead, which is exact.
+
+    Attributes:
+        ids (np.ndarray): The sorted IDs searched.
+
+    Methods:
+        selector(): Returns the FAISS selector of the IDs.
+        search(index, vectors, k, config): Searches the k nearest vectors among the IDs.
+        post_filter(index, vectors, k, max_fetch): Searches all the vectors and keeps those among the IDs.
+    """
+    def __init__(self, ids: np.ndarray):
+        self.ids = np.unique(np.asarray(ids, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def selector(self) -> faiss.IDSelector:
+        first, last = int(self.ids[0]), int(self.ids[-1])
+        if last - first + 1 == len(self.ids):
+            return faiss.IDSelectorRange(first, last + 1)
+        if last < 64 * len(self.ids):
+            bitmap = np.zeros(last + 1, dtype=bool)
+            bitmap[self.ids] = True
+            return faiss.IDSelectorBitmap(np.packbits(bitmap, bitorder="little"))
+        return faiss.IDSelectorBatch(self.ids)
+
+    def search(self, index: faiss.Index, vectors: np.ndarray, k: int,
+               config: IndexConfig) -> tuple[np.ndarray, np.ndarray]:
+        """Searches the k nearest vectors among the IDs, like `index.search`."""
+        if not len(self.ids):
+            return np.full((len(vectors), k), np.inf, dtype="float32"), np.full((len(vectors), k), -1, dtype="int64")
+        if config.index_type == "hnsw" and len(self.ids) <= EXACT_SEARCH_MAX_IDS:
+            return self.exact_search(index, vectors, k)
+        if config.supports_selectors:
+            return index.search(vectors, k, params=config.search_parameters(self.selector()))
+        return self.post_filter(index, vectors, k)
+
+    def exact_search(self, index: faiss.Index, vectors: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Compares the queries with the vectors of every ID, reconstructed from the index."""
+        found = min(k, len(self.ids))
+        D, I = faiss.knn(vectors, index.reconstruct_batch(self.ids), found)
+        distances = np.full((len(vectors), k), np.inf, dtype="float32")
+        ids = np.full((len(vectors), k), -1, dtype="int64")
+        distances[:, :found] = D
+        ids[:, :found] = self.ids[I]
+        return distances, ids
+
+    def post_filter(self, index: faiss.Index, vectors: np.ndarray, k: int,
+                    max_fetch: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Searches all the vectors and keeps the k nearest among the IDs.
+
+        The number of neighbours fetched grows until every query has k matches, or up to `max_fetch`.
+        """
+        fetch = 4 * k
+        limit = index.ntotal if max_fetch is None else min(max_fetch, index.ntotal)
+        while True:
+            fetch = min(fetch, max(limit, k))
+            D, I = index.search(vectors, fetch)
+            keep = np.isin(I, self.ids)
+            if fetch >= limit or (keep.sum(axis=1) >= k).all():
+                break
+            fetch *= 4
+        distances = np.full((len(vectors), k), np.inf, dtype="float32")
+        ids = np.full((len(vectors), k), -1, dtype="int64")
+        for row in range(len(vectors)):
+            found = np.flatnonzero(keep[row])[:k]
+            distances[row, :len(found)] = D[row, found]
+            ids[row, :len(found)] = I[row, found]
+        return distances, ids
@@ -0,0 +1,114 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def normalize_query(query: str) -> str:
+    """Normalizes a query for cache lookups: case-folded, with whitespace collapsed."""
+    return " ".join(query.casefold().split())
+
+
+class QueryCache:
+    """In-process LRU cache, with a time to live, of query embeddings and search results.
+
+    Query vectors are cached by normalized query text, search results (IDs and distances) by
+    normalized query text, number of results and filter. Results are tied to the version of the
+    index they were computed on: they are dropped as soon as the index is modified or reloaded.
+
+    Attributes:
+        max_entries (int): Maximum number of entries of each cache.
+        ttl (float): Seconds after which an entry expires.
+        hits (dict): Number of hits of the vector and results caches.
+        misses (dict): Number of misses of the vector and results caches.
+
+    Methods:
+        get_vector(query) / put_vector(query, vector): Query embeddings.
+        get_results(query, k, version, filter_key) / put_results(query, k, version, ids, distances, filter_key):
+            Search results.
+        invalidate(vectors): Drops the cached results, and the vectors if asked to.
+        stats(): Returns hit ratios.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: float = 3600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = {"vectors": 0, "results": 0}
+        self.misses = {"vectors": 0, "results": 0}
+        self._vectors: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        self._results: OrderedDict[tuple[str, int, str | None], tuple[float, np.ndarray, np.ndarray]] = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _get(self, cache: OrderedDict, key, name: str):
+        entry = cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            del cache[key]
+            entry = None
+        if entry is None:
+            self.misses[name] += 1
+            return None
+        cache.move_to_end(key)
+        self.hits[name] += 1
+        return entry[1:]
+
+    def _put(self, cache: OrderedDict, key, *values):
+        cache[key] = (time.monotonic(), *values)
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    def get_vector(self, query: str) -> np.ndarray | None:
+        """Returns the cached embedding of a query, or None."""
+        with self._lock:
+            entry = self._get(self._vectors, normalize_query(query), "vectors")
+        return None if entry is None else entry[0]
+
+    def put_vector(self, query: str, vector: np.ndarray):
+        with self._lock:
+            self._put(self._vectors, normalize_query(query), vector)
+
+    def get_results(self, query: str, k: int, version: int,
+                    filter_key: str | None = None) -> tuple[np.ndarray, np.ndarray] | None:
+        """Returns the cached IDs and distances of a search, or None.
+
+        Args:
+            query (str): The query text.
+            k (int): The number of results.
+            version (int): The current version of the index, cached results of other versions are dropped.
+            filter_key (str, optional): The filter of the search, see `metadata_store.filter_key`.
+        """
+        with self._lock:
+            if version != self._version:
+                self._results.clear()
+                self._version = version
+            return self._get(self._results, (normalize_query(query), k, filter_key), "results")
+
+    def put_results(self, query: str, k: int, version: int, ids: np.ndarray, distances: np.ndarray,
+                    filter_key: str | None = None):
+        with self._lock:
+            if version != self._version:
+                self._results.clear()
+                self._version = version
+            self._put(self._results, (normalize_query(query), k, filter_key), ids, distances)
+
+    def invalidate(self, vectors: bool = False):
+        """Drops the cached results, and the cached vectors when `vectors` is True."""
+        with self._lock:
+            self._results.clear()
+            if vectors:
+                self._vectors.clear()
+
+    def stats(self) -> dict:
+        """Returns the number of entries, hits, misses and hit ratio of both caches."""
+        with self._lock:
+            stats = {}
+            for name, cache in (("vectors", self._vectors), ("results", self._results)):
+                lookups = self.hits[name] + self.misses[name]
+                stats[name] = {
+                    "entries": len(cache),
+                    "hits": self.hits[name],
+                    "misses": self.misses[name],
+                    "hit_ratio": round(self.hits[name] / lookups, 4) if lookups else 0.0,
+                }
+            return stats
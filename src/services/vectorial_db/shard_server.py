@@ -0,0 +1,213 @@
+"""Serves a shard of a sharded index to other processes, possibly on other hosts.
+
+A `ShardServer` loads the FAISS index of one shard and answers searches over a
+`multiprocessing.connection` socket. A `ShardedFAISSIndex` created with the addresses of the
+servers searches them in parallel like local shards, through `RemoteShard` proxies. Messages are
+pickled, so only peers holding the authentication key (SHARD_AUTHKEY) can connect. There is no
+default key, on the loopback interface either: servers and clients refuse to start without one.
+Generate a random key per deployment, e.g. with `python -c "import secrets; print(secrets.token_hex(32))"`.
+
+Usage:
+    SHARD_AUTHKEY=secret python -m src.services.vectorial_db.shard_server ./faiss_index --shard 0 --port 9500
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection, Listener
+
+import numpy as np
+from faiss import IO_FLAG_MMAP, read_index
+
+from src.services.vectorial_db.index_factory import IndexConfig, empty_results
+from src.services.vectorial_db.snapshots import SnapshotStore
+
+
+logger = logging.getLogger(__name__)
+
+
+
+def shard_folder(path: str, shard: int) -> str:
+    """Returns the folder of a shard in the folder of a sharded index."""
+    return os.path.join(path, f"shard_{shard:03d}")
+
+
+def get_authkey() -> bytes:
+    """Returns the authentication key of the shard connections, from SHARD_AUTHKEY.
+
+    Raises:
+        ValueError: SHARD_AUTHKEY is not set.
+    """
+    authkey = os.getenv("SHARD_AUTHKEY")
+    if not authkey:
+        raise ValueError("Set SHARD_AUTHKEY to the authentication key of the shard servers, "
+                         "e.g. a random key from secrets.token_hex(32)")
+    return authkey.encode("utf-8")
+
+
+def parse_address(address: str | tuple[str, int]) -> tuple[str, int]:
+    """Turns "host:port" into a (host, port) tuple."""
+    if isinstance(address, tuple):
+        return address
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+class ShardServer:
+    """Answers the searches of one shard of a saved sharded index.
+
+    The shard is read from the current snapshot of the index (see `SnapshotStore`). Servers don't
+    follow newer snapshots: restart them, then the processes searching them, to serve a new save.
+
+    Attributes:
+        path (str): The folder of the sharded index.
+        snapshot (str | None): The name of the snapshot served.
+        shard (int): The shard number.
+        index (faiss.Index): The FAISS index of the shard.
+        config (IndexConfig): The configuration of the index.
+        address (tuple[str, int]): The address the server listens on.
+
+    Methods:
+        serve_forever(): Answers connections until closed.
+        start(): Serves in a background thread, returns the server.
+        close(): Stops listening.
+    """
+    def __init__(self, path: str, shard: int, host: str = "127.0.0.1", port: int = 0, mmap: bool = True):
+        self.path = path
+        self.shard = shard
+        # Fails before loading the shard when there is no key to authenticate peers with
+        authkey = get_authkey()
+        self.snapshot, folder = SnapshotStore(path).current()
+        index_path = os.path.join(shard_folder(folder, shard), "index.faiss")
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"Shard {shard} not found in {path}")
+        self.config = IndexConfig()
+        config_path = os.path.join(folder, "index_config.json")
+        if os.path.exists(config_path):
+            with open(config_path, encoding="utf-8") as file:
+                self.config = IndexConfig.from_dict(json.load(file))
+        # Only the inverted lists of IVF indexes are mapped, the other types are read in memory
+        mmap = mmap and self.config.supports_mmap
+        self.index = read_index(index_path, IO_FLAG_MMAP) if mmap else read_index(index_path)
+        self.config.apply_search_params(self.index)
+        self._listener = Listener((host, port), authkey=authkey)
+        self.address = self._listener.address
+        self._closed = False
+
+    def serve_forever(self):
+        logger.info("Serving shard", extra={"shard": self.shard, "vectors": self.index.ntotal,
+                                            "address": f"{self.address[0]}:{self.address[1]}"})
+        while not self._closed:
+            try:
+                connection = self._listener.accept()
+            except (OSError, AuthenticationError, EOFError):
+                # Closed, or a peer failed to authenticate
+                continue
+            threading.Thread(target=self._handle, args=(connection,), daemon=True).start()
+
+    def start(self) -> "ShardServer":
+        threading.Thread(target=self.serve_forever, name=f"shard-server-{self.shard}", daemon=True).start()
+        return self
+
+    def close(self):
+        self._closed = True
+        self._listener.close()
+
+    def _handle(self, connection: Connection):
+        with connection:
+            while True:
+                try:
+                    method, args = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    if method == "search":
+                        vectors, k, id_filter = args
+                        if self.index.ntotal == 0:
+                            # FAISS crashes searching an emptied flat index
+                            result = empty_results(len(vectors), k)
+                        elif id_filter is None:
+                            result = self.index.search(vectors, k)
+                        else:
+                            result = id_filter.search(self.index, vectors, k, self.config)
+                    elif method == "info":
+                        result = {"d": self.index.d, "ntotal": self.index.ntotal, "snapshot": self.snapshot}
+                    else:
+                        raise ValueError(f"Unknown method {method}")
+                    connection.send(("ok", result))
+                except Exception as error:
+                    connection.send(("error", f"{type(error).__name__}: {error}"))
+
+
+class RemoteShard:
+    """A shard served by a `ShardServer`, searched like a FAISS index. Remote shards are read-only.
+
+    Connections are opened on demand and reused, one per concurrent search.
+
+    Attributes:
+        address (tuple[str, int]): The address of the server.
+        d (int): The dimension of the vectors.
+        ntotal (int): The number of vectors of the shard.
+        snapshot (str | None): The name of the snapshot the server serves.
+    """
+    is_trained = True
+
+    def __init__(self, address: str | tuple[str, int]):
+        self.address = parse_address(address)
+        self._authkey = get_authkey()
+        self._connections: queue.LifoQueue[Connection] = queue.LifoQueue()
+        info = self._call("info")
+        self.d = info["d"]
+        self.ntotal = info["ntotal"]
+        self.snapshot = info.get("snapshot")
+
+    def _call(self, method: str, *args):
+        try:
+            connection = self._connections.get_nowait()
+        except queue.Empty:
+            connection = Client(self.address, authkey=self._authkey)
+        try:
+            connection.send((method, args))
+            status, result = connection.recv()
+        except Exception:
+            connection.close()
+            raise
+        self._connections.put(connection)
+        if status == "error":
+            raise RuntimeError(f"Shard server {self.address[0]}:{self.address[1]} failed: {result}")
+        return result
+
+    def search(self, vectors: np.ndarray, k: int, id_filter=None) -> tuple[np.ndarray, np.ndarray]:
+        """Searches the shard, restricted to the IDs of an `IDFilter` if given."""
+        return self._call("search", np.ascontiguousarray(vectors, dtype="float32"), k, id_filter)
+
+    def _read_only(self, *args, **kwargs):
+        raise RuntimeError("Remote shards are read-only, modify the index locally and restart the shard servers")
+
+    train = add_with_ids = remove_ids = _read_only
+
+    def close(self):
+        while True:
+            try:
+                self._connections.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+if __name__ == "__main__":
+    from src.services.observability.telemetry import configure_logging
+
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Serves a shard of a sharded FAISS index.")
+    parser.add_argument("path", help="The folder of the sharded index.")
+    parser.add_argument("--shard", type=int, required=True, help="The shard number.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9500)
+    parser.add_argument("--no-mmap", action="store_true", help="Load the inverted lists of an IVF shard in memory instead of memory-mapping them.")
+    args = parser.parse_args()
+    server = ShardServer(args.path, args.shard, args.host, args.port, mmap=not args.no_mmap)
+    print(f"Serving shard {args.shard} on {server.address[0]}:{server.address[1]}", flush=True)
+    server.serve_forever()
@@ -0,0 +1,327 @@
+import json
+import logging
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+from faiss import IO_FLAG_MMAP, read_index, write_index
+
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.index_factory import IndexConfig, empty_results
+from src.services.vectorial_db.metadata_store import IDFilter
+from src.services.vectorial_db.shard_server import RemoteShard, shard_folder
+from src.services.vectorial_db.snapshots import SnapshotStore
+
+
+logger = logging.getLogger(__name__)
+
+SHARDS_FILE = "shards.json"
+PARTITIONS = ("hash", "document")
+# Fibonacci hashing: consecutive IDs are spread evenly over the shards
+_HASH_MULTIPLIER = np.uint64(11400714819323198485)
+
+
+def hash_ids(ids: np.ndarray, num_shards: int) -> np.ndarray:
+    """Returns the shard of each vector ID under hash partitioning."""
+    mixed = ids.astype(np.uint64) * _HASH_MULTIPLIER >> np.uint64(32)
+    return (mixed % np.uint64(num_shards)).astype(np.int64)
+
+
+def is_sharded(path: str) -> bool:
+    """Whether the index saved in a folder, or its current snapshot, is a sharded one."""
+    try:
+        _, folder = SnapshotStore(path).current()
+    except FileNotFoundError:
+        return False
+    return os.path.exists(os.path.join(folder, SHARDS_FILE))
+
+
+def merge_results(results: list[tuple[np.ndarray, np.ndarray]], k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Merges the top-k of every shard into the global top-k, as one index over all shards returns it.
+
+    Args:
+        results (list[tuple[np.ndarray, np.ndarray]]): The distances and IDs matrices of each shard.
+        k (int): The number of results per query.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: The distances and IDs matrices of the nearest vectors overall.
+    """
+    if len(results) == 1:
+        return results[0]
+    D = np.concatenate([distances for distances, _ in results], axis=1)
+    I = np.concatenate([ids for _, ids in results], axis=1)
+    # Equal distances are ordered by ID, like a flat index orders the vectors it holds; padding goes last
+    order = np.lexsort((np.where(I < 0, np.iinfo(np.int64).max, I), D), axis=-1)[:, :k]
+    return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+
+class ShardRouter:
+    """Decides which shard holds each vector ID.
+
+    With "hash" partitioning, the shard is a hash of the ID. With "document" partitioning, all the
+    chunks of a document go to the shard of a hash of its name: IDs are given in increasing order,
+    so the router only records the first ID of each run of IDs placed on the same shard.
+
+    Attributes:
+        num_shards (int): The number of shards.
+        partition (str): "hash" or "document".
+
+    Methods:
+        assign(ids, document): Places newly added IDs.
+        route(ids): Returns the shard of each ID.
+        clear(): Forgets the placed IDs.
+    """
+    def __init__(self, num_shards: int, partition: str = "hash"):
+        if partition not in PARTITIONS:
+            raise ValueError(f"Unknown partition {partition}, expected one of {PARTITIONS}")
+        if num_shards < 1:
+            raise ValueError(f"Got {num_shards} shards")
+        self.num_shards = num_shards
+        self.partition = partition
+        self.clear()
+
+    def clear(self):
+        self._starts: list[int] = []
+        self._shards: list[int] = []
+        self._arrays = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+
+    def assign(self, ids: np.ndarray, document: str | None):
+        if self.partition != "document" or not len(ids):
+            return
+        if document is None:
+            # Chunks added without a document are kept together all the same
+            shard = int(hash_ids(ids[:1], self.num_shards)[0])
+        else:
+            shard = zlib.crc32(document.encode("utf-8")) % self.num_shards
+        if self._starts and int(ids[0]) < self._starts[-1]:
+            raise ValueError("Vector IDs must be assigned in increasing order")
+        if not self._shards or self._shards[-1] != shard:
+            self._starts.append(int(ids[0]))
+            self._shards.append(shard)
+            self._arrays = (np.asarray(self._starts, dtype=np.int64), np.asarray(self._shards, dtype=np.int64))
+
+    def route(self, ids: np.ndarray) -> np.ndarray:
+        if self.partition == "hash":
+            return hash_ids(ids, self.num_shards)
+        starts, shards = self._arrays
+        return shards[np.maximum(np.searchsorted(starts, ids, side="right") - 1, 0)]
+
+    def as_dict(self) -> dict:
+        return {"num_shards": self.num_shards, "partition": self.partition, "starts": self._starts,
+                "shards": self._shards}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ShardRouter":
+        router = cls(data["num_shards"], data["partition"])
+        router._starts = list(data.get("starts", []))
+        router._shards = list(data.get("shards", []))
+        router._arrays = (np.asarray(router._starts, dtype=np.int64), np.asarray(router._shards, dtype=np.int64))
+        return router
+
+
+class ShardedVectors:
+    """The vectors of an index spread over several FAISS indexes, used like a single one.
+
+    Additions and removals are routed to the shards holding the IDs. Searches fan out to every
+    shard in parallel and their top-k are merged by distance: with flat shards, the results are
+    exactly those of a single flat index holding all the vectors.
+
+    Attributes:
+        shards (list): The FAISS indexes (or `RemoteShard` proxies) of the shards.
+        router (ShardRouter): The shard of every vector ID.
+        d (int): The dimension of the vectors.
+    """
+    def __init__(self, shards: list, router: ShardRouter, pool: ThreadPoolExecutor | None = None):
+        self.shards = shards
+        self.router = router
+        self.d = shards[0].d
+        self._pool = pool
+
+    @property
+    def ntotal(self) -> int:
+        return sum(shard.ntotal for shard in self.shards)
+
+    @property
+    def is_trained(self) -> bool:
+        return all(shard.is_trained for shard in self.shards)
+
+    def _map(self, function: Callable, items) -> list:
+        items = list(items)
+        if self._pool is None or len(items) < 2:
+            return [function(item) for item in items]
+        return list(self._pool.map(function, items))
+
+    def _by_shard(self, ids: np.ndarray) -> list[tuple[int, np.ndarray]]:
+        route = self.router.route(ids)
+        return [(shard, route == shard) for shard in range(len(self.shards)) if (route == shard).any()]
+
+    def train(self, vectors: np.ndarray):
+        # Every shard gets the same quantizers, trained on the same sample
+        self._map(lambda shard: shard.train(vectors), self.shards)
+
+    def add_with_ids(self, vectors: np.ndarray, ids: np.ndarray):
+        def add(item):
+            shard, mask = item
+            self.shards[shard].add_with_ids(np.ascontiguousarray(vectors[mask]), ids[mask])
+
+        self._map(add, self._by_shard(ids))
+
+    def remove_ids(self, ids: np.ndarray) -> int:
+        return sum(self._map(lambda item: self.shards[item[0]].remove_ids(ids[item[1]]), self._by_shard(ids)))
+
+    def search(self, vectors: np.ndarray, k: int, id_filter: IDFilter | None = None,
+               config: IndexConfig | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Searches every shard and merges their results, like `index.search`.
+
+        With an `id_filter`, only the shards holding some of its IDs are searched, each restricted
+        to its own IDs (see `IDFilter.search`) with the search parameters of `config`.
+        """
+        # Shards emptied by removals are skipped: FAISS crashes searching an emptied flat index
+        if id_filter is None:
+            shards = [shard for shard in self.shards if shard.ntotal]
+            if not shards:
+                return empty_results(len(vectors), k)
+            return merge_results(self._map(lambda shard: shard.search(vectors, k), shards), k)
+        route = self.router.route(id_filter.ids)
+        searched = [shard for shard in np.unique(route).tolist() if self.shards[shard].ntotal]
+        if not searched:
+            return empty_results(len(vectors), k)
+
+        def search(shard: int):
+            shard_filter = IDFilter(id_filter.ids[route == shard])
+            # Remote shards build their selector on their side
+            if isinstance(self.shards[shard], RemoteShard):
+                return self.shards[shard].search(vectors, k, shard_filter)
+            return shard_filter.search(self.shards[shard], vectors, k, config)
+
+        return merge_results(self._map(search, searched), k)
+
+
+class ShardedFAISSIndex(FAISSIndex):
+    """A `FAISSIndex` whose vectors are partitioned over several shards.
+
+    Chunks, manifest and query cache work as in `FAISSIndex`; only the vectors are split, by hash of
+    their ID or by document, over `num_shards` FAISS indexes. Each shard is saved in its own
+    subfolder (`shard_000/index.faiss`, ...), next to `shards.json` which records the partitioning.
+    Searches run on all the shards in parallel threads (FAISS releases the GIL) or, when
+    `shard_addresses` are given, on shard servers in other processes or hosts (see
+    `shard_server.ShardServer`), which the index then only searches.
+
+    Attributes:
+        num_shards (int): The number of shards.
+        partition (str): "hash" or "document".
+        shard_addresses (list[str] | None): "host:port" of the shard servers, None for local shards.
+
+    Methods:
+        close(): Stops the search threads and closes the connections to the shard servers.
+    """
+    def __init__(self, dimension: int = 3072, embeddings=None, batch_embeddings=None, num_shards: int = 4,
+                 partition: str = "hash", shard_addresses: list[str] | None = None, search_threads: int | None = None,
+                 **kwargs):
+        """
+        Args:
+            dimension (int): The dimension of the embeddings.
+            embeddings (function): The function that returns the embeddings.
+            batch_embeddings (function): The function that returns the embeddings of a list of texts.
+            num_shards (int, optional): The number of shards. Defaults to 4.
+            partition (str, optional): "hash" to spread the vectors by ID, "document" to keep the chunks
+                of a document on the same shard. Defaults to "hash".
+            shard_addresses (list[str], optional): The addresses of the shard servers of a saved index,
+                one per shard in order. Defaults to local shards.
+            search_threads (int, optional): Threads searching the shards. Defaults to one per shard.
+            **kwargs: The other arguments of `FAISSIndex`.
+        """
+        if partition not in PARTITIONS:
+            raise ValueError(f"Unknown partition {partition}, expected one of {PARTITIONS}")
+        self.num_shards = len(shard_addresses) if shard_addresses else num_shards
+        self.partition = partition
+        self.shard_addresses = shard_addresses
+        self._pool = ThreadPoolExecutor(search_threads or self.num_shards, thread_name_prefix="shard-search") \
+            if self.num_shards > 1 else None
+        self.index = None
+        super().__init__(dimension, embeddings, batch_embeddings, **kwargs)
+
+    @property
+    def router(self) -> ShardRouter:
+        return self.index.router
+
+    def _create_faiss_index(self):
+        # A new index starts with a new router, a retrained one keeps it
+        self.index = None
+        super()._create_faiss_index()
+
+    def _build_index(self, config: IndexConfig) -> ShardedVectors:
+        router = self.index.router if self.index is not None else ShardRouter(self.num_shards, self.partition)
+        return ShardedVectors([config.build(self.dimension) for _ in range(self.num_shards)], router, self._pool)
+
+    def _assign(self, ids: np.ndarray, document: str | None):
+        self.index.router.assign(ids, document)
+
+    def _search_index(self, vectors: np.ndarray, k: int, id_filter: IDFilter | None) -> tuple[np.ndarray, np.ndarray]:
+        return self.index.search(vectors, k, id_filter, self.index_config)
+
+    def _write_index(self, path: str):
+        if self.shard_addresses:
+            raise RuntimeError("The index is served by shard servers, save it where its shards were built")
+
+        def write(shard: int):
+            os.makedirs(shard_folder(path, shard))
+            write_index(self.index.shards[shard], os.path.join(shard_folder(path, shard), "index.faiss"))
+
+        self.index._map(write, range(self.num_shards))
+        with open(os.path.join(path, SHARDS_FILE), "w", encoding="utf-8") as file:
+            json.dump(self.index.router.as_dict(), file)
+
+    def _read_index(self, path: str, mmap: bool) -> ShardedVectors:
+        if not is_sharded(path):
+            raise ValueError(f"{path} holds an index that is not sharded")
+        with open(os.path.join(path, SHARDS_FILE), encoding="utf-8") as file:
+            router = ShardRouter.from_dict(json.load(file))
+        if self.shard_addresses:
+            if len(self.shard_addresses) != router.num_shards:
+                raise ValueError(f"The index has {router.num_shards} shards, got {len(self.shard_addresses)} addresses")
+            shards = [RemoteShard(address) for address in self.shard_addresses]
+        else:
+            def read(shard: int):
+                index_path = os.path.join(shard_folder(path, shard), "index.faiss")
+                return read_index(index_path, IO_FLAG_MMAP) if mmap else read_index(index_path)
+
+            with ThreadPoolExecutor(router.num_shards) as pool:
+                shards = list(pool.map(read, range(router.num_shards)))
+        if router.num_shards != self.num_shards:
+            logger.info("Loading an index of %d shards instead of %d", router.num_shards, self.num_shards)
+            self.num_shards = router.num_shards
+        self.partition = router.partition
+        return ShardedVectors(shards, router, self._pool)
+
+    def load_index(self, path: str = r"./faiss_index", mmap: bool = False):
+        """Loads the index, its configuration, chunks and manifest from disk.
+
+        With `shard_addresses`, the vectors are searched on the shard servers, and the index is read-only.
+        See `FAISSIndex.load_index`.
+        """
+        super().load_index(path, mmap=mmap)
+        if self.shard_addresses:
+            with self.lock.write():
+                self.read_only = True
+        starts = self.router.as_dict()["starts"]
+        if starts and self.next_id <= starts[-1]:
+            # Saved before the next ID was: the last documents were removed, their IDs can't be given again
+            with self.lock.write():
+                self.next_id = starts[-1] + 1
+        stale = [shard.address for shard in self.index.shards
+                 if isinstance(shard, RemoteShard) and shard.snapshot != self.snapshot]
+        if stale:
+            logger.warning("Shard servers serve another snapshot than %s, restart them", self.snapshot,
+                           extra={"servers": [f"{host}:{port}" for host, port in stale]})
+        if self.num_shards > 1 and self._pool is None:
+            self._pool = self.index._pool = ThreadPoolExecutor(self.num_shards, thread_name_prefix="shard-search")
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+        for shard in self.index.shards:
+            if isinstance(shard, RemoteShard):
+                shard.close()
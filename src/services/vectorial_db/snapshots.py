@@ -0,0 +1,183 @@
+import logging
+import os
+import shutil
+import time
+
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = "CURRENT"
+SNAPSHOTS_FOLDER = "snapshots"
+TMP_PREFIX = ".tmp-"
+# Files found at the root of an index folder saved before snapshots existed
+LEGACY_FILES = ("index.faiss", "shards.json", "chunks.npy")
+# Temporary folders older than this were left by an interrupted save
+STALE_TMP_SECONDS = 3600
+
+
+def fsync_tree(path: str):
+    """Flushes every file of a folder, and the folders themselves, to disk."""
+    for folder, _, names in os.walk(path):
+        for name in names:
+            with open(os.path.join(folder, name), "rb") as file:
+                os.fsync(file.fileno())
+        fsync_dir(folder)
+
+
+def fsync_dir(path: str):
+    """Flushes a folder's entries to disk, so a rename into it survives a crash. A no-op on Windows."""
+    if os.name == "nt":
+        return
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+class SnapshotStore:
+    """Versioned snapshots of a saved index, published atomically.
+
+    Every save writes a complete snapshot (FAISS index, chunks, metadata, manifest) to a temporary
+    folder, flushes it to disk and renames it into `snapshots/`. The `CURRENT` file names the
+    published snapshot: it is replaced in a single `os.replace`, so a reader resolving it always
+    gets a complete snapshot, never a mix of two saves. Snapshots are named by their UTC creation
+    time, so their names sort chronologically.
+
+        faiss_index/
+            CURRENT                       "20261018-093012-123456789"
+            snapshots/
+                20261018-081500-000000001/
+                20261018-093012-123456789/
+
+    Index folders saved before snapshots existed hold the files at their root, they are read as
+    they are and replaced by a snapshot on the next save.
+
+    Attributes:
+        path (str): The index folder.
+        keep (int): Number of most recent snapshots kept by the garbage collection, the current one included.
+
+    Methods:
+        current_name(): Returns the name of the published snapshot.
+        current(): Returns the name and folder of the snapshot to read.
+        create(): Creates the temporary folder of a new snapshot.
+        publish(folder): Publishes a snapshot written to a folder returned by `create`.
+        gc(in_use): Deletes the snapshots no longer needed.
+    """
+    def __init__(self, path: str = r"./faiss_index", keep: int = 2):
+        self.path = os.path.normpath(path)
+        self.keep = max(1, keep)
+        self.snapshots_path = os.path.join(self.path, SNAPSHOTS_FOLDER)
+
+    def folder(self, name: str) -> str:
+        return os.path.join(self.snapshots_path, name)
+
+    def current_name(self) -> str | None:
+        """Returns the name of the published snapshot, None if none was published."""
+        try:
+            with open(os.path.join(self.path, CURRENT_FILE), encoding="utf-8") as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def is_legacy(self) -> bool:
+        """Whether the folder holds an index saved before snapshots existed."""
+        return any(os.path.exists(os.path.join(self.path, name)) for name in LEGACY_FILES)
+
+    def current(self) -> tuple[str | None, str]:
+        """Returns the name and folder of the snapshot to read, the name is None for a legacy folder.
+
+        Raises:
+            FileNotFoundError: If the folder holds no index.
+        """
+        name = self.current_name()
+        if name is not None:
+            return name, self.folder(name)
+        if self.is_legacy():
+            return None, self.path
+        raise FileNotFoundError(f"No index in {self.path}")
+
+    def snapshots(self) -> list[str]:
+        """Returns the names of the published and former snapshots, oldest first."""
+        if not os.path.isdir(self.snapshots_path):
+            return []
+        return sorted(name for name in os.listdir(self.snapshots_path) if not name.startswith(TMP_PREFIX))
+
+    def create(self) -> str:
+        """Creates the temporary folder a new snapshot is written to, returns its path."""
+        now = time.time_ns()
+        name = time.strftime("%Y%m%d-%H%M%S", time.gmtime(now // 10**9)) + f"-{now % 10**9:09d}"
+        folder = self.folder(TMP_PREFIX + name)
+        os.makedirs(folder)
+        return folder
+
+    def publish(self, folder: str) -> str:
+        """Publishes a snapshot written to a folder returned by `create`, then collects the old ones.
+
+        The files are flushed to disk, the folder renamed to its final name and `CURRENT` replaced
+        to point to it. A crash at any point leaves `CURRENT` pointing to a complete snapshot.
+
+        Args:
+            folder (str): The temporary folder of the snapshot.
+
+        Returns:
+            str: The name of the published snapshot.
+        """
+        name = os.path.basename(folder)[len(TMP_PREFIX):]
+        legacy = self.current_name() is None and self.is_legacy()
+        fsync_tree(folder)
+        os.rename(folder, self.folder(name))
+        fsync_dir(self.snapshots_path)
+        pointer_path = os.path.join(self.path, CURRENT_FILE + ".tmp")
+        with open(pointer_path, "w", encoding="utf-8") as file:
+            file.write(name)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(pointer_path, os.path.join(self.path, CURRENT_FILE))
+        fsync_dir(self.path)
+        if legacy:
+            self._remove_legacy()
+        self.gc()
+        return name
+
+    def _remove_legacy(self):
+        # Only reached once CURRENT points to a snapshot, which readers resolve first
+        for entry in os.scandir(self.path):
+            if entry.name in (CURRENT_FILE, SNAPSHOTS_FOLDER):
+                continue
+            if entry.is_dir():
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.remove(entry.path)
+
+    def gc(self, in_use: set[str] | None = None) -> list[str]:
+        """Deletes the snapshots no longer needed, and the temporary folders of interrupted saves.
+
+        The current snapshot, the `keep` most recent ones and those in `in_use` are kept. A reader
+        that loaded a deleted snapshot keeps working: its files are open or memory-mapped, which
+        keeps them alive on POSIX systems. Where open files can't be deleted (Windows), they are
+        left for a later collection.
+
+        Args:
+            in_use (set[str], optional): Names of snapshots still served, e.g. by in-flight queries.
+
+        Returns:
+            list[str]: The names of the deleted snapshots.
+        """
+        keep = set(self.snapshots()[-self.keep:]) | set(in_use or ())
+        current = self.current_name()
+        if current is not None:
+            keep.add(current)
+        removed = []
+        for name in self.snapshots():
+            if name not in keep:
+                shutil.rmtree(self.folder(name), ignore_errors=True)
+                removed.append(name)
+        if os.path.isdir(self.snapshots_path):
+            for name in os.listdir(self.snapshots_path):
+                folder = self.folder(name)
+                if name.startswith(TMP_PREFIX) and time.time() - os.path.getmtime(folder) > STALE_TMP_SECONDS:
+                    shutil.rmtree(folder, ignore_errors=True)
+        if removed:
+            logger.info("Deleted %d old index snapshots", len(removed), extra={"snapshots": removed})
+        return removed
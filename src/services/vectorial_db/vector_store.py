@@ -0,0 +1,87 @@
+import os
+from collections.abc import Mapping
+from typing import Iterable, Iterator
+
+import numpy as np
+
+
+IDS_FILE = "vector_ids.npy"
+VECTORS_FILE = "vectors.npy"
+
+
+class VectorStore(Mapping):
+    """Read-only, memory-mapped store of full-precision vectors by ID.
+
+    Keeps the exact vectors of an index storing compressed ones, to re-rank search candidates:
+    only the rows of the candidates are read, so the store costs disk space and page cache rather
+    than process memory. Vectors are saved as a float32 matrix sorted by ID, with the array of IDs.
+
+    Methods:
+        write(path, items, dimension): Writes a store.
+        exists(path): Tells whether a store was written in a folder.
+        take(ids): Returns the vectors of several IDs as a matrix.
+    """
+    def __init__(self, path: str):
+        self._ids = np.load(os.path.join(path, IDS_FILE), mmap_mode="r")
+        self._vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r")
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, IDS_FILE))
+
+    @staticmethod
+    def write(path: str, items: Iterable[tuple[int, np.ndarray]], count: int, dimension: int):
+        """Writes a store in a folder, filling the memory-mapped matrix row by row.
+
+        Args:
+            path (str): The folder to write the store files to.
+            items (Iterable[tuple[int, np.ndarray]]): The IDs and vectors, sorted by ID.
+            count (int): The number of vectors.
+            dimension (int): The dimension of the vectors.
+        """
+        ids = np.empty(count, dtype=np.int64)
+        vectors = np.lib.format.open_memmap(os.path.join(path, VECTORS_FILE), mode="w+", dtype=np.float32,
+                                            shape=(count, dimension))
+        for row, (vector_id, vector) in enumerate(items):
+            if row and vector_id <= ids[row - 1]:
+                raise ValueError("Vectors must be written sorted by ID")
+            ids[row] = vector_id
+            vectors[row] = vector
+        vectors.flush()
+        del vectors
+        np.save(os.path.join(path, IDS_FILE), ids)
+
+    def _position(self, vector_id: int) -> int:
+        position = int(np.searchsorted(self._ids, vector_id))
+        if position >= len(self._ids) or self._ids[position] != vector_id:
+            return -1
+        return position
+
+    def take(self, ids: Iterable[int]) -> np.ndarray:
+        """Returns the vectors of several IDs as a matrix, locating them all with one search of the IDs.
+
+        Raises:
+            KeyError: One of the IDs is not in the store.
+        """
+        ids = np.asarray(list(ids), dtype=np.int64)
+        positions = np.searchsorted(self._ids, ids)
+        found = positions < len(self._ids)
+        found[found] = self._ids[positions[found]] == ids[found]
+        if not found.all():
+            raise KeyError(int(ids[~found][0]))
+        return self._vectors[positions]
+
+    def __getitem__(self, vector_id: int) -> np.ndarray:
+        position = self._position(vector_id)
+        if position < 0:
+            raise KeyError(vector_id)
+        return self._vectors[position]
+
+    def __contains__(self, vector_id) -> bool:
+        return self._position(vector_id) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids.tolist())
+
+    def __len__(self) -> int:
+        return len(self._ids)
@@ -0,0 +1,42 @@
+import time
+
+import httpx
+import openai
+import pytest
+
+from src.services.models.api_client import CircuitOpenError, ResilientClient
+
+
+def connection_error():
+    raise openai.APIConnectionError(request=httpx.Request("POST", "https://example.test"))
+
+
+def open_breaker(client: ResilientClient):
+    with pytest.raises(openai.APIConnectionError):
+        client.call(connection_error)
+    assert client.breaker.state == "open"
+
+
+def test_interrupted_trial_lets_another_trial_through():
+    client = ResilientClient("test", failure_threshold=1, reset_timeout=0.01, max_retries=0)
+    open_breaker(client)
+    time.sleep(0.02)
+
+    def interrupted():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        client.call(interrupted)
+    assert client.breaker.state == "half_open"
+    assert client.call(lambda: "answer") == "answer"
+    assert client.breaker.state == "closed"
+
+
+def test_rejection_during_trial_reports_reset_timeout():
+    client = ResilientClient("test", failure_threshold=1, reset_timeout=0.01, max_retries=0)
+    open_breaker(client)
+    time.sleep(0.02)
+    assert client.breaker.before_call()
+    with pytest.raises(CircuitOpenError) as error:
+        client.breaker.before_call()
+    assert error.value.retry_after == client.breaker.reset_timeout
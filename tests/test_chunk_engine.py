@@ -0,0 +1,64 @@
+import pytest
+from llama_index.core.node_parser import TokenTextSplitter
+
+from benchmarks.bench_chunking import irregular_spacing, pages_of
+from benchmarks.corpus import synthetic_text
+from src.ingestion.chunking.chunk_engine import TokenChunkEngine
+from src.ingestion.chunking.token_chunking import iter_chunks_from_pages, text_to_chunks
+
+
+TEXTS = {
+    "synthetic": synthetic_text(3000),
+    "irregular_spacing": irregular_spacing(synthetic_text(3000, seed=1), seed=1),
+    # Words longer than a chunk are split into characters
+    "long_words": " ".join(["x" * 700, synthetic_text(300, seed=2), "y" * 1500 + "\n" + "z" * 40]),
+    "lines_only": "\n".join(synthetic_text(2000, seed=3).split(" ")),
+    "special_tokens": synthetic_text(400, seed=4).replace(".", ". <|endoftext|>"),
+    "surrounding_whitespace": "\n\n  " + synthetic_text(800, seed=5) + "  \n",
+    "short": "A single short sentence.",
+    "empty": "",
+}
+
+
+@pytest.mark.parametrize("chunk_size, chunk_overlap", [(500, 100), (100, 20), (64, 0), (50, 50)])
+@pytest.mark.parametrize("name", TEXTS)
+def test_chunks_are_those_of_the_token_text_splitter(name, chunk_size, chunk_overlap):
+    text = TEXTS[name]
+    engine = TokenChunkEngine(chunk_size, chunk_overlap)
+    splitter = TokenTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    assert engine.split(text) == splitter.split_text(text)
+
+
+def test_spans_slice_the_chunks_from_the_text():
+    text = TEXTS["irregular_spacing"]
+    engine = TokenChunkEngine(100, 20)
+
+    assert [text[start:end] for start, end in engine.split_spans(text)] == engine.split(text)
+
+
+def test_batch_and_cached_counts_give_the_same_chunks():
+    texts = list(TEXTS.values())
+    engine = TokenChunkEngine(100, 20)
+    expected = [TokenChunkEngine(100, 20).split(text) for text in texts]
+
+    assert engine.split_batch(texts) == expected
+    # Every split is counted by now
+    assert [engine.split(text) for text in texts] == expected
+
+
+@pytest.mark.parametrize("window_chunks", [1, 2, 16])
+def test_streamed_pages_give_the_chunks_of_the_whole_text(window_chunks):
+    pages = pages_of(TEXTS["irregular_spacing"], page_chars=1000)
+    # Pages are joined with a space, as the streaming does
+    whole = text_to_chunks("".join(" " + page for _, page in pages))
+
+    streamed = list(iter_chunks_from_pages(pages, window_chunks=window_chunks))
+    assert [chunk for chunk, _, _ in streamed] == whole
+    assert [first for _, first, _ in streamed] == sorted(first for _, first, _ in streamed)
+    assert all(first <= last for _, first, last in streamed)
+
+
+def test_overlap_larger_than_chunk_is_rejected():
+    with pytest.raises(ValueError):
+        TokenChunkEngine(100, 101)
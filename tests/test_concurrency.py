@@ -0,0 +1,116 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from src.services.serving.micro_batcher import MicroBatcher
+from src.services.vectorial_db.rw_lock import RWLock
+
+
+def test_readers_share_the_lock():
+    lock = RWLock()
+    barrier = threading.Barrier(4, timeout=5)
+
+    def read():
+        with lock.read():
+            # Only passes once the 4 readers hold the lock together
+            barrier.wait()
+
+    with ThreadPoolExecutor(4) as pool:
+        for future in [pool.submit(read) for _ in range(4)]:
+            future.result()
+
+
+def test_writer_excludes_readers_and_writers():
+    lock = RWLock()
+    inside = []
+    overlaps = []
+
+    def hold(mode: str):
+        with getattr(lock, mode)():
+            inside.append(mode)
+            if "write" in inside and len(inside) > 1:
+                overlaps.append(list(inside))
+            time.sleep(0.001)
+            inside.remove(mode)
+
+    with ThreadPoolExecutor(8) as pool:
+        for future in [pool.submit(hold, "write" if i % 3 == 0 else "read") for i in range(300)]:
+            future.result()
+    assert overlaps == []
+
+
+def test_waiting_writer_holds_up_new_readers():
+    lock = RWLock()
+    order = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    def first_reader():
+        with lock.read():
+            reading.set()
+            release.wait(5)
+            order.append("first reader")
+
+    def writer():
+        with lock.write():
+            order.append("writer")
+
+    def late_reader():
+        with lock.read():
+            order.append("late reader")
+
+    threads = [threading.Thread(target=first_reader)]
+    threads[0].start()
+    reading.wait(5)
+    threads.append(threading.Thread(target=writer))
+    threads[1].start()
+    while not lock._waiting_writers:
+        time.sleep(0.001)
+    threads.append(threading.Thread(target=late_reader))
+    threads[2].start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert order == ["first reader", "writer", "late reader"]
+
+
+def test_concurrent_items_are_batched():
+    batches = []
+
+    def handler(items):
+        batches.append(list(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(handler, max_batch_size=8, max_wait=0.05)
+    with ThreadPoolExecutor(32) as pool:
+        results = list(pool.map(batcher, range(32)))
+    batcher.close()
+
+    assert results == [item * 2 for item in range(32)]
+    assert sorted(item for batch in batches for item in batch) == list(range(32))
+    assert max(map(len, batches)) <= 8
+    assert len(batches) < 32
+    assert batcher.stats()["items"] == 32
+
+
+def test_handler_errors_reach_every_caller_of_the_batch():
+    batcher = MicroBatcher(lambda items: items[1:], max_wait=0.05)
+    futures = [batcher.submit(item) for item in range(3)]
+    batcher.close()
+
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+
+
+def test_close_handles_the_queued_items():
+    batcher = MicroBatcher(lambda items: [item + 1 for item in items], max_batch_size=2, max_in_flight=1)
+    futures = [batcher.submit(item) for item in range(10)]
+    batcher.close()
+
+    assert [future.result(0) for future in futures] == list(range(1, 11))
+    with pytest.raises(RuntimeError):
+        batcher.submit(0)
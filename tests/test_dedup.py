@@ -0,0 +1,65 @@
+from benchmarks.corpus import synthetic_chunks
+from benchmarks.fakes import FakeEmbeddings
+from src.services.vectorial_db.dedup import ChunkDeduplicator
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+CHUNK, OTHER = synthetic_chunks(2, words=60)
+
+
+def test_exact_and_near_duplicates_are_found():
+    dedup = ChunkDeduplicator(0.8)
+    chunks = {0: CHUNK}
+    dedup.add_existing(chunks)
+
+    assert dedup.assign("  " + CHUNK.upper() + " ", chunks) == (0, "exact")
+    words = CHUNK.split()
+    assert dedup.assign(" ".join(words[:-1] + ["verification"]), chunks) == (0, "near")
+    assert dedup.assign(OTHER, chunks)[1] is None
+
+
+def test_dead_slot_is_ignored():
+    dedup = ChunkDeduplicator()
+    dedup.add_existing({0: CHUNK})
+
+    # Chunk 0 was removed from the index since
+    slot, duplicate = dedup.assign(CHUNK, {})
+    assert duplicate is None
+    assert slot != 0
+
+
+def test_same_run_duplicate_binds_after_original_is_added():
+    dedup = ChunkDeduplicator()
+    slot, duplicate = dedup.assign(CHUNK, {})
+    assert duplicate is None
+    # Not added yet: an unbound slot still matches the chunks of the same run
+    assert dedup.assign(CHUNK, {}) == (slot, "exact")
+    assert dedup.id_of(slot) == -1
+
+    dedup.bind([slot], [7])
+    assert dedup.id_of(slot) == 7
+    assert dedup.assign(CHUNK, {7: CHUNK}) == (slot, "exact")
+
+
+def test_duplicates_of_one_batch_get_the_id_of_their_original():
+    embeddings = FakeEmbeddings(16)
+    index = FAISSIndex(16, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch,
+                       dedup=ChunkDeduplicator())
+
+    ids = index.add_chunks([CHUNK, OTHER, CHUNK])
+    assert ids[0] == ids[2] != ids[1]
+    assert len(index.chunks) == 2
+
+
+def test_write_drops_removed_and_unbound_ids(tmp_path):
+    dedup = ChunkDeduplicator()
+    dedup.add_existing({0: CHUNK, 1: OTHER})
+    # Fingerprinted but never added
+    dedup.assign(synthetic_chunks(3, words=60)[2], {})
+
+    dedup.write(str(tmp_path), {1: OTHER})
+    loaded = ChunkDeduplicator.load(str(tmp_path))
+    assert len(loaded) == 1
+    assert loaded.id_of(0) == 1
+    assert loaded.assign(OTHER, {1: OTHER}) == (0, "exact")
+    assert loaded.assign(CHUNK, {1: OTHER})[1] is None
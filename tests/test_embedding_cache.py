@@ -0,0 +1,121 @@
+import multiprocessing
+import threading
+
+import numpy as np
+import pytest
+
+from benchmarks.fakes import FakeEmbeddings
+from src.services.models.embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+DIMENSION = 8
+
+
+def vectors_of(texts: list[str]) -> np.ndarray:
+    return np.asarray(FakeEmbeddings(DIMENSION).get_embeddings_batch(texts), dtype=np.float32)
+
+
+def texts_of(count: int, prefix: str = "text") -> list[str]:
+    return [f"{prefix} {i}" for i in range(count)]
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIMENSION, max_entries=4)
+    texts = texts_of(4)
+    cache.put_many(texts, vectors_of(texts))
+    # "text 0" is used again, "text 1" is now the least recently used
+    assert cache.get("text 0") is not None
+
+    cache.put_many(["new"], vectors_of(["new"]))
+
+    assert len(cache) == 4
+    assert cache.evictions == 1
+    assert cache.get("text 1") is None
+    for text in ["text 0", "text 2", "text 3", "new"]:
+        np.testing.assert_array_equal(cache.get(text), vectors_of([text])[0])
+
+
+def test_batch_larger_than_the_cache_keeps_its_last_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIMENSION, max_entries=3)
+    texts = texts_of(5)
+    cache.put_many(texts, vectors_of(texts))
+
+    assert len(cache) == 3
+    assert [cache.get(text) is not None for text in texts] == [False, False, True, True, True]
+
+
+def test_entries_persist_and_are_keyed_by_model(tmp_path):
+    texts = texts_of(3)
+    EmbeddingCache(str(tmp_path), "model", DIMENSION, max_entries=10).put_many(texts, vectors_of(texts))
+
+    reopened = EmbeddingCache(str(tmp_path), "model", DIMENSION, max_entries=10)
+    np.testing.assert_array_equal(np.stack(reopened.get_many(texts)), vectors_of(texts))
+    assert EmbeddingCache(str(tmp_path), "other-model", DIMENSION, max_entries=10).get_many(texts) == [None] * 3
+
+
+def test_wrong_shape_is_rejected(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIMENSION)
+    with pytest.raises(ValueError):
+        cache.put_many(["a", "b"], np.zeros((2, DIMENSION + 1)))
+
+
+def test_only_misses_reach_the_api(tmp_path):
+    embeddings = FakeEmbeddings(DIMENSION)
+    cache = EmbeddingCache(str(tmp_path), embeddings.model, DIMENSION, max_entries=10)
+    cached = CachedEmbeddings(cache, embeddings.get_embeddings, embeddings.get_embeddings_batch)
+
+    first = cached.get_embeddings_batch(["a", "b", "a"])
+    assert embeddings.requests == 1
+    assert cached.get_embeddings_batch(["b", "a"]) == [first[1], first[0]]
+    assert cached.get_embeddings("a") == first[0]
+    assert embeddings.requests == 1
+    assert cache.stats()["hits"] == 3
+
+
+def test_concurrent_reads_see_whole_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model", DIMENSION, max_entries=64)
+    texts = texts_of(64)
+    expected = dict(zip(texts, vectors_of(texts)))
+    cache.put_many(texts, list(expected.values()))
+    errors = []
+
+    def read():
+        for _ in range(50):
+            for text, vector in zip(texts, cache.get_many(texts)):
+                if vector is None or not np.array_equal(vector, expected[text]):
+                    errors.append(text)
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert cache.stats()["hits"] == 8 * 50 * 64
+
+
+def write_batches(path: str, batches: int):
+    cache = EmbeddingCache(path, "model", DIMENSION, max_entries=16)
+    for batch in range(batches):
+        texts = texts_of(8, prefix=f"batch {batch}")
+        cache.put_many(texts, vectors_of(texts))
+
+
+def test_reads_during_writes_of_another_process_are_never_torn(tmp_path):
+    # The writer keeps evicting entries: lookups either miss or return the vector of their text
+    texts = [f"batch {batch} {i}" for batch in range(40) for i in range(8)]
+    expected = dict(zip(texts, vectors_of(texts)))
+    cache = EmbeddingCache(str(tmp_path), "model", DIMENSION, max_entries=16)
+    writer = multiprocessing.get_context("spawn").Process(target=write_batches, args=(str(tmp_path), 40))
+    writer.start()
+    torn = []
+    while writer.is_alive():
+        for text, vector in zip(texts, cache.get_many(texts)):
+            if vector is not None and not np.array_equal(vector, expected[text]):
+                torn.append(text)
+    writer.join()
+
+    assert writer.exitcode == 0
+    assert torn == []
+    assert len(cache) == 16
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pytest
+
+from benchmarks.corpus import synthetic_text
+from benchmarks.fakes import FakeEmbeddings
+from src.ingestion.ingest_files import ingest_files_data_folder
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.index_factory import IndexConfig
+
+
+DIMENSION = 16
+
+
+def write_document(folder, name: str, seed: int):
+    text = synthetic_text(400, seed=seed)
+    (folder / name).write_text(f"<html><body><p>{text}</p></body></html>", encoding="utf-8")
+
+
+@pytest.fixture
+def embeddings() -> FakeEmbeddings:
+    return FakeEmbeddings(DIMENSION)
+
+
+@pytest.fixture
+def index(embeddings) -> FAISSIndex:
+    return FAISSIndex(DIMENSION, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch)
+
+
+@pytest.fixture
+def data(tmp_path):
+    folder = tmp_path / "data"
+    folder.mkdir()
+    for number in range(3):
+        write_document(folder, f"document_{number}.html", seed=number)
+    return folder
+
+
+def test_unchanged_files_are_not_ingested_again(index, data, embeddings, tmp_path):
+    ingest_files_data_folder(index, str(data), parse_workers=0)
+    index.save_index(str(tmp_path / "index"))
+    ids = {file: entry["ids"] for file, entry in index.manifest["files"].items()}
+    requests = embeddings.requests
+
+    loaded = FAISSIndex(DIMENSION, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch)
+    loaded.load_index(str(tmp_path / "index"))
+    # Touched but identical content
+    os.utime(data / "document_0.html", (0, 0))
+    ingest_files_data_folder(loaded, str(data), parse_workers=0)
+
+    assert embeddings.requests == requests
+    assert {file: entry["ids"] for file, entry in loaded.manifest["files"].items()} == ids
+    assert loaded.chunks == index.chunks
+
+
+def test_deleted_and_changed_files_are_removed_and_reingested(index, data):
+    ingest_files_data_folder(index, str(data), parse_workers=0)
+    before = {file: entry["ids"] for file, entry in index.manifest["files"].items()}
+
+    os.remove(data / "document_0.html")
+    write_document(data, "document_1.html", seed=10)
+    ingest_files_data_folder(index, str(data), parse_workers=0)
+
+    files = index.manifest["files"]
+    assert sorted(files) == ["document_1.html", "document_2.html"]
+    assert files["document_2.html"]["ids"] == before["document_2.html"]
+    assert not set(files["document_1.html"]["ids"]) & set(before["document_1.html"])
+    assert sorted(index.chunks) == sorted(files["document_1.html"]["ids"] + files["document_2.html"]["ids"])
+    assert index.index.ntotal == len(index.chunks)
+
+
+def test_batched_search_of_an_emptied_index(index, data, embeddings):
+    ingest_files_data_folder(index, str(data), parse_workers=0)
+    vectors = np.stack([embeddings._vector(chunk) for chunk in index.chunks.values()])
+    for path in data.iterdir():
+        os.remove(path)
+    ingest_files_data_folder(index, str(data), parse_workers=0)
+    assert index.index.ntotal == 0
+
+    # FAISS crashes searching an emptied flat index with 20 queries or more
+    queries = np.resize(vectors, (32, DIMENSION))
+    distances, ids = index.search_vectors(queries, 5)
+    assert ids.shape == (32, 5)
+    assert (ids == -1).all() and np.isinf(distances).all()
+    assert index.retrieve_chunks_batch(["scope emissions"] * 32, 5) == [[] for _ in range(32)]
+
+
+def test_removal_is_rejected_by_index_types_without_it(embeddings):
+    index = FAISSIndex(DIMENSION, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch,
+                       index_config=IndexConfig(index_type="hnsw"))
+    ids = index.add_chunks(["first chunk", "second chunk"])
+    with pytest.raises(ValueError):
+        index.remove_ids(ids[:1])
+    assert len(index.chunks) == 2
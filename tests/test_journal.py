@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from benchmarks.corpus import synthetic_text
+from benchmarks.fakes import FakeEmbeddings
+from src.ingestion.ingest_files import ingest_files_data_folder
+from src.ingestion.journal import PROGRESS_FILE, RECORDS_FILE, IngestionJournal
+from src.services.vectorial_db.dedup import ChunkDeduplicator
+from src.services.vectorial_db.faiss_index import FAISSIndex
+
+
+DIMENSION = 16
+
+
+class OutageEmbeddings(FakeEmbeddings):
+    """Fails every request once `fail_after` requests were served."""
+    def __init__(self, fail_after: int | None = None):
+        super().__init__(DIMENSION)
+        self.fail_after = fail_after
+        self.chunks = 0
+
+    def get_embeddings_batch(self, texts: list[str]) -> list[list[float]]:
+        if self.fail_after is not None and self.requests >= self.fail_after:
+            raise ConnectionError("Embeddings API unavailable")
+        self.chunks += len(texts)
+        return super().get_embeddings_batch(texts)
+
+
+@pytest.fixture
+def data(tmp_path) -> str:
+    folder = tmp_path / "data"
+    folder.mkdir()
+    for number in range(4):
+        text = synthetic_text(2500, seed=number)
+        (folder / f"document_{number}.html").write_text(f"<html><body><p>{text}</p></body></html>", encoding="utf-8")
+    # Duplicates of a document ingested earlier are journaled as references
+    shutil.copy(folder / "document_0.html", folder / "document_4.html")
+    return str(folder)
+
+
+def ingest(data: str, embeddings: OutageEmbeddings, journal: IngestionJournal | None) -> FAISSIndex:
+    # Two chunks per segment and per request, so a file spans several segments and checkpoints
+    index = FAISSIndex(DIMENSION, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch,
+                       max_batch_items=2, dedup=ChunkDeduplicator())
+    try:
+        ingest_files_data_folder(index, data, parse_workers=0, embed_concurrency=1, journal=journal)
+    finally:
+        if journal is not None:
+            journal.close()
+    return index
+
+
+def contents(index: FAISSIndex) -> tuple[dict, dict]:
+    return dict(index.chunks.items()), {file: entry["ids"] for file, entry in index.manifest["files"].items()}
+
+
+def interrupt(data: str, journal_path: str, fail_after: int):
+    with pytest.raises(ConnectionError):
+        ingest(data, OutageEmbeddings(fail_after), IngestionJournal(journal_path, checkpoint_chunks=1))
+
+
+@pytest.fixture
+def complete(data) -> tuple[dict, dict, int]:
+    embeddings = OutageEmbeddings()
+    index = ingest(data, embeddings, None)
+    return *contents(index), embeddings.requests
+
+
+def test_resumed_run_matches_uninterrupted_run(data, complete, tmp_path):
+    chunks, ids, requests = complete
+    journal_path = str(tmp_path / "journal")
+    # Fails in the middle of the third file
+    interrupt(data, journal_path, requests // 2 + 1)
+    with open(os.path.join(journal_path, PROGRESS_FILE), encoding="utf-8") as file:
+        cursors = list(json.load(file)["files"].values())
+    assert [cursor["done"] for cursor in cursors] == [True, True, False]
+    assert 0 < cursors[-1]["chunks"] < len(ids["document_2.html"])
+
+    embeddings = OutageEmbeddings()
+    index = ingest(data, embeddings, IngestionJournal(journal_path, checkpoint_chunks=1))
+    assert contents(index) == (chunks, ids)
+    # Only the chunks not journaled were embedded again
+    assert embeddings.chunks < len(chunks)
+
+
+def test_records_past_the_last_checkpoint_are_dropped(data, complete, tmp_path):
+    chunks, ids, requests = complete
+    journal_path = str(tmp_path / "journal")
+    interrupt(data, journal_path, requests // 2 + 1)
+    # A record torn by a crash, after the durable part of the journal
+    with open(os.path.join(journal_path, RECORDS_FILE), "ab") as file:
+        file.write(b"\x01\x02\x03\x04\x05")
+
+    index = ingest(data, OutageEmbeddings(), IngestionJournal(journal_path, checkpoint_chunks=1))
+    assert contents(index) == (chunks, ids)
+
+
+@pytest.mark.parametrize("damage", ["truncate", "flip"])
+def test_damaged_durable_records_are_rejected(data, complete, tmp_path, damage):
+    _, _, requests = complete
+    journal_path = str(tmp_path / "journal")
+    interrupt(data, journal_path, requests // 2 + 1)
+    with open(os.path.join(journal_path, PROGRESS_FILE), encoding="utf-8") as file:
+        durable = json.load(file)["offset"]
+    with open(os.path.join(journal_path, RECORDS_FILE), "r+b") as file:
+        if damage == "truncate":
+            file.truncate(durable - 3)
+        else:
+            file.seek(durable // 2)
+            byte = file.read(1)
+            file.seek(durable // 2)
+            file.write(bytes([byte[0] ^ 0xFF]))
+
+    with pytest.raises(ValueError, match="Ingestion journal"):
+        ingest(data, OutageEmbeddings(), IngestionJournal(journal_path, checkpoint_chunks=1))
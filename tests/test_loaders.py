@@ -0,0 +1,100 @@
+import html2text
+import pytest
+from docx import Document
+
+from benchmarks.bench_loaders import sentences, write_csv, write_docx, write_html
+from src.ingestion.loaders.loader import Loader
+from src.ingestion.loaders.loaderCSV import LoaderCSV
+from src.ingestion.loaders.loaderDOCX import LoaderDOCX
+from src.ingestion.loaders.loaderHTML import LoaderHTML
+from src.services.models.batching import estimate_tokens
+
+
+def test_csv_rows_name_their_columns(tmp_path):
+    path = tmp_path / "products.csv"
+    # Semicolons, a byte order mark, an unnamed column and empty values
+    path.write_text("﻿ID;Name;;Price\n1;Solar panel;;120\n2;;spare;\n3;Battery;;80\n", encoding="utf-8")
+    loader = LoaderCSV(str(path))
+
+    assert loader.extract_metadata() == {"columns": "ID, Name, column 3, Price"}
+    assert list(loader.iter_pages()) == [(1, "ID: 1 | Name: Solar panel | Price: 120\n"
+                                             "ID: 2 | column 3: spare\n"
+                                             "ID: 3 | Name: Battery | Price: 80")]
+    assert loader.extract_metadata()["rows"] == 3
+    # Values past the header
+    assert loader.format_row(["4", "Inverter", "", "", "extra"]) == "ID: 4 | Name: Inverter | column 5: extra"
+
+
+def test_csv_pages_hold_whole_rows_within_their_budget(tmp_path):
+    path = tmp_path / "products.csv"
+    write_csv(str(path), 200_000)
+    loader = LoaderCSV(str(path), page_tokens=300)
+
+    pages = list(loader.iter_pages())
+    lines = [line for _, text in pages for line in text.split("\n")]
+    assert [number for number, _ in pages] == list(range(1, len(pages) + 1))
+    assert all(estimate_tokens(text) <= 300 + 1 for _, text in pages)
+    assert len(lines) == loader.rows
+    assert all(line.startswith("Product ID: ") for line in lines)
+    assert LoaderCSV.SELF_CONTAINED_PAGES
+
+
+@pytest.mark.parametrize("block_chars, section_chars", [(1024 * 1024, 16 * 1024), (97, 500)])
+def test_streamed_html_is_the_whole_conversion(tmp_path, block_chars, section_chars):
+    path = tmp_path / "export.html"
+    write_html(str(path), 100_000)
+    converter = html2text.HTML2Text(bodywidth=0)
+    converter.ignore_images = True
+    whole = converter.handle(path.read_text(encoding="utf-8"))
+
+    pages = list(LoaderHTML(str(path), section_chars=section_chars, block_chars=block_chars).iter_pages())
+
+    assert "".join(text for _, text in pages) == whole
+    assert [number for number, _ in pages] == list(range(1, len(pages) + 1))
+    # Sections are cut at line breaks
+    assert all(text.endswith("\n") for _, text in pages[:-1])
+
+
+def test_html_metadata_and_entities(tmp_path):
+    path = tmp_path / "page.html"
+    path.write_text('<html><head><title>Scope 3 &amp; more</title><meta name="author" content="Alice">'
+                    '<meta name="description" content="Emissions report"></head>'
+                    '<body><p>Net&nbsp;zero <img src="chart.png" alt="chart"></p></body></html>', encoding="utf-8")
+    loader = Loader(str(path), "HTM")
+
+    assert loader.extract_metadata() == {"title": "Scope 3 & more", "author": "Alice", "subject": "Emissions report"}
+    assert loader.extract_text().strip() == "Net zero"
+
+
+def test_docx_paragraphs_pages_and_metadata(tmp_path):
+    path = tmp_path / "report.docx"
+    document = Document()
+    document.core_properties.title = "Annual report"
+    document.core_properties.author = "Alice"
+    document.add_paragraph("First page")
+    document.add_paragraph("Tab\tseparated")
+    document.add_page_break()
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = "Scope"
+    table.cell(0, 1).text = "Value"
+    document.add_paragraph("")
+    document.add_paragraph("Second page")
+    document.save(str(path))
+    loader = LoaderDOCX(str(path))
+
+    assert {"title": "Annual report", "author": "Alice"}.items() <= loader.extract_metadata().items()
+    assert list(loader.iter_pages()) == [(1, "First page\nTab\tseparated"), (2, "Scope\nValue\nSecond page")]
+
+
+def test_docx_rendered_pages_and_long_pages_are_split(tmp_path):
+    path = tmp_path / "large.docx"
+    write_docx(str(path), 100_000, paragraphs_per_page=12)
+    expected = [paragraph.text for paragraph in Document(str(path)).paragraphs]
+
+    pages = list(LoaderDOCX(str(path), section_chars=2000).iter_pages())
+
+    assert "\n".join(text for _, text in pages).split("\n") == expected
+    assert all(len(text) < 2000 + max(map(len, expected)) for _, text in pages)
+    assert pages[-1][0] == len(expected) // 12 + 1
+    assert [number for number, _ in pages] == sorted(number for number, _ in pages)
+    assert next(sentences(3)) in pages[0][1]
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from benchmarks.fakes import FakeEmbeddings
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.index_factory import IndexConfig
+from src.services.vectorial_db.metadata_store import ChunkMetadata, filter_key
+
+
+DIMENSION = 16
+DOCUMENTS = ["data/report.pdf", "data/glossary.pdf", "data/notes/minutes.docx"]
+CHUNKS_PER_DOCUMENT = 200
+
+
+@pytest.fixture
+def metadata() -> ChunkMetadata:
+    metadata = ChunkMetadata()
+    metadata.add(np.arange(0, 4), DOCUMENTS[0], [(1, 1), (1, 2), (2, 2), (3, 4)])
+    metadata.add(np.arange(4, 6), DOCUMENTS[1], [(1, 1), (2, 2)])
+    metadata.add(np.arange(6, 8), DOCUMENTS[2])
+    # Chunk 1 was also found in the glossary
+    metadata.add(np.array([1]), DOCUMENTS[1], [(5, 5)])
+    metadata.update_document(DOCUMENTS[0], {"author": "Alice", "year": 2023})
+    metadata.update_document(DOCUMENTS[1], {"author": "Bob", "year": 2024})
+    return metadata
+
+
+def test_documents_are_selected_by_their_fields(metadata):
+    assert metadata.select({"file": "glossary.pdf"}).tolist() == [1, 4, 5]
+    assert metadata.select({"source": DOCUMENTS[2]}).tolist() == [6, 7]
+    assert metadata.select({"author": ["Alice", "Bob"], "year": 2023}).tolist() == [0, 1, 2, 3]
+    assert metadata.select({"author": "Carol"}).tolist() == []
+    assert metadata.select({}).tolist() == list(range(8))
+
+
+def test_chunks_are_selected_by_the_pages_they_span(metadata):
+    assert metadata.select({"pages": [2, 3]}).tolist() == [1, 2, 3, 5]
+    # Both conditions must hold for the same source of a chunk
+    assert metadata.select({"file": "glossary.pdf", "pages": [5, 9]}).tolist() == [1]
+    assert metadata.select({"file": "report.pdf", "pages": [5, 9]}).tolist() == []
+    # Chunks without pages never match a page filter
+    assert metadata.select({"file": "minutes.docx", "pages": [0, 100]}).tolist() == []
+
+
+def test_chunk_metadata_lists_every_source(metadata):
+    assert metadata.get(4) == {"source": DOCUMENTS[1], "file": "glossary.pdf", "author": "Bob", "year": 2024,
+                               "page_start": 1, "page_end": 1}
+    assert metadata.get(6) == {"source": DOCUMENTS[2], "file": "minutes.docx"}
+    assert [source["page_start"] for source in metadata.get(1)["sources"]] == [1, 5]
+    assert metadata.get(100) == {}
+
+
+def test_removed_references_and_unused_documents_are_dropped(metadata, tmp_path):
+    # Chunk 1 is still found in the glossary
+    assert metadata.remove_references(np.arange(0, 4), DOCUMENTS[0]).tolist() == [0, 2, 3]
+    metadata.remove(np.array([0, 2, 3]))
+    metadata.write(str(tmp_path))
+
+    loaded = ChunkMetadata.load(str(tmp_path))
+    assert [document["file"] for document in loaded.documents] == ["glossary.pdf", "minutes.docx"]
+    assert loaded.select({"author": "Bob"}).tolist() == [1, 4, 5]
+    assert loaded.select({"author": "Alice"}).tolist() == []
+    assert loaded.get(1) == {"source": DOCUMENTS[1], "file": "glossary.pdf", "author": "Bob", "year": 2024,
+                             "page_start": 5, "page_end": 5}
+
+
+def test_filter_key_is_canonical():
+    assert filter_key(None) is None
+    assert filter_key({"file": "a.pdf", "pages": [1, 2]}) == filter_key({"pages": [1, 2], "file": "a.pdf"})
+
+
+def build_index(config: IndexConfig) -> tuple[FAISSIndex, np.ndarray]:
+    embeddings = FakeEmbeddings(DIMENSION)
+    index = FAISSIndex(DIMENSION, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch,
+                       index_config=config)
+    vectors = np.random.default_rng(0).standard_normal((len(DOCUMENTS) * CHUNKS_PER_DOCUMENT, DIMENSION))
+    vectors = vectors.astype("float32")
+    for number, document in enumerate(DOCUMENTS):
+        rows = slice(number * CHUNKS_PER_DOCUMENT, (number + 1) * CHUNKS_PER_DOCUMENT)
+        pages = [(page // 10 + 1, page // 10 + 1) for page in range(CHUNKS_PER_DOCUMENT)]
+        index.add_vectors(vectors[rows], [f"{document} chunk {i}" for i in range(CHUNKS_PER_DOCUMENT)],
+                          document=document, pages=pages)
+    index.train()
+    return index, vectors
+
+
+@pytest.mark.parametrize("config, exact", [
+    (IndexConfig("flat"), True),
+    (IndexConfig("hnsw"), True),
+    (IndexConfig("ivf_flat", nlist=4, nprobe=4, training_size=600), True),
+    (IndexConfig("pq", pq_m=4, pq_nbits=4, training_size=600), False),
+])
+@pytest.mark.parametrize("where", [{"file": "glossary.pdf"}, {"pages": [3, 4]},
+                                   {"file": ["report.pdf", "minutes.docx"], "pages": [20, 20]}])
+def test_filtered_searches_only_return_matching_chunks(config, exact, where):
+    index, vectors = build_index(config)
+    allowed = index.metadata.select(where)
+    queries = np.random.default_rng(1).standard_normal((8, DIMENSION)).astype("float32")
+
+    distances, ids = index.search_vectors(queries, 5, filter=where)
+
+    assert ids.shape == (8, 5)
+    assert np.isin(ids, allowed).all()
+    if exact:
+        # The 5 nearest of the allowed vectors
+        squared = ((queries[:, None, :] - vectors[allowed][None, :, :]) ** 2).sum(axis=2)
+        expected = allowed[np.argsort(squared, axis=1)[:, :5]]
+        np.testing.assert_array_equal(np.sort(ids, axis=1), np.sort(expected, axis=1))
+
+
+def test_filter_matching_no_chunk_returns_nothing():
+    index, _ = build_index(IndexConfig("flat"))
+    assert index.retrieve_chunks_batch(["scope emissions"] * 3, 5, filter={"file": "missing.pdf"}) == [[]] * 3
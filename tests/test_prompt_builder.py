@@ -0,0 +1,85 @@
+import logging
+
+from benchmarks.corpus import synthetic_chunks, synthetic_text
+from src.services.models.prompt_builder import PromptBuilder, merge_overlapping_chunks
+from src.services.observability.telemetry import PROMPT_TOKENS_SAVED
+
+
+TEXT = synthetic_text(300)
+
+
+def test_overlapping_chunks_are_merged():
+    # Consecutive chunks sharing 100 characters, retrieved in reverse order
+    first, second = TEXT[:600], TEXT[500:1100]
+    assert merge_overlapping_chunks([second, first]) == [TEXT[:1100].strip()]
+
+
+def test_contained_and_duplicated_chunks_are_dropped():
+    other = synthetic_chunks(1, words=50, seed=1)[0]
+    chunks = [TEXT[100:300], other, TEXT[:400], "  " + other + "\n", TEXT[50:150], ""]
+    # The containing chunk takes the rank of the best contained one
+    assert merge_overlapping_chunks(chunks) == [TEXT[:400], other]
+
+
+def test_short_overlaps_are_not_merged():
+    first, second = TEXT[:600], TEXT[590:1100]
+    assert merge_overlapping_chunks([first, second]) == [first.strip(), second.strip()]
+    assert merge_overlapping_chunks([first, second], min_overlap=8) == [TEXT[:1100].strip()]
+
+
+def test_context_fits_its_budget():
+    builder = PromptBuilder(max_context_tokens=200)
+    chunks = synthetic_chunks(10, words=100)
+
+    messages, stats = builder.build([], chunks, "What are scope 3 emissions?")
+
+    context = messages[-1]["content"].removeprefix("Context:\n").rsplit("\n\n", 1)[0]
+    assert builder.count_tokens(context) <= 200
+    assert context.startswith(chunks[0])
+    # The last chunk that fits in part is truncated
+    assert context.endswith("…")
+    assert messages[-1]["content"].endswith("What are scope 3 emissions?")
+    assert stats["prompt_tokens"] == builder.count_message_tokens(messages)
+    assert stats["saved_tokens"] == stats["unbudgeted_prompt_tokens"] - stats["prompt_tokens"] > 0
+
+
+def test_older_messages_are_summarized():
+    builder = PromptBuilder(max_history_messages=3, summary_tokens_per_message=10)
+    history = [{"role": "user" if i % 2 == 0 else "assistant", "content": synthetic_text(80, seed=i)}
+               for i in range(10)]
+
+    messages, stats = builder.build(history, "Some context.", "And then?")
+
+    # The window of 3 messages would start with an answer, which is left out of it
+    assert messages[2:-1] == history[-2:]
+    assert stats["history_messages"] == 2
+    assert stats["summarized_messages"] == 8
+    summary = messages[1]["content"]
+    assert summary.startswith("Summary of the earlier conversation:\n")
+    assert len(summary.splitlines()) == 9
+    assert builder.count_tokens(summary) < 8 * 20
+
+
+def test_history_window_fits_its_budget():
+    builder = PromptBuilder(max_history_tokens=100)
+    history = [{"role": "user", "content": synthetic_text(60, seed=i)} for i in range(6)]
+
+    messages, stats = builder.build(history, "", "Next question")
+
+    window = [message for message in messages if message["role"] == "user"][:-1]
+    assert window == history[len(history) - len(window):]
+    assert builder.count_message_tokens(window) <= 100 + 3
+    assert stats["summarized_messages"] == len(history) - len(window)
+
+
+def test_stats_are_logged_and_exported(caplog):
+    builder = PromptBuilder(max_context_tokens=100)
+    saved = PROMPT_TOKENS_SAVED.value()
+
+    with caplog.at_level(logging.INFO, logger="src.services.models.prompt_builder"):
+        _, stats = builder.build([], synthetic_chunks(5, words=60), "Question")
+
+    [record] = [record for record in caplog.records if record.getMessage() == "Prompt built"]
+    assert record.levelno == logging.INFO
+    assert record.saved_tokens == stats["saved_tokens"]
+    assert PROMPT_TOKENS_SAVED.value() == saved + stats["saved_tokens"]
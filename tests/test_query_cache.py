@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from benchmarks.corpus import synthetic_chunks
+from benchmarks.fakes import FakeEmbeddings
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.query_cache import QueryCache
+
+
+DIMENSION = 16
+CHUNKS = synthetic_chunks(20, words=30)
+
+
+@pytest.fixture
+def embeddings() -> FakeEmbeddings:
+    return FakeEmbeddings(DIMENSION)
+
+
+@pytest.fixture
+def index(embeddings) -> FAISSIndex:
+    index = FAISSIndex(DIMENSION, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch,
+                       query_cache=QueryCache())
+    index.add_chunks(CHUNKS[:10])
+    return index
+
+
+def ids_of(index: FAISSIndex, query: str, k: int = 3) -> list[int]:
+    return index.search_queries([query], k)[0][0].tolist()
+
+
+def test_normalized_queries_hit_the_cache(index, embeddings):
+    ids = ids_of(index, CHUNKS[0])
+    requests = embeddings.requests
+
+    assert ids_of(index, "  " + CHUNKS[0].upper().replace(" ", "\n ")) == ids
+    assert embeddings.requests == requests
+    assert index.query_cache.stats()["results"]["hits"] == 1
+
+
+def test_writes_invalidate_the_results(index, embeddings):
+    # The query is the embedding of a chunk not added yet
+    query = CHUNKS[15]
+    # Cached before the write
+    before = ids_of(index, query, 1)
+    requests = embeddings.requests
+
+    [added] = index.add_chunks([query])
+    assert ids_of(index, query, 1) == [added]
+    # The query vector is still cached, only the results were dropped
+    assert embeddings.requests == requests + 1
+
+    index.remove_ids([added])
+    assert ids_of(index, query, 1) == before
+
+
+def test_reload_invalidates_results_and_vectors(index, embeddings, tmp_path):
+    index.save_index(str(tmp_path / "index"))
+    ids = ids_of(index, CHUNKS[15])
+    index.add_chunks(CHUNKS[10:])
+    assert ids_of(index, CHUNKS[15], 1) != ids[:1]
+    requests = embeddings.requests
+
+    index.load_index(str(tmp_path / "index"))
+
+    assert ids_of(index, CHUNKS[15]) == ids
+    assert embeddings.requests == requests + 1
+
+
+def test_results_are_cached_per_filter_and_number_of_results(index):
+    cache = index.query_cache
+    index.search_queries([CHUNKS[0]], 3)
+    index.search_queries([CHUNKS[0]], 5)
+    index.search_queries([CHUNKS[0]], 3, filter={"file": "doc_0.pdf"})
+
+    assert cache.stats()["results"] == {"entries": 3, "hits": 0, "misses": 3, "hit_ratio": 0.0}
+
+
+def test_entries_expire_and_least_recently_used_are_evicted(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr("src.services.vectorial_db.query_cache.time.monotonic", lambda: now[0])
+    cache = QueryCache(max_entries=2, ttl=10)
+    for query in ["a", "b"]:
+        cache.put_vector(query, np.zeros(2))
+    assert cache.get_vector("a") is not None
+    cache.put_vector("c", np.zeros(2))
+
+    assert cache.get_vector("b") is None
+    now[0] = 11
+    assert cache.get_vector("a") is None
+    assert cache.stats()["vectors"]["entries"] == 1
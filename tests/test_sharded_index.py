@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from benchmarks.bench_ann_index import synthetic_vectors
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.shard_server import RemoteShard, ShardServer
+from src.services.vectorial_db.sharded_index import ShardedFAISSIndex
+
+
+DIMENSION = 16
+
+
+def no_embeddings(text: str):
+    raise RuntimeError("The tests search vectors only")
+
+
+def fill(index: FAISSIndex, vectors: np.ndarray, documents: int, first: int = 0):
+    for batch in np.array_split(np.arange(len(vectors)), documents):
+        index.add_vectors(vectors[batch], [str(first + i) for i in batch], document=f"document_{first + batch[0]}")
+
+
+def remove_save_load_add(index: FAISSIndex, vectors: np.ndarray, path: str):
+    fill(index, vectors[:400], documents=8)
+    for document in ("document_300", "document_350"):
+        index.remove_document(document, index.metadata.select({"file": document}))
+    index.save_index(path)
+    index.load_index(path)
+    fill(index, vectors[400:], documents=4, first=400)
+
+
+@pytest.mark.parametrize("shards", [3, 6, 7, 8])
+def test_emptied_shards_are_searched_like_a_single_index(tmp_path, shards):
+    vectors = synthetic_vectors(600, DIMENSION)
+    flat = FAISSIndex(DIMENSION, no_embeddings)
+    sharded = ShardedFAISSIndex(DIMENSION, no_embeddings, num_shards=shards, partition="document")
+    try:
+        remove_save_load_add(flat, vectors, str(tmp_path / "flat"))
+        remove_save_load_add(sharded, vectors, str(tmp_path / "sharded"))
+        # Document partitioning leaves the shards of the documents removed empty
+        assert any(shard.ntotal == 0 for shard in sharded.index.shards)
+
+        queries = vectors[::18][:32]
+        assert len(queries) == 32
+        assert np.array_equal(sharded.search_vectors(queries, 5)[1], flat.search_vectors(queries, 5)[1])
+        where = {"file": ["document_0", "document_400"]}
+        assert np.array_equal(sharded.search_vectors(queries, 5, filter=where)[1],
+                              flat.search_vectors(queries, 5, filter=where)[1])
+    finally:
+        sharded.close()
+
+
+def test_shard_server_answers_for_an_emptied_shard(tmp_path, monkeypatch):
+    monkeypatch.setenv("SHARD_AUTHKEY", "test-key")
+    vectors = synthetic_vectors(100, DIMENSION)
+    path = str(tmp_path / "sharded")
+    sharded = ShardedFAISSIndex(DIMENSION, no_embeddings, num_shards=2, partition="document")
+    fill(sharded, vectors, documents=1)
+    sharded.remove_document("document_0", sharded.metadata.select({"file": "document_0"}))
+    sharded.save_index(path)
+    sharded.close()
+
+    server = ShardServer(path, 0).start()
+    remote = RemoteShard(server.address)
+    try:
+        assert remote.ntotal == 0
+        distances, ids = remote.search(vectors[:32], 5)
+        assert (ids == -1).all() and np.isinf(distances).all()
+    finally:
+        remote.close()
+        server.close()
@@ -0,0 +1,91 @@
+import os
+import time
+
+import pytest
+
+from benchmarks.fakes import FakeEmbeddings
+from src.services.vectorial_db.faiss_index import FAISSIndex
+from src.services.vectorial_db.snapshots import CURRENT_FILE, STALE_TMP_SECONDS, TMP_PREFIX, SnapshotStore
+
+
+def write_snapshot(store: SnapshotStore, content: str) -> str:
+    folder = store.create()
+    with open(os.path.join(folder, "data.txt"), "w", encoding="utf-8") as file:
+        file.write(content)
+    return store.publish(folder)
+
+
+def read_current(store: SnapshotStore) -> str:
+    _, folder = store.current()
+    with open(os.path.join(folder, "data.txt"), encoding="utf-8") as file:
+        return file.read()
+
+
+def test_publish_points_current_to_the_new_snapshot(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=5)
+    with pytest.raises(FileNotFoundError):
+        store.current()
+
+    first = write_snapshot(store, "first")
+    assert store.current_name() == first
+    assert read_current(store) == "first"
+    second = write_snapshot(store, "second")
+    assert second > first
+    assert store.current() == (second, store.folder(second))
+    assert read_current(store) == "second"
+    assert store.snapshots() == [first, second]
+    assert not os.path.exists(os.path.join(store.path, CURRENT_FILE + ".tmp"))
+
+
+def test_gc_keeps_recent_current_and_in_use_snapshots(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=2)
+    names = [write_snapshot(store, str(number)) for number in range(4)]
+    # Collected on every publish
+    assert store.snapshots() == names[-2:]
+
+    store.keep = 1
+    assert store.gc(in_use={names[2]}) == []
+    assert store.gc() == [names[2]]
+    assert store.snapshots() == [names[3]]
+    assert read_current(store) == "3"
+
+
+def test_gc_removes_only_stale_temporary_folders(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    write_snapshot(store, "published")
+    interrupted, in_progress = store.create(), store.create()
+    stale = time.time() - STALE_TMP_SECONDS - 1
+    os.utime(interrupted, (stale, stale))
+
+    store.gc()
+    assert not os.path.exists(interrupted)
+    assert os.path.exists(in_progress)
+    assert all(not name.startswith(TMP_PREFIX) for name in store.snapshots())
+
+
+def test_legacy_folder_is_replaced_by_a_snapshot(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    with open(os.path.join(store.path, "index.faiss"), "wb") as file:
+        file.write(b"legacy")
+    assert store.current() == (None, store.path)
+
+    name = write_snapshot(store, "converted")
+    assert store.current_name() == name
+    assert not os.path.exists(os.path.join(store.path, "index.faiss"))
+    assert read_current(store) == "converted"
+
+
+def test_index_loads_the_snapshot_it_saved(tmp_path):
+    embeddings = FakeEmbeddings(16)
+    path = str(tmp_path / "faiss_index")
+    index = FAISSIndex(16, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch)
+    index.add_chunks(["first chunk", "second chunk"])
+    first = index.save_index(path)
+    index.add_chunks(["third chunk"])
+    second = index.save_index(path, keep_snapshots=1)
+    assert SnapshotStore(path).snapshots() == [second] != [first]
+
+    loaded = FAISSIndex(16, embeddings.get_embeddings, batch_embeddings=embeddings.get_embeddings_batch)
+    loaded.load_index(path)
+    assert loaded.snapshot == second
+    assert dict(loaded.chunks.items()) == {0: "first chunk", 1: "second chunk", 2: "third chunk"}